@@ -14,184 +14,175 @@
     searching through the ANUGA source tree for the functions that they need.
 
     Also, it isolates the user from "under-the-hood" refactorings.
-"""
 
-# -----------------------------------------------------
-# Make selected classes available directly
-# -----------------------------------------------------
+    The names of the public API are resolved lazily (PEP 562): the module
+    providing a name is only imported the first time the name is accessed,
+    so that "import anuga" does not pull in matplotlib, scipy, netCDF4 or
+    mpi4py until they are actually needed.
+"""
 
+import sys
+import importlib
+import importlib.util
 
+from os.path import join
 
 from .revision import  __git_sha__
 from .revision import __git_committed_datetime__
 from .revision import __version__
 
-# ----------------------------------
-# NetCDF changes stdout to terminal
-# Causes trouble when using jupyter
-# ---------------------------------
-import sys
-_stdout = sys.stdout
+#from anuga.__config__ import show as show_config
+
+# -----------------------------------------------------
+# Make selected classes available directly.
+#
+# _lazy_imports maps a public name to the module that
+# provides it and the attribute of that module (None
+# if the name is the module itself).
+# -----------------------------------------------------
+_lazy_imports = {}
 
-# ---------------------------------
-# Setup the tester from numpy
-# ---------------------------------
-from numpy._pytesttester import PytestTester
-test = PytestTester(__name__)
-del PytestTester
 
-#from anuga.__config__ import show as show_config
+def _lazy(module, *names, **aliases):
+    """Register names of module to be imported on first access.
+
+    Keyword arguments register a public alias for an attribute of the module
+    with a different name.
+    """
+
+    for name in names:
+        _lazy_imports[name] = (module, name)
+    for alias, name in aliases.items():
+        _lazy_imports[alias] = (module, name)
+
 
 # --------------------------------
 # Important basic classes
 # --------------------------------
-from anuga.shallow_water.shallow_water_domain import Domain
-from anuga.abstract_2d_finite_volumes.quantity import Quantity
-from anuga.abstract_2d_finite_volumes.region import Region
-from anuga.geospatial_data.geospatial_data import Geospatial_data
-from anuga.coordinate_transforms.geo_reference import Geo_reference
-from anuga.operators.base_operator import Operator
-from anuga.structures.structure_operator import Structure_operator
-
-from anuga.utilities.animate import SWW_plotter
-from anuga.utilities.animate import Domain_plotter
+_lazy('anuga.shallow_water.shallow_water_domain', 'Domain')
+_lazy('anuga.abstract_2d_finite_volumes.quantity', 'Quantity')
+_lazy('anuga.abstract_2d_finite_volumes.region', 'Region')
+_lazy('anuga.geospatial_data.geospatial_data', 'Geospatial_data')
+_lazy('anuga.coordinate_transforms.geo_reference', 'Geo_reference')
+_lazy('anuga.operators.base_operator', 'Operator')
+_lazy('anuga.structures.structure_operator', 'Structure_operator')
 
+_lazy('anuga.utilities.animate', 'SWW_plotter', 'Domain_plotter')
 
-from anuga.abstract_2d_finite_volumes.generic_domain import Generic_Domain
-from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+_lazy('anuga.abstract_2d_finite_volumes.generic_domain', 'Generic_Domain')
+_lazy('anuga.abstract_2d_finite_volumes.neighbour_mesh', 'Mesh')
 
 # ------------------------------------------------------------------------------
 # Miscellaneous
 # ------------------------------------------------------------------------------
-from anuga.abstract_2d_finite_volumes.util import file_function, \
-                                        sww2timeseries, sww2csv_gauges, \
-                                        csv2timeseries_graphs
-
-from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross, \
-                                                    rectangular
+_lazy('anuga.abstract_2d_finite_volumes.util', 'file_function',
+      'sww2timeseries', 'sww2csv_gauges', 'csv2timeseries_graphs')
 
-from anuga.file.csv_file import load_csv_as_building_polygons,  \
-                                load_csv_as_polygons
+_lazy('anuga.abstract_2d_finite_volumes.mesh_factory', 'rectangular_cross',
+      'rectangular')
 
-from anuga.file.sts import create_sts_boundary
+_lazy('anuga.file.csv_file', 'load_csv_as_building_polygons',
+      'load_csv_as_polygons')
 
-from anuga.file.ungenerate import load_ungenerate
+_lazy('anuga.file.sts', 'create_sts_boundary')
 
-from anuga.geometry.polygon import read_polygon
-from anuga.geometry.polygon import plot_polygons
-from anuga.geometry.polygon import inside_polygon
-from anuga.geometry.polygon import polygon_area
-from anuga.geometry.polygon_function import Polygon_function
+_lazy('anuga.file.ungenerate', 'load_ungenerate')
 
-from anuga.coordinate_transforms.lat_long_UTM_conversion import LLtoUTM, UTMtoLL
+_lazy('anuga.geometry.polygon', 'read_polygon', 'plot_polygons',
+      'inside_polygon', 'polygon_area')
+_lazy('anuga.geometry.polygon_function', 'Polygon_function')
 
-from anuga.abstract_2d_finite_volumes.pmesh2domain import \
-                                            pmesh_to_domain_instance
+_lazy('anuga.coordinate_transforms.lat_long_UTM_conversion', 'LLtoUTM',
+      'UTMtoLL')
 
-from anuga.fit_interpolate.fit import fit_to_mesh_file
-from anuga.fit_interpolate.fit import fit_to_mesh
+_lazy('anuga.abstract_2d_finite_volumes.pmesh2domain',
+      'pmesh_to_domain_instance')
 
-from anuga.utilities.system_tools import file_length
-from anuga.utilities.sww_merge import sww_merge_parallel as sww_merge
-from anuga.utilities.file_utils import copy_code_files
-from anuga.utilities.numerical_tools import safe_acos as acos
-import anuga.utilities.plot_utils as plot_utils
+_lazy('anuga.fit_interpolate.fit', 'fit_to_mesh_file', 'fit_to_mesh')
 
+_lazy('anuga.utilities.system_tools', 'file_length')
+_lazy('anuga.utilities.sww_merge', sww_merge='sww_merge_parallel')
+_lazy('anuga.utilities.file_utils', 'copy_code_files')
+_lazy('anuga.utilities.numerical_tools', acos='safe_acos')
+_lazy('anuga.utilities.plot_utils', plot_utils=None)
 
-from anuga.caching import cache
-from os.path import join
-from anuga.config import indent
+_lazy('anuga.caching', 'cache')
+_lazy('anuga.config', 'indent')
 
-from anuga.utilities.parse_time import parse_time
+_lazy('anuga.utilities.parse_time', 'parse_time')
 
 # ----------------------------
 # Parallel api
 # ----------------------------
-from anuga.parallel.parallel_api import distribute
-from anuga.parallel.parallel_api import myid, numprocs, get_processor_name
-from anuga.parallel.parallel_api import send, receive, reduce
-from anuga.parallel.parallel_api import pypar_available, barrier, finalize
-from anuga.parallel.parallel_api import collect_value
-from anuga.parallel.parallel_api import mpicmd
-from anuga.parallel.parallel_api import mpi_extra_options
-
-
-from anuga.parallel.parallel_api import sequential_distribute_dump
-from anuga.parallel.parallel_api import sequential_distribute_load
-        
+_lazy('anuga.parallel.parallel_api', 'distribute', 'myid', 'numprocs',
+      'get_processor_name', 'send', 'receive', 'reduce', 'pypar_available',
+      'barrier', 'finalize', 'collect_value', 'allreduce_values', 'mpicmd',
+      'mpi_extra_options', 'sequential_distribute_dump',
+      'sequential_distribute_load')
 
 # -----------------------------
 # Checkpointing
 # -----------------------------
-from anuga.shallow_water.checkpoint import load_checkpoint_file
+_lazy('anuga.shallow_water.checkpoint', 'load_checkpoint_file')
 
 # -----------------------------
 # SwW Standard Boundaries
 # -----------------------------
-from anuga.shallow_water.boundaries import File_boundary
-from anuga.shallow_water.boundaries import Reflective_boundary
-from anuga.shallow_water.boundaries import Characteristic_stage_boundary
-from anuga.shallow_water.boundaries import Field_boundary
-from anuga.shallow_water.boundaries import \
-                    Time_stage_zero_momentum_boundary
-from anuga.shallow_water.boundaries import \
-                    Transmissive_stage_zero_momentum_boundary
-from anuga.shallow_water.boundaries import \
-                    Transmissive_momentum_set_stage_boundary
-from anuga.shallow_water.boundaries import \
-                    Transmissive_n_momentum_zero_t_momentum_set_stage_boundary
-from anuga.shallow_water.boundaries import \
-                    Flather_external_stage_zero_velocity_boundary
-from anuga.abstract_2d_finite_volumes.generic_boundary_conditions import \
-                    Compute_fluxes_boundary
+_lazy('anuga.shallow_water.boundaries', 'File_boundary',
+      'Reflective_boundary',
+      'Characteristic_stage_boundary',
+      'Field_boundary',
+      'Time_stage_zero_momentum_boundary',
+      'Transmissive_stage_zero_momentum_boundary',
+      'Transmissive_momentum_set_stage_boundary',
+      'Transmissive_n_momentum_zero_t_momentum_set_stage_boundary',
+      'Flather_external_stage_zero_velocity_boundary')
+_lazy('anuga.abstract_2d_finite_volumes.generic_boundary_conditions',
+      'Compute_fluxes_boundary')
 
 # -----------------------------
 # General Boundaries
 # -----------------------------
-from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
-                            import Dirichlet_boundary
-from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
-                            import Time_boundary
-from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
-                            import Time_space_boundary
-from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
-                            import Transmissive_boundary
+_lazy('anuga.abstract_2d_finite_volumes.generic_boundary_conditions',
+      'Dirichlet_boundary',
+      'Time_boundary',
+      'Time_space_boundary',
+      'Transmissive_boundary')
 
 # -----------------------------
 # Shallow Water Tsunamis
 # -----------------------------
-from anuga.tsunami_source.smf import slide_tsunami, slump_tsunami
+_lazy('anuga.tsunami_source.smf', 'slide_tsunami', 'slump_tsunami')
 
 # -----------------------------
 # Forcing
 # These are old, should use operators
 # -----------------------------
-from anuga.shallow_water.forcing import Inflow, Rainfall, Wind_stress
+_lazy('anuga.shallow_water.forcing', 'Inflow', 'Rainfall', 'Wind_stress')
 
 # -----------------------------
 # File conversion utilities
 # -----------------------------
-from anuga.file_conversion.file_conversion import sww2obj
-from anuga.file_conversion.file_conversion import timefile2netcdf
-from anuga.file_conversion.file_conversion import tsh2sww
-from anuga.file_conversion.urs2nc import urs2nc
-from anuga.file_conversion.urs2sww import urs2sww
-from anuga.file_conversion.urs2sts import urs2sts
-from anuga.file_conversion.dem2pts import dem2pts
-from anuga.file_conversion.esri2sww import esri2sww
-from anuga.file_conversion.sww2dem import sww2dem, sww2dem_batch
-from anuga.file_conversion.asc2dem import asc2dem
-from anuga.file_conversion.xya2pts import xya2pts
-from anuga.file_conversion.ferret2sww import ferret2sww
-from anuga.file_conversion.dem2dem import dem2dem
-from anuga.file_conversion.sww2array import sww2array
-from anuga.file_conversion.llasc2pts import llasc2pts
+_lazy('anuga.file_conversion.file_conversion', 'sww2obj', 'timefile2netcdf',
+      'tsh2sww')
+_lazy('anuga.file_conversion.urs2nc', 'urs2nc')
+_lazy('anuga.file_conversion.urs2sww', 'urs2sww')
+_lazy('anuga.file_conversion.urs2sts', 'urs2sts')
+_lazy('anuga.file_conversion.dem2pts', 'dem2pts')
+_lazy('anuga.file_conversion.esri2sww', 'esri2sww')
+_lazy('anuga.file_conversion.sww2dem', 'sww2dem', 'sww2dem_batch')
+_lazy('anuga.file_conversion.asc2dem', 'asc2dem')
+_lazy('anuga.file_conversion.xya2pts', 'xya2pts')
+_lazy('anuga.file_conversion.ferret2sww', 'ferret2sww')
+_lazy('anuga.file_conversion.dem2dem', 'dem2dem')
+_lazy('anuga.file_conversion.sww2array', 'sww2array')
+_lazy('anuga.file_conversion.llasc2pts', 'llasc2pts')
 
 # -----------------------------
 # Parsing arguments
 # -----------------------------
-from anuga.utilities.argparsing import create_standard_parser
-from anuga.utilities.argparsing import parse_standard_args
+_lazy('anuga.utilities.argparsing', 'create_standard_parser',
+      'parse_standard_args')
 
 
 def get_args():
@@ -199,127 +190,155 @@ def get_args():
 
     Don't use this if you want to setup your own parser
     """
+    from anuga.utilities.argparsing import create_standard_parser
     parser = create_standard_parser()
     return parser.parse_args()
 
 # -----------------------------
 # Running Script
 # -----------------------------
-from anuga.utilities.run_anuga_script import run_script as run_anuga_script
+_lazy('anuga.utilities.run_anuga_script', run_anuga_script='run_script')
 
 # ---------------------------
 # Simulation and Excel mesh_interface
 # ---------------------------
-from anuga.simulation.simulation import Simulation
+_lazy('anuga.simulation.simulation', 'Simulation')
 
 # -----------------------------
 # Mesh API
 # -----------------------------
-from anuga.pmesh.mesh_interface import create_mesh_from_regions
+_lazy('anuga.pmesh.mesh_interface', 'create_mesh_from_regions')
 
 # -----------------------------
 # SWW file access
 # -----------------------------
-from anuga.shallow_water.sww_interrogate import get_flow_through_cross_section
+_lazy('anuga.shallow_water.sww_interrogate', 'get_flow_through_cross_section')
 
 # ---------------------------
 # Operators
 # ---------------------------
-from anuga.operators.kinematic_viscosity_operator import Kinematic_viscosity_operator
+_lazy('anuga.operators.kinematic_viscosity_operator',
+      'Kinematic_viscosity_operator')
 
-from anuga.operators.rate_operators import Rate_operator
-from anuga.operators.set_friction_operators import Set_depth_friction_operator
+_lazy('anuga.operators.rate_operators', 'Rate_operator')
+_lazy('anuga.operators.set_friction_operators', 'Set_depth_friction_operator')
 
-from anuga.operators.set_elevation_operator import Set_elevation_operator
-from anuga.operators.set_quantity_operator import Set_quantity_operator
-from anuga.operators.set_stage_operator import Set_stage_operator
+_lazy('anuga.operators.set_elevation_operator', 'Set_elevation_operator')
+_lazy('anuga.operators.set_quantity_operator', 'Set_quantity_operator')
+_lazy('anuga.operators.set_stage_operator', 'Set_stage_operator')
 
+_lazy('anuga.operators.set_elevation', 'Set_elevation')
+_lazy('anuga.operators.set_quantity', 'Set_quantity')
+_lazy('anuga.operators.set_stage', 'Set_stage')
 
-from anuga.operators.set_elevation import Set_elevation
-from anuga.operators.set_quantity import Set_quantity
-from anuga.operators.set_stage import Set_stage
-
-from anuga.operators.sanddune_erosion_operator import Sanddune_erosion_operator
-from anuga.operators.erosion_operators import Bed_shear_erosion_operator
-from anuga.operators.erosion_operators import Flat_slice_erosion_operator
-from anuga.operators.erosion_operators import Flat_fill_slice_erosion_operator
+_lazy('anuga.operators.sanddune_erosion_operator', 'Sanddune_erosion_operator')
+_lazy('anuga.operators.erosion_operators', 'Bed_shear_erosion_operator',
+      'Flat_slice_erosion_operator', 'Flat_fill_slice_erosion_operator')
 
 # ---------------------------
 # Structure Operators
+#
+# The parallel versions are used when pypar is available,
+# so these are resolved in __getattr__
 # ---------------------------
+_structure_operators = {
+    'Inlet_operator': 'anuga.structures.inlet_operator',
+    'Boyd_box_operator': 'anuga.structures.boyd_box_operator',
+    'Boyd_pipe_operator': 'anuga.structures.boyd_pipe_operator',
+    'Weir_orifice_trapezoid_operator':
+        'anuga.structures.weir_orifice_trapezoid_operator',
+    'Internal_boundary_operator': 'anuga.structures.internal_boundary_operator',
+}
+
+_lazy('anuga.structures.internal_boundary_functions',
+      'pumping_station_function')
+_lazy('anuga.structures.structure_set_operator', 'Structure_set_operator')
 
+# ----------------------------
+#
+# Added by Petar Milevski 10/09/2013
+_lazy('anuga.utilities.model_tools',
+      'get_polygon_from_single_file',
+      'get_polygons_from_Mid_Mif',
+      'get_polygon_list_from_files',
+      'get_polygon_dictionary',
+      'get_polygon_value_list',
+      'read_polygon_dir',
+      'read_hole_dir_multi_files_with_single_poly',
+      'read_multi_poly_file',
+      'read_hole_dir_single_file_with_multi_poly',
+      'read_multi_poly_file_value',
+      'Create_culvert_bridge_Operator',
+      'get_WCC_2002_Blockage_factor',
+      'get_WCC_2016_Blockage_factor')
 
+# ---------------------------
+# User Access Functions
+# ---------------------------
+_lazy('anuga.utilities.system_tools', 'get_user_name', 'get_host_name',
+      'get_version', 'get_revision_number', 'get_revision_date')
+_lazy('anuga.utilities.mem_time_equation', 'estimate_time_mem')
 
-if pypar_available:
-    from anuga.parallel.parallel_operator_factory import Inlet_operator
-    from anuga.parallel.parallel_operator_factory import Boyd_box_operator
-    from anuga.parallel.parallel_operator_factory import Boyd_pipe_operator
-    from anuga.parallel.parallel_operator_factory import Weir_orifice_trapezoid_operator
-    from anuga.parallel.parallel_operator_factory import Internal_boundary_operator
-else:
-    from anuga.structures.inlet_operator import Inlet_operator
-    from anuga.structures.boyd_box_operator import Boyd_box_operator
-    from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
-    from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
-    from anuga.structures.internal_boundary_operator import Internal_boundary_operator
+# -------------------------
+# create domain functions
+# -------------------------
+_lazy('anuga.extras', 'create_domain_from_regions', 'create_domain_from_file',
+      'rectangular_cross_domain')
 
-from anuga.structures.internal_boundary_functions import pumping_station_function
+_lazy('anuga.utilities.log', log=None)
 
+_lazy('anuga.config', 'g', 'velocity_protection')
 
 
-# ----------------------------
-# Parallel distribute
-# ----------------------------
+__all__ = sorted(set(_lazy_imports) | set(_structure_operators) |
+                 {'join', 'get_args', 'test', '__version__', '__git_sha__',
+                  '__git_committed_datetime__'})
 
-# ----------------------------
-#
-# Added by Petar Milevski 10/09/2013
 
-from anuga.utilities.model_tools import get_polygon_from_single_file
-from anuga.utilities.model_tools import get_polygons_from_Mid_Mif
-from anuga.utilities.model_tools import get_polygon_list_from_files
-from anuga.utilities.model_tools import get_polygon_dictionary
-from anuga.utilities.model_tools import get_polygon_value_list
-from anuga.utilities.model_tools import read_polygon_dir
-from anuga.utilities.model_tools import read_hole_dir_multi_files_with_single_poly
-from anuga.utilities.model_tools import read_multi_poly_file
-from anuga.utilities.model_tools import read_hole_dir_single_file_with_multi_poly
-from anuga.utilities.model_tools import read_multi_poly_file_value
-from anuga.utilities.model_tools import Create_culvert_bridge_Operator
-from anuga.utilities.model_tools import get_WCC_2002_Blockage_factor
-from anuga.utilities.model_tools import get_WCC_2016_Blockage_factor
+def __getattr__(name):
+    """Import the module providing a public name on first access."""
 
-# ---------------------------
-# User Access Functions
-# ---------------------------
+    if name == 'test':
+        # Setup the tester from numpy
+        from numpy._pytesttester import PytestTester
+        value = PytestTester(__name__)
+    elif name in _structure_operators:
+        if __getattr__('pypar_available'):
+            module = 'anuga.parallel.parallel_operator_factory'
+        else:
+            module = _structure_operators[name]
+        value = _import(module, name)
+    elif name in _lazy_imports:
+        value = _import(*_lazy_imports[name])
+    elif importlib.util.find_spec(__name__ + '.' + name) is not None:
+        # Subpackages were previously always loaded by this module
+        value = _import(__name__ + '.' + name, None)
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
-from anuga.utilities.system_tools import get_user_name
-from anuga.utilities.system_tools import get_host_name
-from anuga.utilities.system_tools import get_version
+    globals()[name] = value
+    return value
 
-from anuga.utilities.system_tools import get_revision_number
-from anuga.utilities.system_tools import get_revision_date
-from anuga.utilities.mem_time_equation import estimate_time_mem
 
-# -------------------------
-# create domain functions
-# -------------------------
-from anuga.extras import create_domain_from_regions
-from anuga.extras import create_domain_from_file
-from anuga.extras import rectangular_cross_domain
-
-from anuga.utilities import log as log
-
-from anuga.config import g
-from anuga.config import velocity_protection
-
-# --------------------------------------
-# NetCDF changes stdout to the terminal
-# This resets it
-# --------------------------------------
-try:
-    from importlib import reload
-except:
-    pass
-reload(sys)
-sys.stdout = _stdout
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+def _import(module, name):
+    """Import module and return its attribute name (or the module if None)."""
+
+    # --------------------------------------
+    # NetCDF changes stdout to the terminal
+    # Causes trouble when using jupyter,
+    # so reset it after the import
+    # --------------------------------------
+    stdout = sys.stdout
+    try:
+        value = importlib.import_module(module)
+    finally:
+        sys.stdout = stdout
+
+    if name is not None:
+        value = getattr(value, name)
+
+    return value
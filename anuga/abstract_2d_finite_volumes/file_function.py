@@ -19,7 +19,7 @@ from builtins import range
 import numpy as num
 
 from anuga.geospatial_data.geospatial_data import ensure_absolute
-from anuga.file.netcdf import NetCDFFile
+from anuga.file.netcdf import NetCDFFile, netcdf_lock
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.utilities.numerical_tools import ensure_numeric
 
@@ -36,7 +36,8 @@ def file_function(filename,
                   verbose=False,
                   use_cache=False,
                   boundary_polygon=None,
-                  output_centroids=False):
+                  output_centroids=False,
+                  time_window=None):
     """Read time history of spatial and/or temporal data from NetCDF file and return
     a callable object.
 
@@ -83,6 +84,11 @@ def file_function(filename,
 
     boundary_polygon - 
 
+    time_window - If not None, the time series are read from the file and
+                  interpolated this number of timesteps at a time when
+                  needed instead of all at once. The file is kept open
+                  and caching is not used.
+
     
     See Interpolation function in anuga.fit_interpolate.interpolation for
     further documentation
@@ -125,9 +131,15 @@ def file_function(filename,
               'time_limit': time_limit,                                 
               'verbose': verbose,
               'boundary_polygon': boundary_polygon,
-              'output_centroids': output_centroids}
+              'output_centroids': output_centroids,
+              'time_window': time_window}
 
     # Call underlying engine with or without caching
+    if use_cache is True and time_window is not None:
+        if verbose:
+            log.critical('Caching is not used with a time_window')
+        use_cache = False
+
     if use_cache is True:
         try:
             from anuga.caching import cache
@@ -177,7 +189,8 @@ def _file_function(filename,
                    time_limit=None,
                    verbose=False,
                    boundary_polygon=None,
-                   output_centroids=False):
+                   output_centroids=False,
+                   time_window=None):
     """Internal function
     
     See file_function for documentatiton
@@ -212,7 +225,8 @@ def _file_function(filename,
                                         time_limit=time_limit,
                                         verbose=verbose,
                                         boundary_polygon=boundary_polygon,
-                                        output_centroids=output_centroids)
+                                        output_centroids=output_centroids,
+                                        time_window=time_window)
     elif ext in [".csv"]:
         # FIXME (Ole): Could add csv file here to address Ted Rigby's
         # suggestion about reading hydrographs.
@@ -232,11 +246,15 @@ def get_netcdf_file_function(filename,
                              time_limit=None,            
                              verbose=False,
                              boundary_polygon=None,
-                             output_centroids=False):
+                             output_centroids=False,
+                             time_window=None):
     """Read time history of spatial data from NetCDF sww file and
     return a callable object f(t,x,y)
     which will return interpolated values based on the input file.
 
+    If time_window is given (and there are interpolation points) the
+    quantities are read lazily from the file, which is kept open.
+
     Model time (domain_starttime)
     will be checked, possibly modified and returned
     
@@ -458,15 +476,27 @@ def get_netcdf_file_function(filename,
     
     # Produce values for desired data points at
     # each timestep for each quantity
+    lazy = time_window is not None and spatial and interpolation_points is not None
+
     quantities = {}
     for i, name in enumerate(quantity_names):
-        quantities[name] = fid.variables[name][:]
         if boundary_polygon is not None:
+            point_ids = gauge_id
+        else:
+            point_ids = None
+
+        if lazy:
+            quantities[name] = Netcdf_time_series(fid, name, point_ids)
+            continue
+
+        quantities[name] = fid.variables[name][:]
+        if point_ids is not None:
             #removes sts points that do not lie on boundary
-            quantities[name] = num.take(quantities[name], gauge_id, axis=1)
+            quantities[name] = num.take(quantities[name], point_ids, axis=1)
             
     # Close sww, tms or sts netcdf file         
-    fid.close()
+    if not lazy:
+        fid.close()
 
     from anuga.fit_interpolate.interpolate import Interpolation_function
 
@@ -490,8 +520,44 @@ def get_netcdf_file_function(filename,
                                    time_thinning=time_thinning,
                                    verbose=verbose,
                                    gauge_neighbour_id=gauge_neighbour_id,
-                                   output_centroids=output_centroids),
+                                   output_centroids=output_centroids,
+                                   time_window=time_window),
             starttime)
 
     # NOTE (Ole): Caching Interpolation function is too slow as
     # the very long parameters need to be hashed.
+
+
+class Netcdf_time_series(object):
+    """Time series (timesteps x points) stored in a netcdf variable.
+
+    Values are read from the file when the object is sliced, so that
+    only the timesteps needed are held in memory. If point_ids is
+    specified only those columns are returned.
+    """
+
+    def __init__(self, fid, name, point_ids=None):
+
+        self.fid = fid   # Keeps the file open
+        self.variable = fid.variables[name]
+
+        if point_ids is not None:
+            point_ids = ensure_numeric(point_ids, int)
+        self.point_ids = point_ids
+
+        shape = self.variable.shape
+        if point_ids is not None and len(shape) == 2:
+            shape = (shape[0], len(point_ids))
+        self.shape = shape
+
+    def __getitem__(self, key):
+
+        # Reads may happen from the prefetch thread of an
+        # Interpolation_function
+        with netcdf_lock:
+            values = num.array(self.variable[key], float)
+
+        if self.point_ids is not None and len(values.shape) == 2:
+            values = num.take(values, self.point_ids, axis=1)
+
+        return values
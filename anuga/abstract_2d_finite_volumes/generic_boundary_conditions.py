@@ -539,6 +539,10 @@ class File_boundary(Boundary):
     an instance of class descending from class Boundary.
     This will be used in case model time exceeds that available in the 
     underlying data.
+
+    Optional keyword argument time_window limits the number of timesteps
+    read from the file and interpolated at a time, which saves memory
+    for long time series. See file_function.
        
     """
 
@@ -551,7 +555,8 @@ class File_boundary(Boundary):
                  boundary_polygon=None,    
                  default_boundary=None,
                  use_cache=False, 
-                 verbose=False): 
+                 verbose=False,
+                 time_window=None): 
 
         import time
         from anuga.config import time_format
@@ -569,16 +574,16 @@ class File_boundary(Boundary):
         # any tagged boundary later on.
 
         if verbose: log.critical('Find midpoint coordinates of entire boundary')
-        self.midpoint_coordinates = num.zeros((len(domain.boundary), 2), float)
-        boundary_keys = list(domain.boundary.keys())
+        self.midpoint_coordinates = num.zeros((domain.boundary_length, 2), float)
+
+        # Boundary edges ordered by (vol_id, edge_id)
+        boundary_keys = list(zip(domain.boundary_cells.tolist(),
+                                 domain.boundary_edges.tolist()))
 
         xllcorner = domain.geo_reference.get_xllcorner()
         yllcorner = domain.geo_reference.get_yllcorner()        
         
 
-        # Make ordering unique #FIXME: should this happen in domain.py?
-        boundary_keys.sort()
-
         # Record ordering #FIXME: should this also happen in domain.py or general_mesh.py?
         self.boundary_indices = {}
         for i, (vol_id, edge_id) in enumerate(boundary_keys):
@@ -589,7 +594,9 @@ class File_boundary(Boundary):
             # Register index of this boundary edge for use with evaluate
             self.boundary_indices[(vol_id, edge_id)] = i
 
-            
+        # Point index of each of the domain boundary edges
+        # for use with evaluate_segment
+        self.boundary_point_ids = _get_boundary_point_ids(domain, self.boundary_indices)
             
         if verbose: log.critical('Initialise file_function')
         self.F = file_function(filename,
@@ -600,7 +607,8 @@ class File_boundary(Boundary):
                                time_limit=time_limit,
                                use_cache=use_cache, 
                                verbose=verbose,
-                               boundary_polygon=boundary_polygon)
+                               boundary_polygon=boundary_polygon,
+                               time_window=time_window)
                              
         # Check and store default_boundary
         msg = 'Keyword argument default_boundary must be either None '
@@ -688,27 +696,7 @@ class File_boundary(Boundary):
                         self.default_boundary_invoked = True
             
             if num.any(res == NAN):
-                x,y=self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
-
-                if hasattr(self.F, 'indices_outside_mesh') and\
-                       len(self.F.indices_outside_mesh) > 0:
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n'\
-                               %self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' %self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+                raise Exception(_nan_message(self, i))
             
             return res 
         else:
@@ -716,6 +704,53 @@ class File_boundary(Boundary):
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Set the boundary values of all the edges in segment_edges
+        at once, interpolating the file values in time for all the
+        associated boundary points together.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        point_ids = self.boundary_point_ids[ids]
+
+        t = self.domain.get_time()
+
+        try:
+            q_bdry = self.F.evaluate_points(t, point_ids)
+        except Modeltime_too_early as e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late as e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+            else:
+                # Pass control to default boundary
+                self.default_boundary.evaluate_segment(domain, segment_edges)
+
+                if self.default_boundary_invoked is False:
+                    # Issue warning the first time
+                    if self.verbose:
+                        msg = '%s' %str(e)
+                        msg += 'Instead I will use the default boundary: %s\n'\
+                            %str(self.default_boundary)
+                        msg += 'Note: Further warnings will be supressed'
+                        log.critical(msg)
+
+                    self.default_boundary_invoked = True
+                return
+
+        nans = q_bdry == NAN
+        if num.any(nans):
+            i = point_ids[num.nonzero(num.any(nans, axis=1))[0][0]]
+            raise Exception(_nan_message(self, i))
+
+        _set_segment_boundary_values(domain, ids, q_bdry)
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
@@ -757,15 +792,15 @@ class AWI_boundary(Boundary):
         # any tagged boundary later on.
 
         if verbose: log.critical('Find midpoint coordinates of entire boundary')
-        self.midpoint_coordinates = num.zeros((len(domain.boundary), 2), float)
-        boundary_keys = list(domain.boundary.keys())
+        self.midpoint_coordinates = num.zeros((domain.boundary_length, 2), float)
+
+        # Boundary edges ordered by (vol_id, edge_id)
+        boundary_keys = list(zip(domain.boundary_cells.tolist(),
+                                 domain.boundary_edges.tolist()))
 
         xllcorner = domain.geo_reference.get_xllcorner()
         yllcorner = domain.geo_reference.get_yllcorner()        
 
-        # Make ordering unique #FIXME: should this happen in domain.py?
-        boundary_keys.sort()
-
         # Record ordering #FIXME: should this also happen in domain.py?
         self.boundary_indices = {}
         for i, (vol_id, edge_id) in enumerate(boundary_keys):
@@ -789,6 +824,9 @@ class AWI_boundary(Boundary):
             # Register index of this boundary edge for use with evaluate
             self.boundary_indices[(vol_id, edge_id)] = i
 
+        # Point index of each of the domain boundary edges
+        # for use with evaluate_segment
+        self.boundary_point_ids = _get_boundary_point_ids(domain, self.boundary_indices)
 
         if verbose: log.critical('Initialise file_function')
         self.F = file_function(filename, domain,
@@ -843,27 +881,8 @@ class AWI_boundary(Boundary):
             i = self.boundary_indices[vol_id, edge_id]
             res = self.F(t, point_id=i)
 
-            if res == NAN:
-                x,y = self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' % (i, x, y)
-
-                if (hasattr(self.F, 'indices_outside_mesh') and
-                       len(self.F.indices_outside_mesh) > 0):
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n' % self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' % self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+            if num.any(res == NAN):
+                raise Exception(_nan_message(self, i))
             
             q[0] = res[0] # Take stage, leave momentum alone
             return q
@@ -874,4 +893,104 @@ class AWI_boundary(Boundary):
             return self.F(t)
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set the stage boundary values of all the edges in segment_edges
+        at once from the file, the other quantities from the edge values.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        point_ids = self.boundary_point_ids[ids]
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        t = self.domain.get_time()
+        res = self.F.evaluate_points(t, point_ids)
+
+        nans = res == NAN
+        if num.any(nans):
+            i = point_ids[num.nonzero(num.any(nans, axis=1))[0][0]]
+            raise Exception(_nan_message(self, i))
+
+        # Take stage, leave momentum alone
+        for j, name in enumerate(domain.evolved_quantities):
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = Q.edge_values[vol_ids, edge_ids]
+
+        Q = domain.quantities[domain.conserved_quantities[0]]
+        Q.boundary_values[ids] = res[:, 0]
+
+
+def _get_boundary_point_ids(domain, boundary_indices):
+    """Return an array of the index in boundary_indices of each of
+    the domain boundary edges (domain.boundary_cells, domain.boundary_edges)
+    """
+
+    point_ids = num.zeros(len(domain.boundary_cells), int)
+    for k, (vol_id, edge_id) in enumerate(zip(domain.boundary_cells,
+                                              domain.boundary_edges)):
+        point_ids[k] = boundary_indices[(vol_id, edge_id)]
+
+    return point_ids
+
+
+def _nan_message(boundary, i):
+    """Message for a NAN value found by a file based boundary
+    at point id i
+    """
+
+    x,y = boundary.midpoint_coordinates[i,:]
+    msg = 'NAN value found in file_boundary at '
+    msg += 'point id #%d: (%.2f, %.2f).\n' % (i, x, y)
+
+    F = boundary.F
+    if (hasattr(F, 'indices_outside_mesh') and
+           len(F.indices_outside_mesh) > 0):
+        # Check if NAN point is due it being outside
+        # boundary defined in sww file.
+
+        if i in F.indices_outside_mesh:
+            msg += 'This point refers to one outside the '
+            msg += 'mesh defined by the file %s.\n' % F.filename
+            msg += 'Make sure that the file covers '
+            msg += 'the boundary segment it is assigned to '
+            msg += 'in set_boundary.'
+        else:
+            msg += 'This point is inside the mesh defined '
+            msg += 'the file %s.\n' % F.filename
+            msg += 'Check this file for NANs.'
+
+    return msg
+
+
+def _set_segment_boundary_values(domain, ids, q_bdry):
+    """Set the boundary values of the edges ids from the rows of q_bdry,
+    which has a column for each of the conserved or evolved quantities.
+    Evolved quantities not given are set to the edge values.
+    """
+
+    if q_bdry.shape[1] == len(domain.evolved_quantities):
+        quantities = domain.evolved_quantities
+    elif q_bdry.shape[1] == len(domain.conserved_quantities):
+        quantities = domain.conserved_quantities
+
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+        for name in domain.evolved_quantities:
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = Q.edge_values[vol_ids, edge_ids]
+    else:
+        msg = 'Boundary must return array of either conserved'
+        msg += ' or evolved quantities'
+        raise Exception(msg)
+
+    for j, name in enumerate(quantities):
+        Q = domain.quantities[name]
+        Q.boundary_values[ids] = q_bdry[:, j]
+
+
 
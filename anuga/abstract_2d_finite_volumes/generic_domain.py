@@ -31,6 +31,7 @@ from anuga.geometry.polygon import inside_polygon
 from anuga.abstract_2d_finite_volumes.util import get_textual_float
 from .quantity import Quantity
 import anuga.utilities.log as log
+from anuga.utilities.phase_timers import Phase_timers, Null_phase_timers
 import anuga
 
 import numpy as num
@@ -82,14 +83,18 @@ class Generic_Domain(object):
                  numproc=1,
                  number_of_full_nodes=None,
                  number_of_full_triangles=None,
-                 ghost_layer_width=2):
+                 ghost_layer_width=2,
+                 reorder_triangles=None):
 
         """Instantiate generic computational Domain.
 
         Input:
-          source:    Either a mesh filename or coordinates of mesh vertices.
-                     If it is a filename values specified for triangles will
-                     be overridden.
+          source:    Either a mesh filename, coordinates of mesh vertices
+                     or a prebuilt Mesh instance (e.g. restored with
+                     Mesh.from_state). If it is a filename values specified
+                     for triangles will be overridden. If it is a Mesh, the
+                     triangles, boundary and tagged_elements are taken from
+                     the mesh.
           triangles: Mesh connectivity (see mesh.py for more information)
           boundary:  See mesh.py for more information
 
@@ -100,6 +105,11 @@ class Generic_Domain(object):
 
           tagged_elements:
           ...
+
+          reorder_triangles: Renumber the triangles for better cache reuse,
+                             one of 'hilbert', 'morton' or 'rcm'
+                             (see mesh_reordering.py). None (the default)
+                             keeps the given numbering.
         """
 
         if verbose:
@@ -111,9 +121,12 @@ class Generic_Domain(object):
         number_of_full_nodes = None
         number_of_full_triangles = None
 
-        # Determine whether source is a mesh filename or coordinates
+        # Determine whether source is a mesh filename, a mesh or coordinates
+        mesh = None
         if isinstance(source, str):
             mesh_filename = source
+        elif isinstance(source, Mesh):
+            mesh = source
         else:
             coordinates = source
 
@@ -126,15 +139,42 @@ class Generic_Domain(object):
                                     use_cache=use_cache,
                                     verbose=verbose)
 
+        # Renumber the triangles (the SWW output and the parallel
+        # tri_l2g maps refer to the original numbering)
+        self.reordered_to_original = None
+        self.original_to_reordered = None
+        if reorder_triangles is not None and reorder_triangles is not False:
+            if mesh is not None:
+                msg = 'Triangles of a prebuilt mesh can not be reordered'
+                raise Exception(msg)
+
+            from .mesh_reordering import compute_triangle_ordering, \
+                reorder_triangles as reorder, invert_ordering
+
+            if verbose:
+                log.critical('Domain: Reorder triangles (%s)' % reorder_triangles)
+
+            reordered_to_original = compute_triangle_ordering(coordinates,
+                                                              triangles,
+                                                              method=reorder_triangles)
+            triangles, boundary, tagged_elements = \
+                reorder(triangles, boundary, tagged_elements, reordered_to_original)
+
+            self.reordered_to_original = reordered_to_original
+            self.original_to_reordered = invert_ordering(reordered_to_original)
+
         # Initialise underlying mesh structure
-        self.mesh = Mesh(coordinates, triangles,
-                         boundary=boundary,
-                         tagged_elements=tagged_elements,
-                         geo_reference=geo_reference,
-                         use_inscribed_circle=use_inscribed_circle,
-                         # number_of_full_nodes=number_of_full_nodes,
-                         # number_of_full_triangles=number_of_full_triangles,
-                         verbose=verbose)
+        if mesh is not None:
+            self.mesh = mesh
+        else:
+            self.mesh = Mesh(coordinates, triangles,
+                             boundary=boundary,
+                             tagged_elements=tagged_elements,
+                             geo_reference=geo_reference,
+                             use_inscribed_circle=use_inscribed_circle,
+                             # number_of_full_nodes=number_of_full_nodes,
+                             # number_of_full_triangles=number_of_full_triangles,
+                             verbose=verbose)
         
         if verbose:
             log.critical('Domain: Expose mesh attributes')
@@ -145,10 +185,6 @@ class Generic_Domain(object):
         self.centroid_coordinates = self.mesh.centroid_coordinates
         self.vertex_coordinates = self.mesh.vertex_coordinates
         self.edge_coordinates = self.mesh.edge_midpoint_coordinates
-        self.boundary = self.mesh.boundary
-        self.boundary_enumeration = self.mesh.boundary_enumeration
-        self.boundary_cells = self.mesh.boundary_cells
-        self.boundary_edges = self.mesh.boundary_edges
         self.neighbours = self.mesh.neighbours
         self.surrogate_neighbours = self.mesh.surrogate_neighbours
         self.neighbour_edges = self.mesh.neighbour_edges
@@ -158,8 +194,7 @@ class Generic_Domain(object):
         self.areas = self.mesh.areas
 
         self.number_of_boundaries = self.mesh.number_of_boundaries
-        self.boundary_length = self.mesh.boundary_length
-        self.tag_boundary_cells = self.mesh.tag_boundary_cells
+        self.expose_mesh_boundary()
         # self.number_of_full_nodes = self.mesh.number_of_full_nodes
         # self.number_of_full_triangles = self.mesh.number_of_full_triangles
         self.number_of_triangles_per_node = \
@@ -256,18 +291,30 @@ class Generic_Domain(object):
         self.communication_reduce_time = 0.0
         self.communication_broadcast_time = 0.0
 
+        # Wall clock timers for the phases of evolve (off by default)
+        self.phase_timers = Null_phase_timers()
+        self.phase_timers_file_format = None
+
+        # Take the steps between yields in compiled code (see set_batch_steps)
+        self.batch_steps = False
+
         # Setup Communication Buffers
         if verbose:
             log.critical('Domain: Set up communication buffers ')
 
         self.nsys = len(self.conserved_quantities)
         for key in self.full_send_dict:
+            # Contiguous int64 ids as used by ghost_buffer_ext
+            self.full_send_dict[key][0] = \
+                num.ascontiguousarray(self.full_send_dict[key][0], dtype=num.int64)
             buffer_shape = self.full_send_dict[key][0].shape[0]
             self.full_send_dict[key].append(num.zeros((buffer_shape,
                                                        self.nsys),
                                                       float))
 
         for key in self.ghost_recv_dict:
+            self.ghost_recv_dict[key][0] = \
+                num.ascontiguousarray(self.ghost_recv_dict[key][0], dtype=num.int64)
             buffer_shape = self.ghost_recv_dict[key][0].shape[0]
             self.ghost_recv_dict[key].append(num.zeros((buffer_shape,
                                                         self.nsys),
@@ -425,6 +472,20 @@ class Generic_Domain(object):
     def get_vertex_coordinates(self, *args, **kwargs):
         return self.mesh.get_vertex_coordinates(*args, **kwargs)
 
+    def get_reordered_to_original(self):
+        """Return the original ids of the triangles if they have been
+        reordered (see reorder_triangles), None otherwise.
+        """
+
+        return self.reordered_to_original
+
+    def get_original_to_reordered(self):
+        """Return the ids of the originally numbered triangles if they have
+        been reordered (see reorder_triangles), None otherwise.
+        """
+
+        return self.original_to_reordered
+
     def get_vertex_coordinate(self, *args, **kwargs):
         return self.mesh.get_vertex_coordinate(*args, **kwargs)
 
@@ -464,6 +525,38 @@ class Generic_Domain(object):
     def get_boundary_tags(self, *args, **kwargs):
         return self.mesh.get_boundary_tags(*args, **kwargs)
 
+    def expose_mesh_boundary(self):
+        """Expose the boundary arrays of the mesh
+        """
+
+        self.boundary_cells = self.mesh.boundary_cells
+        self.boundary_edges = self.mesh.boundary_edges
+        self.boundary_tag_ids = self.mesh.boundary_tag_ids
+        self.boundary_tags = self.mesh.boundary_tags
+        self.boundary_length = self.mesh.boundary_length
+        self.tag_boundary_cells = self.mesh.tag_boundary_cells
+
+    @property
+    def boundary(self):
+        """Dictionary of boundary tags keyed by (vol_id, edge_id), built
+        from the boundary arrays of the mesh when first used
+        """
+
+        return self.mesh.boundary
+
+    @boundary.setter
+    def boundary(self, boundary):
+        self.mesh.boundary = boundary
+        self.expose_mesh_boundary()
+
+    @property
+    def boundary_enumeration(self):
+        """Dictionary of boundary edge indices keyed by (vol_id, edge_id),
+        built from the boundary arrays of the mesh when first used
+        """
+
+        return self.mesh.boundary_enumeration
+
     def get_boundary_polygon(self, *args, **kwargs):
         return self.mesh.get_boundary_polygon(*args, **kwargs)
 
@@ -949,16 +1042,20 @@ class Generic_Domain(object):
         where the index is used as pointer to the boundary_values arrays
         within each quantity.
 
-        self.boundary:          (vol_id, edge_id): tag
-        boundary_map (input):   tag: boundary_object
+        self.boundary_tags:        tag_id: tag
+        boundary_map (input):      tag: boundary_object
         ----------------------------------------------
-        self.boundary_objects:  ((vol_id, edge_id), boundary_object)
+        self.boundary_tag_objects: tag_id: boundary_object
+
+        The boundary edges of each tag are given by self.tag_boundary_cells.
+        The list self.boundary_objects of ((vol_id, edge_id), boundary_object)
+        is only built when used.
 
         Pre-condition:
           self.boundary has been built.
 
         Post-condition:
-          self.boundary_objects is built
+          self.boundary_tag_objects is built
 
         If a tag from the domain doesn't appear in the input dictionary an
         exception is raised.
@@ -1014,28 +1111,13 @@ class Generic_Domain(object):
                 self.boundary_map[key] = boundary_map[key]
 
              
-        # FIXME (Ole): Try to remove the sorting. Everyhing works except three tests 
-        # in test_urs2sts (representing functionality not likely to be used anymore).
-        # All other tests and validations work without this sorting step.
-        x = list(self.boundary.keys())
-        x.sort()
-
-        # Loop through edges that lie on the boundary and associate them with
-        # callable boundary objects depending on their tags
-        self.boundary_objects = []
-        for k, (vol_id, edge_id) in enumerate(x):
-            tag = self.boundary[(vol_id, edge_id)]
-
+        # Associate the tags of the boundary edges with callable
+        # boundary objects (the boundary edges are ordered by
+        # (vol_id, edge_id))
+        tag_objects = []
+        for tag in self.boundary_tags:
             if tag in self.boundary_map:
-                B = self.boundary_map[tag]  # Get callable boundary object
-
-                if B is not None:
-                    self.boundary_objects.append(((vol_id, edge_id), B))
-                    # self.neighbours[vol_id, edge_id] = \
-                    # -len(self.boundary_objects)
-                else:
-                    pass
-                    # FIXME: Check and perhaps fix neighbour structure
+                tag_objects.append(self.boundary_map[tag])  # May be None
             else:
                 msg = 'ERROR (domain.py): Tag "%s" has not been ' % tag
                 msg += 'bound to a boundary object.\n'
@@ -1044,19 +1126,36 @@ class Generic_Domain(object):
                 msg += 'The tags are: %s' % self.get_boundary_tags()
                 raise Exception(msg)
 
+        self.boundary_tag_objects = tag_objects
+        self._boundary_objects = None
+
         # Add a flag which can be used to distinguish flux boundaries within
         # compute_fluxes_central
 
         # Initialise to zero (which means 'not a flux_boundary')
-        self.boundary_flux_type = self.boundary_edges * 0
-
-        # HACK to set the values of domain.boundary_flux
-        for k, ((vol_id, edge_id), B) in enumerate(self.boundary_objects):
-            # If Boundary set to Compute_fluxes_boundary identify as flux boundary
-            # print vol_id, edge_id, B
+        self.boundary_flux_type = num.zeros_like(self.boundary_edges)
 
+        # If Boundary set to Compute_fluxes_boundary identify as flux boundary
+        for tag, B in zip(self.boundary_tags, tag_objects):
             if isinstance(B, anuga.Compute_fluxes_boundary):
-                self.boundary_flux_type[k] = 1
+                self.boundary_flux_type[self.tag_boundary_cells[tag]] = 1
+
+    @property
+    def boundary_objects(self):
+        """List of ((vol_id, edge_id), boundary_object) of the boundary
+        edges which are bound to a boundary object, built when first used
+        """
+
+        if self._boundary_objects is None:
+            objects = self.boundary_tag_objects
+            self._boundary_objects = \
+                [((vol_id, edge_id), objects[i]) for vol_id, edge_id, i in
+                 zip(self.boundary_cells.tolist(),
+                     self.boundary_edges.tolist(),
+                     self.boundary_tag_ids.tolist())
+                 if objects[i] is not None]
+
+        return self._boundary_objects
 
     def set_tag_region(self, *args, **kwargs):
         """Set quantities based on a regional tag.
@@ -1197,6 +1296,79 @@ class Generic_Domain(object):
     def write_time(self, track_speeds=False):
         log.critical(self.timestepping_statistics(track_speeds))
 
+    def set_phase_timing(self, flag=True, file_format='json'):
+        """Switch on (or off) wall clock timers for the phases of evolve,
+        e.g. compute_fluxes, update_boundary, each fractional step operator,
+        ghost communication and storage.
+
+        The accumulated times and number of calls are reported by
+        timestepping_statistics and, if file_format is 'json' or 'csv',
+        written to <name>_phase_timers.<file_format> in the data directory
+        at the end of evolve.
+        """
+
+        if file_format not in [None, 'json', 'csv']:
+            msg = 'Unknown phase timers file format %s, use json, csv or None' % file_format
+            raise Exception(msg)
+
+        if flag:
+            if not self.phase_timers.enabled:
+                self.phase_timers = Phase_timers()
+        else:
+            self.phase_timers = Null_phase_timers()
+
+        self.phase_timers_file_format = file_format
+
+    def set_batch_steps(self, flag=True):
+        """Switch on (or off) taking the timesteps between yields in
+        compiled code, without returning to python for each step.
+
+        Only used when no python callbacks (operators, forcing terms,
+        boundaries or extrema monitoring) are needed between yields,
+        otherwise the steps are taken one at a time as usual.
+        """
+
+        self.batch_steps = bool(flag)
+
+    def get_batch_steps(self):
+
+        return self.batch_steps
+
+    def get_phase_timing(self):
+
+        return self.phase_timers.enabled
+
+    def get_phase_timers(self):
+        """Return list of (phase, time, calls) sorted by decreasing time
+        """
+
+        if not self.phase_timers.enabled:
+            return []
+
+        return self.phase_timers.get_phases()
+
+    def write_phase_timers(self, filename=None):
+        """Write the phase timers to filename (default
+        <name>_phase_timers.<file_format> in the data directory)
+        """
+
+        import os
+
+        if not self.phase_timers.enabled:
+            return
+
+        if filename is None:
+            if self.phase_timers_file_format is None:
+                return
+            filename = os.path.join(self.get_datadir(),
+                                    self.get_name() + '_phase_timers.' +
+                                    self.phase_timers_file_format)
+
+        self.phase_timers.write(filename,
+                                processor=self.processor,
+                                numproc=self.numproc,
+                                time=self.get_time())
+
     def timestepping_statistics(self,
                                 track_speeds=False,
                                 triangle_id=None,
@@ -1265,6 +1437,9 @@ class Generic_Domain(object):
         msg += ' (%ds)' % (walltime() - self.last_walltime)
         self.last_walltime = walltime()
 
+        if self.phase_timers.enabled:
+            msg += '\n' + self.phase_timers.statistics().rstrip('\n')
+
         if track_speeds is True:
             msg += '\n'
 
@@ -1424,11 +1599,12 @@ class Generic_Domain(object):
 
                 # Find range of boundary values for tag and q
                 maxval = minval = None
-                for i, ((vol_id, edge_id), B) in enumerate(self.boundary_objects):
-                    if self.boundary[(vol_id, edge_id)] == tag:
-                        v = q.boundary_values[i]
-                        if minval is None or v < minval: minval = v
-                        if maxval is None or v > maxval: maxval = v
+                if tag in self.tag_boundary_cells and \
+                   self.boundary_map.get(tag) is not None:
+                    ids = self.tag_boundary_cells[tag]
+                    if len(ids) > 0:
+                        minval = num.min(q.boundary_values[ids])
+                        maxval = num.max(q.boundary_values[ids])
 
                 if minval is None or maxval is None:
                     msg += ('        Sorry no information available about'
@@ -1801,8 +1977,6 @@ class Generic_Domain(object):
             # let's get out of here
             return
 
-        N = len(self)                             # Number of triangles
-        
         self.relative_yieldtime = self.relative_time + yieldstep     # set next relative yield time
         self.yieldtime = self.relative_yieldtime + self.starttime    # set next yield time
 
@@ -1820,6 +1994,12 @@ class Generic_Domain(object):
         # Update extrema if necessary (for reporting)
         self.update_extrema()
 
+        # Timestepping method, extrema monitoring and batch steps can only
+        # be changed between yields
+        evolve_one_step = self._get_evolve_one_step()
+        monitor_extrema = self.quantities_to_be_monitored is not None
+        batch_steps = self.batch_steps
+
         # Or maybe restore from latest checkpoint
         # if self.checkpoint is True:
         #     self.goto_latest_checkpoint()
@@ -1833,36 +2013,39 @@ class Generic_Domain(object):
             yield(self.get_time())      # Yield initial values
 
         while True:
-            initial_relative_time = self.relative_time
 
-            # Apply fluid flow fractional step
-            if self.get_timestepping_method() == 'euler':
-                self.evolve_one_euler_step(yieldstep, self.finaltime)
+            # Take all the steps up to the next yield in compiled code
+            # if possible (see set_batch_steps)
+            if batch_steps:
+                number_of_batch_steps = self.evolve_batch_steps(yieldstep, self.finaltime)
+            else:
+                number_of_batch_steps = 0
 
-            elif self.get_timestepping_method() == 'rk2':
-                self.evolve_one_rk2_step(yieldstep, self.finaltime)
+            if number_of_batch_steps == 0:
+                initial_relative_time = self.relative_time
 
-            elif self.get_timestepping_method() == 'rk3':
-                self.evolve_one_rk3_step(yieldstep, self.finaltime)
+                # Apply fluid flow fractional step
+                evolve_one_step(yieldstep, self.finaltime)
 
-            # Apply other fractional steps
-            self.apply_fractional_steps()
+                # Apply other fractional steps
+                self.apply_fractional_steps()
 
-            # Centroid Values of variables should be ok
+                # Centroid Values of variables should be ok
 
-            # Update time
-            #self.set_time(initial_time + self.timestep)
-            self.relative_time = initial_relative_time + self.timestep
+                # Update time
+                #self.set_time(initial_time + self.timestep)
+                self.relative_time = initial_relative_time + self.timestep
 
-            self.update_ghosts()
+                self.update_ghosts()
 
-            # Update extrema (only uses centroid values)
-            self.update_extrema()
+                # Update extrema (only uses centroid values)
+                if monitor_extrema:
+                    self.update_extrema()
 
-            self.number_of_steps += 1
+                self.number_of_steps += 1
 
-            if self._order_ == 1:
-                self.number_of_first_order_steps += 1
+                if self._order_ == 1:
+                    self.number_of_first_order_steps += 1
 
             #print(self.relative_time, self.get_time())
 
@@ -1909,7 +2092,37 @@ class Generic_Domain(object):
                 self.recorded_max_timestep = self.evolve_min_timestep
                 self.number_of_steps = 0
                 self.number_of_first_order_steps = 0
-                self.max_speed = num.zeros(N, float)
+                self.max_speed.fill(0.0)
+
+                evolve_one_step = self._get_evolve_one_step()
+                monitor_extrema = self.quantities_to_be_monitored is not None
+                batch_steps = self.batch_steps
+
+    def _get_evolve_one_step(self):
+        """Return the method taking one step of the timestepping method"""
+
+        timestepping_method = self.get_timestepping_method()
+
+        if timestepping_method == 'euler':
+            return self.evolve_one_euler_step
+        elif timestepping_method == 'rk2':
+            return self.evolve_one_rk2_step
+        elif timestepping_method == 'rk3':
+            return self.evolve_one_rk3_step
+
+        msg = 'Unknown timestepping method %s' % timestepping_method
+        raise Exception(msg)
+
+    def evolve_batch_steps(self, yieldstep, finaltime):
+        """Take all the timesteps up to the next yield (or final) time in
+        compiled code. Overridden by Domain subclasses supporting batch
+        steps (see set_batch_steps).
+
+        Returns the number of steps taken, 0 if batch steps are not possible
+        and the steps must be taken one at a time.
+        """
+
+        return 0
 
     def evolve_one_euler_step(self, yieldstep, finaltime):
         """One Euler Time Step
@@ -2294,6 +2507,8 @@ class Generic_Domain(object):
         quantity in domain.
         """
 
+        self.phase_timers.start('update_boundary')
+
         #import pdb; pdb.set_trace()
         for tag in self.tag_boundary_cells:
             B = self.boundary_map[tag]
@@ -2305,13 +2520,19 @@ class Generic_Domain(object):
 
             B.evaluate_segment(self, boundary_segment_edges)
 
+        self.phase_timers.stop('update_boundary')
+
     def compute_fluxes(self):
         msg = 'Method compute_fluxes must be overridden by Domain subclass'
         raise Exception(msg)
 
     def apply_fractional_steps(self):
+        timers = self.phase_timers
         for operator in self.fractional_step_operators:
+            label = getattr(operator, 'label', operator.__class__.__name__)
+            timers.start(label)
             operator()
+            timers.stop(label)
 
     def log_operator_timestepping_statistics(self):
         for operator in self.fractional_step_operators:
@@ -2367,6 +2588,33 @@ class Generic_Domain(object):
         self.recorded_min_timestep = min(timestep, self.recorded_min_timestep)
 
         # Protect against degenerate time steps
+        self._protect_against_degenerate_timesteps(timestep)
+
+        # NOTE: Here the timestep is redefined. This can lead to a timestep
+        #       being smaller than the self.recorded_min_timestep, which
+        #       confused me (GD).
+        #       The behaviour is good though, since then the
+        #       recorded_min_timestep reflects the mathematical constraints on
+        #       the timestep, EXCEPT the constraint that we yield at the
+        #       required time. Otherwise we would often have very small
+        #       recorded_min_timesteps simply because of we have to yield at a
+        #       given time
+
+        # Ensure that final time is not exceeded
+        if self.relative_finaltime is not None and self.relative_time + timestep > self.relative_finaltime:
+            timestep = self.relative_finaltime - self.relative_time
+
+        # Ensure that model time is aligned with yieldsteps
+        if self.relative_time + timestep > self.relative_yieldtime:
+            timestep = self.relative_yieldtime - self.relative_time
+
+        self.timestep = timestep
+
+    def _protect_against_degenerate_timesteps(self, timestep):
+        """Count consecutive timesteps smaller than evolve_min_timestep,
+        switching to first order (or failing) if there are too many.
+        """
+
         if timestep < self.evolve_min_timestep:
             # Number of consecutive small steps taken b4 taking action
             self.smallsteps += 1
@@ -2380,7 +2628,6 @@ class Generic_Domain(object):
                     msg += 'even after %d steps of 1 order scheme' \
                         % self.max_smallsteps
                     log.critical(msg)
-                    timestep = self.evolve_min_timestep  # Try enforce min_step
 
                     stats = self.timestepping_statistics(track_speeds=True)
                     log.critical(stats)
@@ -2394,26 +2641,6 @@ class Generic_Domain(object):
             if self._order_ == 1 and self.default_order == 2:
                 self._order_ = 2
 
-        # NOTE: Here the timestep is redefined. This can lead to a timestep
-        #       being smaller than the self.recorded_min_timestep, which
-        #       confused me (GD).
-        #       The behaviour is good though, since then the
-        #       recorded_min_timestep reflects the mathematical constraints on
-        #       the timestep, EXCEPT the constraint that we yield at the
-        #       required time. Otherwise we would often have very small
-        #       recorded_min_timesteps simply because of we have to yield at a
-        #       given time
-
-        # Ensure that final time is not exceeded
-        if self.relative_finaltime is not None and self.relative_time + timestep > self.relative_finaltime:
-            timestep = self.relative_finaltime - self.relative_time
-
-        # Ensure that model time is aligned with yieldsteps
-        if self.relative_time + timestep > self.relative_yieldtime:
-            timestep = self.relative_yieldtime - self.relative_time
-
-        self.timestep = timestep
-
     def compute_forcing_terms(self):
         """If there are any forcing functions driving the system
         they should be defined in Domain subclass and appended to
@@ -2423,9 +2650,13 @@ class Generic_Domain(object):
         # The parameter self.flux_timestep should be updated
         # by the forcing_terms to ensure stability
 
+        self.phase_timers.start('compute_forcing_terms')
+
         for f in self.forcing_terms:
             f(self)
 
+        self.phase_timers.stop('compute_forcing_terms')
+
     def update_conserved_quantities(self):
         """Update vectors of conserved quantities using previously
         computed fluxes and specified forcing functions.
@@ -2464,9 +2695,10 @@ class Generic_Domain(object):
             # Now store ghost as local id, global id, value
             Idg = self.ghost_recv_dict[iproc][0]
 
-            for i, q in enumerate(quantities):
-                Q_cv = self.quantities[q].centroid_values
-                num.put(Q_cv, Idg, num.take(Q_cv, Idf, axis=0))
+            from .ghost_buffer_ext import copy_ghost_values
+
+            centroid_values = [self.quantities[q].centroid_values for q in quantities]
+            copy_ghost_values(centroid_values, Idf, Idg)
 
 #    def update_special_conditions(self):
 #        """There may be a need to change the values of the conserved
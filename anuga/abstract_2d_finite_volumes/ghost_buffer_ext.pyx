@@ -0,0 +1,124 @@
+#cython: wraparound=False, boundscheck=False, cdivision=True, profile=False, nonecheck=False, overflowcheck=False, cdivision_warnings=False, unraisable_tracebacks=False
+import cython
+from libc.stdint cimport int64_t
+
+# import both numpy and the Cython declarations for numpy
+import numpy as np
+cimport numpy as np
+
+
+# Centroid values of the evolved quantities may be stored in single
+# precision (see set_precision of the shallow water domain), the
+# buffers are always double precision
+ctypedef fused state_t:
+	float
+	double
+
+
+cdef void _pack_values(state_t[::1] Q_cv, int64_t[::1] ids, double[:, ::1] buffer, int64_t i) noexcept nogil:
+
+	cdef int64_t j
+
+	for j in range(ids.shape[0]):
+		buffer[j, i] = Q_cv[ids[j]]
+
+
+cdef void _unpack_values(state_t[::1] Q_cv, int64_t[::1] ids, double[:, ::1] buffer, int64_t i) noexcept nogil:
+
+	cdef int64_t j
+
+	for j in range(ids.shape[0]):
+		Q_cv[ids[j]] = buffer[j, i]
+
+
+cdef void _copy_values(state_t[::1] Q_cv, int64_t[::1] full_ids, int64_t[::1] ghost_ids) noexcept nogil:
+
+	cdef int64_t j
+
+	for j in range(full_ids.shape[0]):
+		Q_cv[ghost_ids[j]] = Q_cv[full_ids[j]]
+
+
+cdef int _pack(list centroid_values, int64_t[::1] ids, double[:, ::1] buffer) except -1:
+
+	cdef int64_t i, n, nq
+
+	n = ids.shape[0]
+	nq = len(centroid_values)
+
+	assert buffer.shape[0] == n, "Mismatch in size of ids and buffer"
+	assert buffer.shape[1] >= nq, "Buffer has too few columns for the quantities"
+
+	for i in range(nq):
+		Q_cv = centroid_values[i]
+		if Q_cv.dtype == np.float32:
+			_pack_values[float](Q_cv, ids, buffer, i)
+		else:
+			_pack_values[double](Q_cv, ids, buffer, i)
+
+	return 0
+
+
+cdef int _unpack(list centroid_values, int64_t[::1] ids, double[:, ::1] buffer) except -1:
+
+	cdef int64_t i, n, nq
+
+	n = ids.shape[0]
+	nq = len(centroid_values)
+
+	assert buffer.shape[0] == n, "Mismatch in size of ids and buffer"
+	assert buffer.shape[1] >= nq, "Buffer has too few columns for the quantities"
+
+	for i in range(nq):
+		Q_cv = centroid_values[i]
+		if Q_cv.dtype == np.float32:
+			_unpack_values[float](Q_cv, ids, buffer, i)
+		else:
+			_unpack_values[double](Q_cv, ids, buffer, i)
+
+	return 0
+
+
+def pack_ghost_buffers(list centroid_values, list ids, list buffers):
+	"""Copy the centroid values of each quantity at the triangles ids[k]
+	into the columns of buffers[k], for all the (send) buffers in one call.
+	"""
+
+	cdef int64_t k
+
+	assert len(ids) == len(buffers), "Mismatch in number of ids and buffers"
+
+	for k in range(len(ids)):
+		_pack(centroid_values, ids[k], buffers[k])
+
+
+def unpack_ghost_buffers(list centroid_values, list ids, list buffers):
+	"""Copy the columns of buffers[k] into the centroid values of each
+	quantity at the triangles ids[k], for all the (receive) buffers in one call.
+	"""
+
+	cdef int64_t k
+
+	assert len(ids) == len(buffers), "Mismatch in number of ids and buffers"
+
+	for k in range(len(ids)):
+		_unpack(centroid_values, ids[k], buffers[k])
+
+
+def copy_ghost_values(list centroid_values, int64_t[::1] full_ids not None, int64_t[::1] ghost_ids not None):
+	"""Copy centroid values from the full triangles to the ghost triangles
+	of the same domain (e.g. periodic boundaries).
+	"""
+
+	cdef int64_t i, n
+
+	n = full_ids.shape[0]
+
+	assert ghost_ids.shape[0] == n, "Mismatch in size of full_ids and ghost_ids"
+
+	for i in range(len(centroid_values)):
+		Q_cv = centroid_values[i]
+		if Q_cv.dtype == np.float32:
+			_copy_values[float](Q_cv, full_ids, ghost_ids)
+		else:
+			_copy_values[double](Q_cv, full_ids, ghost_ids)
@@ -0,0 +1,262 @@
+"""Cache friendly renumbering of the triangles of a mesh.
+
+The flux and extrapolation kernels access the neighbours of each triangle,
+so triangles which are close in space should also be close in memory.
+Meshes produced by triangle come out in generator order which has poor
+locality. The orderings available are
+
+  'hilbert': sort the centroids along a Hilbert space filling curve
+  'morton':  sort the centroids along a Morton (z order) curve
+  'rcm':     reverse Cuthill-McKee ordering of the neighbour graph
+
+Only the triangles are renumbered, the nodes keep their numbering.
+
+An ordering is given by the array reordered_to_original, where
+reordered_to_original[k] is the original id of the k-th reordered triangle.
+Its inverse original_to_reordered maps original triangle ids to reordered
+ids.
+
+Usage:
+
+    domain = anuga.Domain(points, vertices, boundary, reorder_triangles='hilbert')
+"""
+
+import numpy as num
+
+reordering_methods = ['hilbert', 'morton', 'rcm']
+
+# Number of bits per coordinate of the space filling curves
+curve_order = 16
+
+
+def _integer_coordinates(points, order=curve_order):
+    """Scale points to integer coordinates in [0, 2**order)
+    """
+
+    points = num.asarray(points, float)
+
+    lower = points.min(axis=0)
+    extent = (points.max(axis=0) - lower).max()
+    if extent <= 0.0:
+        extent = 1.0
+
+    n = 2**order
+    ixy = ((points - lower)/extent*(n - 1)).astype(num.int64)
+
+    return ixy[:, 0], ixy[:, 1]
+
+
+def hilbert_index(points, order=curve_order):
+    """Return the distance of each point along a Hilbert curve
+    covering the bounding square of the points.
+    """
+
+    x, y = _integer_coordinates(points, order)
+    n = num.int64(2**order)
+
+    d = num.zeros(len(x), num.int64)
+    s = n//2
+    while s > 0:
+        rx = ((x & s) > 0).astype(num.int64)
+        ry = ((y & s) > 0).astype(num.int64)
+        d += s*s*((3*rx) ^ ry)
+
+        # Rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        x = num.where(flip, n - 1 - x, x)
+        y = num.where(flip, n - 1 - y, y)
+
+        swap = ry == 0
+        x, y = num.where(swap, y, x), num.where(swap, x, y)
+
+        s //= 2
+
+    return d
+
+
+def _spread_bits(v):
+    """Insert a zero bit between each of the lower 32 bits of v
+    """
+
+    v = v & 0x00000000FFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+
+    return v
+
+
+def morton_index(points, order=curve_order):
+    """Return the distance of each point along a Morton (z order) curve
+    covering the bounding square of the points.
+    """
+
+    x, y = _integer_coordinates(points, order)
+
+    return _spread_bits(x) | (_spread_bits(y) << 1)
+
+
+def triangle_neighbours(triangles):
+    """Return the (N,3) array of the neighbours of each triangle, the
+    neighbour across edge i being opposite vertex i, and -1 for
+    boundary edges.
+    """
+
+    triangles = num.asarray(triangles, num.int64)
+    N = len(triangles)
+
+    # Edge i is opposite vertex i
+    v0 = triangles[:, [1, 2, 0]].ravel()
+    v1 = triangles[:, [2, 0, 1]].ravel()
+    a = num.minimum(v0, v1)
+    b = num.maximum(v0, v1)
+
+    order = num.lexsort((b, a))
+    a = a[order]
+    b = b[order]
+
+    neighbours = -num.ones(3*N, num.int64)
+
+    same = (a[1:] == a[:-1]) & (b[1:] == b[:-1])
+    first = order[:-1][same]
+    second = order[1:][same]
+    neighbours[first] = second//3
+    neighbours[second] = first//3
+
+    return neighbours.reshape(N, 3)
+
+
+def reverse_cuthill_mckee(neighbours):
+    """Return the reverse Cuthill-McKee ordering of the graph given by the
+    neighbour array (negative entries are ignored).
+    """
+
+    neighbours = num.asarray(neighbours, num.int64)
+    N = len(neighbours)
+
+    rows = num.repeat(num.arange(N, dtype=num.int64), neighbours.shape[1])
+    cols = neighbours.ravel()
+    mask = cols >= 0
+    rows = rows[mask]
+    cols = cols[mask]
+
+    try:
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import reverse_cuthill_mckee as rcm
+    except ImportError:
+        pass
+    else:
+        graph = csr_matrix((num.ones(len(rows), num.int32), (rows, cols)), shape=(N, N))
+        return num.asarray(rcm(graph, symmetric_mode=True), num.int64)
+
+    return _reverse_cuthill_mckee_bfs(N, rows, cols)
+
+
+def _reverse_cuthill_mckee_bfs(N, rows, cols):
+    """Reverse Cuthill-McKee ordering of the graph with N nodes and edges
+    (rows[i], cols[i]) if scipy is not available: breadth first search from
+    a node of lowest degree in each connected component, visiting the
+    neighbours by increasing degree.
+    """
+
+    from collections import deque
+
+    degree = num.bincount(rows, minlength=N)
+    adjacency = [[] for _ in range(N)]
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        adjacency[i].append(j)
+    degree_list = degree.tolist()
+    for adjacent in adjacency:
+        adjacent.sort(key=degree_list.__getitem__)
+
+    visited = num.zeros(N, bool)
+    ordering = []
+    for start in num.argsort(degree, kind='stable').tolist():
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            ordering.append(i)
+            for j in adjacency[i]:
+                if not visited[j]:
+                    visited[j] = True
+                    queue.append(j)
+
+    return num.array(ordering[::-1], num.int64)
+
+
+def compute_triangle_ordering(nodes, triangles, method='hilbert'):
+    """Return the array reordered_to_original of a cache friendly
+    ordering of the triangles.
+
+    method is one of 'hilbert', 'morton' or 'rcm' (True gives 'hilbert').
+    """
+
+    if method is True:
+        method = 'hilbert'
+
+    if method not in reordering_methods:
+        msg = 'Triangle reordering method %s not supported, use one of %s' \
+              % (method, reordering_methods)
+        raise Exception(msg)
+
+    nodes = num.asarray(nodes, float)
+    triangles = num.asarray(triangles, num.int64)
+
+    if len(triangles) == 0:
+        return num.zeros(0, num.int64)
+
+    if method == 'rcm':
+        return reverse_cuthill_mckee(triangle_neighbours(triangles))
+
+    centroids = nodes[triangles].mean(axis=1)
+
+    if method == 'hilbert':
+        index = hilbert_index(centroids)
+    else:
+        index = morton_index(centroids)
+
+    return num.argsort(index, kind='stable').astype(num.int64)
+
+
+def invert_ordering(reordered_to_original):
+    """Return original_to_reordered from reordered_to_original
+    """
+
+    original_to_reordered = num.empty_like(reordered_to_original)
+    original_to_reordered[reordered_to_original] = \
+        num.arange(len(reordered_to_original), dtype=reordered_to_original.dtype)
+
+    return original_to_reordered
+
+
+def reorder_triangles(triangles, boundary, tagged_elements, reordered_to_original):
+    """Renumber the triangles, the boundary dictionary {(vol_id, edge): tag}
+    and the tagged_elements dictionary {tag: [vol_ids]} with the ordering
+    reordered_to_original.
+
+    Return the reordered triangles, boundary and tagged_elements.
+    """
+
+    original_to_reordered = invert_ordering(reordered_to_original)
+
+    new_triangles = num.asarray(triangles)[reordered_to_original]
+
+    new_boundary = None
+    if boundary is not None:
+        new_boundary = {}
+        for (vol_id, edge), tag in boundary.items():
+            new_boundary[int(original_to_reordered[vol_id]), edge] = tag
+
+    new_tagged_elements = None
+    if tagged_elements is not None:
+        new_tagged_elements = {}
+        for tag, elements in tagged_elements.items():
+            elements = num.asarray(elements, num.int64)
+            new_tagged_elements[tag] = num.sort(original_to_reordered[elements]).tolist()
+
+    return new_triangles, new_boundary, new_tagged_elements
@@ -56,9 +56,14 @@ class Mesh(General_mesh):
 
 
     Mesh takes the optional third argument boundary which is a
-    dictionary mapping from (element_id, edge_id) to boundary tag.
+    dictionary mapping from (element_id, edge_id) to boundary tag,
+    or the equivalent arrays (see boundary_to_arrays).
     The default value is None which will assign the default_boundary_tag
     as specified in config.py to all boundary edges.
+
+    The boundary is stored as arrays (boundary_cells, boundary_edges and
+    boundary_tag_ids indexing boundary_tags). The dictionaries boundary and
+    boundary_enumeration are only built when used.
     """
 
     #FIXME: Maybe rename coordinates to points (as in a poly file)
@@ -194,8 +199,69 @@ class Mesh(General_mesh):
 
     def __repr__(self):
         return General_mesh.__repr__(self) + ', %d boundary segments'\
-               %(len(self.boundary))
+               %(self.boundary_length)
+
+    # Precomputed arrays of a mesh (see get_state)
+    state_arrays = ['nodes', 'triangles', 'xy_extent',
+                    'normals', 'areas', 'edgelengths', 'radii',
+                    'centroid_coordinates', 'vertex_coordinates',
+                    'edge_midpoint_coordinates',
+                    'node_index', 'number_of_triangles_per_node',
+                    'vertex_value_indices',
+                    'neighbours', 'neighbour_edges', 'surrogate_neighbours',
+                    'number_of_boundaries',
+                    'boundary_cells', 'boundary_edges', 'boundary_tag_ids']
+
+    def get_state(self):
+        """Return the precomputed geometry and neighbour structure of the
+        mesh as a dictionary of arrays (and a few small values), from which
+        Mesh.from_state restores the mesh without rebuilding it.
+        """
+
+        state = {}
+        for name in self.state_arrays:
+            state[name] = getattr(self, name)
+
+        state['boundary_tags'] = self.boundary_tags
+        state['tagged_elements'] = self.tagged_elements
+        state['geo_reference'] = self.geo_reference
+        state['use_inscribed_circle'] = self.use_inscribed_circle
+
+        return state
+
+    @classmethod
+    def from_state(cls, state, verbose=False):
+        """Restore a mesh from the dictionary returned by get_state.
+
+        The arrays are used as given (they may for instance be memory mapped).
+        """
+
+        if verbose: log.critical('Mesh: Restoring from state')
+
+        mesh = cls.__new__(cls)
+
+        mesh.verbose = verbose
+        mesh.use_inscribed_circle = state['use_inscribed_circle']
+        mesh.geo_reference = state['geo_reference']
+
+        for name in cls.state_arrays:
+            setattr(mesh, name, state[name])
+
+        mesh.number_of_triangles = int(mesh.triangles.shape[0])
+        mesh.number_of_nodes = int(mesh.nodes.shape[0])
+
+        mesh.boundary_tags = list(state['boundary_tags'])
+        mesh.boundary_length = len(mesh.boundary_cells)
+        mesh._boundary = None
+        mesh._boundary_enumeration = None
+        mesh.build_tag_boundary_cells()
 
+        mesh.tagged_elements = state['tagged_elements']
+
+        mesh.lone_vertices = \
+            num.flatnonzero(num.asarray(mesh.number_of_triangles_per_node) == 0).tolist()
+
+        return mesh
 
     def set_to_inscribed_circle(self,safety_factor = 1):
         #FIXME phase out eventually
@@ -346,29 +412,111 @@ class Mesh(General_mesh):
 
 
     def build_boundary_dictionary(self, boundary=None):
-        """Build or check the dictionary of boundary tags.
-        self.boundary is a dictionary of tags,
+        """Build the boundary of the mesh from a dictionary of tags,
         keyed by volume id and edge:
         { (id, edge): tag, ... }
+        or from the equivalent arrays (ids, tag_ids, tags) as returned by
+        boundary_to_arrays. Exterior edges which are not tagged get the
+        default_boundary_tag.
+
+        The boundary is stored as arrays, sorted by (id, edge):
+        self.boundary_cells, self.boundary_edges and self.boundary_tag_ids,
+        the latter indexing the list of tags self.boundary_tags.
 
         Postconditions:
-        self.boundary is defined.
+        self.boundary is defined (as a dictionary built when first used).
         """
 
         from anuga.config import default_boundary_tag
 
-        #arr_neighbours = num.array(self.neighbours)
-
-        
         if boundary is None:
             boundary = {}
 
-        from .neighbour_mesh_ext import boundary_dictionary_construct
-        boundary = boundary_dictionary_construct(len(self), default_boundary_tag, self.neighbours, boundary)
+        if isinstance(boundary, dict):
+            ids, tag_ids, tags = boundary_to_arrays(boundary)
+        else:
+            ids, tag_ids, tags = boundary
+            ids = num.asarray(ids, int).reshape((-1, 2))
+            tag_ids = num.asarray(tag_ids, int)
+            tags = list(tags)
+
+        N = len(self)
+        bad = num.flatnonzero((ids[:,0] >= N) | (ids[:,1] >= 3))
+        msg = 'Segment (%d, %d) does not exist' % tuple(ids[bad[0]]) if len(bad) > 0 else ''
+        assert len(bad) == 0, msg
+
+        keys = 3*ids[:,0] + ids[:,1]
+
+        # Tag the remaining exterior edges with the default tag
+        exterior = num.flatnonzero(self.neighbours.ravel() < 0)
+        exterior = exterior[num.logical_not(num.isin(exterior, keys))]
+        if len(exterior) > 0:
+            if default_boundary_tag not in tags:
+                tags.append(default_boundary_tag)
+            default_id = tags.index(default_boundary_tag)
+
+            keys = num.concatenate((keys, exterior))
+            tag_ids = num.concatenate((tag_ids,
+                                       num.full(len(exterior), default_id, int)))
+
+        order = num.argsort(keys, kind='stable')
+        keys = keys[order]
+        tag_ids = tag_ids[order]
+
+        msg = 'Boundary segments must be unique'
+        assert num.all(num.diff(keys) > 0), msg
+
+        # Only keep the tags in use (in order of first use)
+        used = num.zeros(len(tags), bool)
+        used[tag_ids] = True
+        if not num.all(used):
+            new_ids = num.cumsum(used) - 1
+            tags = [tag for tag, u in zip(tags, used) if u]
+            tag_ids = new_ids[tag_ids]
+
+        self.boundary_cells = keys//3
+        self.boundary_edges = keys%3
+        self.boundary_tag_ids = tag_ids
+        self.boundary_tags = tags
+        self.boundary_length = len(keys)
+
+        # Dictionaries are built when used
+        self._boundary = None
+        self._boundary_enumeration = None
+
+    @property
+    def boundary(self):
+        """Dictionary of boundary tags, keyed by (id, edge), built from the
+        boundary arrays when first used
+        """
+
+        if self._boundary is None:
+            tags = self.boundary_tags
+            self._boundary = dict(zip(self._boundary_keys(),
+                                      [tags[i] for i in self.boundary_tag_ids.tolist()]))
+
+        return self._boundary
+
+    @boundary.setter
+    def boundary(self, boundary):
+        self.build_boundary_dictionary(boundary)
+        self.build_boundary_neighbours()
+
+    @property
+    def boundary_enumeration(self):
+        """Dictionary of boundary edge indices, keyed by (id, edge), built
+        from the boundary arrays when first used
+        """
+
+        if self._boundary_enumeration is None:
+            self._boundary_enumeration = \
+                dict(zip(self._boundary_keys(), range(self.boundary_length)))
+
+        return self._boundary_enumeration
 
-        self.boundary = boundary
-        self.boundary_length = len(self.boundary)
+    def _boundary_keys(self):
 
+        return zip(self.boundary_cells.tolist(), self.boundary_edges.tolist())
 
     def build_tagged_elements_dictionary(self, tagged_elements = None):
         """Build the dictionary of element tags.
@@ -444,75 +592,36 @@ class Mesh(General_mesh):
         counting down.
 
         Precondition:
-            self.boundary is defined.
+            The boundary arrays are defined.
         Post condition:
             neighbours array has unique negative indices for boundary
-            boundary_segments array imposes an ordering on segments
-            (not otherwise available from the dictionary)
-
+            boundary_cells and boundary_edges arrays impose an ordering
+            on segments
         """
 
-        if self.boundary is None:
+        if not hasattr(self, 'boundary_tag_ids'):
             msg = 'Boundary dictionary must be defined before '
             msg += 'building boundary structure'
             raise Exception(msg)
 
-        self.boundary_enumeration = {}
-
-
+        M = self.boundary_length
+        self.neighbours[self.boundary_cells, self.boundary_edges] = -num.arange(M) - 1
 
-        X = list(self.boundary.keys())
-        X.sort()
+        self.build_tag_boundary_cells()
 
-        #print 'X', X
-        index = -1
-        for id, edge in X:
-            self.neighbours[id, edge] = index
-
-            self.boundary_enumeration[id,edge] = -index -1 
-
-            index -= 1
-
-        # Now we know number of boundaries
-        M = len(self.boundary_enumeration)
-        self.boundary_cells = num.zeros((M,),int)
-        self.boundary_edges = num.zeros((M,),int)
-
-        for id, edge in X:
-            j = self.boundary_enumeration[id,edge]
-            self.boundary_cells[j] = id
-            self.boundary_edges[j] = edge
+    def build_tag_boundary_cells(self):
+        """For each tag create an array of boundary edge indices
+        """
 
-        # For each tag create list of boundary edges
         self.tag_boundary_cells = {}
-
-        tags = self.get_boundary_tags()
-
-        #print tags
-
-        for tag in tags:
-            self.tag_boundary_cells[tag] = []
-
-
-        for j in range(self.boundary_length):
-            id  = self.boundary_cells[j]
-            edge = self.boundary_edges[j]
-            tag = self.boundary[id, edge]
-            #print tag, id, edge
-            self.tag_boundary_cells[tag].append(j)
-
-
-        #print self.tag_boundary_cells
+        for i, tag in enumerate(self.boundary_tags):
+            self.tag_boundary_cells[tag] = num.flatnonzero(self.boundary_tag_ids == i)
 
     def get_boundary_tags(self):
         """Return list of available boundary tags
         """
 
-        tags = {}
-        for v in list(self.boundary.values()):
-            tags[v] = 1
-
-        return list(tags.keys())
+        return list(self.boundary_tags)
 
 
     def get_boundary_polygon(self, verbose=False):
@@ -539,7 +648,7 @@ class Mesh(General_mesh):
 
         # Start value across entire mesh
         mindist = num.sqrt(num.sum((pmax-pmin)**2))
-        for i, edge_id in list(self.boundary.keys()):
+        for i, edge_id in self._boundary_keys():
             # Find vertex ids for boundary segment
             if edge_id == 0: a = 1; b = 2
             if edge_id == 1: a = 2; b = 0
@@ -583,7 +692,7 @@ class Mesh(General_mesh):
 
         point_registry[tuple(p0)] = 0
 
-        while len(point_registry) < len(self.boundary):
+        while len(point_registry) < self.boundary_length:
             candidate_list = segments[tuple(p0)]
             if len(candidate_list) > 1:
                 # Multiple points detected (this will be the case for meshes
@@ -1046,7 +1155,7 @@ class Mesh(General_mesh):
 
 
         str += '  Boundary:\n'
-        str += '    Number of boundary segments == %d\n' %(len(self.boundary))
+        str += '    Number of boundary segments == %d\n' %(self.boundary_length)
         str += '    Boundary tags == %s\n' %self.get_boundary_tags()
         str += '------------------------------------------------\n'
 
@@ -1462,4 +1571,26 @@ def segment_midpoints(segments):
     return midpoints
 
 
+def boundary_to_arrays(boundary):
+    """Convert a boundary dictionary {(vol_id, edge_id): tag} to an
+    (n,2) array of the keys, an array of tag indices and the list of tags
+    (in order of first appearance)
+    """
+
+    tag_index = {}
+    tag_ids = [tag_index.setdefault(tag, len(tag_index))
+               for tag in boundary.values()]
+
+    ids = num.array(list(boundary.keys()), int).reshape((-1, 2))
+    tag_ids = num.array(tag_ids, int)
+
+    return ids, tag_ids, list(tag_index.keys())
+
+
+def arrays_to_boundary(ids, tag_ids, tags):
+    """Inverse of boundary_to_arrays
+    """
+
+    tag_list = [tags[i] for i in num.asarray(tag_ids).tolist()]
 
+    return dict(zip([tuple(i) for i in num.asarray(ids).tolist()], tag_list))
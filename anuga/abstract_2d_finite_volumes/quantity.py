@@ -17,6 +17,37 @@ import anuga.utilities.log as log
 
 import numpy as num
 
+# Value arrays which are float32 if the domain stores its evolved
+# quantities in single precision (see Domain.set_precision)
+state_arrays = ['vertex_values', 'edge_values', 'centroid_values',
+                'centroid_backup_values']
+
+
+def _double_precision_state(method):
+    """Run a quantity method on float64 copies of single precision value
+    arrays, as the quantity C extensions work in double precision.
+    """
+
+    def wrapper(self, *args, **kwargs):
+        if self.centroid_values.dtype == float:
+            return method(self, *args, **kwargs)
+
+        single = dict((name, getattr(self, name)) for name in state_arrays)
+        for name, values in single.items():
+            setattr(self, name, values.astype(float))
+
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            for name, values in single.items():
+                num.copyto(values, getattr(self, name))
+                setattr(self, name, values)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+
+    return wrapper
+
 
 class Quantity(object):
     """Class Quantity - Implements values at each triangular element
@@ -682,6 +713,7 @@ class Quantity(object):
     ##
     # @brief Compute interpolated values at edges and centroid.
     # @note vertex_values must be set before calling this.
+    @_double_precision_state
     def interpolate(self):
         """Compute interpolated values at edges and centroid
         Pre-condition: vertex_values have been set
@@ -690,12 +722,14 @@ class Quantity(object):
         interpolate(self)
 
 
+    @_double_precision_state
     def interpolate_from_vertices_to_edges(self):
         # Call correct module function (either from this module or C-extension)
 
         from .quantity_ext import interpolate_from_vertices_to_edges
         interpolate_from_vertices_to_edges(self)
 
+    @_double_precision_state
     def interpolate_from_edges_to_vertices(self):
         # Call correct module function (either from this module or C-extension)
 
@@ -2128,6 +2162,7 @@ class Quantity(object):
     #them.
     # Note, the naming of this function seems confusing - it seems to actually
     # update the 'node values' given a list of vertices.
+    @_double_precision_state
     def _set_vertex_values(self, vertex_list, A):
         """Go through list of unique vertices
         This is the common case e.g. when values
@@ -2155,7 +2190,8 @@ class Quantity(object):
     # Methods for outputting model results
     ############################################################################
 
-    def get_vertex_values(self, xy=True, smooth=None, centroid_averaging=None, precision=None):
+    def get_vertex_values(self, xy=True, smooth=None, centroid_averaging=None, precision=None,
+                          vertex_values=None, centroid_values=None):
         """Return vertex values like an OBJ format i.e. one value per node.
 
         The vertex values are returned as one sequence in the 1D float array A.
@@ -2177,6 +2213,10 @@ class Quantity(object):
         vertices 2.  This corresponds to the node coordinates obtained from the
         method general_mesh.get_vertex_coordinates()
 
+        If vertex_values (centroid_values) is given it is used in place of
+        self.vertex_values (self.centroid_values), e.g. to compute the
+        values from a copy saved earlier.
+
         Calling convention
         if xy is True:
            X, Y, A, V = get_vertex_values
@@ -2184,6 +2224,12 @@ class Quantity(object):
            A, V = get_vertex_values
         """
 
+        if vertex_values is None:
+            vertex_values = self.vertex_values
+
+        if centroid_values is None:
+            centroid_values = self.centroid_values
+
         if smooth is None:
             # Take default from domain
             try:
@@ -2211,12 +2257,12 @@ class Quantity(object):
             if centroid_averaging:
                 average_centroid_values(ensure_numeric(self.domain.vertex_value_indices),
                                     ensure_numeric(self.domain.number_of_triangles_per_node),
-                                    ensure_numeric(self.centroid_values),
+                                    ensure_numeric(centroid_values, float),
                                     A)
             else:
                 average_vertex_values(ensure_numeric(self.domain.vertex_value_indices),
                                     ensure_numeric(self.domain.number_of_triangles_per_node),
-                                    ensure_numeric(self.vertex_values),
+                                    ensure_numeric(vertex_values, float),
                                     A)
             A = A.astype(precision)
 
@@ -2224,7 +2270,7 @@ class Quantity(object):
             # Return disconnected internal vertex values
             V = self.domain.get_disconnected_triangles()
             points = self.domain.get_vertex_coordinates()
-            A = self.vertex_values.flatten().astype(precision)
+            A = vertex_values.flatten().astype(precision)
 
         # Return
         if xy is True:
@@ -2289,6 +2335,7 @@ class Quantity(object):
 
         return self.x_gradient, self.y_gradient
 
+    @_double_precision_state
     def update(self, timestep):
         # Call correct module function
         # (either from this module or C-extension)
@@ -2306,12 +2353,14 @@ class Quantity(object):
         
         return update(self, timestep)
 
+    @_double_precision_state
     def compute_gradients(self):
         # Call correct module function
         # (either from this module or C-extension)
         return compute_gradients(self)
 
 
+    @_double_precision_state
     def compute_local_gradients(self):
         # Call correct module function
         # (either from this module or C-extension)
@@ -2320,47 +2369,56 @@ class Quantity(object):
 
 
 
+    @_double_precision_state
     def limit(self):
         # Call correct module depending on whether
         # basing limit calculations on edges or vertices
         limit_old(self)
 
+    @_double_precision_state
     def limit_vertices_by_all_neighbours(self):
         # Call correct module function
         # (either from this module or C-extension)
         limit_vertices_by_all_neighbours(self)
 
+    @_double_precision_state
     def limit_edges_by_all_neighbours(self):
         # Call correct module function
         # (either from this module or C-extension)
         limit_edges_by_all_neighbours(self)
 
+    @_double_precision_state
     def limit_edges_by_neighbour(self):
         # Call correct module function
         # (either from this module or C-extension)
         limit_edges_by_neighbour(self)
 
+    @_double_precision_state
     def extrapolate_second_order(self):
         # Call correct module function
         # (either from this module or C-extension)
         compute_gradients(self)
         extrapolate_from_gradient(self)
 
+    @_double_precision_state
     def extrapolate_second_order_and_limit_by_edge(self):
         # Call correct module function
         # (either from this module or C-extension)
         extrapolate_second_order_and_limit_by_edge(self)
 
+    @_double_precision_state
     def extrapolate_second_order_and_limit_by_vertex(self):
         # Call correct module function
         # (either from this module or C-extension)
         extrapolate_second_order_and_limit_by_vertex(self)
 
+    @_double_precision_state
     def bound_vertices_below_by_constant(self, bound):
         # Call correct module function
         # (either from this module or C-extension)
         bound_vertices_below_by_constant(self, bound)
 
+    @_double_precision_state
     def bound_vertices_below_by_quantity(self, quantity):
         # Call correct module function
         # (either from this module or C-extension)
@@ -2372,12 +2430,19 @@ class Quantity(object):
     def backup_centroid_values(self):
         # Call correct module function
         # (either from this module or C-extension)
-        backup_centroid_values(self)
+        if self.centroid_values.dtype == float:
+            backup_centroid_values(self)
+        else:
+            num.copyto(self.centroid_backup_values, self.centroid_values)
 
     def saxpy_centroid_values(self, a, b):
         # Call correct module function
         # (either from this module or C-extension)
-        saxpy_centroid_values(self, a, b)
+        if self.centroid_values.dtype == float:
+            saxpy_centroid_values(self, a, b)
+        else:
+            num.copyto(self.centroid_values,
+                       a*self.centroid_values.astype(float) + b*self.centroid_backup_values)
 
 
 class Conserved_quantity(Quantity):
@@ -553,6 +553,52 @@ class Test_Domain(unittest.TestCase):
         for k, ((vol_id, edge_id), _) in enumerate(domain.boundary_objects):
             assert domain.neighbours[vol_id, edge_id] == -k-1
 
+    def test_boundary_objects_of_tags(self):
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0,0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0,0.0]
+
+        points = [a, b, c, d, e, f]
+        #bac, bce, ecf, dbe
+        vertices = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4] ]
+        boundary = { (0, 0): 'First',
+                     (0, 2): 'Second',
+                     (2, 0): 'Second',
+                     (2, 1): 'First',
+                     (3, 1): 'Third',
+                     (3, 2): 'Second'}
+
+        domain = Generic_Domain(points, vertices, boundary,
+                        conserved_quantities =\
+                        ['stage', 'xmomentum', 'ymomentum'])
+
+        Bd = anuga.Dirichlet_boundary([5,2,1])
+        Bf = anuga.Compute_fluxes_boundary()
+        domain.set_boundary({'First': Bd, 'Second': None, 'Third': Bf})
+
+        assert domain.boundary_tag_objects == [Bd, None, Bf]
+        assert domain.boundary_objects == [((0, 0), Bd), ((2, 1), Bd), ((3, 1), Bf)]
+        assert num.all(domain.boundary_flux_type == [0, 0, 0, 0, 1, 0])
+
+        domain.update_boundary()
+        assert num.all(domain.quantities['stage'].boundary_values[[0, 3]] == 5.0)
+
+        # All tags must be bound
+        domain2 = Generic_Domain(points, vertices, boundary,
+                        conserved_quantities =\
+                        ['stage', 'xmomentum', 'ymomentum'])
+        try:
+            domain2.set_boundary({'First': Bd, 'Second': None})
+        except Exception:
+            pass
+        else:
+            msg = 'Should have raised exception'
+            raise Exception(msg)
+
     def Xtest_error_when_boundary_tag_does_not_exist(self):
         """An error should be raised if an invalid tag is supplied to set_boundary().
         """
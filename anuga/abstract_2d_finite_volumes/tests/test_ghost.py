@@ -44,6 +44,76 @@ class Test_Domain(unittest.TestCase):
         assert num.all(domain.get_conserved_quantities(0, edge=1) == 0.)
 
 
+    def test_pack_unpack_ghost_buffers(self):
+
+        from anuga.abstract_2d_finite_volumes.ghost_buffer_ext import \
+            pack_ghost_buffers, unpack_ghost_buffers
+
+        Q = [num.arange(10, dtype=float), 10.0 + num.arange(10, dtype=float)]
+
+        ids = [num.array([3, 1, 7], num.int64), num.array([0, 9], num.int64)]
+        buffers = [num.zeros((3, 3)), num.zeros((2, 3))]
+
+        pack_ghost_buffers(Q, ids, buffers)
+
+        for Idf, X in zip(ids, buffers):
+            for i in range(2):
+                assert num.allclose(X[:, i], num.take(Q[i], Idf))
+            assert num.all(X[:, 2] == 0.0)
+
+        R = [num.zeros(10), num.zeros(10)]
+        unpack_ghost_buffers(R, ids, buffers)
+
+        for i in range(2):
+            for Idg in ids:
+                assert num.allclose(R[i][Idg], Q[i][Idg])
+            assert num.sum(R[i] != 0.0) == 5 - (i == 0)
+
+        # Buffers of the wrong size
+        try:
+            pack_ghost_buffers(Q, ids, buffers[::-1])
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Mismatched buffers should raise an error')
+
+    def test_update_ghosts(self):
+        """Full to ghost copies within a domain (as used by
+        periodic boundaries)
+        """
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0,0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0,0.0]
+
+        points = [a, b, c, d, e, f]
+        vertices = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        conserved_quantities = ['stage', 'xmomentum', 'ymomentum']
+
+        full_send_dict = {0 : [num.array([0, 1]), num.array([0, 1])]}
+        ghost_recv_dict = {0 : [num.array([2, 3]), num.array([2, 3])]}
+
+        domain = Generic_Domain(points, vertices, None,
+                        conserved_quantities, None, None,
+                        full_send_dict=full_send_dict,
+                        ghost_recv_dict=ghost_recv_dict)
+
+        assert domain.full_send_dict[0][0].dtype == num.int64
+
+        domain.set_quantity('stage', [1.0, 2.0, 0.0, 0.0], location='centroids')
+        domain.set_quantity('xmomentum', [3.0, 4.0, 0.0, 0.0], location='centroids')
+
+        domain.update_ghosts()
+
+        assert num.allclose(domain.quantities['stage'].centroid_values, [1.0, 2.0, 1.0, 2.0])
+        assert num.allclose(domain.quantities['xmomentum'].centroid_values, [3.0, 4.0, 3.0, 4.0])
+        assert num.allclose(domain.quantities['ymomentum'].centroid_values, 0.0)
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import numpy as num
+
+import anuga
+
+from anuga.abstract_2d_finite_volumes.mesh_reordering import \
+    compute_triangle_ordering, triangle_neighbours, _reverse_cuthill_mckee_bfs, \
+    hilbert_index, invert_ordering, reorder_triangles
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+from anuga.file.netcdf import NetCDFFile
+
+
+def shuffled_rectangular_cross(m, n, len1, len2, seed=17):
+    """Rectangular cross mesh with the triangles in random order
+    """
+
+    points, vertices, boundary = anuga.rectangular_cross(m, n, len1=len1, len2=len2)
+    vertices = num.array(vertices, int)
+
+    shuffle = num.random.RandomState(seed).permutation(len(vertices))
+    inverse = invert_ordering(shuffle)
+
+    vertices = vertices[shuffle]
+    boundary = dict(((int(inverse[vol_id]), edge), tag)
+                    for (vol_id, edge), tag in boundary.items())
+
+    return points, vertices, boundary
+
+
+def bandwidth(neighbours):
+    """Mean distance in memory between neighbouring triangles
+    """
+
+    ids = num.repeat(num.arange(len(neighbours)), 3)
+    neighbours = neighbours.ravel()
+    mask = neighbours >= 0
+
+    return num.mean(num.abs(ids[mask] - neighbours[mask]))
+
+
+class Test_mesh_reordering(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for name in ['reordering_original.sww', 'reordering_hilbert.sww']:
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_triangle_neighbours(self):
+
+        points, vertices, boundary = shuffled_rectangular_cross(5, 4, 5.0, 4.0)
+
+        mesh = Mesh(points, vertices, boundary)
+
+        assert num.all(triangle_neighbours(vertices) == num.maximum(mesh.neighbours, -1))
+
+    def test_hilbert_index(self):
+
+        # First order curve visits the quadrants in the order
+        # lower left, upper left, upper right, lower right
+        points = num.array([[1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]])
+
+        assert num.all(num.argsort(hilbert_index(points, order=1)) == [3, 2, 1, 0])
+
+    def test_orderings_improve_locality(self):
+
+        points, vertices, boundary = shuffled_rectangular_cross(20, 20, 1.0, 1.0)
+
+        neighbours = triangle_neighbours(vertices)
+        shuffled_bandwidth = bandwidth(neighbours)
+
+        for method in ['hilbert', 'morton', 'rcm']:
+            reordered_to_original = compute_triangle_ordering(points, vertices, method)
+
+            assert num.all(num.sort(reordered_to_original) == num.arange(len(vertices)))
+
+            new_vertices, new_boundary, _ = \
+                reorder_triangles(vertices, boundary, None, reordered_to_original)
+
+            assert bandwidth(triangle_neighbours(new_vertices)) < 0.2*shuffled_bandwidth
+
+        # Fallback rcm used if scipy is not available
+        N = len(vertices)
+        rows = num.repeat(num.arange(N), 3)
+        cols = neighbours.ravel()
+        mask = cols >= 0
+        ordering = _reverse_cuthill_mckee_bfs(N, rows[mask], cols[mask])
+
+        assert num.all(num.sort(ordering) == num.arange(N))
+        assert bandwidth(triangle_neighbours(vertices[ordering])) < 0.2*shuffled_bandwidth
+
+    def test_unknown_method(self):
+
+        points, vertices, boundary = anuga.rectangular_cross(2, 2)
+
+        try:
+            compute_triangle_ordering(points, vertices, 'unknown')
+        except Exception:
+            pass
+        else:
+            raise Exception('Unknown reordering method should raise an exception')
+
+    def test_domain_maps(self):
+
+        points, vertices, boundary = shuffled_rectangular_cross(6, 4, 6.0, 4.0)
+        tagged_elements = {'first': [0, 1, 2], 'last': [len(vertices) - 1]}
+
+        domain = anuga.Domain(points, vertices, boundary,
+                              tagged_elements=tagged_elements)
+        domain_reordered = anuga.Domain(points, vertices, boundary,
+                                        tagged_elements=tagged_elements,
+                                        reorder_triangles='hilbert')
+
+        assert domain.get_reordered_to_original() is None
+
+        r2o = domain_reordered.get_reordered_to_original()
+        o2r = domain_reordered.get_original_to_reordered()
+
+        assert num.all(r2o[o2r] == num.arange(len(vertices)))
+        assert num.all(domain_reordered.triangles == domain.triangles[r2o])
+        assert num.allclose(domain_reordered.centroid_coordinates,
+                            domain.centroid_coordinates[r2o])
+
+        # Boundary tags and tagged elements follow the triangles
+        for (vol_id, edge), tag in domain.boundary.items():
+            assert domain_reordered.boundary[int(o2r[vol_id]), edge] == tag
+
+        for tag, elements in tagged_elements.items():
+            assert num.all(num.sort(r2o[domain_reordered.get_tagged_elements()[tag]]) == elements)
+
+    def test_partition_maps(self):
+
+        from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+
+        points, vertices, boundary = shuffled_rectangular_cross(10, 6, 10.0, 6.0)
+
+        domain = anuga.Domain(points, vertices, boundary)
+        domain_reordered = anuga.Domain(points, vertices, boundary,
+                                        reorder_triangles='rcm')
+
+        # Parallel to serial map refers to the original numbering
+        for numprocs in [1, 3]:
+            nodes, triangles, boundary, triangles_per_proc, quantities, \
+                s2p_map, p2s_map = pmesh_divide_metis_with_map(domain_reordered, numprocs)
+
+            assert num.all(triangles == domain.triangles[p2s_map])
+
+            proc_sum = num.concatenate(([0], num.cumsum(triangles_per_proc)))
+            assert num.all(proc_sum[s2p_map[:, 0]] + s2p_map[:, 1] == invert_ordering(p2s_map))
+
+    def run_domain(self, reorder_triangles, name, smooth):
+
+        points, vertices, boundary = shuffled_rectangular_cross(10, 6, 10.0, 6.0)
+
+        domain = anuga.Domain(points, vertices, boundary,
+                              reorder_triangles=reorder_triangles)
+        domain.set_flow_algorithm('DE0')
+        domain.set_multiprocessor_mode(2)
+        domain.set_name(name)
+        domain.set_store_centroids(True)
+        domain.set_quantities_to_be_stored({'elevation': 1, 'stage': 2})
+        domain.smooth = smooth
+
+        domain.set_quantity('elevation', lambda x, y: -x/10.)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: -x/10. + 0.5*(x < 3.))
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([-0.5, 0., 0.])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.5):
+            pass
+
+        return domain
+
+    def check_evolve_and_sww(self, smooth):
+
+        domain = self.run_domain(None, 'reordering_original', smooth)
+        domain_reordered = self.run_domain('hilbert', 'reordering_hilbert', smooth)
+
+        o2r = domain_reordered.get_original_to_reordered()
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.allclose(domain_reordered.quantities[name].centroid_values[o2r],
+                                domain.quantities[name].centroid_values)
+
+        # Stored in the original numbering
+        fid = NetCDFFile('reordering_original.sww')
+        fid_reordered = NetCDFFile('reordering_hilbert.sww')
+
+        for name in ['x', 'y', 'volumes', 'elevation', 'stage', 'stage_c',
+                     'elevation_c']:
+            assert num.allclose(fid_reordered.variables[name][:],
+                                fid.variables[name][:]), name
+
+        fid.close()
+        fid_reordered.close()
+
+    def test_evolve_and_sww_smooth(self):
+
+        self.check_evolve_and_sww(True)
+
+    def test_evolve_and_sww_not_smooth(self):
+
+        self.check_evolve_and_sww(False)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_mesh_reordering)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
@@ -631,6 +631,68 @@ class Test_Mesh(unittest.TestCase):
         #    b = -k-1
         #    assert mesh.neighbours[vol_id, edge_id] == b
 
+    def test_boundary_arrays(self):
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0,0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0,0.0]
+
+        points = [a, b, c, d, e, f]
+
+        #bac, bce, ecf, dbe
+        vertices = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4] ]
+
+        boundary = { (3, 2): 'Sixth',
+                     (0, 0): 'First',
+                     (2, 0): 'Third',
+                     (0, 2): 'Second',
+                     (2, 1): 'Third'}
+
+        from anuga.config import default_boundary_tag
+
+        mesh = Mesh(points, vertices, boundary)
+
+        # Boundary edges are ordered by (vol_id, edge_id)
+        assert num.all(mesh.boundary_cells == [0, 0, 2, 2, 3, 3])
+        assert num.all(mesh.boundary_edges == [0, 2, 0, 1, 1, 2])
+        assert mesh.boundary_tags == ['Sixth', 'First', 'Third', 'Second',
+                                      default_boundary_tag]
+        assert num.all(mesh.boundary_tag_ids == [1, 3, 2, 2, 4, 0])
+        assert num.all(mesh.tag_boundary_cells['Third'] == [2, 3])
+        assert num.all(mesh.neighbours[mesh.boundary_cells, mesh.boundary_edges] ==
+                       [-1, -2, -3, -4, -5, -6])
+
+        # The dictionaries are built when used
+        assert mesh._boundary is None
+        assert mesh.boundary[(3, 1)] == default_boundary_tag
+        assert mesh.boundary_enumeration[(2, 1)] == 3
+
+        # The same mesh from arrays
+        mesh2 = Mesh(points, vertices, boundary_to_arrays(boundary))
+        assert mesh2.boundary == mesh.boundary
+        assert num.all(mesh2.boundary_tag_ids == mesh.boundary_tag_ids)
+
+        ids, tag_ids, tags = boundary_to_arrays(mesh.boundary)
+        assert arrays_to_boundary(ids, tag_ids, tags) == mesh.boundary
+
+        # Segments must exist
+        try:
+            Mesh(points, vertices, {(4, 0): 'First'})
+        except AssertionError:
+            pass
+        else:
+            msg = 'Should have raised exception'
+            raise Exception(msg)
+
+        # Reset the boundary
+        mesh.boundary = {(3, 1): 'Fifth'}
+        assert mesh.boundary[(3, 1)] == 'Fifth'
+        assert mesh.boundary[(0, 0)] == default_boundary_tag
+        assert mesh.get_boundary_tags() == ['Fifth', default_boundary_tag]
+        mesh.check_integrity()
+
 
 
 
@@ -1905,6 +1967,44 @@ class Test_Mesh(unittest.TestCase):
             #print ref_length, total_length
             assert num.allclose(total_length, ref_length)
 
+    def test_mesh_state(self):
+        """Restore a mesh from its state without rebuilding it
+        """
+
+        from anuga.abstract_2d_finite_volumes.generic_domain import Generic_Domain
+
+        points, vertices, boundary = rectangular(4, 3)
+        tagged_elements = {'middle': [5, 6, 7]}
+        mesh = Mesh(points, vertices, boundary,
+                    tagged_elements=tagged_elements,
+                    geo_reference=Geo_reference(56, 100.0, 200.0))
+
+        restored = Mesh.from_state(mesh.get_state())
+
+        for name in Mesh.state_arrays:
+            assert num.all(getattr(restored, name) == getattr(mesh, name))
+
+        assert restored.number_of_triangles == mesh.number_of_triangles
+        assert restored.number_of_nodes == mesh.number_of_nodes
+        assert restored.boundary == mesh.boundary
+        assert restored.boundary_length == mesh.boundary_length
+        assert restored.boundary_enumeration == mesh.boundary_enumeration
+        assert restored.boundary_tags == mesh.boundary_tags
+        for tag in mesh.boundary_tags:
+            assert num.all(restored.tag_boundary_cells[tag] == mesh.tag_boundary_cells[tag])
+        assert num.all(restored.tagged_elements['middle'] == [5, 6, 7])
+        assert restored.geo_reference == mesh.geo_reference
+        assert restored.lone_vertices == mesh.lone_vertices
+        assert sorted(vars(restored)) == sorted(vars(mesh))
+
+        restored.check_integrity()
+
+        # A domain can be built on the restored mesh
+        domain = Generic_Domain(restored)
+        assert domain.mesh is restored
+        assert domain.neighbours is mesh.neighbours
+        assert domain.get_boundary_tags() == mesh.get_boundary_tags()
+
 
 #-------------------------------------------------------------
 
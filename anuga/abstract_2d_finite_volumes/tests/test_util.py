@@ -332,6 +332,84 @@ class Test_Util(unittest.TestCase):
 
 
 
+    def test_spatio_temporal_file_function_time_window(self):
+        """Test that a file function reading a few timesteps at a time
+        from the sww file gives the same values as reading all of them
+        """
+
+        from anuga.abstract_2d_finite_volumes.file_function import \
+            Netcdf_time_series
+
+        points, vertices, boundary = rectangular(3, 3)
+        domain1 = Domain(points, vertices, boundary)
+
+        from anuga.utilities.numerical_tools import mean
+        domain1.reduction = mean
+        domain1.smooth = True
+
+        domain1.default_order = 2
+        domain1.store = True
+        domain1.set_datadir('.')
+        sww_file = 'spatio_temporal_time_window'
+        domain1.set_name(sww_file)
+
+        domain1.set_quantity('elevation', 0)
+        domain1.set_quantity('friction', 0)
+        domain1.set_quantity('stage', 0)
+
+        B0 = Dirichlet_boundary([0,0,0])
+        B6 = Dirichlet_boundary([0.6,0,0])
+        domain1.set_boundary({'left': B6, 'top': B6, 'right': B0, 'bottom': B0})
+
+        for t in domain1.evolve(yieldstep = 0.1, finaltime = 3):
+            pass
+
+        filename = domain1.get_name() + '.sww'
+
+        # Midpoints and vertices of the diagonal
+        interpolation_points = [[0.125, 0.125], [0.5, 0.5], [0.7, 0.4],
+                                [1.0, 1.0]]
+
+        f = file_function(filename, domain1,
+                          interpolation_points = interpolation_points,
+                          time_thinning = 2)
+        fw = file_function(filename, domain1,
+                           interpolation_points = interpolation_points,
+                           time_thinning = 2,
+                           time_window = 4)
+
+        assert isinstance(fw.quantities['stage'], Netcdf_time_series)
+        assert num.allclose(fw.get_time(), f.get_time())
+        assert fw.quantities_range == f.quantities_range
+
+        # Reads of the sww file, also those of the prefetch
+        # thread, must hold the netcdf lock
+        from anuga.file.netcdf import netcdf_lock
+
+        class Locked_reads(object):
+            def __init__(self, variable):
+                self.variable = variable
+                self.shape = variable.shape
+                self.owned = []
+
+            def __getitem__(self, key):
+                self.owned.append(netcdf_lock._is_owned())
+                return self.variable[key]
+
+        stage = fw.quantities['stage']
+        stage.variable = Locked_reads(stage.variable)
+
+        for t in num.linspace(0.0, f.get_time()[-1], 45):
+            for i in range(len(interpolation_points)):
+                assert num.allclose(fw(t, point_id=i), f(t, point_id=i))
+
+        assert len(stage.variable.owned) > 1
+        assert all(stage.variable.owned)
+
+        del f, fw
+        os.remove(filename)
+
+
     def test_spatio_temporal_file_function_different_origin(self):
         """Test that spatio temporal file function performs the correct
         interpolations in both time and space where space is offset by
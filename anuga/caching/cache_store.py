@@ -0,0 +1,400 @@
+"""Content addressed, size bounded store for cached function results.
+
+Numeric arrays in a result are written natively, either to a compressed
+.npz file or, without compression, to a directory of .npy files which are
+memory mapped when the entry is read back. The remainder of the result
+(its nesting of tuples, lists and dicts and any non array values) is
+pickled alongside the arrays.
+
+Entries are written under temporary names and renamed into place, so any
+number of processes (MPI ranks, ensemble members) may read and write the
+same cache directory. The modification time of an entry records when it
+was last used and the least recently used entries are evicted whenever
+the store exceeds its quota.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import hashlib
+import weakref
+
+import numpy as num
+import dill as pickler
+
+
+npz_suffix = '.npz'         # Compressed entries
+mmap_suffix = '.npd'        # Directories of memory mappable .npy files
+tmp_prefix = '.tmp_'        # Entries being written
+stale_age = 3600.0          # Seconds after which temporary files are removed
+digest_size = 20            # Bytes in array digests
+chunk_size = 2**24          # Bytes hashed per update of the digest
+
+
+# -----------------------------------------------------------------------------
+# Array digests
+
+_digest_memo = {}
+
+
+def _is_read_only(A):
+    """Return True if the contents of A can not change.
+
+    That is the case if A and the arrays it views are not writeable and
+    their memory is an immutable buffer (bytes, a read only mmap or a read
+    only memoryview). An array owning its memory may be made writeable
+    again, so it never counts as read only.
+    """
+
+    while isinstance(A, num.ndarray):
+        if A.flags.writeable:
+            return False
+        A = A.base
+
+    if A is None:
+        return False
+
+    if isinstance(A, bytes):
+        return True
+
+    try:
+        return memoryview(A).readonly
+    except TypeError:
+        return False
+
+
+def _forget_digest(key):
+    _digest_memo.pop(key, None)
+
+
+def array_digest(A):
+    """Return hex digest of the dtype, shape and contents of numpy array A.
+
+    The array buffer is streamed through blake2b in chunks. Digests of
+    arrays whose contents can not change (e.g. arrays memory mapped with
+    mode 'r' or made with frombuffer from bytes) are remembered for the
+    lifetime of the array.
+    """
+
+    key = id(A)
+    entry = _digest_memo.get(key)
+    if entry is not None and entry[0]() is A:
+        return entry[1]
+
+    h = hashlib.blake2b(digest_size=digest_size)
+    h.update(('%s%s' % (A.dtype.str, A.shape)).encode())
+
+    if A.dtype.hasobject:
+        h.update(repr(A.tolist()).encode())
+    else:
+        B = num.ascontiguousarray(A).reshape(-1).view(num.uint8)
+        for i in range(0, B.shape[0], chunk_size):
+            h.update(B[i:i+chunk_size])
+
+    digest = h.hexdigest()
+
+    if _is_read_only(A):
+        try:
+            ref = weakref.ref(A, lambda r, key=key: _forget_digest(key))
+        except TypeError:
+            pass
+        else:
+            _digest_memo[key] = (ref, digest)
+
+    return digest
+
+
+# -----------------------------------------------------------------------------
+# Splitting results into arrays and a picklable skeleton
+
+class _Array_slot(object):
+    """Placeholder for the i'th array of a stored result."""
+
+    def __init__(self, i):
+        self.i = i
+
+
+def _split(T, arrays):
+    """Replace numeric arrays in T by placeholders and collect them in arrays.
+    """
+
+    if type(T) in (num.ndarray, num.memmap) and not T.dtype.hasobject:
+        arrays.append(T)
+        return _Array_slot(len(arrays) - 1)
+    elif type(T) in (tuple, list):
+        return type(T)(_split(t, arrays) for t in T)
+    elif type(T) is dict:
+        return dict((k, _split(v, arrays)) for k, v in T.items())
+    else:
+        return T
+
+
+def _join(S, arrays):
+    """Inverse of _split."""
+
+    if isinstance(S, _Array_slot):
+        return arrays[S.i]
+    elif type(S) in (tuple, list):
+        return type(S)(_join(s, arrays) for s in S)
+    elif type(S) is dict:
+        return dict((k, _join(v, arrays)) for k, v in S.items())
+    else:
+        return S
+
+
+def _remove(path):
+    """Remove entry (file or directory) at path, ignoring missing entries."""
+
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+# -----------------------------------------------------------------------------
+
+class Cache_store(object):
+    """Directory of cached results with a least recently used size quota.
+
+    USAGE:
+      store = Cache_store(cachedir, max_bytes=2**30)
+      store.put(key, T)
+      T, found = store.get(key)
+
+    ARGUMENTS:
+      cachedir --    Directory holding the entries (created if needed)
+      max_bytes --   Maximal total size of the entries (Default: None, no limit)
+      max_entries -- Maximal number of entries (Default: None, no limit)
+
+    Keys must be valid file names. Values may be anything dill can pickle;
+    numeric arrays held directly or in (nested) tuples, lists and dicts are
+    stored natively.
+    """
+
+    def __init__(self, cachedir, max_bytes=None, max_entries=None):
+
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir, exist_ok=True)
+
+    def paths(self, key):
+        """Return paths of the compressed and memory mapped entries of key."""
+
+        base = os.path.join(self.cachedir, key)
+        return base + npz_suffix, base + mmap_suffix
+
+    def get(self, key):
+        """Return (T, True) if key is stored, otherwise (None, False).
+
+        Arrays of memory mapped entries are mapped copy on write, so that
+        modifying them does not change the stored entry. Unreadable entries
+        (e.g. truncated by a full disk or being replaced by another process)
+        are treated as missing and will be overwritten by the next put.
+        """
+
+        for path in self.paths(key):
+            try:
+                if path.endswith(npz_suffix):
+                    T = self._read_npz(path)
+                else:
+                    T = self._read_mmap(path)
+            except Exception:
+                continue
+
+            # Mark entry as recently used
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+            self.hits += 1
+            return T, True
+
+        self.misses += 1
+        return None, False
+
+    def put(self, key, T, compression=True):
+        """Store T under key and evict entries exceeding the quota.
+
+        If compression is True the entry is a compressed .npz file, otherwise
+        a directory of .npy files that are memory mapped on retrieval.
+        Returns the size of the entry in bytes.
+        """
+
+        arrays = []
+        skeleton = num.frombuffer(pickler.dumps(_split(T, arrays)), num.uint8)
+
+        npz_path, mmap_path = self.paths(key)
+
+        if compression:
+            fd, tmp = tempfile.mkstemp(prefix=tmp_prefix, suffix=npz_suffix,
+                                       dir=self.cachedir)
+            try:
+                with os.fdopen(fd, 'wb') as fid:
+                    num.savez_compressed(fid, skeleton=skeleton,
+                                         **self._array_names(arrays))
+                os.replace(tmp, npz_path)
+            except BaseException:
+                _remove(tmp)
+                raise
+
+            _remove(mmap_path)
+            size = os.path.getsize(npz_path)
+        else:
+            tmp = tempfile.mkdtemp(prefix=tmp_prefix, suffix=mmap_suffix,
+                                   dir=self.cachedir)
+            try:
+                num.save(os.path.join(tmp, 'skeleton.npy'), skeleton)
+                for name, A in self._array_names(arrays).items():
+                    num.save(os.path.join(tmp, name + '.npy'), A)
+            except BaseException:
+                _remove(tmp)
+                raise
+
+            size = self._size(tmp)
+
+            # Replace any previous entry. If another process renames its
+            # entry into place between the removal and our rename, ours
+            # is discarded as both hold the same result.
+            _remove(mmap_path)
+            try:
+                os.rename(tmp, mmap_path)
+            except OSError:
+                _remove(tmp)
+
+            _remove(npz_path)
+
+        self.evict()
+
+        return size
+
+    def remove(self, key):
+        """Remove the entries stored under key."""
+
+        for path in self.paths(key):
+            _remove(path)
+
+    def clear(self, prefix=''):
+        """Remove all entries whose keys start with prefix."""
+
+        for mtime, size, path in self.entries():
+            if os.path.basename(path).startswith(prefix):
+                _remove(path)
+
+    def entries(self):
+        """Return list of (mtime, size, path) of the stored entries."""
+
+        entries = []
+        for entry in os.scandir(self.cachedir):
+            if entry.name.startswith(tmp_prefix):
+                continue
+            if not entry.name.endswith((npz_suffix, mmap_suffix)):
+                continue
+
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.is_dir():
+                    size = self._size(entry.path)
+                else:
+                    size = entry.stat().st_size
+            except OSError:
+                # Removed by another process
+                continue
+
+            entries.append((mtime, size, entry.path))
+
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the quota is met.
+
+        Also removes temporary files left behind by writers that died.
+        """
+
+        now = time.time()
+        for entry in os.scandir(self.cachedir):
+            if entry.name.startswith(tmp_prefix):
+                try:
+                    if now - entry.stat().st_mtime > stale_age:
+                        _remove(entry.path)
+                except OSError:
+                    pass
+
+        if self.max_bytes is None and self.max_entries is None:
+            return
+
+        entries = self.entries()
+        entries.sort()
+
+        total = sum(size for mtime, size, path in entries)
+        count = len(entries)
+        for mtime, size, path in entries:
+            if (self.max_bytes is None or total <= self.max_bytes) and \
+               (self.max_entries is None or count <= self.max_entries):
+                break
+
+            _remove(path)
+            total -= size
+            count -= 1
+
+    def statistics(self):
+        """Return dictionary with the number and size of the stored entries
+        and the hits and misses of this store object.
+        """
+
+        entries = self.entries()
+
+        return {'entries': len(entries),
+                'bytes': sum(size for mtime, size, path in entries),
+                'hits': self.hits,
+                'misses': self.misses}
+
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _array_names(arrays):
+        return dict(('a%d' % i, A) for i, A in enumerate(arrays))
+
+    @staticmethod
+    def _size(path):
+        size = 0
+        for name in os.listdir(path):
+            size += os.path.getsize(os.path.join(path, name))
+        return size
+
+    @staticmethod
+    def _read_npz(path):
+        with num.load(path, allow_pickle=False) as data:
+            n = len(data.files) - 1
+            arrays = [data['a%d' % i] for i in range(n)]
+            S = pickler.loads(data['skeleton'].tobytes())
+
+        return _join(S, arrays)
+
+    @staticmethod
+    def _read_mmap(path):
+        skeleton = num.load(os.path.join(path, 'skeleton.npy'))
+        S = pickler.loads(skeleton.tobytes())
+
+        arrays = []
+        n = len(os.listdir(path)) - 1
+        for i in range(n):
+            name = os.path.join(path, 'a%d.npy' % i)
+            try:
+                A = num.load(name, mmap_mode='c')
+            except ValueError:
+                # Empty arrays can not be mapped
+                A = num.load(name)
+            arrays.append(A)
+
+        return _join(S, arrays)
@@ -63,6 +63,8 @@ from anuga.utilities import system_tools
 
 import numpy as num
 
+from .cache_store import Cache_store, array_digest
+
 cache_dir = '.python_cache'
 
 # Make default caching directory name
@@ -113,8 +115,13 @@ options = {
   'bin': True,           # Use binary format (more efficient)
   'compression': True,   # Use zlib compression
   'bytecode': True,      # Recompute if bytecode has changed
-  'expire': False        # Automatically remove files that have been accessed
+  'expire': False,       # Automatically remove files that have been accessed
                          # least recently
+  'backend': 'pickle',   # 'pickle': args, results and admin info in pickled
+                         # files. 'store': results in a Cache_store of .npz
+                         # files (or memory mapped .npy files if compression
+                         # is off) with least recently used eviction
+  'maxbytes': None       # Maximum total size of the 'store' backend in bytes
 }
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -283,6 +290,17 @@ def cache(my_F,
     New form of clear:
       cache(my_F,(arg1,...,argn), clear=True)
     clears cached data for particular combination my_F and args 
+
+  Cache store backend:
+    The call
+      set_option('backend', 'store')
+    keeps results in a Cache_store (see cache_store.py) instead of pickled
+    files. Arrays in results are stored as compressed .npz files or, with
+    compression=False, as .npy files which are memory mapped when retrieved.
+    The store is shared safely by concurrent processes and its least
+    recently used entries are evicted once it holds more than
+    options['maxfiles'] entries or options['maxbytes'] bytes.
+    Statistics are not written to the stats file for this backend.
       
   """
 
@@ -346,6 +364,10 @@ def cache(my_F,
   if return_filename:
     return(FN)
 
+  if options['backend'] == 'store':
+    return cache_in_store(CD, funcname, arghash, my_F, args, kwargs, deps,
+                          verbose, compression, evaluate, test, clear)
+
   if clear:
     for file_type in file_types:
       file_name = CD+FN+'_'+file_type
@@ -419,6 +441,100 @@ def cache(my_F,
 
 # -----------------------------------------------------------------------------
 
+def cache_in_store(CD, funcname, arghash, my_F, args, kwargs, deps, verbose,
+                   compression, evaluate, test, clear):
+  """Cache results of my_F in a Cache_store. Used by cache if
+  options['backend'] is 'store'.
+
+  USAGE:
+    T = cache_in_store(CD, funcname, arghash, my_F, args, kwargs, deps,
+                       verbose, compression, evaluate, test, clear)
+
+  ARGUMENTS:
+    As for cache, with
+    CD --       Cache directory (from checkdir)
+    funcname -- Name of my_F
+    arghash --  myhash of (args, kwargs)
+    deps --     Dependency statistics (from get_depstats)
+
+  DESCRIPTION:
+    The entry key is the function name followed by a digest of the arguments,
+    the dependency statistics and (if options['bytecode']) the bytecode of
+    my_F, so changes to any of these give a new entry and stale entries are
+    left to the eviction. The arguments, with arrays replaced by their
+    digests, are stored with the result and compared on retrieval to guard
+    against hash collisions.
+  """
+
+  import time
+
+  store = Cache_store(CD,
+                      max_bytes=options['maxbytes'],
+                      max_entries=options['maxfiles'])
+
+  if options['bytecode']:
+    bytecode = get_bytecode(my_F)
+  else:
+    bytecode = None
+  key = funcname + '_' + hash(str(arghash) + str(myhash((deps, bytecode))))
+
+  if clear:
+    store.remove(key)
+    if verbose is True:
+      log.critical('MESSAGE (caching): Entry %s deleted' % key)
+    return None
+
+  # Taken before evaluation in case the arguments are modified by my_F
+  signature = digest_arrays((args, kwargs))
+
+  if evaluate is True:
+    reason = 5
+  else:
+    t0 = time.time()
+    entry, found = store.get(key)
+    loadtime = time.time()-t0
+
+    if not found:
+      reason = 1
+    elif not compare(entry['args'], signature):
+      reason = 3
+    else:
+      T = entry['result']
+      deserialise_result(T, verbose)
+      if verbose is True:
+        log.critical('Caching: Retrieved result of %s from %s in %.2f s '
+                     '(computed in %.2f s)'
+                     % (funcname, key, loadtime, entry['comptime']))
+      return T
+
+  if test:  # Do not attempt to evaluate function
+    return None
+
+  if verbose is True:
+    msg1(funcname, args, kwargs, reason)
+
+  t0 = time.time()
+  T = my_F(*args, **kwargs)
+  comptime = time.time()-t0
+
+  if verbose is True:
+    msg2(funcname, args, kwargs, comptime, reason)
+
+  serialise_result(T)
+  try:
+    size = store.put(key,
+                     {'result': T, 'args': signature, 'comptime': comptime},
+                     compression)
+  finally:
+    deserialise_result(T, verbose)
+
+  if verbose is True:
+    log.critical('Caching: Stored %d bytes in %s' % (size, key))
+
+  return T
+
+# -----------------------------------------------------------------------------
+
 def cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
   """Generate statistics of caching efficiency.
 
@@ -959,39 +1075,7 @@ def CacheLookup(CD, FN, my_F, args, kwargs, deps, verbose, compression,
       else:   
         reason = 3 # Arguments have changed 
         
-  # PADARN NOTE 17/12/12: Adding a special case to handle the existence of a 
-  # FitInterpolate object. C Structures are serialised so they can be pickled.
-  #---------------------------------------------------------------------------
-  from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
-  
-  # Setup for quad_tree extension
-  #from anuga.utilities import compile
-  #if compile.can_use_C_extension('quad_tree_ext.c'):
-  #import quad_tree_ext
-  #else:
-  #    msg = "C implementation of quad tree extension not avaliable"
-  #    raise Exception(msg)
-
-  # Setup for sparse_matrix extension
-  #from anuga.utilities import compile
-  #if compile.can_use_C_extension('sparse_matrix_ext.c'):
-
-  #else:
-  #    msg = "C implementation of sparse_matrix extension not avaliable"
-  #    raise Exception(msg)
-
-  import anuga.utilities.sparse_matrix_ext as sparse_matrix_ext
-  import anuga.utilities.quad_tree_ext as quad_tree_ext
-  from anuga.geometry.aabb import AABB
-
-  if isinstance(T, FitInterpolate):
-    if hasattr(T,"D"):
-        T.D=sparse_matrix_ext.deserialise_dok(T.D)
-    if hasattr(T,"AtA"):
-        T.AtA=sparse_matrix_ext.deserialise_dok(T.AtA)
-    if hasattr(T,"root"):
-        T.build_quad_tree(verbose=verbose)
-  #---------------------------------------------------------------------------
+  deserialise_result(T, verbose)
 
   return((T, FN, Retrieved, reason, comptime, loadtime, compressed))
 
@@ -1014,7 +1098,7 @@ def clear_cache(CD, my_F=None, verbose=None):
     otherwise clear only files pertaining to my_F.
   """
 
-  import os, re
+  import os, re, shutil
    
   if CD[-1] != os.sep:
     CD = CD+os.sep
@@ -1034,7 +1118,10 @@ def clear_cache(CD, my_F=None, verbose=None):
       #RE = re.search('^' + funcname,file_name)  #Inefficient
       #if RE:
       if file_name[:len(funcname)] == funcname:
-        if unix:
+        if os.path.isdir(CD+file_name):
+          # Memory mapped entry of the store backend
+          shutil.rmtree(CD+file_name, ignore_errors=True)
+        elif unix:
           os.remove(CD+file_name)
         else:
           os.system('del '+CD+file_name)
@@ -1053,7 +1140,9 @@ def clear_cache(CD, my_F=None, verbose=None):
         
       if A == 'Y' or A == 'y':
         for file_name in file_names:
-          if unix:
+          if os.path.isdir(CD+file_name):
+            shutil.rmtree(CD+file_name, ignore_errors=True)
+          elif unix:
             os.remove(CD+file_name)
           else:
             os.system('del '+CD+file_name)
@@ -1136,25 +1225,7 @@ def save_results_to_cache(T, CD, FN, my_F, deps, comptime, funcname,
   import time, os, sys
   verbose = False
 
-  # PADARN NOTE 17/12/12: Adding a special case to handle the existence of a 
-  # FitInterpolate object. C Structures are serialised so they can be pickled.
-  #---------------------------------------------------------------------------
-  from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
-  
-  import anuga.utilities.quad_tree_ext as quad_tree_ext
-  import anuga.utilities.sparse_matrix_ext as sparse_matrix_ext
-  from anuga.geometry.aabb import AABB
-
-  if isinstance(T, FitInterpolate):
-    if hasattr(T,"D"):
-        T.D=sparse_matrix_ext.serialise_dok(T.D)
-    if hasattr(T,"AtA"):
-        T.AtA=sparse_matrix_ext.serialise_dok(T.AtA)
-    if hasattr(T,"root"):
-        T.root.root=None
-
-
-  #---------------------------------------------------------------------------
+  serialise_result(T)
 
   (datafile, compressed1) = myopen(CD+FN+'_'+file_types[0],'wb',compression)
   (admfile, compressed2) = myopen(CD+FN+'_'+file_types[2],'wb',compression)
@@ -1197,6 +1268,51 @@ def save_results_to_cache(T, CD, FN, my_F, deps, comptime, funcname,
 
 # -----------------------------------------------------------------------------
 
+def serialise_result(T):
+  """Prepare result T for pickling
+
+  USAGE:
+    serialise_result(T)
+
+  DESCRIPTION:
+    PADARN NOTE 17/12/12: Adding a special case to handle the existence of a
+    FitInterpolate object. C Structures are serialised so they can be pickled.
+    T is modified in place. deserialise_result reverses this.
+  """
+
+  from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
+  import anuga.utilities.sparse_matrix_ext as sparse_matrix_ext
+
+  if isinstance(T, FitInterpolate):
+    if hasattr(T,"D"):
+        T.D=sparse_matrix_ext.serialise_dok(T.D)
+    if hasattr(T,"AtA"):
+        T.AtA=sparse_matrix_ext.serialise_dok(T.AtA)
+    if hasattr(T,"root"):
+        T.root.root=None
+
+# -----------------------------------------------------------------------------
+
+def deserialise_result(T, verbose=False):
+  """Restore C structures of a result T prepared by serialise_result
+
+  USAGE:
+    deserialise_result(T, verbose)
+  """
+
+  from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
+  import anuga.utilities.sparse_matrix_ext as sparse_matrix_ext
+
+  if isinstance(T, FitInterpolate):
+    if hasattr(T,"D"):
+        T.D=sparse_matrix_ext.deserialise_dok(T.D)
+    if hasattr(T,"AtA"):
+        T.AtA=sparse_matrix_ext.deserialise_dok(T.AtA)
+    if hasattr(T,"root"):
+        T.build_quad_tree(verbose=verbose)
+
+# -----------------------------------------------------------------------------
+
 def load_from_cache(CD, FN, compression):
   """Load previously cached data from file FN
 
@@ -1471,10 +1587,8 @@ def myhash(T, ids=None):
       val = myhash(I, ids)
   elif isinstance(T, num.ndarray):
       #print('NUM')
-      T = num.array(T) # Ensure array is contiguous
-
-      # Use mean value for efficiency
-      val = hash(num.average(T.flat))
+      # Digest of the array contents, memoised for read only arrays
+      val = array_digest(T)
   elif callable(T):
       #print('CALLABLE')
 
@@ -1496,6 +1610,27 @@ def myhash(T, ids=None):
 
 
 
+def digest_arrays(T):
+  """Replace numeric arrays in (nested) tuples, lists and dicts by digests
+
+  USAGE:
+    digest_arrays(T)
+
+  DESCRIPTION:
+    Used to store a compact copy of the arguments of a cached function.
+  """
+
+  if isinstance(T, num.ndarray):
+    return ('ndarray', array_digest(T))
+  elif type(T) in (tuple, list):
+    return type(T)(digest_arrays(t) for t in T)
+  elif type(T) is dict:
+    return dict((k, digest_arrays(v)) for k, v in T.items())
+  else:
+    return T
+
+# -----------------------------------------------------------------------------
+
 def compare(A, B, ids=None):
     """Safe comparison of general objects
 
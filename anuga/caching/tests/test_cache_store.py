@@ -0,0 +1,246 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as num
+
+from anuga.caching import cache, set_option, options, myhash
+from anuga.caching.cache_store import Cache_store, array_digest
+
+
+def f_numeric(A, B):
+    """Operation on numeric arrays
+    """
+
+    return 3.1 * A + B + 1
+
+
+def f_mixed(A, n):
+    return {'x': A * n, 'info': ('mixed', n), 'list': [A, None]}
+
+
+class Test_cache_store(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp(prefix='anuga_store_')
+        self.backend = options['backend']
+
+    def tearDown(self):
+        set_option('backend', self.backend)
+        shutil.rmtree(self.cachedir, ignore_errors=True)
+
+    def test_array_digest(self):
+
+        A0 = num.arange(5) * 1.0
+        A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])
+
+        # Same average but different contents
+        assert array_digest(A0) != array_digest(A1)
+        assert myhash(A0) != myhash(A1)
+
+        # Same contents
+        assert array_digest(A0) == array_digest(A0.copy())
+
+        # Dtype and shape are part of the digest
+        assert array_digest(A0) != array_digest(A0.astype(num.float32))
+        assert array_digest(A0[:4]) != array_digest(A0[:4].reshape(2, 2))
+
+        # Non contiguous arrays digest their values
+        B = num.arange(12.0).reshape(3, 4)
+        assert array_digest(B[:, 1]) == array_digest(num.array([1.0, 5.0, 9.0]))
+
+    def test_array_digest_memo(self):
+
+        from anuga.caching.cache_store import _digest_memo
+
+        A = num.arange(10.0)
+        array_digest(A)
+        assert id(A) not in _digest_memo
+
+        # An array owning its data can be made writeable again,
+        # so its digest must not be memoised
+        A.flags.writeable = False
+        d = array_digest(A)
+        assert id(A) not in _digest_memo
+
+        A.flags.writeable = True
+        A[0] = 99.0
+        A.flags.writeable = False
+        assert array_digest(A) != d
+
+        # A read only view of a writeable array is not memoised
+        B = num.arange(10.0)
+        V = B[:]
+        V.flags.writeable = False
+        array_digest(V)
+        assert id(V) not in _digest_memo
+
+        # Arrays of immutable buffers are
+        C = num.frombuffer(num.arange(10.0).tobytes(), float)
+        d = array_digest(C)
+        assert _digest_memo[id(C)][1] == d
+        assert array_digest(C[2:]) == array_digest(num.arange(2.0, 10.0))
+
+        # Read only memory maps are
+        filename = os.path.join(self.cachedir, 'memo.npy')
+        num.save(filename, num.arange(10.0))
+        M = num.load(filename, mmap_mode='r')
+        d = array_digest(M)
+        assert _digest_memo[id(M)][1] == d
+
+        # Forgotten when the array is collected
+        key = id(C)
+        del C
+        assert key not in _digest_memo
+        del M
+
+    def test_put_get(self):
+
+        store = Cache_store(self.cachedir)
+
+        A = num.arange(6.0).reshape(2, 3)
+        T = f_mixed(A, 2)
+
+        for compression in [True, False]:
+            key = 'f_mixed_%d' % compression
+            store.put(key, T, compression)
+
+            R, found = store.get(key)
+            assert found
+            assert num.allclose(R['x'], T['x'])
+            assert R['info'] == ('mixed', 2)
+            assert num.allclose(R['list'][0], A)
+            assert R['list'][1] is None
+
+            if not compression:
+                # Memory mapped copy on write
+                assert isinstance(R['x'], num.memmap)
+                R['x'][:] = 0.0
+                R2, found = store.get(key)
+                assert num.allclose(R2['x'], T['x'])
+
+        R, found = store.get('missing')
+        assert not found and R is None
+
+        stats = store.statistics()
+        assert stats['entries'] == 2
+        assert stats['misses'] == 1
+
+        store.remove('f_mixed_1')
+        assert store.statistics()['entries'] == 1
+
+        store.clear()
+        assert store.statistics()['entries'] == 0
+
+    def test_eviction(self):
+
+        store = Cache_store(self.cachedir, max_entries=3)
+
+        now = time.time()
+        for i in range(4):
+            store.put('entry_%d' % i, num.zeros(100) + i)
+            path = store.paths('entry_%d' % i)[0]
+            os.utime(path, (now - 100 + i, now - 100 + i))
+
+        # entry_0 was least recently used
+        assert not store.get('entry_0')[1]
+
+        # Using entry_1 makes entry_2 the least recently used
+        assert store.get('entry_1')[1]
+        store.put('entry_4', num.zeros(100))
+        assert store.get('entry_1')[1]
+        assert not store.get('entry_2')[1]
+
+        # Size quota
+        size = max(size for mtime, size, path in store.entries())
+        store = Cache_store(self.cachedir, max_bytes=int(1.5 * size))
+        store.evict()
+        assert len(store.entries()) == 1
+
+        # Stale temporary files are removed
+        fd, tmp = tempfile.mkstemp(prefix='.tmp_', dir=self.cachedir)
+        os.close(fd)
+        os.utime(tmp, (now - 7200, now - 7200))
+        store.evict()
+        assert not os.path.exists(tmp)
+
+    def test_unreadable_entry(self):
+
+        store = Cache_store(self.cachedir)
+        store.put('bad', num.arange(1000.0))
+
+        path = store.paths('bad')[0]
+        with open(path, 'r+b') as fid:
+            fid.truncate(20)
+
+        R, found = store.get('bad')
+        assert not found
+
+        store.put('bad', num.arange(10.0))
+        R, found = store.get('bad')
+        assert found and num.allclose(R, num.arange(10.0))
+
+    def test_cache_with_store_backend(self):
+
+        set_option('backend', 'store')
+
+        A0 = num.arange(5) * 1.0
+        A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])
+        B = num.ones(5)
+
+        for comp in [True, False]:
+            cache(f_numeric, (A0, B), clear=True, cachedir=self.cachedir,
+                  compression=comp, verbose=False)
+
+            T = cache(f_numeric, (A0, B), test=True, cachedir=self.cachedir,
+                      compression=comp, verbose=False)
+            assert T is None
+
+            T1 = cache(f_numeric, (A0, B), cachedir=self.cachedir,
+                       compression=comp, verbose=False)
+            T2 = cache(f_numeric, (A0, B), test=True, cachedir=self.cachedir,
+                       compression=comp, verbose=False)
+            T3 = cache(f_numeric, (A1, B), cachedir=self.cachedir,
+                       compression=comp, verbose=False)
+
+            assert num.allclose(T1, f_numeric(A0, B))
+            assert num.allclose(T2, T1)
+            assert num.allclose(T3, f_numeric(A1, B))
+
+        # Clear all entries of f_numeric
+        cache(f_numeric, 'clear', cachedir=self.cachedir, verbose=False)
+        T = cache(f_numeric, (A0, B), test=True, cachedir=self.cachedir,
+                  verbose=False)
+        assert T is None
+
+    def test_cache_with_store_dependencies(self):
+
+        set_option('backend', 'store')
+
+        FN = os.path.join(self.cachedir, 'dependency.txt')
+        with open(FN, 'w') as fid:
+            fid.write('first')
+
+        A = num.arange(5) * 1.0
+        cache(f_numeric, (A, A), dependencies=[FN], cachedir=self.cachedir,
+              verbose=False)
+        T = cache(f_numeric, (A, A), dependencies=[FN], test=True,
+                  cachedir=self.cachedir, verbose=False)
+        assert T is not None
+
+        with open(FN, 'w') as fid:
+            fid.write('changed')
+
+        T = cache(f_numeric, (A, A), dependencies=[FN], test=True,
+                  cachedir=self.cachedir, verbose=False)
+        assert T is None
+
+
+################################################################################
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_cache_store)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -173,10 +173,11 @@ class Test_Caching(unittest.TestCase):
         A0 = num.arange(5) * 1.0
         B = ('x', 15)
         
-        # Create different A that hashes to the same address (having the same average)
+        # Create different A with the same average. This used to hash to
+        # the same address, but arrays are now hashed by their contents.
         A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])        
         
-        assert myhash(A0) == myhash(A1)
+        assert myhash(A0) != myhash(A1)
             
             
         # Test caching
@@ -209,6 +209,13 @@ optimised_gradient_limiter = True # Use hardwired gradient limiter
 points_file_block_line_size = 1e6 # Number of lines read in from a points file
                                   # when blocking
 
+sww_buffer_max_frames = 10        # Number of timesteps held in memory by a
+                                  # buffered sww writer before flushing
+sww_buffer_max_bytes = 2**28      # Memory budget (bytes) for buffered
+                                  # sww timesteps
+sww_async_queue_size = 2          # Number of staging buffers used by the
+                                  # asynchronous sww writer
+
 ################################################################################
 # NetCDF-specific type constants.  Used when defining NetCDF file variables.
 ################################################################################
@@ -70,7 +70,8 @@ def create_domain_from_regions(bounding_polygon,
                                minimum_triangle_angle=28.0,
                                fail_if_polygons_outside=True,
                                use_cache=False,
-                               verbose=False):
+                               verbose=False,
+                               reorder_triangles=None):
     
 
     """Create domain from bounding polygons and resolutions.
@@ -121,6 +122,10 @@ def create_domain_from_regions(bounding_polygon,
     :param fail_if_polygons_outside: If True (the default) Exception in thrown
         where interior polygons fall outside bounding polygon. If False, these
         will be ignored and execution continued.
+
+    :param reorder_triangles: renumber the triangles of the domain for better
+        cache reuse, one of 'hilbert', 'morton' or 'rcm'. None (the default)
+        keeps the numbering of the mesh generator.
     
     
     :return: shallow water domain instance
@@ -154,6 +159,7 @@ def create_domain_from_regions(bounding_polygon,
               'regionPtArea' : regionPtArea,
               'minimum_triangle_angle': minimum_triangle_angle,
               'fail_if_polygons_outside': fail_if_polygons_outside,
+              'reorder_triangles': reorder_triangles,
               'verbose': verbose} #FIXME (Ole): See ticket:14
 
     # Call underlying engine with or without caching
@@ -189,6 +195,7 @@ def _create_domain_from_regions(bounding_polygon,
                                 regionPtArea=None,
                                 minimum_triangle_angle=28.0,
                                 fail_if_polygons_outside=True,
+                                reorder_triangles=None,
                                 verbose=True):
     """_create_domain_from_regions - internal function.
 
@@ -214,7 +221,8 @@ def _create_domain_from_regions(bounding_polygon,
                              use_cache=False,
                              verbose=verbose)
 
-    domain = Domain(mesh_filename, use_cache=False, verbose=verbose)
+    domain = Domain(mesh_filename, use_cache=False, verbose=verbose,
+                    reorder_triangles=reorder_triangles)
 
 
     return domain
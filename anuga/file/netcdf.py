@@ -3,6 +3,7 @@
 
 from builtins import range
 from builtins import object
+import threading
 import numpy as num
 
 from anuga.coordinate_transforms.redfearn import \
@@ -22,6 +23,12 @@ lat_name = 'LAT'
 time_name = 'TIME'
 precision = netcdf_float # So if we want to change the precision its done here
 
+# The netcdf-c library is not thread safe and netCDF4 releases the GIL
+# during I/O. Threads of one process (the asynchronous sww writer and the
+# prefetch threads of file functions and rainfall time slices) must hold
+# this lock for all netcdf calls, as must the main thread while any of
+# those threads may be running. Reentrant so that locked helpers nest.
+netcdf_lock = threading.RLock()
 
 
 def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
@@ -58,10 +65,11 @@ def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
         return NetCDFFile(file_name, netcdf_mode)
 
     if using_netcdf4:
-        if netcdf_mode == 'wl' :
-            return Dataset(file_name, 'w', format='NETCDF3_64BIT')
-        else:
-            return Dataset(file_name, netcdf_mode, format='NETCDF3_64BIT')
+        with netcdf_lock:
+            if netcdf_mode == 'wl' :
+                return Dataset(file_name, 'w', format='NETCDF3_64BIT')
+            else:
+                return Dataset(file_name, netcdf_mode, format='NETCDF3_64BIT')
 
 
 
@@ -8,8 +8,11 @@ from anuga.coordinate_transforms.geo_reference import \
     ensure_geo_reference
 from .sts import Write_sts
 from anuga.config import minimum_storable_height as default_minimum_storable_height
+from anuga.config import sww_buffer_max_frames as default_buffer_max_frames
+from anuga.config import sww_buffer_max_bytes as default_buffer_max_bytes
+from anuga.config import sww_async_queue_size as default_async_queue_size
 from anuga.config import institution as default_institution
-from anuga.file.netcdf import NetCDFFile
+from anuga.file.netcdf import NetCDFFile, netcdf_lock
 import anuga.utilities.log as log
 from anuga.utilities.numerical_tools import ensure_numeric
 from anuga.config import max_float
@@ -75,6 +78,22 @@ class SWW_file(Data_format):
     2: Variable data: Conserved quantities. Stored once per timestep.
 
     All data is assumed to reside at vertex locations.
+
+    If the domain has store_buffered set (see Domain.set_store_buffering)
+    the file is kept open between calls to store_timestep and timesteps
+    are held in memory until either max_frames timesteps or max_bytes
+    of data have been collected. They are then written with one block
+    write per variable. Call close (or flush) to write out any pending
+    timesteps.
+
+    If the domain has store_asynchronous set (see
+    Domain.set_store_asynchronous) store_timestep only copies the
+    centroid and vertex values into one of queue_size preallocated
+    staging buffers. A writer thread then computes the stored values
+    and writes them to file. If all staging buffers are in use
+    store_timestep waits for the writer thread. Errors raised in the
+    writer thread are raised again by the next call to store_timestep
+    or close.
     """
 
     def __init__(self, domain,
@@ -109,6 +128,44 @@ class SWW_file(Data_format):
         else:
             self.timezone = 'UTC'
 
+        if hasattr(domain, 'store_buffered'):
+            self.store_buffered = domain.store_buffered
+            self.buffer_max_frames = domain.buffer_max_frames
+            self.buffer_max_bytes = domain.buffer_max_bytes
+        else:
+            self.store_buffered = False
+            self.buffer_max_frames = default_buffer_max_frames
+            self.buffer_max_bytes = default_buffer_max_bytes
+
+        if hasattr(domain, 'store_asynchronous'):
+            self.store_asynchronous = domain.store_asynchronous
+            self.queue_size = domain.async_queue_size
+        else:
+            self.store_asynchronous = False
+            self.queue_size = default_async_queue_size
+
+        # Triangle based arrays are stored in the original numbering
+        # of reordered domains
+        if hasattr(domain, 'original_to_reordered'):
+            self.original_to_reordered = domain.original_to_reordered
+        else:
+            self.original_to_reordered = None
+
+        # State of the buffered writer
+        self._fid = None
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._next_slice = None
+        self._last_time = None
+        self._monitored = None
+        self._frames_submitted = 0
+        self._frame_bytes = 0
+
+        # State of the asynchronous writer
+        self._thread = None
+        self._queue = None
+        self._free_staging = None
+        self._writer_error = None
 
         # Call parent constructor
         Data_format.__init__(self, domain, 'sww', mode)
@@ -138,64 +195,65 @@ class SWW_file(Data_format):
                     dynamic_c_quantities.append(q+'_c')
 
         # NetCDF file definition
-        fid = NetCDFFile(self.filename, mode)
-        if mode[0] == 'w':
-            description = 'Output from anuga.file.sww ' \
-                          'suitable for plotting'
-
-            self.writer = Write_sww(static_quantities,
-                                    dynamic_quantities,
-                                    static_c_quantities,
-                                    dynamic_c_quantities)
-
-            self.writer.store_header(fid,
-                                     domain.starttime,
-                                     self.number_of_volumes,
-                                     self.domain.number_of_nodes,
-                                     description=description,
-                                     institution=self.institution,
-                                     smoothing=domain.smooth,
-                                     order=domain.default_order,
-                                     sww_precision=self.precision,
-                                     timezone=self.timezone)
-
-            # Extra optional information
-            if hasattr(domain, 'texture'):
-                fid.texture = domain.texture
-
-            if domain.quantities_to_be_monitored is not None:
-                fid.createDimension('singleton', 1)
-                fid.createDimension('two', 2)
-
-                poly = domain.monitor_polygon
-                if poly is not None:
-                    N = len(poly)
-                    fid.createDimension('polygon_length', N)
-                    fid.createVariable('extrema.polygon',
-                                       self.precision,
-                                       ('polygon_length', 'two'))
-                    fid.variables['extrema.polygon'][:] = poly
-
-                interval = domain.monitor_time_interval
-                if interval is not None:
-                    fid.createVariable('extrema.time_interval',
-                                       self.precision,
-                                       ('two',))
-                    fid.variables['extrema.time_interval'][:] = interval
-
-                for q in domain.quantities_to_be_monitored:
-                    fid.createVariable(q + '.extrema', self.precision,
-                                       ('numbers_in_range',))
-                    fid.createVariable(q + '.min_location', self.precision,
-                                       ('numbers_in_range',))
-                    fid.createVariable(q + '.max_location', self.precision,
-                                       ('numbers_in_range',))
-                    fid.createVariable(q + '.min_time', self.precision,
-                                       ('singleton',))
-                    fid.createVariable(q + '.max_time', self.precision,
-                                       ('singleton',))
+        with netcdf_lock:
+            fid = NetCDFFile(self.filename, mode)
+            if mode[0] == 'w':
+                description = 'Output from anuga.file.sww ' \
+                              'suitable for plotting'
+
+                self.writer = Write_sww(static_quantities,
+                                        dynamic_quantities,
+                                        static_c_quantities,
+                                        dynamic_c_quantities)
+
+                self.writer.store_header(fid,
+                                         domain.starttime,
+                                         self.number_of_volumes,
+                                         self.domain.number_of_nodes,
+                                         description=description,
+                                         institution=self.institution,
+                                         smoothing=domain.smooth,
+                                         order=domain.default_order,
+                                         sww_precision=self.precision,
+                                         timezone=self.timezone)
+
+                # Extra optional information
+                if hasattr(domain, 'texture'):
+                    fid.texture = domain.texture
+
+                if domain.quantities_to_be_monitored is not None:
+                    fid.createDimension('singleton', 1)
+                    fid.createDimension('two', 2)
+
+                    poly = domain.monitor_polygon
+                    if poly is not None:
+                        N = len(poly)
+                        fid.createDimension('polygon_length', N)
+                        fid.createVariable('extrema.polygon',
+                                           self.precision,
+                                           ('polygon_length', 'two'))
+                        fid.variables['extrema.polygon'][:] = poly
+
+                    interval = domain.monitor_time_interval
+                    if interval is not None:
+                        fid.createVariable('extrema.time_interval',
+                                           self.precision,
+                                           ('two',))
+                        fid.variables['extrema.time_interval'][:] = interval
+
+                    for q in domain.quantities_to_be_monitored:
+                        fid.createVariable(q + '.extrema', self.precision,
+                                           ('numbers_in_range',))
+                        fid.createVariable(q + '.min_location', self.precision,
+                                           ('numbers_in_range',))
+                        fid.createVariable(q + '.max_location', self.precision,
+                                           ('numbers_in_range',))
+                        fid.createVariable(q + '.min_time', self.precision,
+                                           ('singleton',))
+                        fid.createVariable(q + '.max_time', self.precision,
+                                           ('singleton',))
 
-        fid.close()
+            fid.close()
 
     def store_connectivity(self):
         """Store information about nodes, triangles and static quantities
@@ -211,56 +269,74 @@ class SWW_file(Data_format):
         domain = self.domain
 
         # append to the NetCDF file
-        fid = NetCDFFile(self.filename, netcdf_mode_a)
-
-        # Get X, Y from one (any) of the quantities
-        Q = list(domain.quantities.values())[0]
-        X, Y, _, V = Q.get_vertex_values(xy=True, precision=self.precision)
-
-        # store the connectivity data
-        points = num.concatenate(
-            (X[:, num.newaxis], Y[:, num.newaxis]), axis=1)
-        self.writer.store_triangulation(fid,
-                                        points,
-                                        V.astype(num.float32),
-                                        points_georeference=domain.geo_reference)
-
-        if domain.parallel:
-            self.writer.store_parallel_data(fid,
-                                            domain.number_of_global_triangles,
-                                            domain.number_of_global_nodes,
-                                            domain.tri_full_flag,
-                                            domain.tri_l2g,
-                                            domain.node_l2g)
-
-        # Get names of static quantities
-        static_quantities = {}
-        static_quantities_centroid = {}
-
-        for name in self.writer.static_quantities:
-            Q = domain.quantities[name]
-            A, _ = Q.get_vertex_values(xy=False,
-                                       precision=self.precision)
-            static_quantities[name] = A
+        with netcdf_lock:
+            fid = NetCDFFile(self.filename, netcdf_mode_a)
+
+            # Get X, Y from one (any) of the quantities
+            Q = list(domain.quantities.values())[0]
+            X, Y, _, V = Q.get_vertex_values(xy=True, precision=self.precision)
+
+            if self.original_to_reordered is not None:
+                if domain.smooth:
+                    V = V[self.original_to_reordered]
+                else:
+                    X = self._to_original_order(X, vertices=True)
+                    Y = self._to_original_order(Y, vertices=True)
+
+            # store the connectivity data
+            points = num.concatenate(
+                (X[:, num.newaxis], Y[:, num.newaxis]), axis=1)
+            self.writer.store_triangulation(fid,
+                                            points,
+                                            V.astype(num.float32),
+                                            points_georeference=domain.geo_reference)
+
+            if domain.parallel:
+                self.writer.store_parallel_data(fid,
+                                                domain.number_of_global_triangles,
+                                                domain.number_of_global_nodes,
+                                                domain.tri_full_flag,
+                                                domain.tri_l2g,
+                                                domain.node_l2g)
+
+            # Get names of static quantities
+            static_quantities = {}
+            static_quantities_centroid = {}
+
+            for name in self.writer.static_quantities:
+                Q = domain.quantities[name]
+                A, _ = Q.get_vertex_values(xy=False,
+                                           precision=self.precision)
+                static_quantities[name] = self._to_original_order(A, vertices=True)
 
-        # print domain.quantities
-        # print self.writer.static_c_quantities
+            # print domain.quantities
+            # print self.writer.static_c_quantities
 
-        for name in self.writer.static_c_quantities:
-            Q = domain.quantities[name[:-2]]  # rip off _c from name
-            static_quantities_centroid[name] = Q.centroid_values
+            for name in self.writer.static_c_quantities:
+                Q = domain.quantities[name[:-2]]  # rip off _c from name
+                static_quantities_centroid[name] = \
+                    self._to_original_order(Q.centroid_values)
 
-        # Store static quantities
-        self.writer.store_static_quantities(fid, **static_quantities)
-        self.writer.store_static_quantities_centroid(
-            fid, **static_quantities_centroid)
+            # Store static quantities
+            self.writer.store_static_quantities(fid, **static_quantities)
+            self.writer.store_static_quantities_centroid(
+                fid, **static_quantities_centroid)
 
-        fid.close()
+            fid.close()
 
     def store_timestep(self):
         """Store time and time dependent quantities
         """
 
+        if self.store_buffered or self.store_asynchronous:
+            self._store_timestep_buffered()
+        else:
+            self._store_timestep_unbuffered()
+
+    def _store_timestep_unbuffered(self):
+        """Open the sww file, store the current timestep and close the file.
+        """
+
         #import types
         from time import sleep
         from os import stat
@@ -288,149 +364,469 @@ class SWW_file(Data_format):
             msg = 'File %s could not be opened for append' % self.filename
             raise DataFileNotOpenError(msg)
 
-        # Check to see if the file is already too big:
-        time = fid.variables['time'][:]
-
-        i = len(time) + 1
-        file_size = stat(self.filename)[6]
-        file_size_increase = file_size//i
-        if file_size + file_size_increase > self.max_size * 2**self.recursion:
-            # In order to get the file name and start time correct,
-            # I change the domain.filename and domain.starttime.
-            # This is the only way to do this without changing
-            # other modules (I think).
-
-            # Write a filename addon that won't break the anuga viewers
-            # (10.sww is bad)
-            filename_ext = '_time_%s' % self.domain.relative_time
-            filename_ext = filename_ext.replace('.', '_')
-
-            # Remember the old filename, then give domain a
-            # name with the extension
-            old_domain_filename = self.domain.get_name()
-            if not self.recursion:
-                self.domain.set_name(old_domain_filename + filename_ext)
-
-            # Temporarily change the domain starttime to the current time
-            old_domain_starttime = self.domain.starttime
-            self.domain.starttime = self.domain.get_time()
-
-            # Build a new data_structure.
-            next_data_structure = SWW_file(self.domain, mode=self.mode,
-                                           max_size=self.max_size,
-                                           recursion=self.recursion+1)
-            if not self.recursion:
-                log.critical('    file_size = %s' % file_size)
-                log.critical('    saving file to %s'
-                             % next_data_structure.filename)
-
-            # Set up the new data_structure
-            self.domain.writer = next_data_structure
-
-            # Store connectivity and first timestep
-            next_data_structure.store_connectivity()
-            next_data_structure.store_timestep()
-            fid.sync()
-            fid.close()
+        with netcdf_lock:
+            # Check to see if the file is already too big:
+            time = fid.variables['time'][:]
+
+            i = len(time) + 1
+            file_size = stat(self.filename)[6]
+            file_size_increase = file_size//i
+            if file_size + file_size_increase > self.max_size * 2**self.recursion:
+                # In order to get the file name and start time correct,
+                # I change the domain.filename and domain.starttime.
+                # This is the only way to do this without changing
+                # other modules (I think).
+
+                # Write a filename addon that won't break the anuga viewers
+                # (10.sww is bad)
+                filename_ext = '_time_%s' % self.domain.relative_time
+                filename_ext = filename_ext.replace('.', '_')
+
+                # Remember the old filename, then give domain a
+                # name with the extension
+                old_domain_filename = self.domain.get_name()
+                if not self.recursion:
+                    self.domain.set_name(old_domain_filename + filename_ext)
+
+                # Temporarily change the domain starttime to the current time
+                old_domain_starttime = self.domain.starttime
+                self.domain.starttime = self.domain.get_time()
+
+                # Build a new data_structure.
+                next_data_structure = SWW_file(self.domain, mode=self.mode,
+                                               max_size=self.max_size,
+                                               recursion=self.recursion+1)
+                if not self.recursion:
+                    log.critical('    file_size = %s' % file_size)
+                    log.critical('    saving file to %s'
+                                 % next_data_structure.filename)
+
+                # Set up the new data_structure
+                self.domain.writer = next_data_structure
+
+                # Store connectivity and first timestep
+                next_data_structure.store_connectivity()
+                next_data_structure.store_timestep()
+                fid.sync()
+                fid.close()
+
+                # Restore the old starttime and filename
+                self.domain.starttime = old_domain_starttime
+                self.domain.set_name(old_domain_filename)
+            else:
+                self.recursion = False
+
+                dynamic_quantities, dynamic_quantities_centroid = \
+                    self._get_dynamic_quantities()
+
+                # Store dynamic quantities
+                slice_index = self.writer.store_quantities(fid,
+                                                           time=self.domain.relative_time,
+                                                           sww_precision=self.precision,
+                                                           **dynamic_quantities)
+
+                # Store dynamic quantities
+                if self.store_centroids:
+                    self.writer.store_quantities_centroid(fid,
+                                                          slice_index=slice_index,
+                                                          sww_precision=self.precision,
+                                                          **dynamic_quantities_centroid)
+
+                # Update extrema if requested
+                self._store_extrema(fid)
+
+                # Flush and close
+                # fid.sync()
+                fid.close()
+
+    def _get_dynamic_quantities(self, snapshot=None):
+        """Return dictionaries of the vertex and centroid values of the
+        dynamic quantities as they are to be stored at the current time.
+
+        If snapshot is given (see _take_snapshot) the values are computed
+        from the copies held there instead of the domain quantities.
+        """
+
+        domain = self.domain
 
-            # Restore the old starttime and filename
-            self.domain.starttime = old_domain_starttime
-            self.domain.set_name(old_domain_filename)
+        def get_vertex_values(name, precision=None):
+            Q = domain.quantities[name]
+            if snapshot is None:
+                return Q.get_vertex_values(xy=False, precision=precision)
+            vertex_values, centroid_values = snapshot[name]
+            return Q.get_vertex_values(xy=False, precision=precision,
+                                       vertex_values=vertex_values,
+                                       centroid_values=centroid_values)
+
+        def get_centroid_values(name):
+            if snapshot is None:
+                return domain.quantities[name].centroid_values
+            return snapshot[name][1]
+
+        if 'stage' in self.writer.dynamic_quantities:
+            # Select only those values for stage,
+            # xmomentum and ymomentum (if stored) where
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
+
+            # Smoothing for the get_vertex_values will be obtained
+            # from the smooth setting in domain
+
+            w, _ = get_vertex_values('stage')
+            z, _ = get_vertex_values('elevation')
+
+            storable_indices = num.array(
+                w-z >= self.minimum_storable_height)
+
+            # print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
         else:
-            self.recursion = False
-            domain = self.domain
+            # Very unlikely branch
+            storable_indices = None  # This means take all
 
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
+        # Now store dynamic quantities
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
+
+        for name in self.writer.dynamic_quantities:
+            #netcdf_array = fid.variables[name]
+
+            A, _ = get_vertex_values(name, precision=self.precision)
+
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.choose(storable_indices, (z, A))
+
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get xmomentum where depth exceeds
+                    # minimum_storable_height
+
+                    # Define a zero vector of same size and type as A
+                    # for use with momenta
+                    null = num.zeros(num.size(A), A.dtype.char)
+                    A = num.choose(storable_indices, (null, A))
+
+            dynamic_quantities[name] = self._to_original_order(A, vertices=True)
+
+        for name in self.writer.dynamic_c_quantities:
+            dynamic_quantities_centroid[name] = \
+                self._to_original_order(get_centroid_values(name[:-2]))
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+    def _to_original_order(self, A, vertices=False):
+        """Return the triangle based array A in the original numbering of
+        the triangles of a reordered domain.
+
+        If vertices A holds the values at the vertices of the triangles as
+        returned by get_vertex_values, which are only triangle based if the
+        domain is not smooth.
+        """
+
+        if self.original_to_reordered is None:
+            return A
+
+        if vertices:
+            if self.domain.smooth:
+                return A
+            return A.reshape(-1, 3)[self.original_to_reordered].reshape(-1)
+
+        return A[self.original_to_reordered]
 
-            if 'stage' in self.writer.dynamic_quantities:
-                # Select only those values for stage,
-                # xmomentum and ymomentum (if stored) where
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
+    def _get_snapshot_names(self):
+        """Names of the domain quantities needed to compute the stored
+        dynamic quantities.
+        """
+
+        names = list(self.writer.dynamic_quantities)
+        if 'stage' in names:
+            names.append('elevation')
+        for name in self.writer.dynamic_c_quantities:
+            names.append(name[:-2])
+
+        return sorted(set(names))
+
+    def _take_snapshot(self, snapshot):
+        """Copy the current vertex and centroid values into the staging
+        buffer snapshot.
+        """
+
+        for name, (vertex_values, centroid_values) in snapshot.items():
+            Q = self.domain.quantities[name]
+            num.copyto(vertex_values, Q.vertex_values)
+            num.copyto(centroid_values, Q.centroid_values)
 
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
+    def _store_extrema(self, fid, monitored=None):
+        """Write monitored extrema (if requested) to the open file fid.
+
+        monitored defaults to domain.quantities_to_be_monitored
+        """
 
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
+        if monitored is None:
+            monitored = self.domain.quantities_to_be_monitored
+
+        if monitored is not None:
+            for q, info in list(monitored.items()):
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                        info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                        info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
+
+    def _open(self):
+        """Open the sww file for append and keep the handle for
+        subsequent buffered writes.
+        """
 
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)
+        if self._fid is not None:
+            return
 
-                storable_indices = num.array(
-                    w-z >= self.minimum_storable_height)
+        try:
+            self._fid = NetCDFFile(self.filename, netcdf_mode_a)
+        except IOError:
+            msg = 'File %s could not be opened for append' % self.filename
+            raise DataFileNotOpenError(msg)
 
-                # print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
+        with netcdf_lock:
+            time = self._fid.variables['time']
+            self._next_slice = len(time)
+            if self._next_slice > 0:
+                self._last_time = float(time[self._next_slice-1])
             else:
-                # Very unlikely branch
-                storable_indices = None  # This means take all
+                self._last_time = None
+        self._frames_submitted = self._next_slice
 
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
+        # Bytes added to the file by each timestep
+        names = self.writer.dynamic_quantities + self.writer.dynamic_c_quantities
+        self._frame_bytes = num.dtype(self.precision).itemsize * \
+            sum(int(num.prod(self._fid.variables[q].shape[1:])) for q in names)
 
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
+    def _store_timestep_buffered(self):
+        """Store the current timestep via the persistent file handle,
+        either directly, or by handing a snapshot to the writer thread.
+        """
 
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
+        from os import stat
+        import copy
+
+        self._raise_writer_error()
+        self._open()
+
+        # Check to see if the file (with the pending timesteps)
+        # is already too big. If so, write out the pending timesteps
+        # and let the unbuffered code start a new file.
+        i = self._frames_submitted + 1
+        pending = self._frames_submitted - self._next_slice
+        file_size = stat(self.filename)[6] + pending*self._frame_bytes
+        if file_size + file_size//i > self.max_size * 2**self.recursion:
+            self.close()
+            self._store_timestep_unbuffered()
+            return
+
+        self.recursion = False
+        self._frames_submitted += 1
+
+        time = self.domain.relative_time
+        monitored = copy.deepcopy(self.domain.quantities_to_be_monitored)
+
+        if self.store_asynchronous:
+            self._start_writer_thread()
+
+            # Blocks while all staging buffers are in use
+            snapshot = self._free_staging.get()
+            self._take_snapshot(snapshot)
+            self._queue.put((time, snapshot, monitored))
+        else:
+            dynamic_quantities, dynamic_quantities_centroid = \
+                self._get_dynamic_quantities()
+            self._store_frame(time, dynamic_quantities,
+                              dynamic_quantities_centroid, monitored)
+
+    def _store_frame(self, time, dynamic_quantities,
+                     dynamic_quantities_centroid, monitored):
+        """Add one timestep to the buffer, writing the buffer to file
+        once it exceeds either buffer_max_frames or buffer_max_bytes.
+        """
 
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
-
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds
-                        # minimum_storable_height
-
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
-
-                dynamic_quantities[name] = A
-
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
-
-            # Store dynamic quantities
-            slice_index = self.writer.store_quantities(fid,
-                                                       time=self.domain.relative_time,
-                                                       sww_precision=self.precision,
-                                                       **dynamic_quantities)
-
-            # Store dynamic quantities
-            if self.store_centroids:
-                self.writer.store_quantities_centroid(fid,
-                                                      slice_index=slice_index,
-                                                      sww_precision=self.precision,
-                                                      **dynamic_quantities_centroid)
-
-            # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in list(domain.quantities_to_be_monitored.items()):
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                            info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
-
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                            info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
-
-            # Flush and close
-            # fid.sync()
-            fid.close()
+        self._monitored = monitored
+
+        if self._last_time is not None and time <= self._last_time:
+            # Time already stored, as in checkpointing, so
+            # overwrite the stored timestep directly
+            self.flush()
+            with netcdf_lock:
+                slice_index = self.writer.store_quantities(self._fid,
+                                                           time=time,
+                                                           sww_precision=self.precision,
+                                                           **dynamic_quantities)
+                if self.store_centroids:
+                    self.writer.store_quantities_centroid(self._fid,
+                                                          slice_index=slice_index,
+                                                          sww_precision=self.precision,
+                                                          **dynamic_quantities_centroid)
+                self._store_extrema(self._fid, monitored)
+                self._next_slice = len(self._fid.variables['time'])
+            return
+
+        # Take copies as centroid_values are updated in place
+        frame = {}
+        for name, A in dynamic_quantities.items():
+            frame[name] = num.array(A, self.precision)
+        for name, A in dynamic_quantities_centroid.items():
+            frame[name] = num.array(A, self.precision)
+
+        self._buffer.append((time, frame))
+        self._buffer_bytes += sum(A.nbytes for A in frame.values())
+        self._last_time = time
+
+        if self.store_buffered:
+            max_frames = self.buffer_max_frames
+        else:
+            max_frames = 1
+
+        if len(self._buffer) >= max_frames or \
+                self._buffer_bytes >= self.buffer_max_bytes:
+            self.flush()
+
+    def _start_writer_thread(self):
+        """Allocate the staging buffers and start the writer thread
+        (if not already running).
+        """
+
+        import threading
+        import queue
+
+        if self._thread is not None:
+            return
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._free_staging = queue.Queue()
+        for _ in range(self.queue_size):
+            snapshot = {}
+            for name in self._get_snapshot_names():
+                Q = self.domain.quantities[name]
+                snapshot[name] = (num.empty_like(Q.vertex_values),
+                                  num.empty_like(Q.centroid_values))
+            self._free_staging.put(snapshot)
+
+        self._thread = threading.Thread(target=self._writer_loop,
+                                        name='sww_writer',
+                                        daemon=True)
+        self._thread.start()
+
+    def _writer_loop(self):
+        """Body of the writer thread: write queued snapshots until
+        the sentinel None is received.
+        """
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            time, snapshot, monitored = item
+            try:
+                # After an error just recycle the staging buffers
+                if self._writer_error is None:
+                    dynamic_quantities, dynamic_quantities_centroid = \
+                        self._get_dynamic_quantities(snapshot)
+                    with netcdf_lock:
+                        self._store_frame(time, dynamic_quantities,
+                                          dynamic_quantities_centroid,
+                                          monitored)
+            except Exception as e:
+                self._writer_error = e
+            finally:
+                self._free_staging.put(snapshot)
+
+    def _stop_writer_thread(self):
+        """Wait for the writer thread to write all queued snapshots.
+        """
+
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+
+        self._thread = None
+        self._queue = None
+        self._free_staging = None
+
+    def _raise_writer_error(self):
+        """Raise (once) an error that occurred in the writer thread.
+        """
+
+        if self._writer_error is not None:
+            error = self._writer_error
+            self._writer_error = None
+            raise error
+
+    def flush(self):
+        """Write all buffered timesteps to the sww file.
+        """
+
+        if not self._buffer:
+            return
+
+        self._open()
+
+        times = [time for time, _ in self._buffer]
+        quantities = {}
+        for name in self._buffer[0][1]:
+            quantities[name] = num.array([frame[name]
+                                          for _, frame in self._buffer])
+
+        with netcdf_lock:
+            self.writer.store_quantities_block(self._fid,
+                                               times,
+                                               slice_index=self._next_slice,
+                                               sww_precision=self.precision,
+                                               **quantities)
+
+            self._store_extrema(self._fid, self._monitored)
+            self._fid.sync()
+
+        self._next_slice += len(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def close(self):
+        """Write any buffered timesteps and close the sww file.
+
+        Waits for the writer thread (if any) to finish. Safe to call
+        more than once. A subsequent store_timestep will reopen the file.
+        """
+
+        self._stop_writer_thread()
+
+        if self._fid is not None:
+            try:
+                if self._writer_error is None:
+                    self.flush()
+            finally:
+                with netcdf_lock:
+                    self._fid.close()
+                self._fid = None
+                self._buffer = []
+                self._buffer_bytes = 0
+
+        self._raise_writer_error()
+
+    def __getstate__(self):
+        """Open file handles and threads cannot be pickled (e.g. when
+        checkpointing) so write out pending timesteps and drop them.
+        """
+
+        self.close()
+        return self.__dict__.copy()
 
 
 class Read_sww(object):
@@ -1090,6 +1486,56 @@ class Write_sww(Write_sts):
                 q_retyped = q_values.astype(sww_precision)
                 outfile.variables[q][slice_index] = q_retyped
 
+    def store_quantities_block(self,
+                               outfile,
+                               times,
+                               slice_index,
+                               sww_precision=num.float32,
+                               verbose=False,
+                               **quant):
+        """
+        Write a block of consecutive timesteps starting at slice_index.
+
+        times is the list of (relative) times of the timesteps and
+        **quant are 2D numpy arrays with dimensions
+        number_of_timesteps X number_of_points (or number_of_volumes
+        for centroid quantities), one for each dynamic quantity.
+
+        Each variable is written with a single block write and the
+        ranges of the dynamic (vertex) quantities are updated once.
+
+        Precondition:
+            store_triangulation and
+            store_header have been called.
+        """
+
+        slice_index = int(slice_index)
+        n = len(times)
+
+        outfile.variables['time'][slice_index:slice_index+n] = times
+
+        for q in self.dynamic_quantities + self.dynamic_c_quantities:
+            if q not in quant:
+                msg = 'Values for quantity %s was not specified in ' % q
+                msg += 'store_quantities_block so they cannot be stored.'
+                raise NewQuantity(msg)
+
+            q_values = ensure_numeric(quant[q])
+            outfile.variables[q][slice_index:slice_index+n] = \
+                q_values.astype(sww_precision)
+
+            if q in self.dynamic_quantities:
+                # This updates the _range values
+                q_range = outfile.variables[q + Write_sww.RANGE][:]
+                q_values_min = num.min(q_values)
+                if q_values_min < q_range[0]:
+                    outfile.variables[q + Write_sww.RANGE][0] = q_values_min
+                q_values_max = num.max(q_values)
+                if q_values_max > q_range[1]:
+                    outfile.variables[q + Write_sww.RANGE][1] = q_values_max
+
+        return slice_index + n
+
     def verbose_quantities(self, outfile):
         log.critical('------------------------------------------------')
         log.critical('More Statistics:')
@@ -1258,9 +1704,6 @@ def Xload_sww_as_domain(filename, boundary=None, t=None,
               'Perhaps use "fail_if_NaN=False and NaN_filler = ..."' % e
         raise DataDomainError(msg)
 
-    if boundary is not None:
-        domain.boundary = boundary
-
     domain.geo_reference = geo_reference
 
     for quantity in static_quantities:
@@ -42,8 +42,10 @@ from anuga.geospatial_data.geospatial_data import ensure_absolute
 from anuga.pmesh.mesh_quadtree import MeshQuadtree
 from anuga.fit_interpolate.general_fit_interpolate import FitInterpolate
 from anuga.abstract_2d_finite_volumes.file_function import file_function
+from anuga.file.netcdf import netcdf_lock
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a, epsilon
 from anuga.geometry.polygon import interpolate_polyline, in_and_outside_polygon
+from anuga.geometry.polygon import polyline_interpolation_weights
 import anuga.utilities.log as log
 
 
@@ -707,6 +709,29 @@ def interpolate_sww2csv(sww_file,
     csv_files.close_all()
 
 
+def _get_quantity_range(Q, thinning=1, block_size=None):
+    """Return [min, max] of the time series Q thinned by thinning,
+    reading block_size timesteps at a time if specified.
+    """
+
+    if len(Q.shape) < 2 or block_size is None:
+        if len(Q.shape) == 2 and thinning > 1:
+            Q = Q[::thinning]
+        q = num.asarray(Q[:]).flatten()
+        return [min(q), max(q)]
+
+    step = block_size*thinning
+    minq = maxq = None
+    for i in range(0, Q.shape[0], step):
+        q = num.asarray(Q[i:i+step:thinning])
+        if minq is None:
+            minq, maxq = q.min(), q.max()
+        else:
+            minq, maxq = min(minq, q.min()), max(maxq, q.max())
+
+    return [minq, maxq]
+
+
 class Interpolation_function(object):
     """Interpolation_interface - creates callable object f(t, id) or f(t, x, y)
     which is interpolated from time series defined at vertices of
@@ -731,6 +756,10 @@ class Interpolation_function(object):
         triangles:            nx3 array of indices into vertex_coordinates (int)
         interpolation_points: Nx2 array of coordinates to be interpolated to
         verbose:              Level of reporting
+        time_window:          Number of timesteps interpolated at a time
+                              (default all of them)
+        prefetch:             Interpolate the next time window in the
+                              background
 
     The quantities returned by the callable object are specified by
     the list quantities which must contain the names of the
@@ -761,12 +790,21 @@ class Interpolation_function(object):
                  time_thinning=1,
                  verbose=False,
                  gauge_neighbour_id=None,
-                 output_centroids=False):
+                 output_centroids=False,
+                 time_window=None,
+                 prefetch=True):
         """Initialise object and build spatial interpolation if required
 
         Time_thinning_number controls how many timesteps to use. Only timesteps
         with index%time_thinning_number == 0 will used, or in other words a
         value of 3, say, will cause the algorithm to use every third time step.
+
+        If time_window is None the values at the interpolation points are
+        precomputed for all timesteps. Otherwise only time_window timesteps
+        around the model time are interpolated at a time, and the arrays of
+        quantities (which may be netcdf variables) are read as required.
+        If prefetch is True the next window is interpolated in a separate
+        thread.
         """
 
         from anuga.config import time_format
@@ -811,12 +849,27 @@ class Interpolation_function(object):
                          % time_thinning)
 
 
+        if time_window is not None:
+            if interpolation_points is None:
+                # Nothing is precomputed so there is nothing to window
+                time_window = None
+            elif int(time_window) < 1:
+                msg = 'time_window must be a positive number of timesteps. '
+                msg += 'I got %s' % str(time_window)
+                raise Exception(msg)
+            else:
+                time_window = int(time_window)
+
         # Thin timesteps if needed
         # Note array() is used to make the thinned arrays contiguous in memory
+        # The time series to be interpolated are thinned when they are
+        # read, one block of timesteps at a time
         self.time = num.array(time[::time_thinning])
-        for name in quantity_names:
-            if len(quantities[name].shape) == 2:
-                quantities[name] = num.array(quantities[name][::time_thinning,:])
+        self.time_thinning = time_thinning
+        if interpolation_points is None:
+            for name in quantity_names:
+                if len(quantities[name].shape) == 2:
+                    quantities[name] = num.array(quantities[name][::time_thinning,:])
 
         if verbose is True:
             log.critical('Interpolation_function: precomputing')
@@ -824,8 +877,12 @@ class Interpolation_function(object):
         # Save for use with statistics
         self.quantities_range = {}
         for name in quantity_names:
-            q = quantities[name][:].flatten()
-            self.quantities_range[name] = [min(q), max(q)]
+            if interpolation_points is None:
+                thinning = 1 # Already thinned
+            else:
+                thinning = time_thinning
+            self.quantities_range[name] = \
+                _get_quantity_range(quantities[name], thinning, time_window)
 
         self.quantity_names = quantity_names
         self.vertex_coordinates = vertex_coordinates
@@ -835,6 +892,14 @@ class Interpolation_function(object):
         self.precomputed_values = {}
         self.centroids = []
 
+        # Timesteps of precomputed_values are window_start to window_end
+        self.time_window = time_window
+        self.prefetch = prefetch
+        self.window_start = 0
+        self.window_end = len(self.time)
+        self._prefetch_thread = None
+        self._prefetched = None
+
         # Precomputed spatial interpolation if requested
         if interpolation_points is not None:
             #no longer true. sts files have spatial = True but
@@ -926,14 +991,11 @@ class Interpolation_function(object):
             m = len(self.interpolation_points)
             p = len(self.time)
 
-            for name in quantity_names:
-                self.precomputed_values[name] = num.zeros((p, m), float)
-
             if verbose is True:
                 log.critical('Build interpolator')
 
-
-            # Build interpolator
+            # Build the interpolation matrix once. It maps the values at
+            # the source points at one timestep to the interpolation points
             if triangles is not None and vertex_coordinates is not None:
                 if verbose:
                     msg = 'Building interpolation matrix from source mesh '
@@ -947,55 +1009,53 @@ class Interpolation_function(object):
                                        triangles,
                                        verbose=verbose)
 
+                A, _, outside_indices, self.centroids = \
+                    interpol._build_interpolation_matrix_A(self.interpolation_points,
+                                                           output_centroids,
+                                                           verbose=verbose)
+                self.interpolation_matrix = Sparse_CSR(A)
+                self.outside_indices = num.array(outside_indices, int)
+
             elif triangles is None and vertex_coordinates is not None:
                 if verbose:
                     log.critical('Interpolation from STS file')
 
-
-
-            if verbose:
-                log.critical('Interpolating (%d interpolation points, %d timesteps).'
-                             % (self.interpolation_points.shape[0], self.time.shape[0]))
-
-                if time_thinning > 1:
-                    log.critical('Timesteps were thinned by a factor of %d'
-                                 % time_thinning)
-                else:
-                    log.critical()
-
-            for i, t in enumerate(self.time):
-                # Interpolate quantities at this timestep
-                #if verbose and i%((p+10)/10) == 0:
+                # Each interpolation point lies between two sts gauges
+                node_ids, weights = \
+                    polyline_interpolation_weights(vertex_coordinates,
+                                                   gauge_neighbour_id,
+                                                   self.interpolation_points)
+                self.interpolation_matrix = Sparse_CSR(None,
+                                                       weights.flatten(),
+                                                       node_ids.flatten(),
+                                                       num.arange(0, 2*m+1, 2),
+                                                       m,
+                                                       len(vertex_coordinates))
+                self.outside_indices = num.zeros(0, int)
+
+            if time_window is None:
                 if verbose:
-                    log.critical('  time step %d of %d' % (i, p))
+                    log.critical('Interpolating (%d interpolation points, %d timesteps).'
+                                 % (m, p))
 
-                for name in quantity_names:
-                    if len(quantities[name].shape) == 2:
-                        Q = quantities[name][i,:] # Quantities at timestep i
+                    if time_thinning > 1:
+                        log.critical('Timesteps were thinned by a factor of %d'
+                                     % time_thinning)
                     else:
-                        Q = quantities[name][:]   # No time dependency
+                        log.critical()
 
-                    #if verbose and i%((p+10)/10) == 0:
-                    if verbose:
-                        log.critical('    quantity %s, size=%d' % (name, len(Q)))
-
-                    # Interpolate
-                    if triangles is not None and vertex_coordinates is not None:
-                        result = interpol.interpolate(Q,
-                                                      point_coordinates=\
-                                                      self.interpolation_points,
-                                                      verbose=False,
-                                                      output_centroids=output_centroids)
-                        self.centroids = interpol.centroids
-                    elif triangles is None and vertex_coordinates is not None:
-                        result = interpolate_polyline(Q,
-                                                      vertex_coordinates,
-                                                      gauge_neighbour_id,
-                                                      interpolation_points=\
-                                                          self.interpolation_points)
-
-                    #assert len(result), len(interpolation_points)
-                    self.precomputed_values[name][i, :] = result
+                # All timesteps at once
+                self.precomputed_values = \
+                    self._interpolate_time_slices(quantities, 0, p)
+            else:
+                if verbose:
+                    log.critical('Interpolating (%d interpolation points) '
+                                 '%d timesteps at a time.' % (m, time_window))
+
+                # Keep the source time series and interpolate the
+                # window of timesteps around the model time when needed
+                self.quantities = quantities
+                self._update_window(0)
 
             # Report
             if verbose:
@@ -1005,6 +1065,114 @@ class Interpolation_function(object):
             for name in quantity_names:
                 self.precomputed_values[name] = quantities[name]
 
+    def _interpolate_time_slices(self, quantities, i0, i1):
+        """Interpolate the quantities at the (thinned) timesteps i0 to i1-1
+        to the interpolation points.
+
+        Only these timesteps are read from the source time series, which
+        may be numeric arrays or netcdf variables. Each quantity is
+        interpolated with one sparse matrix product.
+
+        Return dictionary of (i1-i0) x N arrays.
+        """
+
+        A = self.interpolation_matrix
+        thinning = self.time_thinning
+
+        values = {}
+        for name in self.quantity_names:
+            Q = quantities[name]
+            if len(Q.shape) == 2:
+                # Source values at timesteps i0 to i1-1 (one per column)
+                with netcdf_lock:
+                    Q = num.array(Q[i0*thinning:(i1-1)*thinning+1:thinning],
+                                  float)
+                Q = num.ascontiguousarray(Q.T)
+            else:
+                # No time dependency
+                with netcdf_lock:
+                    Q = num.array(Q[:], float).reshape((-1, 1))
+
+            if A.nonzeros() > 0:
+                result = A*Q
+            else:
+                result = num.zeros((A.M, Q.shape[1]), float)
+
+            if result.shape[1] != i1 - i0:
+                result = num.repeat(result, i1 - i0, axis=1)
+
+            # Taking into account points outside the mesh.
+            result[self.outside_indices, :] = NAN
+
+            values[name] = num.ascontiguousarray(result.T)
+
+        return values
+
+    def _update_window(self, index, use_next=True):
+        """Make sure that the timesteps index (and index+1 if use_next)
+        are available in precomputed_values. Otherwise interpolate the
+        window of time_window timesteps starting (or, when moving back
+        in time, ending) at index.
+        """
+
+        p = len(self.time)
+        last = min(index + 1, p - 1) if use_next else index
+
+        if self.window_start <= index and last < self.window_end \
+           and len(self.precomputed_values) > 0:
+            return
+
+        if index < self.window_start:
+            # Moving back in time
+            start = max(index - self.time_window + 1, 0)
+        else:
+            start = index
+        end = min(start + self.time_window + 1, p)
+
+        values = None
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+
+            prefetch_start, prefetched = self._prefetched
+            self._prefetched = None
+            if prefetch_start == start:
+                if isinstance(prefetched, Exception):
+                    raise prefetched
+                values = prefetched
+
+        if values is None:
+            values = self._interpolate_time_slices(self.quantities, start, end)
+
+        self.precomputed_values = values
+        self.window_start = start
+        self.window_end = end
+
+        # Interpolate the next window while the model evolves
+        if self.prefetch and end < p:
+            self._start_prefetch(end - 1)
+
+    def _start_prefetch(self, start):
+        """Interpolate the window starting at timestep start in a
+        separate thread.
+        """
+
+        import threading
+
+        end = min(start + self.time_window + 1, len(self.time))
+
+        def prefetch():
+            try:
+                values = self._interpolate_time_slices(self.quantities, start, end)
+            except Exception as e:
+                values = e
+            self._prefetched = (start, values)
+
+        self._prefetch_thread = threading.Thread(target=prefetch,
+                                                 name='interpolation_prefetch',
+                                                 daemon=True)
+        self._prefetch_thread.start()
+
 #     def __repr__(self):
 #         # return 'Interpolation function (spatio-temporal)'
 #         return self.statistics()
@@ -1042,24 +1210,8 @@ class Interpolation_function(object):
                           'parameter point_id can be used'
                     raise Exception(msg)
 
-        msg = 'Model time %.16f' % t
-        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
-        if t < self.time[0]: raise Modeltime_too_early(msg)
-        if t > self.time[-1]: raise Modeltime_too_late(msg)
-
-        oldindex = self.index #Time index
-
-        # Find current time slot
-        while t > self.time[self.index]: self.index += 1
-        while t < self.time[self.index]: self.index -= 1
-
-        if t == self.time[self.index]:
-            # Protect against case where t == T[-1] (last time)
-            #  - also works in general when t == T[i]
-            ratio = 0
-        else:
-            # t is now between index and index+1
-            ratio = (t - self.time[self.index]) / (self.time[self.index+1] - self.time[self.index])
+        ratio = self._update_time_index(t)
+        index = self.index - self.window_start
 
         # Compute interpolated values
         q = num.zeros(len(self.quantity_names), float)
@@ -1070,17 +1222,17 @@ class Interpolation_function(object):
                 # If there is no spatial info
                 assert len(Q.shape) == 1
 
-                Q0 = Q[self.index]
-                if ratio > 0: Q1 = Q[self.index+1]
+                Q0 = Q[index]
+                if ratio > 0: Q1 = Q[index+1]
             else:
                 if x is not None and y is not None:
                     # Interpolate to x, y
                     raise Exception('x,y interpolation not yet implemented')
                 else:
                     # Use precomputed point
-                    Q0 = Q[self.index, point_id]
+                    Q0 = Q[index, point_id]
                     if ratio > 0:
-                        Q1 = Q[self.index+1, point_id]
+                        Q1 = Q[index+1, point_id]
 
             # Linear temporal interpolation
             if ratio > 0:
@@ -1115,6 +1267,75 @@ class Interpolation_function(object):
 
                 return res
 
+    def _update_time_index(self, t):
+        """Move self.index to the time slot containing t and return the
+        ratio for the linear interpolation between index and index+1
+        """
+
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
+        if t < self.time[0]: raise Modeltime_too_early(msg)
+        if t > self.time[-1]: raise Modeltime_too_late(msg)
+
+        # Find current time slot, starting from the previous one
+        while t > self.time[self.index]: self.index += 1
+        while t < self.time[self.index]: self.index -= 1
+
+        if t == self.time[self.index]:
+            # Protect against case where t == T[-1] (last time)
+            #  - also works in general when t == T[i]
+            ratio = 0
+        else:
+            # t is now between index and index+1
+            ratio = (t - self.time[self.index]) / (self.time[self.index+1] - self.time[self.index])
+
+        if self.time_window is not None:
+            self._update_window(self.index, use_next=ratio > 0)
+
+        return ratio
+
+    def evaluate_points(self, t, point_ids=None):
+        """Evaluate f(t) at many of the preprocessed points at once
+
+        Inputs:
+          t:         time - Model time. Must lie within existing timesteps
+          point_ids: array of indices of the preprocessed points
+                     (default all of them)
+
+        Return array of shape (len(point_ids), number of quantities)
+        with the values linearly interpolated in time.
+        """
+
+        if self.spatial is False:
+            msg = 'evaluate_points requires an Interpolation_function with spatial information'
+            raise Exception(msg)
+
+        if self.interpolation_points is None:
+            msg = 'Interpolation_function must be instantiated ' + \
+                  'with a list of interpolation points before ' + \
+                  'evaluate_points can be used'
+            raise Exception(msg)
+
+        if point_ids is None:
+            point_ids = num.arange(len(self.interpolation_points))
+
+        ratio = self._update_time_index(t)
+        index = self.index - self.window_start
+
+        q = num.zeros((len(point_ids), len(self.quantity_names)), float)
+        for i, name in enumerate(self.quantity_names):
+            Q = self.precomputed_values[name]
+
+            Q0 = Q[index, point_ids]
+            if ratio > 0:
+                Q1 = Q[index+1, point_ids]
+                with num.errstate(invalid='ignore'):
+                    q[:, i] = num.where((Q0 == NAN) & (Q1 == NAN), Q0, Q0 + ratio*(Q1 - Q0))
+            else:
+                q[:, i] = Q0
+
+        return q
+
     def get_time(self):
         """Return model time as a vector of timesteps
         """
@@ -1160,7 +1381,11 @@ class Interpolation_function(object):
                                             max(interpolation_points[:,0]))
             msg += '    eta in [%f, %f]\n' %(min(interpolation_points[:,1]),
                                              max(interpolation_points[:,1]))
-            msg += '  Interpolated quantities (over all timesteps):\n'
+            if self.time_window is None:
+                msg += '  Interpolated quantities (over all timesteps):\n'
+            else:
+                msg += '  Interpolated quantities (over timesteps %d to %d):\n'\
+                       %(self.window_start, self.window_end - 1)
 
             for name in quantity_names:
                 q = precomputed_values[name][:].flatten()
@@ -1510,6 +1510,85 @@ class Test_Interpolate(unittest.TestCase):
             raise Exception('Should raise exception')
 
 
+    def test_interpolation_function_time_window(self):
+        # Interpolating a few timesteps at a time gives the same values as
+        # precomputing all of them
+
+        time = num.arange(41)*0.5
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        #bac, bce, ecf, dbe
+        triangles = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        interpolation_points = [[ 0.0, 0.0],
+                                [ 0.5, 0.5],
+                                [ 0.7, 0.7],
+                                [ 1.0, 0.5],
+                                [ 2.0, 0.4],
+                                [ 545354534, 4354354353]] # outside the mesh
+
+        stage = num.zeros((len(time), 6), float)
+        for i, t in enumerate(time):
+            stage[i, :] = num.sin(t)*linear_function(points)
+        elevation = -num.array(linear_function(points))
+
+        quantities = {'stage': stage, 'elevation': elevation}
+
+        for time_thinning in [1, 3]:
+            I = Interpolation_function(time, quantities.copy(),
+                                       quantity_names=['stage', 'elevation'],
+                                       vertex_coordinates=points,
+                                       triangles=triangles,
+                                       interpolation_points=interpolation_points,
+                                       time_thinning=time_thinning)
+
+            for time_window in [1, 4, 100]:
+                for prefetch in [True, False]:
+                    W = Interpolation_function(time, quantities.copy(),
+                                               quantity_names=['stage', 'elevation'],
+                                               vertex_coordinates=points,
+                                               triangles=triangles,
+                                               interpolation_points=interpolation_points,
+                                               time_thinning=time_thinning,
+                                               time_window=time_window,
+                                               prefetch=prefetch)
+
+                    assert W.quantities_range == I.quantities_range
+                    assert W.precomputed_values['stage'].shape[0] <= time_window + 1
+
+                    # Forward and then backward in time
+                    T = I.get_time()
+                    ts = num.linspace(T[0], T[-1], 97)
+                    for t in num.concatenate((ts, ts[::-1])):
+                        assert num.allclose(W.evaluate_points(t),
+                                            I.evaluate_points(t))
+                        for id in range(len(interpolation_points)):
+                            assert num.allclose(W(t, id), I(t, id))
+
+                    # Jump around
+                    for t in [T[-1], T[0], T[len(T)//2]]:
+                        assert num.allclose(W.evaluate_points(t),
+                                            I.evaluate_points(t))
+
+        try:
+            Interpolation_function(time, stage,
+                                   vertex_coordinates=points,
+                                   triangles=triangles,
+                                   interpolation_points=interpolation_points,
+                                   time_window=0)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should raise exception')
+
+
     def test_interpolation_function_time(self):
         #Test a long time series with an error in it (this did cause an
         #error once)
@@ -318,6 +318,57 @@ int64_t __interpolate_polyline(int64_t number_of_nodes,
 }			       			       
 
 
+int64_t __polyline_interpolation_weights(int64_t number_of_nodes,
+		int64_t number_of_points,
+		double* polyline_nodes,
+		int64_t* gauge_neighbour_id,
+		double* interpolation_points,
+		int64_t* node_ids,
+		double* weights,
+		double rtol,
+		double atol) {
+
+	// Weights of the linear interpolation done by __interpolate_polyline:
+	// the value at point i is
+	//   weights[2*i]*data[node_ids[2*i]] + weights[2*i+1]*data[node_ids[2*i+1]]
+	// Points not on the polyline are left untouched.
+
+	int64_t j, i, neighbour_id;
+	double x0, y0, x1, y1, x, y;
+	double segment_len, alpha;
+
+	for (j=0; j<number_of_nodes; j++) {
+
+		neighbour_id = gauge_neighbour_id[j];
+
+		if (neighbour_id >= 0) {
+			x0 = polyline_nodes[2*j];
+			y0 = polyline_nodes[2*j+1];
+
+			x1 = polyline_nodes[2*neighbour_id];
+			y1 = polyline_nodes[2*neighbour_id+1];
+
+			segment_len = dist(x1-x0, y1-y0);
+
+			for (i=0; i<number_of_points; i++) {
+				x = interpolation_points[2*i];
+				y = interpolation_points[2*i+1];
+
+				if (__point_on_line(x, y, x0, y0, x1, y1, rtol, atol)) {
+					alpha = dist(x-x0, y-y0)/segment_len;
+					node_ids[2*i] = j;
+					node_ids[2*i+1] = neighbour_id;
+					weights[2*i] = 1.0 - alpha;
+					weights[2*i+1] = alpha;
+				}
+			}
+		}
+	}
+
+	return 0;
+}
+
+
 int64_t __triangle_polygon_overlap(double* polygon,
                                double* triangle,
                                int64_t polygon_number_of_vertices)
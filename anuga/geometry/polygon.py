@@ -5,6 +5,7 @@
 
 from .polygon_ext import _is_inside_triangle
 from .polygon_ext import _interpolate_polyline
+from .polygon_ext import _polyline_interpolation_weights
 from .polygon_ext import _line_intersect
 from .polygon_ext import _polygon_overlap
 from .polygon_ext import _separate_points_by_polygon
@@ -1130,6 +1131,54 @@ def interpolate_polyline(data,
     return interpolated_values
 
 
+def polyline_interpolation_weights(polyline_nodes,
+                                   gauge_neighbour_id,
+                                   interpolation_points,
+                                   rtol=1.0e-6,
+                                   atol=1.0e-8):
+    """Weights of the linear interpolation done by interpolate_polyline.
+
+    Inputs:
+      polyline_nodes, gauge_neighbour_id, interpolation_points, rtol, atol:
+          As for interpolate_polyline
+
+    Output:
+      node_ids: Nx2 array of the indices of the two polyline nodes
+                used for each interpolation point
+      weights:  Nx2 array of the corresponding weights
+
+    so that interpolate_polyline(data, ...)[i] equals
+    weights[i,0]*data[node_ids[i,0]] + weights[i,1]*data[node_ids[i,1]].
+    Points not on the polyline get zero weights.
+    """
+
+    if isinstance(interpolation_points, Geospatial_data):
+        interpolation_points = interpolation_points.\
+            get_data_points(absolute=True)
+
+    polyline_nodes = ensure_numeric(polyline_nodes, float)
+    interpolation_points = ensure_numeric(interpolation_points, float)
+    gauge_neighbour_id = ensure_numeric(gauge_neighbour_id, int)
+
+    number_of_points = interpolation_points.shape[0]
+    node_ids = num.zeros((number_of_points, 2), int)
+    weights = num.zeros((number_of_points, 2), float)
+
+    if polyline_nodes.shape[0] == 1:
+        msg = 'Polyline contained only one point. I need more.'
+        raise Exception(msg)
+
+    _polyline_interpolation_weights(polyline_nodes,
+                                    gauge_neighbour_id,
+                                    interpolation_points,
+                                    node_ids,
+                                    weights,
+                                    rtol,
+                                    atol)
+
+    return node_ids, weights
+
+
 def polylist2points_verts(polylist):
     """ Convert a list of polygons to discrete points and vertices.
     """
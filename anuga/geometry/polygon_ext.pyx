@@ -10,6 +10,7 @@ cimport numpy as np
 cdef extern from "polygon.c":
     int64_t __point_on_line(double x, double y, double x0, double y0, double x1, double y1, double rtol, double atol)
     int64_t __interpolate_polyline(int64_t number_of_nodes, int64_t number_of_points, double* data, double* polyline_nodes, int64_t* gauge_neighbour_id, double* interpolation_points, double* interpolated_values, double rtol, double atol)
+    int64_t __polyline_interpolation_weights(int64_t number_of_nodes, int64_t number_of_points, double* polyline_nodes, int64_t* gauge_neighbour_id, double* interpolation_points, int64_t* node_ids, double* weights, double rtol, double atol)
     int64_t __polygon_overlap(double* polygon, double* triangles, int64_t* indices, int64_t M, int64_t polygon_number_of_vertices)
     int64_t __line_intersect(double* line, double* triangles, int64_t* indices, int64_t M)
     int64_t __is_inside_triangle(double* point, double* triangle, int64_t closed, double rtol, double atol)
@@ -51,6 +52,29 @@ def _interpolate_polyline(np.ndarray[double, ndim=1, mode="c"] data not None,\
                                 rtol,\
                                 atol)
 
+def _polyline_interpolation_weights(np.ndarray[double, ndim=2, mode="c"] polyline_nodes not None,\
+                        np.ndarray[int64_t, ndim=1, mode="c"] gauge_neighbour_id not None,\
+                        np.ndarray[double, ndim=2, mode="c"] interpolation_points not None,\
+                        np.ndarray[int64_t, ndim=2, mode="c"] node_ids not None,\
+                        np.ndarray[double, ndim=2, mode="c"] weights not None,\
+                        double rtol,\
+                        double atol):
+
+    cdef int64_t number_of_nodes, number_of_points, res
+
+    number_of_nodes = polyline_nodes.shape[0]
+    number_of_points = interpolation_points.shape[0]
+
+    res = __polyline_interpolation_weights(number_of_nodes,\
+                                number_of_points,\
+                                &polyline_nodes[0,0],\
+                                &gauge_neighbour_id[0],\
+                                &interpolation_points[0,0],\
+                                &node_ids[0,0],\
+                                &weights[0,0],\
+                                rtol,\
+                                atol)
+
 def _polygon_overlap(np.ndarray[double, ndim=2, mode="c"] polygon not None, np.ndarray[double, ndim=2, mode="c"] triangles not None, np.ndarray[int64_t, ndim=1, mode="c"] indices not None):
 
     cdef int64_t res
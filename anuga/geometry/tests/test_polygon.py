@@ -16,7 +16,7 @@ from anuga.geometry.polygon import _poly_xy, separate_points_by_polygon, \
     intersection, is_complex, polygon_overlap, not_polygon_overlap,\
     line_intersect, not_line_intersect,\
     is_inside_triangle, interpolate_polyline, inside_polygon, \
-    in_and_outside_polygon
+    in_and_outside_polygon, polyline_interpolation_weights
 
 from anuga.geometry.polygon_function import Polygon_function
 from anuga.coordinate_transforms.geo_reference import Geo_reference
@@ -1913,6 +1913,54 @@ class Test_Polygon(unittest.TestCase):
         z_ref = [1.1, 4.5, 5., 7.4, 11., 12.85, 12., 10.8, 8.52, 9.22, 24.4]
         assert num.allclose(z, z_ref)
 
+    def test_polyline_interpolation_weights(self):
+        """The weights reproduce interpolate_polyline
+        """
+
+        polyline_nodes = num.array([[0., 0.],
+                                    [4., 4.],
+                                    [8., 8.],
+                                    [10., 10.],
+                                    [10., 5.],
+                                    [10., 0.]])
+        gauge_neighbour_id = [1, 2, 3, 4, 5, -1]
+        point_coordinates = num.array([[0.1, 0.1],
+                                       [3.5, 3.5],
+                                       [4.0, 4.0],
+                                       [5.2, 5.2],
+                                       [7.0, 7.0],
+                                       [8.3, 8.3],
+                                       [10., 10.],
+                                       [10., 9.],
+                                       [10., 4.9],
+                                       [10., 2.5],
+                                       [2., 7.]])
+
+        node_ids, weights = polyline_interpolation_weights(polyline_nodes,
+                                                           gauge_neighbour_id,
+                                                           point_coordinates)
+
+        # The last point is not on the polyline
+        assert num.allclose(weights[-1], 0.0)
+        assert num.allclose(weights[:-1].sum(axis=1), 1.0)
+
+        for data in [num.array([1, 5, 13, 12, 6, 29]),
+                     num.arange(6)**2,
+                     num.random.rand(6)]:
+            z_ref = interpolate_polyline(data, polyline_nodes,
+                                         gauge_neighbour_id, point_coordinates)
+            z = (weights*num.take(data, node_ids)).sum(axis=1)
+            assert num.allclose(z, z_ref)
+
+        # Test exception thrown for one point
+        try:
+            polyline_interpolation_weights([[4., 4.]], [-1],
+                                           point_coordinates)
+        except Exception:
+            pass
+        else:
+            raise Exception('One point should have raised exception')
+
     def test_is_inside_triangle_more(self):
         """ Test if points inside triangles are detected correctly. """
         res = is_inside_triangle([0.5, 0.5], [[0.5,  0.],
@@ -2,6 +2,7 @@
 
 from builtins import object
 from anuga.utilities.system_tools import log_to_file
+import numpy as num
 
 
 class Operator(object):
@@ -99,6 +100,42 @@ class Operator(object):
         if self.logging:
             log_to_file(self.log_filename, self.timestepping_statistics())
 
+    def get_checkpoint_state(self):
+        """Return a dictionary of the state of the operator to be saved
+        in checkpoint files.
+
+        By default all numbers and numerical arrays, other than the
+        aliases of the domain quantities and geometry, are saved.
+        Operators with other state should extend this.
+        """
+
+        domain = self.domain
+        domain_arrays = [Q.centroid_values for Q in domain.quantities.values()]
+        domain_arrays += [domain.centroid_coordinates, domain.areas]
+
+        state = {}
+        for key, value in self.__dict__.items():
+            if isinstance(value, (bool, int, float, num.number)):
+                state[key] = value
+            elif isinstance(value, num.ndarray) and value.dtype != object:
+                if not any(value is a or num.may_share_memory(value, a) for a in domain_arrays):
+                    state[key] = value
+
+        return state
+
+    def set_checkpoint_state(self, state):
+        """Restore the state returned by get_checkpoint_state
+        """
+
+        for key, value in state.items():
+            current = getattr(self, key, None)
+            if isinstance(current, num.ndarray) and current.shape == num.shape(value):
+                current[...] = value
+            elif isinstance(current, num.ndarray):
+                setattr(self, key, num.array(value))
+            else:
+                setattr(self, key, num.asarray(value).item())
+
     def set_label(self, label=None):
 
         if label is None:
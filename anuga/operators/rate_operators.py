@@ -20,6 +20,8 @@ from anuga.utilities.function_utils import evaluate_temporal_function
 from anuga import Quantity
 from anuga.operators.base_operator import Operator
 from anuga import Region
+from anuga.rain.time_slice_rate import Time_slices, Xarray_time_slices
+from anuga.rain.time_slice_rate import Time_slice_rate
 
 class Rate_operator(Operator):
 
@@ -34,6 +36,8 @@ class Rate_operator(Operator):
                  center=None,
                  radius=None,
                  default_rate=0.0,
+                 remap='nearest',
+                 prefetch=True,
                  description = None,
                  label = None,
                  logging = False,
@@ -55,10 +59,16 @@ Parameters specifying rate
 
 :param rate: scalar, function of (t), (x,y), or (x,y,t), or a Quantity, 
                 a numpy array of size (number_of_triangles), 
-                or an xarray with rate at points and time
+                an xarray with rate at points and time
+                or a Time_slices object (see anuga.rain.time_slice_rate)
 :param factor: scalar, function of t, or 2 by n numpy array time sequence, 
                 used to specify conversion from rate argument to m/s
 :param default_rate: use this rate if outside time interval of rate function or xarray
+:param remap: for xarray or Time_slices rates, 'nearest' (value of nearest pixel),
+                'conservative' (area weighted over the pixels overlapping a triangle)
+                or a precomputed overlap matrix (see raster_overlap_matrix)
+:param prefetch: for xarray or Time_slices rates, read the next time slice
+                in a background thread
 
 Parameters involving communication
 
@@ -104,6 +114,7 @@ Parameters involving communication
         self.rate_callable = False
         self.rate_spatial = False
         self.rate_xarray = False
+        self.rate_time_slices = False
 
 
         #-------------------------------
@@ -117,9 +128,17 @@ Parameters involving communication
         else:
             if type(rate) is xarray.core.dataarray.DataArray:
                 self.rate_xarray = True
-                xa = rate
-                rate = 0.0
-                self._prepare_xarray_rate(xa)
+                self.xa = rate
+                rate = Xarray_time_slices(rate)
+
+        #-------------------------------
+        # Rate given by time slices which
+        # are read as they are needed
+        #-------------------------------
+        if isinstance(rate, Time_slices):
+            self.rate_time_slices = True
+            self._prepare_time_slice_rate(rate, remap, prefetch)
+            rate = 0.0
 
 
         self.set_rate(rate)
@@ -158,9 +177,9 @@ Parameters involving communication
         if self.indices is []:
             return
 
-        if self.rate_xarray:
-            # setup centroid_array from xarray corresponding to current time
-            self._update_Q_xarray()
+        if self.rate_time_slices:
+            # setup centroid_array from time slice corresponding to current time
+            self._update_Q_time_slices()
 
         t = self.domain.get_time()
         timestep = self.domain.get_timestep()
@@ -508,80 +527,31 @@ Parameters involving communication
 
         self.default_rate = default_rate
 
-    def _prepare_xarray_rate(self, xa):
-
-        import numpy as np
-        import pandas
-
-        # to speed up parallel code it helps to load the xarray
-        self.xa = xa.load()
-
-        self.xa['time'] = pandas.to_datetime(xa['time'], utc=True)
-
-        # these are absolute coord (since we haven't implemented offsets)
-        # Convert to relative coords to domain xllcorner and yllcorner
-
-        xllcorner = self.domain.geo_reference.xllcorner
-        yllcorner = self.domain.geo_reference.yllcorner
-        self.xy = np.array([self.xa['eastings']-xllcorner, self.xa['northings']-yllcorner]).T
-
-
-        # Determine data timestep from xarray. We assume the timestep is constant, so just test first 2 timeslices.
-        try:
-            data_dt = (self.xa['time'][1].values.astype('int64')-self.xa['time'][0].values.astype('int64'))/1.0e9
-            self.domain.set_evolve_max_timestep(min(data_dt, self.domain.get_evolve_max_timestep()))
-        except:  # if we can't determine the timestep probably means there is just one timeslice so just
-            pass
-
-        from scipy.spatial import KDTree
-        tree = KDTree(self.xy)
-        if self.verbose:
-            print(tree.size, self.xy.shape)
-
-        #dd, ii = tree.query(self.domain.centroid_coordinates)
-        dd, ii = tree.query(self.domain.get_centroid_coordinates(absolute=True))
+    def _prepare_time_slice_rate(self, time_slices, remap, prefetch):
 
-        self.ii = ii
+        self.time_slice_rate = Time_slice_rate(self.domain,
+                                               time_slices,
+                                               indices=self.indices,
+                                               remap=remap,
+                                               prefetch=prefetch,
+                                               verbose=self.verbose)
 
-        self.previous_Q_ref_time = None
-        self.previous_Q_numpy = None
+        # Make sure we do not step over a time slice
+        if time_slices.time_step is not None:
+            self.domain.set_evolve_max_timestep(min(time_slices.time_step,
+                                                    self.domain.get_evolve_max_timestep()))
 
 
-    def _update_Q_xarray(self):
-
-        import pandas
-        current_utc_datetime64 = pandas.to_datetime(self.domain.get_datetime()).tz_convert('UTC')#.replace(tzinfo=None)
-
-        if self.verbose:
-            print(f"{self.domain.get_time()} {self.domain.get_datetime()}")
-            print(f"UTC time {current_utc_datetime64} type {type(current_utc_datetime64)} ")
-            print(self.xa.sel(time=current_utc_datetime64, method='nearest'))
-      
-        try:
-            Q_ref = self.xa.sel(time=current_utc_datetime64, method="ffill", tolerance='5m')
+    def _update_Q_time_slices(self):
 
-            Q_ref_time = Q_ref['time'].values
+        Q_numpy = self.time_slice_rate(self.domain.get_time())
 
-            if self.verbose:
-                print(f"UTC time {current_utc_datetime64} Q_ref time {Q_ref_time} {Q_ref_time == self.previous_Q_ref_time} ")
-
-            optimize = True
-            if optimize:
-                if Q_ref_time == self.previous_Q_ref_time :
-                    Q_numpy = self.previous_Q_numpy
-                else:
-                    Q_numpy = Q_ref[self.ii].to_numpy()
-                    self.previous_Q_numpy = Q_numpy
-                    self.previous_Q_ref_time = Q_ref_time
-            else:
-                Q_numpy = Q_ref[self.ii].to_numpy()
-                  
-        except:
+        if Q_numpy is None:
             Q_numpy = self.default_rate
             if self.verbose:
-                print(f"UTC time {current_utc_datetime64} Using default rate Q = {Q_numpy(self.get_time())}")
-            
-        self.set_rate(rate=Q_numpy)             
+                print(f"UTC time {self.domain.get_datetime()} Using default rate Q = {Q_numpy(self.get_time())}")
+
+        self.set_rate(rate=Q_numpy)
 
     def parallel_safe(self):
         """Operator is applied independently on each cell and
@@ -1769,6 +1769,202 @@ class Test_rate_operators(unittest.TestCase):
 
 
 
+    def test_rate_operator_time_slices(self):
+        import tempfile
+        from anuga.rain.time_slice_rate import Time_slices
+
+        # Domain covering 4 by 3 pixels of a 10 m raster
+        domain = rectangular_cross_domain(8, 6, len1=40.0, len2=30.0,
+                                          origin=(500000.0, 6000000.0))
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_starttime(1.0e9)
+
+        x = 500005.0 + 10.0*num.arange(4)
+        y = 6000005.0 + 10.0*num.arange(3)
+        times = 1.0e9 + 300.0*num.arange(3)
+
+        # Memory mapped slices, rows from north to south
+        tmp_dir = tempfile.mkdtemp()
+        filename = os.path.join(tmp_dir, 'slices.npy')
+        slices = num.lib.format.open_memmap(filename, mode='w+', shape=(3, 3, 4))
+        slices[:] = num.arange(36).reshape((3, 3, 4))
+        slices.flush()
+        slices = num.load(filename, mmap_mode='r')
+
+        for remap in ['nearest', 'conservative']:
+            domain.set_quantity('stage', 1.0)
+            domain.set_relative_time(0.0)
+            domain.fractional_step_volume_integral = 0.0
+
+            operator = Rate_operator(domain, rate=Time_slices(times, slices, x=x, y=y),
+                                     factor=1.0e-3, default_rate=-1.0, remap=remap)
+
+            for t, tid in [(0.0, 0), (299.0, 0), (300.0, 1), (700.0, 2), (950.0, None)]:
+                domain.set_relative_time(t)
+                domain.timestep = 1.0
+                stage = domain.quantities['stage'].centroid_values.copy()
+                operator()
+
+                if tid is None:
+                    assert operator.rate_type == 't'
+                    continue
+
+                pixel_values = slices[tid][::-1].reshape(-1)
+                assert operator.rate_type == 'centroid_array'
+                assert num.allclose(operator.local_influx,
+                                    1.0e-3*num.sum(pixel_values)*100.0)
+
+                if remap == 'nearest':
+                    c = domain.get_centroid_coordinates(absolute=True) - [500000.0, 6000000.0]
+                    ii = (num.floor(c[:, 1]/10.0)*4 + num.floor(c[:, 0]/10.0)).astype(int)
+                    assert num.allclose(operator.rate, pixel_values[ii])
+                    assert num.allclose(domain.quantities['stage'].centroid_values,
+                                        stage + 1.0e-3*pixel_values[ii])
+
+        assert domain.get_evolve_max_timestep() <= 300.0
+
+        del slices, operator
+        import shutil
+        shutil.rmtree(tmp_dir)
+
+    def test_rate_operator_time_slices_netcdf_lock(self):
+        from anuga.rain.time_slice_rate import Time_slices
+        from anuga.file.netcdf import netcdf_lock
+
+        domain = rectangular_cross_domain(8, 6, len1=40.0, len2=30.0,
+                                          origin=(500000.0, 6000000.0))
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_starttime(1.0e9)
+
+        x = 500005.0 + 10.0*num.arange(4)
+        y = 6000005.0 + 10.0*num.arange(3)
+        times = 1.0e9 + 300.0*num.arange(4)
+
+        # Slices recording whether reads (also those of the
+        # prefetch thread) hold the netcdf lock
+        class Locked_slices(object):
+            def __init__(self):
+                self.owned = []
+
+            def __len__(self):
+                return 4
+
+            def __getitem__(self, i):
+                self.owned.append(netcdf_lock._is_owned())
+                return num.full((3, 4), float(i))
+
+        slices = Locked_slices()
+        operator = Rate_operator(domain, rate=Time_slices(times, slices, x=x, y=y),
+                                 factor=1.0e-3)
+
+        for t in [0.0, 300.0, 600.0, 900.0]:
+            domain.set_relative_time(t)
+            domain.timestep = 1.0
+            operator()
+
+        assert len(slices.owned) == 4
+        assert all(slices.owned)
+
+
+    @pytest.mark.skipif('xarray' not in sys.modules,
+                    reason="requires the xarray module")
+    def test_rate_operator_xarray_time_slices(self):
+        import xarray, pandas
+
+        domain = rectangular_cross_domain(4, 4, len1=40.0, len2=40.0)
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_starttime(float(pandas.Timestamp('2024-01-01T00:00').timestamp()))
+
+        # Pixel centres on a 20m grid
+        X, Y = num.meshgrid([10.0, 30.0], [10.0, 30.0])
+        values = num.array([[1.0, 2.0, 3.0, 4.0], [5.0, 6.0, 7.0, 8.0]])
+        xa = xarray.DataArray(values, dims=['time', 'point'],
+                              coords={'time': pandas.date_range('2024-01-01T00:00', periods=2, freq='5min'),
+                                      'eastings': ('point', X.flatten()),
+                                      'northings': ('point', Y.flatten())})
+
+        operator = Rate_operator(domain, rate=xa, default_rate=0.0, remap='conservative')
+        assert operator.rate_xarray
+
+        c = domain.centroid_coordinates
+        ii = (num.floor(c[:, 1]/20.0)*2 + num.floor(c[:, 0]/20.0)).astype(int)
+
+        for t, tid in [(10.0, 0), (400.0, 1)]:
+            domain.set_relative_time(t)
+            domain.timestep = 1.0
+            operator()
+            assert num.allclose(operator.rate, values[tid, ii])
+            assert num.allclose(operator.local_influx, 400.0*values[tid].sum())
+
+        domain.set_relative_time(1000.0)
+        operator()
+        assert operator.local_influx == 0.0
+
+
+    def test_rate_operator_calibrated_radar_rain(self):
+        import tempfile
+        from anuga.file.netcdf import NetCDFFile
+        from anuga.rain.calibrated_radar_rain import Calibrated_radar_rain
+
+        reference_latitude, reference_longitude = -35.3, 149.1
+        zone, offset_x, offset_y = anuga.LLtoUTM(reference_latitude, reference_longitude)
+
+        # Radar files of 5 minute accumulations (mm) on a 1km grid
+        radar_dir = tempfile.mkdtemp()
+        x_loc = num.array([-1.5, -0.5, 0.5, 1.5])
+        y_loc = num.array([-1.5, -0.5, 0.5, 1.5])
+        for k, key in enumerate(['20120229_1210', '20120229_1215', '20120229_1205']):
+            fid = NetCDFFile(os.path.join(radar_dir, 'RF_%s.nc' % key), netcdf_mode_w)
+            fid.reference_latitude = reference_latitude
+            fid.reference_longitude = reference_longitude
+            fid.createDimension('x', 4)
+            fid.createDimension('y', 4)
+            fid.createDimension('t', 1)
+            for name in ['start_time', 'valid_time']:
+                fid.createVariable(name, float, ('t',))
+            fid.variables['valid_time'][:] = anuga.parse_time(key)
+            fid.variables['start_time'][:] = anuga.parse_time(key) - 300.0
+            fid.createVariable('x_loc', float, ('x',))
+            fid.createVariable('y_loc', float, ('y',))
+            fid.variables['x_loc'][:] = x_loc
+            fid.variables['y_loc'][:] = y_loc
+            fid.createVariable('precipitation', float, ('y', 'x'))
+            fid.variables['precipitation'][:] = k + num.arange(16).reshape((4, 4))
+            fid.close()
+
+        rain = Calibrated_radar_rain(radar_dir)
+        lazy_rain = Calibrated_radar_rain(radar_dir, lazy=True)
+
+        assert num.allclose(lazy_rain.times, rain.times)
+        assert num.allclose(lazy_rain.data_accumulated, rain.data_accumulated)
+        for tid in range(3):
+            assert num.allclose(lazy_rain.data_slices[tid], rain.data_slices[tid])
+
+        # Domain covering the central 2 by 2 pixels
+        domain = rectangular_cross_domain(4, 4, len1=2000.0, len2=2000.0,
+                                          origin=(offset_x - 1000.0, offset_y - 1000.0))
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_starttime(anuga.parse_time('20120229_1200'))
+
+        operator = Rate_operator(domain, rate=lazy_rain.get_time_slices(),
+                                 remap='conservative')
+
+        # Rain accumulated from 12:05 to 12:10 (the 20120229_1210 file, k = 0)
+        domain.set_relative_time(400.0)
+        domain.timestep = 1.0
+        operator()
+
+        pixels = num.arange(16).reshape((4, 4))[1:3, 1:3]
+        assert num.allclose(operator.local_influx, pixels.sum()*1.0e6/1000.0/300.0)
+
+        import shutil
+        shutil.rmtree(radar_dir)
+
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(Test_rate_operators)
     runner = unittest.TextTestRunner(verbosity=1)
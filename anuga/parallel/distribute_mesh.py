@@ -35,6 +35,7 @@ except:
 
 
 from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import arrays_to_boundary
 from anuga import indent
 
 try:
@@ -146,7 +147,25 @@ def pmesh_divide_metis(domain, n_procs):
 
 def pmesh_divide_metis_with_map(domain, n_procs):
 
-    return pmesh_divide_metis_helper(domain, n_procs)
+    new_nodes, new_triangles, new_boundary, triangles_per_proc, new_quantities, \
+        s2p_map, p2s_map = pmesh_divide_metis_helper(domain, n_procs)
+
+    # If the triangles of the domain have been reordered (see
+    # reorder_triangles) map back to the original numbering, so
+    # that tri_l2g refers to the original triangle ids
+    reordered_to_original = getattr(domain, 'reordered_to_original', None)
+    if reordered_to_original is not None:
+        original_to_reordered = domain.original_to_reordered
+        if n_procs != 1:
+            p2s_map = reordered_to_original[p2s_map]
+            s2p_map = s2p_map[original_to_reordered]
+        else:
+            p2s_map = reordered_to_original.copy()
+            s2p_map = num.zeros((len(p2s_map), 2), int)
+            s2p_map[:, 1] = original_to_reordered
+
+    return new_nodes, new_triangles, new_boundary, triangles_per_proc, \
+        new_quantities, s2p_map, p2s_map
 
 
 def pmesh_divide_metis_helper(domain, n_procs):
@@ -248,17 +267,22 @@ def pmesh_divide_metis_helper(domain, n_procs):
 
         # print 50*'='
 
-        new_boundary = {}
-        for b in domain.boundary:
-            t = new_tri_index[b[0]]
-            # print t
-            new_boundary[proc_sum[t[0]]+t[1], b[1]] = domain.boundary[b]
+        # The boundary as arrays (see boundary_to_arrays) with the
+        # triangle ids renumbered
+        t = new_tri_index[domain.boundary_cells]
+        new_ids = num.column_stack((proc_sum[t[:, 0]] + t[:, 1],
+                                    domain.boundary_edges))
+        new_boundary = (new_ids, domain.boundary_tag_ids.copy(),
+                        list(domain.boundary_tags))
 
         #quantities = reorder(domain.quantities, tri_index, proc_sum)
         new_quantities = reorder_new(domain.quantities, epart_order, proc_sum)
 
     else:
-        new_boundary = domain.boundary.copy()
+        new_boundary = (num.column_stack((domain.boundary_cells,
+                                          domain.boundary_edges)),
+                        domain.boundary_tag_ids.copy(),
+                        list(domain.boundary_tags))
         triangles_per_proc = [n_tri]
         new_triangles = domain.triangles.copy()
         new_tri_index = []
@@ -315,72 +339,60 @@ def pmesh_divide_metis_helper(domain, n_procs):
 #
 #########################################################
 
-def submesh_full(mesh, triangles_per_proc):
-
-    # Initialise
-
-    # print triangles_per_proc
+def full_layer(mesh, tlower, tupper):
 
     nodes = mesh.nodes
     triangles = mesh.triangles
-    boundary = mesh.boundary
+
+    # Boundary edges, ordered by triangle id
+    boundary_cells = mesh.boundary_cells
+    boundary_edges = mesh.boundary_edges
+    boundary_tags = mesh.boundary_tags
+    boundary_tag_ids = mesh.boundary_tag_ids
+
+    # Find the triangles on the processor
+
+    subtriangles = triangles[tlower:tupper]
+
+    # Find the boundary edges on the processor
+
+    lo, hi = num.searchsorted(boundary_cells, [tlower, tupper])
+    subboundary = arrays_to_boundary(
+        num.column_stack((boundary_cells[lo:hi], boundary_edges[lo:hi])),
+        boundary_tag_ids[lo:hi], boundary_tags)
+
+    # Find the nodes on the processor
+
+    ids = num.unique(subtriangles.flat)
+    subnodes = num.concatenate((num.reshape(ids, (-1, 1)), nodes[ids]), 1)
+
+    return subnodes, subtriangles, subboundary
+
+
+def submesh_full(mesh, triangles_per_proc):
+
+    # Initialise
 
     tlower = 0
     nproc = len(triangles_per_proc)
-    nnodes = len(nodes)
     node_list = []
     triangle_list = []
     boundary_list = []
     submesh = {}
 
-#    node_range = num.reshape(num.arange(nnodes),(nnodes,1))
-#
-#    #print node_range
-#    tsubnodes = num.concatenate((node_range, nodes), 1)
-
-    # print node_range
-    # print nodes
     # Loop over processors
 
     for p in range(nproc):
 
-        # Find triangles on processor p
+        # Find the triangles, boundary edges and nodes on processor p
 
         tupper = triangles_per_proc[p]+tlower
-        subtriangles = triangles[tlower:tupper]
-        triangle_list.append(subtriangles)
-
-        # Find the boundary edges on processor p
+        subnodes, subtriangles, subboundary = full_layer(mesh, tlower, tupper)
 
-        subboundary = {}
-        for k in boundary:
-            if (k[0] >= tlower and k[0] < tupper):
-                subboundary[k] = boundary[k]
+        node_list.append(subnodes)
+        triangle_list.append(subtriangles)
         boundary_list.append(subboundary)
 
-        # Find nodes in processor p
-
-#        nodemap = num.zeros(nnodes, 'i')
-#        for t in subtriangles:
-#            nodemap[t[0]]=1
-#            nodemap[t[1]]=1
-#            nodemap[t[2]]=1
-#
-#        y = tsubnodes.take(num.flatnonzero(nodemap),axis=0)
-
-        # node_list.append(y)
-
-        ids = num.unique(subtriangles.flat)
-
-        lnodes = nodes[ids]
-#       print nodes.shape
-#       print ids.shape
-#       print lnodes.shape
-        x = num.concatenate((num.reshape(ids, (-1, 1)), lnodes), 1)
-#       print x
-#       print y
-        node_list.append(x)
-
         # Move to the next processor
 
         tlower = tupper
@@ -391,10 +403,6 @@ def submesh_full(mesh, triangles_per_proc):
     submesh["full_triangles"] = triangle_list
     submesh["full_boundary"] = boundary_list
 
-    # Clean up before exiting
-
-    #del (nodemap)
-
     return submesh
 
 
@@ -649,8 +657,6 @@ def ghost_bnd_layer_old(ghosttri, tlower, tupper, mesh, p):
 
 def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
 
-    boundary = mesh.boundary
-
     ghost_list = []
     subboundary = {}
 
@@ -698,12 +704,15 @@ def ghost_bnd_layer(ghosttri, tlower, tupper, mesh, p):
 #    print edge
 #    print values
 
-    subboundary = dict(list(zip(list(zip(gl, edge)), values)))
-    # intersect with boundary
+    # intersect with boundary: the boundary edges of the mesh have
+    # negative neighbours -(j+1) where j is the index of the boundary edge
+    nghb = mesh.neighbours[gl, edge]
+    tags = mesh.boundary_tags
+    tag_ids = mesh.boundary_tag_ids
+    for k in num.flatnonzero(nghb < 0).tolist():
+        values[k] = tags[tag_ids[-nghb[k]-1]]
 
-    # FIXME SR: these keys should be viewkeys but need python 2.7
-    subboundary.update((k, boundary[k]) for k in set(
-        subboundary.keys()) & set(boundary.keys()))
+    subboundary = dict(list(zip(list(zip(gl, edge)), values)))
 
     # print subboundary
 
@@ -1027,6 +1036,111 @@ def build_submesh(nodes, triangles, boundary, quantities,
     submesh["boundary_polygon"] = boundary_polygon
     return submesh
 
+
+#########################################################
+#
+# Build the grid partition of a single processor on the
+# host, without building those of the other processors
+# (so the host need not hold every submesh at once).
+#
+#  *) mesh is the (global) mesh of the reordered nodes,
+# triangles and boundary, the triangles of processor q
+# being the triangles_per_proc[q] after those of the
+# processors before it
+#
+#  *) A full triangle of processor p is a ghost triangle
+# of processor q if it is within ghost_layer_width
+# neighbours of a full triangle of q. These neighbours
+# all lie in p or its ghost layer, so the full
+# communication pattern is found from the ghost layer of
+# p alone
+#
+# -------------------------------------------------------
+#
+#  *) A dictionary containing the full_triangles,
+# full_nodes, full_boundary, ghost_triangles, ghost_nodes,
+# ghost_boundary, ghost_commun, full_commun, full_quan and
+# ghost_quan of processor p (as used by build_local_mesh)
+# is returned.
+#
+#########################################################
+
+def full_commun_pattern_cell(mesh, p, tlower, tupper, ghosttri,
+                             layer_width, tri_per_proc_range):
+
+    # Number p and its ghost layer locally (in the global order)
+
+    cells = num.union1d(num.arange(tlower, tupper), ghosttri[:, 0])
+    owner = num.searchsorted(tri_per_proc_range, cells)
+    N = len(cells)
+
+    # Local neighbours, those outside p and its ghost layer (or on
+    # the boundary) are given the index N
+
+    neighbours = mesh.neighbours[cells]
+    local = num.minimum(num.searchsorted(cells, neighbours), N-1)
+    local = num.where(cells[local] == neighbours, local, N)
+
+    full = num.arange(tlower, tupper)
+    full_commun = {}
+    for i in full:
+        full_commun[i] = []
+
+    for q in num.unique(owner[owner != p]):
+
+        # Triangles within layer_width neighbours of processor q
+
+        near = num.append(owner == q, False)
+        for i in range(layer_width):
+            near[:N] = near[:N] | near[local].any(axis=1)
+
+        for i in cells[near[:N] & (owner == p)]:
+            full_commun[i].append(q)
+
+    return full_commun
+
+
+def build_submesh_cell(mesh, quantities, triangles_per_proc, p,
+                       parameters=None):
+
+    tlower = int(num.sum(triangles_per_proc[:p]))
+    tupper = tlower + triangles_per_proc[p]
+    triangles_per_proc_ranges = num.cumsum(triangles_per_proc) - 1
+
+    submesh = {}
+
+    # The full triangles, nodes and boundary
+
+    subnodes, subtriangles, subboundary = full_layer(mesh, tlower, tupper)
+    submesh["full_nodes"] = subnodes
+    submesh["full_triangles"] = subtriangles
+    submesh["full_boundary"] = subboundary
+
+    # The ghost layer and communication patterns
+
+    [subnodes, subtri, layer_width] = \
+        ghost_layer({"full_nodes": {p: subnodes}}, mesh, p, tupper, tlower,
+                    parameters)
+    submesh["ghost_layer_width"] = layer_width
+    submesh["ghost_nodes"] = subnodes
+    submesh["ghost_triangles"] = subtri
+    submesh["ghost_boundary"] = ghost_bnd_layer(subtri, tlower, tupper, mesh, p)
+    submesh["ghost_commun"] = \
+        ghost_commun_pattern(subtri, p, triangles_per_proc_ranges)
+    submesh["full_commun"] = \
+        full_commun_pattern_cell(mesh, p, tlower, tupper, subtri,
+                                 layer_width, triangles_per_proc_ranges)
+
+    # The quantities, in the same order as the triangles
+
+    submesh["full_quan"] = {}
+    submesh["ghost_quan"] = {}
+    for k in quantities:
+        submesh["full_quan"][k] = quantities[k][tlower:tupper]
+        submesh["ghost_quan"][k] = num.array(quantities[k][subtri[:, 0]], float)
+
+    return submesh
+
 #########################################################
 #
 #  Given the subdivision of the grid assigned to the
@@ -1048,6 +1162,75 @@ def build_submesh(nodes, triangles, boundary, quantities,
 #########################################################
 
 
+#########################################################
+#
+# Classify the triangles of a local (sub)domain for
+# overlapping the ghost communication with computation
+#
+# *) neighbours is the (N,3) neighbour array of the local
+# mesh (negative entries are boundary edges)
+# *) tri_full_flag is 1 for full triangles and 0 for ghosts
+#
+# -------------------------------------------------------
+#
+# *) A dictionary of (sorted) triangle index arrays is
+# returned:
+#
+# 'extrapolate_interior': triangles whose extrapolation
+# does not use ghost cell values
+# 'extrapolate_halo': the remaining triangles
+# 'flux_interior': full triangles whose fluxes use neither
+# ghost cell nor boundary values
+# 'flux_halo': the remaining triangles
+#
+# The '..._closure' arrays add the neighbours of the
+# extrapolation sets (needed by the extrapolation) and
+# 'protect_halo' are the triangles not in
+# 'extrapolate_interior_closure'
+#
+#########################################################
+
+def build_overlap_triangle_sets(neighbours, tri_full_flag):
+
+    neighbours = num.asarray(neighbours)
+    ghost = num.asarray(tri_full_flag) == 0
+
+    def with_neighbours(flag):
+        # Flag triangles which are flagged or have a flagged neighbour
+        result = flag.copy()
+        for i in range(3):
+            n = neighbours[:, i]
+            valid = n >= 0
+            result[valid] |= flag[n[valid]]
+        return result
+
+    # Triangles whose edge values depend on ghost centroid values
+    ghost_1 = with_neighbours(ghost)
+
+    # Triangles whose fluxes depend on ghost centroid values
+    ghost_2 = with_neighbours(ghost_1)
+
+    on_boundary = num.any(neighbours < 0, axis=1)
+
+    flux_halo = ghost_2 | on_boundary
+
+    def indices(flag):
+        return num.flatnonzero(flag).astype(num.int64)
+
+    interior_closure = with_neighbours(~ghost_1)
+
+    sets = {}
+    sets['extrapolate_interior'] = indices(~ghost_1)
+    sets['extrapolate_interior_closure'] = indices(interior_closure)
+    sets['protect_halo'] = indices(~interior_closure)
+    sets['extrapolate_halo'] = indices(ghost_1)
+    sets['extrapolate_halo_closure'] = indices(with_neighbours(ghost_1))
+    sets['flux_interior'] = indices(~flux_halo)
+    sets['flux_halo'] = indices(flux_halo)
+
+    return sets
+
+
 #########################################################
 # Convert the format of the data to that used by ANUGA
 #
@@ -1616,6 +1799,11 @@ def extract_submesh(submesh, triangles_per_proc, p2s_map=None, p=0):
         submesh_cell["full_quan"][k] = submesh["full_quan"][k][p]
         submesh_cell["ghost_quan"][k] = submesh["ghost_quan"][k][p]
 
+    return extract_submesh_cell(submesh_cell, triangles_per_proc, p2s_map, p)
+
+
+def extract_submesh_cell(submesh_cell, triangles_per_proc, p2s_map=None, p=0):
+
     # FIXME SR: I think there is already a structure with this info in the mesh
     lower_t = 0
     for i in range(p):
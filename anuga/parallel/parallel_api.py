@@ -11,7 +11,9 @@ import numpy as num
 # The abstract Python-MPI interface
 from anuga.utilities.parallel_abstraction import size, rank, get_processor_name
 from anuga.utilities.parallel_abstraction import finalize, send, receive, reduce
+from anuga.utilities.parallel_abstraction import waitall
 from anuga.utilities.parallel_abstraction import pypar_available, barrier
+from anuga.utilities.parallel_abstraction import allreduce_values
 
 from anuga.parallel.sequential_distribute import sequential_distribute_dump
 from anuga.parallel.sequential_distribute import sequential_distribute_load
@@ -44,26 +46,16 @@ processor_name = get_processor_name()
 
 
 def collect_value(value):
+    """Sum value (scalar or array) over all processors, result on all processors
+    """
 
-    value = value
-
-    if myid == 0:
-        for i in range(numprocs):
-            if i == 0: continue
-            val = receive(i)
-            value = value + val
-    else:
-        send(value, 0)
-
-
-    if myid == 0:
-        for i in range(1,numprocs):
-            send(value,i)
-    else:
-        value = receive(0)
+    if numprocs == 1:
+        return value
 
+    from anuga.utilities.parallel_abstraction import comm
+    from mpi4py import MPI
 
-    return value
+    return comm.allreduce(value, op=MPI.SUM)
 
 
 
@@ -79,6 +71,7 @@ def distribute(domain, verbose=False, debug=False, parameters = None):
 
     if myid == 0:
         from .sequential_distribute import Sequential_distribute
+        from .sequential_distribute import isend_submesh
         partition = Sequential_distribute(domain, verbose, debug, parameters)
 
         partition.distribute(numprocs)
@@ -90,20 +83,33 @@ def distribute(domain, verbose=False, debug=False, parameters = None):
                 domain_quantities_to_be_stored, domain_smooth, domain_low_froude \
                  = partition.extract_submesh(0)
 
+        # The submesh of processor p is sent (as raw buffers) while the
+        # submesh of processor p+1 is built and extracted. Each submesh
+        # is freed once sent, so at most two are held at any time.
+        sending = None
         for p in range(1, numprocs):
 
             tostore = partition.extract_submesh(p)
 
-            send(tostore,p)
+            if sending is not None:
+                waitall(sending[0])
+
+            sending = isend_submesh(tostore, p)
+            del tostore
+
+        if sending is not None:
+            waitall(sending[0])
+        del sending, partition
 
     else:
+        from .sequential_distribute import receive_submesh
 
         kwargs, points, vertices, boundary, quantities, boundary_map, \
             domain_name, domain_dir, domain_store, domain_store_centroids, \
             domain_minimum_storable_height, domain_minimum_allowed_height, \
             domain_flow_algorithm, domain_georef, \
             domain_quantities_to_be_stored, domain_smooth, domain_low_froude\
-             = receive(0)
+             = receive_submesh(0)
 
     #---------------------------------------------------------------------------
     # Now Create parallel domain
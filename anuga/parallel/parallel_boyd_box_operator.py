@@ -122,6 +122,8 @@ class Parallel_Boyd_box_operator(Parallel_Structure_operator):
         Qvd=self.discharge_routine()
         self.smooth_delta_total_energy=1.0*self.delta_total_energy
         self.smooth_Q=Qvd[0]
+        # All procs of the structure start from the smoothing state of the master proc
+        self.share_smoothing_state()
         # Finally, set the smoothing timescale we actually want
         self.smoothing_timescale=smoothing_timescale
 
@@ -151,46 +153,22 @@ class Parallel_Boyd_box_operator(Parallel_Structure_operator):
 
         local_debug = False
 
-        #Send attributes of both enquiry points to the master proc
-        if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
-
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
-
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
-
+        # Attributes of both enquiry points, on the procs which compute the discharge
+        enq = self.get_enquiry_values()
 
         # Determine the direction of the flow
-        if self.myid == self.master_proc:
+        reverse = False
+        if enq is not None:
+            enq_total_energy0, enq_stage0 = enq[0, 0], enq[0, 1]
+            enq_total_energy1, enq_stage1 = enq[1, 0], enq[1, 1]
+
             if self.use_velocity_head:
                 self.delta_total_energy = enq_total_energy0 - enq_total_energy1
             else:
                 self.delta_total_energy = enq_stage0 - enq_stage1
 
-        self.inflow_index = 0
-        self.outflow_index = 1
-        # master proc orders reversal if applicable
-        if self.myid == self.master_proc:
-
+            # May/June 2014 -- change the driving forces gradually, with forward euler timestepping
+            #
             forward_Euler_smooth = True
             self.smooth_delta_total_energy, ts = total_energy(self.smooth_delta_total_energy,
                                                             self.delta_total_energy,
@@ -200,65 +178,24 @@ class Parallel_Boyd_box_operator(Parallel_Structure_operator):
 
             # Reverse the inflow and outflow direction?
             if self.smooth_delta_total_energy < 0:
-                self.inflow_index = 1
-                self.outflow_index = 0
+                reverse = True
 
                 #self.delta_total_energy = -self.delta_total_energy
                 self.delta_total_energy = -self.smooth_delta_total_energy
-
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
             else:
                 self.delta_total_energy = self.smooth_delta_total_energy
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
 
-            #print "ZZZZ: Delta total energy = %f" %(self.delta_total_energy)
-        else:
-            reverse = pypar.receive(self.master_proc)
-
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
-
-        # Get attribute from inflow enquiry point
-        if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[self.inflow_index]:
-                    inflow_enq_depth = self.inlets[self.inflow_index].get_enquiry_depth()
-                    inflow_enq_specific_energy = self.inlets[self.inflow_index].get_enquiry_specific_energy()
-            else:
-                    inflow_enq_depth = pypar.receive(self.enquiry_proc[self.inflow_index])
-                    inflow_enq_specific_energy = pypar.receive(self.enquiry_proc[self.inflow_index])
-        else:
-            if self.myid == self.enquiry_proc[self.inflow_index]:
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_depth(), self.master_proc)
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_specific_energy(), self.master_proc)
-
-        # Get attribute from outflow enquiry point
-        if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[self.outflow_index]:
-                outflow_enq_depth = self.inlets[self.outflow_index].get_enquiry_depth()
-            else:
-
-                outflow_enq_depth = pypar.receive(self.enquiry_proc[self.outflow_index])
-                #print('receive',outflow_enq_depth)
-
-            #print "ZZZZZ: outflow_enq_depth = %f" %(outflow_enq_depth)
-
-        else:
-            if self.myid == self.enquiry_proc[self.outflow_index]:
-                #print('send',self.inlets[self.outflow_index].get_enquiry_depth())
-                pypar.send(self.inlets[self.outflow_index].get_enquiry_depth(), self.master_proc)
+        # master proc orders reversal if applicable
+        self.set_flow_direction(reverse)
 
+        # Procs which compute the discharge get the attributes of the inflow
+        # and outflow enquiry points and compute return values
+        if enq is not None:
 
-        
+            inflow_enq_depth = enq[self.inflow_index, 2]
+            inflow_enq_specific_energy = enq[self.inflow_index, 3]
+            outflow_enq_depth = enq[self.outflow_index, 2]
 
-        # Master proc computes return values
-        if self.myid == self.master_proc:
 
             #inflow_enq_specific_energy
 
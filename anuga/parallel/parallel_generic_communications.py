@@ -12,6 +12,9 @@ import numpy as num
 
 import anuga.utilities.parallel_abstraction as pypar
 
+from anuga.abstract_2d_finite_volumes.ghost_buffer_ext import \
+    pack_ghost_buffers, unpack_ghost_buffers, copy_ghost_values
+
 
 
 
@@ -31,6 +34,75 @@ def setup_buffers(domain):
     domain.calls_to_update_ghosts = 0
     domain.calls_to_update_timestep = 0
 
+    # Outstanding requests of a split-phase ghost update
+    domain.ghost_requests = None
+
+    # Persistent (Send_init/Recv_init) ghost requests, if used
+    domain.persistent_ghost_requests = None
+
+    # Scalars reduced along with the flux timestep
+    # name -> (function returning the local value, 'min', 'max' or 'sum')
+    domain.reductions = {}
+    domain.reduced_values = {}
+
+
+def setup_persistent_ghost_requests(domain):
+    """Create persistent requests for the ghost update buffers so
+    the communication is set up once rather than every update
+    """
+
+    free_persistent_ghost_requests(domain)
+
+    sendDict = domain.full_send_dict
+    recvDict = domain.ghost_recv_dict
+
+    recv_requests = [pypar.comm.Recv_init(recvDict[recv_proc][2], recv_proc, 123)
+                     for recv_proc in recvDict]
+    send_requests = [pypar.comm.Send_init(sendDict[send_proc][2], send_proc, 123)
+                     for send_proc in sendDict]
+
+    domain.persistent_ghost_requests = (recv_requests, send_requests)
+
+
+def free_persistent_ghost_requests(domain):
+    """Release the persistent ghost requests (if any)
+    """
+
+    communicate_ghosts_finish(domain)
+
+    if domain.persistent_ghost_requests is None:
+        return
+
+    recv_requests, send_requests = domain.persistent_ghost_requests
+    for request in recv_requests + send_requests:
+        request.Free()
+
+    domain.persistent_ghost_requests = None
+
+
+def pack_send_buffers(domain, quantities):
+    """Copy full cell data of the quantities into the send buffers
+    """
+
+    sendDict = domain.full_send_dict
+
+    centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+    pack_ghost_buffers(centroid_values,
+                       [sendDict[send_proc][0] for send_proc in sendDict],
+                       [sendDict[send_proc][2] for send_proc in sendDict])
+
+
+def unpack_recv_buffers(domain, quantities):
+    """Copy the received data of the quantities into the ghost cells
+    """
+
+    recvDict = domain.ghost_recv_dict
+
+    centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+    unpack_ghost_buffers(centroid_values,
+                         [recvDict[recv_proc][0] for recv_proc in recvDict],
+                         [recvDict[recv_proc][2] for recv_proc in recvDict])
+
 
 def communicate_flux_timestep(domain, yieldstep, finaltime):
     """Calculate local timestep
@@ -46,7 +118,7 @@ def communicate_flux_timestep(domain, yieldstep, finaltime):
     # disable allreduce if fixed_flux_timestep is set
     if domain.fixed_flux_timestep is not None:
         domain.flux_timestep = domain.fixed_flux_timestep
-        if not domain.test_allreduce:
+        if not domain.test_allreduce and not domain.reductions:
             return
 
 
@@ -62,13 +134,30 @@ def communicate_flux_timestep(domain, yieldstep, finaltime):
     #                  buffer=domain.global_timestep,
     #                  bypass=True)
 
-    from mpi4py import MPI
-    #pypar.comm.Barrier()
-    pypar.comm.Allreduce(local_timestep, global_timestep, op=MPI.MIN)
-    #pypar.comm.Barrier()
+    if domain.reductions:
+        # Fuse the registered reductions with the timestep
+        names = list(domain.reductions)
+        values = [local_timestep[0]]
+        ops = ['min']
+        for name in names:
+            function, op = domain.reductions[name]
+            values.append(function())
+            ops.append(op)
 
+        result = pypar.allreduce_values(values, ops)
 
-    domain.communication_reduce_time += time.time()-t0
+        global_timestep[0] = result[0]
+        domain.reduced_values = dict(zip(names, result[1:]))
+    else:
+        from mpi4py import MPI
+        #pypar.comm.Barrier()
+        pypar.comm.Allreduce(local_timestep, global_timestep, op=MPI.MIN)
+        #pypar.comm.Barrier()
+
+
+    dt = time.time()-t0
+    domain.communication_reduce_time += dt
+    domain.phase_timers.add('allreduce', dt)
 
 #    pypar.reduce(domain.local_timestep, pypar.MIN, 0,
 #                      buffer=domain.global_timestep,
@@ -113,10 +202,8 @@ def communicate_ghosts_blocking(domain, quantities=None):
                     Idf  = domain.full_send_dict[send_proc][0]
                     Xout = domain.full_send_dict[send_proc][2]
 
-                    for i, q in enumerate(quantities):
-                        #print 'Send',i,q
-                        Q_cv =  domain.quantities[q].centroid_values
-                        Xout[:,i] = num.take(Q_cv, Idf)
+                    centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+                    pack_ghost_buffers(centroid_values, [Idf], [Xout])
 
                     pypar.send(Xout, int(send_proc), use_buffer=True, bypass=True)
 
@@ -130,10 +217,8 @@ def communicate_ghosts_blocking(domain, quantities=None):
 
                 X = pypar.receive(int(iproc), buffer=X, bypass=True)
 
-                for i, q in enumerate(quantities):
-                    #print 'Receive',i,q
-                    Q_cv =  domain.quantities[q].centroid_values
-                    num.put(Q_cv, Idg, X[:,i])
+                centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+                unpack_ghost_buffers(centroid_values, [Idg], [X])
 
     #local update of ghost cells
     iproc = domain.processor
@@ -147,12 +232,12 @@ def communicate_ghosts_blocking(domain, quantities=None):
         # now store ghost as local id, global id, value
         Idg = domain.ghost_recv_dict[iproc][0]
 
-        for i, q in enumerate(quantities):
-            #print 'LOCAL SEND RECEIVE',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, num.take(Q_cv, Idf))
+        centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+        copy_ghost_values(centroid_values, Idf, Idg)
 
-    domain.communication_time += time.time()-t0
+    dt = time.time()-t0
+    domain.communication_time += dt
+    domain.phase_timers.add('ghost_communication', dt)
 
 
 
@@ -164,6 +249,18 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     # the separate processors
     # Using isend and irecv
 
+    communicate_ghosts_start(domain, quantities)
+    communicate_ghosts_finish(domain)
+
+
+def communicate_ghosts_start(domain, quantities=None):
+    """Start a split-phase ghost update.
+
+    Copies full cell data into the send buffers and posts the
+    Irecvs and Isends. Computation which does not use ghost cell
+    values can be done before calling communicate_ghosts_finish.
+    """
+
     import numpy as num
     import time
     import anuga
@@ -185,14 +282,7 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     #iproc == domain.processor
 
     #Setup send buffer arrays for sending full data to other processors
-    for send_proc in domain.full_send_dict:
-        Idf  = sendDict[send_proc][0]
-        Xout = sendDict[send_proc][2]
-
-        for i, q in enumerate(quantities):
-            #print 'Store send data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            Xout[:,i] = num.take(Q_cv, Idf)
+    pack_send_buffers(domain, quantities)
 
     #--------------------------------------------
     # Do all the comuunication using isend/irecv 
@@ -200,6 +290,18 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     # full_send_dict and ghost_recv_dict
     #--------------------------------------------
 
+    if domain.persistent_ghost_requests is not None:
+        import mpi4py
+        recv_requests, send_requests = domain.persistent_ghost_requests
+        mpi4py.MPI.Prequest.Startall(recv_requests)
+        mpi4py.MPI.Prequest.Startall(send_requests)
+
+        domain.ghost_requests = (quantities, recv_requests, send_requests)
+        dt = time.time()-t0
+        domain.communication_time += dt
+        domain.phase_timers.add('ghost_communication', dt)
+        return
+
 
     #-------------------------
     # Do the Irecvs first
@@ -225,27 +327,146 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
         request = pypar.comm.Isend(X, send_proc, 123)
         send_requests.append(request)
 
+    domain.ghost_requests = (quantities, recv_requests, send_requests)
+
+    dt = time.time()-t0
+    domain.communication_time += dt
+    domain.phase_timers.add('ghost_communication', dt)
+
+
+def communicate_ghosts_finish(domain):
+    """Complete a ghost update started by communicate_ghosts_start.
+
+    Waits for the messages and copies the received data into the
+    ghost cells. Does nothing if no ghost update is in progress.
+    """
+
+    import numpy as num
+    import time
+    import mpi4py
+    t0 = time.time()
+
+    if domain.ghost_requests is None:
+        return
+
+    quantities, recv_requests, send_requests = domain.ghost_requests
+    domain.ghost_requests = None
+
     #-----------------------------------------
     # Now complete communication.
-    # We could put some computation between the 
-    # communication calls above and this call.
     #-----------------------------------------
-    import mpi4py
     re=mpi4py.MPI.Request.Waitall(recv_requests)
 
 
     # Now copy data from receive buffers to the domain
-    for recv_proc in recvDict:
-        Idg  = recvDict[recv_proc][0]
-        X    = recvDict[recv_proc][2]
+    unpack_recv_buffers(domain, quantities)
+
+    # Send buffers are reused by the next update
+    mpi4py.MPI.Request.Waitall(send_requests)
+
+    dt = time.time()-t0
+    domain.communication_time += dt
+    domain.phase_timers.add('ghost_communication', dt)
+
+
+def communicate_ghost_values(domain, centroid_values, send_ids=None, recv_ids=None):
+    """Update the ghost triangles of the arrays in centroid_values.
+
+    By default all ghosts are updated, otherwise only those listed in
+    recv_ids[proc] from the full triangles listed in send_ids[proc] (in
+    the same order on both processors). The ids are a prefix of the
+    buffers' rows.
+    """
+
+    import time
+    import mpi4py
+    t0 = time.time()
+
+    communicate_ghosts_finish(domain)
+
+    sendDict = domain.full_send_dict
+    recvDict = domain.ghost_recv_dict
+
+    if send_ids is None:
+        send_ids = {send_proc: sendDict[send_proc][0] for send_proc in sendDict}
+    if recv_ids is None:
+        recv_ids = {recv_proc: recvDict[recv_proc][0] for recv_proc in recvDict}
+
+    send_buffers = {send_proc: sendDict[send_proc][2][:len(send_ids[send_proc])]
+                    for send_proc in sendDict}
+    recv_buffers = {recv_proc: recvDict[recv_proc][2][:len(recv_ids[recv_proc])]
+                    for recv_proc in recvDict}
+
+    pack_ghost_buffers(centroid_values,
+                       [send_ids[send_proc] for send_proc in sendDict],
+                       [send_buffers[send_proc] for send_proc in sendDict])
+
+    recv_requests = [pypar.comm.Irecv(recv_buffers[recv_proc], recv_proc, 123)
+                     for recv_proc in recvDict]
+    send_requests = [pypar.comm.Isend(send_buffers[send_proc], send_proc, 123)
+                     for send_proc in sendDict]
 
-        for i, q in enumerate(quantities):
-            #print 'Read receive data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, X[:,i])
+    mpi4py.MPI.Request.Waitall(recv_requests)
 
+    unpack_ghost_buffers(centroid_values,
+                         [recv_ids[recv_proc] for recv_proc in recvDict],
+                         [recv_buffers[recv_proc] for recv_proc in recvDict])
 
-    domain.communication_time += time.time()-t0
+    mpi4py.MPI.Request.Waitall(send_requests)
+
+    dt = time.time()-t0
+    domain.communication_time += dt
+    domain.phase_timers.add('ghost_communication', dt)
+
+
+def setup_ghost_frequency(domain, frequency):
+    """Local timestepping: copy the timestep frequencies of the full
+    triangles to their ghosts and order the ghost ids by frequency.
+    """
+
+    values = frequency.astype(float)
+    communicate_ghost_values(domain, [values])
+    frequency[:] = values.astype(num.int64)
+
+    order_ghosts_by_frequency(domain, frequency)
+
+
+def order_ghosts_by_frequency(domain, frequency):
+    """Local timestepping: order the ghost send and receive ids by
+    frequency, so the ghosts with frequency at most f are a prefix of the
+    ids (see communicate_ghosts_by_frequency). The order only depends on
+    the frequencies, which are the same for a full triangle and its ghosts.
+    """
+
+    def order_by_frequency(ids):
+        ids = ids[num.argsort(frequency[ids], kind='stable')]
+        return ids, frequency[ids]
+
+    sendDict = domain.full_send_dict
+    recvDict = domain.ghost_recv_dict
+
+    domain.ghost_frequency_ids = \
+        ({send_proc: order_by_frequency(sendDict[send_proc][0]) for send_proc in sendDict},
+         {recv_proc: order_by_frequency(recvDict[recv_proc][0]) for recv_proc in recvDict})
+
+
+def communicate_ghosts_by_frequency(domain, max_frequency, quantities=None):
+    """Local timestepping: update the ghosts with timestep frequency at
+    most max_frequency, i.e. those of the triangles which have just
+    finished a timestep.
+    """
+
+    if quantities is None:
+        quantities = domain.conserved_quantities
+
+    def prefix(ordered_ids):
+        return {proc: ids[:num.searchsorted(freq, max_frequency, side='right')]
+                for proc, (ids, freq) in ordered_ids.items()}
+
+    send_ids, recv_ids = domain.ghost_frequency_ids
+
+    centroid_values = [domain.quantities[q].centroid_values for q in quantities]
+    communicate_ghost_values(domain, centroid_values, prefix(send_ids), prefix(recv_ids))
 
 
 def communicate_ghosts_asynchronous(domain, quantities=None):
@@ -269,14 +490,7 @@ def communicate_ghosts_asynchronous(domain, quantities=None):
     #iproc == domain.processor
 
     #Setup send buffer arrays for sending full data to other processors
-    for send_proc in domain.full_send_dict:
-        Idf  = domain.full_send_dict[send_proc][0]
-        Xout = domain.full_send_dict[send_proc][2]
-
-        for i, q in enumerate(quantities):
-            #print 'Store send data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            Xout[:,i] = num.take(Q_cv, Idf)
+    pack_send_buffers(domain, quantities)
 
     # Do all the comuunication using isend/irecv via the buffers in the
     # full_send_dict and ghost_recv_dict
@@ -284,15 +498,10 @@ def communicate_ghosts_asynchronous(domain, quantities=None):
     pypar.send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
 
     # Now copy data from receive buffers to the domain
-    for recv_proc in domain.ghost_recv_dict:
-        Idg  = domain.ghost_recv_dict[recv_proc][0]
-        X    = domain.ghost_recv_dict[recv_proc][2]
-
-        for i, q in enumerate(quantities):
-            #print 'Read receive data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, X[:,i])
+    unpack_recv_buffers(domain, quantities)
 
 
-    domain.communication_time += time.time()-t0
+    dt = time.time()-t0
+    domain.communication_time += dt
+    domain.phase_timers.add('ghost_communication', dt)
 
@@ -331,6 +331,42 @@ class Parallel_Inlet(Inlet):
         else:
             return 0.0
 
+    def get_local_sums(self):
+        # LOCAL: area and area weighted depth, stage, xmom and ymom of the
+        # part of the inlet on this processor, packed for communication
+
+        areas = self.get_areas()
+        stages = self.get_stages()
+
+        return num.array([self.area,
+                          num.sum((stages - self.get_elevations())*areas),
+                          num.sum(stages*areas),
+                          num.sum(self.get_xmoms()*areas),
+                          num.sum(self.get_ymoms()*areas)])
+
+    def get_global_averages(self):
+        # GLOBAL: master proc gathers the local sums of all child processors,
+        # one message per processor, and returns the array of global area
+        # and average depth, stage, xmom and ymom
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this inlet
+
+        from anuga.utilities import parallel_abstraction as pypar
+        sums = self.get_local_sums()
+
+        if self.myid == self.master_proc:
+            buffer = num.empty_like(sums)
+            for i in self.procs:
+                if i == self.master_proc: continue
+
+                pypar.receive(i, buffer=buffer, bypass=True)
+                sums += buffer
+        else:
+            pypar.send(sums, self.master_proc, bypass=True)
+
+        return inlet_averages(sums)
+
 
     def get_velocities(self):
         #LOCAL
@@ -598,6 +634,20 @@ class Parallel_Inlet(Inlet):
 
         return message
 
+
+def inlet_averages(sums):
+    """Convert the global sums [area, volume, stage*area, xmom*area, ymom*area]
+    of an inlet to the array [area, depth, stage, xmom, ymom] of averages
+    """
+
+    averages = num.zeros(5)
+    averages[0] = sums[0]
+
+    if sums[0] > 0.0:
+        averages[1:] = sums[1:]/sums[0]
+
+    return averages
+
 __author__="pete"
 __date__ ="$16/08/2011 6:49:42 PM$"
 
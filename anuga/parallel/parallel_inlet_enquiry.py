@@ -230,6 +230,19 @@ class Parallel_Inlet_enquiry(parallel_inlet.Parallel_Inlet):
             return None
 
 
+    def get_enquiry_summary(self):
+        # WARNING: Must be called by processor containing inlet enquiry point to have effect
+        # Enquiry total energy, stage, depth and specific energy packed for communication
+
+        if self.enquiry_index >= 0:
+            return num.array([self.get_enquiry_total_energy(),
+                              self.get_enquiry_stage(),
+                              self.get_enquiry_depth(),
+                              self.get_enquiry_specific_energy()])
+        else:
+            return None
+
+
     def get_master_proc(self):
         return self.master_proc
 
@@ -115,6 +115,8 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
         # [values of self.smooth_* are required in discharge_routine, hence dummy values above]
         Qvd = self.discharge_routine()
         self.smooth_Q = Qvd[0]
+        # All procs of the structure start from the smoothing state of the master proc
+        self.share_smoothing_state()
         # Finally, set the smoothing timescale we actually want
         self.smoothing_timescale = smoothing_timescale
 
@@ -161,47 +163,24 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
         
         # If the structure has been closed, then no water gets through
         if self.height <= 0.0:
-            if self.myid == self.master_proc:
-                Q = 0.0
-                barrel_velocity = 0.0
-                outlet_culvert_depth = 0.0
-                self.case = "Structure is blocked"
-                self.inflow = self.inlets[0]
-                self.outflow = self.inlets[1]
-                return Q, barrel_velocity, outlet_culvert_depth
-            else:
-                return None, None, None
-
-        #Send attributes of both enquiry points to the master proc
-        if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
+            Q = 0.0
+            barrel_velocity = 0.0
+            outlet_culvert_depth = 0.0
+            self.case = "Structure is blocked"
+            self.inflow = self.inlets[0]
+            self.outflow = self.inlets[1]
+            return Q, barrel_velocity, outlet_culvert_depth
 
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
+        # Attributes of both enquiry points, on the procs which compute the discharge
+        enq = self.get_enquiry_values()
 
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
+        if enq is not None:
+            enq_total_energy0, enq_stage0 = enq[0, 0], enq[0, 1]
+            enq_total_energy1, enq_stage1 = enq[1, 0], enq[1, 1]
 
 
         # Determine the direction of the flow
-        if self.myid == self.master_proc:
+        if enq is not None:
             # Variables required by anuga's structure operator which are not
             # used
             barrel_velocity = numpy.nan
@@ -258,33 +237,14 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
             self.driving_energy=numpy.nan
 
 
-        self.inflow_index = 0
-        self.outflow_index = 1
-        # master proc orders reversal if applicable
-        if self.myid == self.master_proc:
-
-            # Reverse the inflow and outflow direction?
-            if self.smooth_Q < 0.:
-                self.inflow_index = 1
-                self.outflow_index = 0
-
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
-            else:
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
-
-        else:
-            reverse = pypar.receive(self.master_proc)
+        # Reverse the inflow and outflow direction?
+        reverse = enq is not None and self.smooth_Q < 0.
 
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
+        # master proc orders reversal if applicable
+        self.set_flow_direction(reverse)
 
         # Master proc computes return values
-        if self.myid == self.master_proc:
+        if enq is not None:
             return Q, barrel_velocity, outlet_culvert_depth
         else:
             return None, None, None
@@ -314,69 +274,51 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
         
         # If the structure has been closed, then no water gets through
         if self.height <= 0.0:
-            if self.myid == self.master_proc:
-                Q = 0.0
-                barrel_velocity = 0.0
-                outlet_culvert_depth = 0.0
-                self.case = "Structure is blocked"
-                self.inflow = self.inlets[0]
-                self.outflow = self.inlets[1]
-                return Q, barrel_velocity, outlet_culvert_depth
-            else:
-                return None, None, None
-
-        #Send attributes of both enquiry points to the master proc
-        if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
+            Q = 0.0
+            barrel_velocity = 0.0
+            outlet_culvert_depth = 0.0
+            self.case = "Structure is blocked"
+            self.inflow = self.inlets[0]
+            self.outflow = self.inlets[1]
+            return Q, barrel_velocity, outlet_culvert_depth
 
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
+        # Attributes of both enquiry points, on the procs which compute the discharge
+        enq = self.get_enquiry_values()
 
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
+        if enq is not None:
+            enq_total_energy0, enq_stage0 = enq[0, 0], enq[0, 1]
+            enq_total_energy1, enq_stage1 = enq[1, 0], enq[1, 1]
 
         # Send inlet areas to the master proc. FIXME: Inlet areas don't change
         # -- perhaps we could just do this once?
+        summary = self.get_structure_summary()
 
-        # area0
-        if self.myid in self.inlet_procs[0]:
-            area0 = self.inlets[0].get_global_area()
+        if summary is not None:
+            area0 = summary[0, 0]
+            area1 = summary[1, 0]
+        else:
+            # area0
+            if self.myid in self.inlet_procs[0]:
+                area0 = self.inlets[0].get_global_area()
 
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[0]:
-                area0 = pypar.receive(self.inlet_master_proc[0])
-        elif self.myid == self.inlet_master_proc[0]:
-            pypar.send(area0, self.master_proc)
-        
-        # area1
-        if self.myid in self.inlet_procs[1]:
-            area1 = self.inlets[1].get_global_area()
+            if self.myid == self.master_proc:
+                if self.myid != self.inlet_master_proc[0]:
+                    area0 = pypar.receive(self.inlet_master_proc[0])
+            elif self.myid == self.inlet_master_proc[0]:
+                pypar.send(area0, self.master_proc)
 
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[1]:
-                area1 = pypar.receive(self.inlet_master_proc[1])
-        elif self.myid == self.inlet_master_proc[1]:
-            pypar.send(area1, self.master_proc)
+            # area1
+            if self.myid in self.inlet_procs[1]:
+                area1 = self.inlets[1].get_global_area()
+
+            if self.myid == self.master_proc:
+                if self.myid != self.inlet_master_proc[1]:
+                    area1 = pypar.receive(self.inlet_master_proc[1])
+            elif self.myid == self.inlet_master_proc[1]:
+                pypar.send(area1, self.master_proc)
 
         # Compute discharge
-        if self.myid == self.master_proc:
+        if enq is not None:
 
             # Energy or stage as head
             if self.use_velocity_head:
@@ -428,33 +370,14 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
             self.driving_energy=numpy.nan
 
 
-        self.inflow_index = 0
-        self.outflow_index = 1
-        # master proc orders reversal if applicable
-        if self.myid == self.master_proc:
+        # Reverse the inflow and outflow direction?
+        reverse = enq is not None and Q < 0.
 
-            # Reverse the inflow and outflow direction?
-            if Q < 0.:
-                self.inflow_index = 1
-                self.outflow_index = 0
-
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
-            else:
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
-
-        else:
-            reverse = pypar.receive(self.master_proc)
-
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
+        # master proc orders reversal if applicable
+        self.set_flow_direction(reverse)
 
         # Master proc computes return values
-        if self.myid == self.master_proc:
+        if enq is not None:
             # Zero Q if sign's of smooth_Q and Q differ
             if numpy.sign(self.smooth_Q) != numpy.sign(Q):
                 Q = 0.
@@ -255,7 +255,7 @@ def Boyd_box_operator(domain,
         print("========================================================")
 
     if alloc0 or alloc1:
-        return Parallel_Boyd_box_operator(domain=domain,
+        operator = Parallel_Boyd_box_operator(domain=domain,
                                          losses=losses,
                                          width=width,
                                          height=height,
@@ -282,7 +282,11 @@ def Boyd_box_operator(domain,
                                          inlet_procs = inlet_procs,
                                          enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    register_parallel_structure(domain, operator)
+
+    return operator
 
 
 
@@ -420,7 +424,7 @@ def Boyd_pipe_operator(domain,
         print("========================================================")
 
     if alloc0 or alloc1:
-       return Parallel_Boyd_pipe_operator(domain=domain,
+        operator = Parallel_Boyd_pipe_operator(domain=domain,
                                          losses=losses,
                                          diameter=diameter,
                                          blockage=blockage,
@@ -446,7 +450,11 @@ def Boyd_pipe_operator(domain,
                                          inlet_procs = inlet_procs,
                                          enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    register_parallel_structure(domain, operator)
+
+    return operator
 
 
 
@@ -601,7 +609,7 @@ def Weir_orifice_trapezoid_operator(domain,
         print("========================================================")
 
     if alloc0 or alloc1:
-        return Parallel_Weir_orifice_trapezoid_operator(domain=domain,
+        operator = Parallel_Weir_orifice_trapezoid_operator(domain=domain,
                                          losses=losses,
                                          width=width,
                                          height=height,
@@ -631,7 +639,11 @@ def Weir_orifice_trapezoid_operator(domain,
                                          inlet_procs = inlet_procs,
                                          enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    register_parallel_structure(domain, operator)
+
+    return operator
 
 
 """
@@ -773,7 +785,7 @@ def Internal_boundary_operator(domain,
         print("========================================================")
 
     if alloc0 or alloc1:
-        return Parallel_Internal_boundary_operator(domain=domain,
+        operator = Parallel_Internal_boundary_operator(domain=domain,
                                          internal_boundary_function=internal_boundary_function,
                                          width=width,
                                          height=height,
@@ -799,7 +811,11 @@ def Internal_boundary_operator(domain,
                                          inlet_procs = inlet_procs,
                                          enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    register_parallel_structure(domain, operator)
+
+    return operator
 
 
 
@@ -873,6 +889,16 @@ def __process_skew_culvert(exchange_lines, end_points, enquiry_points, apron, en
     return enquiry_points
 
 
+def register_parallel_structure(domain, operator):
+    """Reserve a slot for the structure in the batched structure exchange
+    of a parallel domain (operator is None on the processors not associated
+    with the structure). Must be called on all processors.
+    """
+
+    if isinstance(domain, Parallel_domain):
+        domain.register_parallel_structure(operator)
+
+
 def allocate_inlet_procs(domain, region, enquiry_point = None, master_proc = 0, procs = None, verbose = False):
 
 
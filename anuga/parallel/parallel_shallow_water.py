@@ -106,6 +106,36 @@ class Parallel_domain(Domain):
 
         self.ghost_counter = 0
 
+        self.set_overlap_communication(False)
+
+        # Parallel structures registered by the parallel operator factory
+        self.structure_exchange = None
+        self.batched_structure_exchange = False
+
+
+    def __getstate__(self):
+        """MPI requests cannot be pickled (e.g. by checkpointing),
+        persistent ghost requests are recreated on unpickling.
+        """
+
+        generic_comms.communicate_ghosts_finish(self)
+
+        state = self.__dict__.copy()
+        state['persistent_ghost_requests'] = None
+        state['_restore_persistent_ghost_requests'] = \
+            self.persistent_ghost_requests is not None
+
+        return state
+
+
+    def __setstate__(self, state):
+
+        restore = state.pop('_restore_persistent_ghost_requests', False)
+        self.__dict__.update(state)
+
+        if restore:
+            generic_comms.setup_persistent_ghost_requests(self)
+
 
     def set_name(self, name):
         """Assign name based on processor number
@@ -134,20 +164,350 @@ class Parallel_domain(Domain):
         Domain.update_timestep(self, yieldstep, finaltime)
 
 
+    def register_reduction(self, name, function, op='sum'):
+        """Register a scalar to be reduced over all processors every
+        timestep, in the same Allreduce as the flux timestep.
+
+        function() returns the local value and op is one of
+        'min', 'max' or 'sum'. The reduced value is available from
+        get_reduced_value(name) after each timestep update.
+        """
+
+        if op not in ['min', 'max', 'sum']:
+            msg = 'Unknown reduction op %s, use min, max or sum' % op
+            raise Exception(msg)
+
+        self.reductions[name] = (function, op)
+
+
+    def deregister_reduction(self, name):
+
+        self.reductions.pop(name, None)
+        self.reduced_values.pop(name, None)
+
+
+    def get_reduced_value(self, name):
+        """Return the value of a registered reduction from the latest
+        timestep (None before the first timestep)
+        """
+
+        if name not in self.reductions:
+            msg = 'No reduction %s has been registered' % name
+            raise Exception(msg)
+
+        return self.reduced_values.get(name)
+
+
+    def set_step_diagnostics(self, flag=True):
+        """Reduce the water volume and the maximum speed of the full
+        triangles every timestep, in the same Allreduce as the flux
+        timestep (see register_reduction).
+
+        The values, from the start of the latest timestep, are available
+        from get_reduced_value('water_volume') and
+        get_reduced_value('max_speed').
+        """
+
+        if flag:
+            full = self.tri_full_flag == 1
+
+            def max_speed():
+                if not num.any(full):
+                    return 0.0
+                return num.max(self.max_speed[full])
+
+            self.register_reduction('water_volume', self._get_local_water_volume)
+            self.register_reduction('max_speed', max_speed, 'max')
+        else:
+            self.deregister_reduction('water_volume')
+            self.deregister_reduction('max_speed')
+
+
+
+    def set_overlap_communication(self, flag=True):
+        """Overlap the ghost communication with computation.
+
+        When set, update_ghosts only starts the exchange of ghost
+        cell data. The extrapolation and fluxes of the triangles which
+        do not depend on ghost values are computed while the messages
+        are in flight, and the rest once they have arrived.
+
+        Only used with the discontinuous elevation (DE) algorithms
+        with multiprocessor_mode 2, otherwise the flag is ignored.
+        """
+
+        generic_comms.communicate_ghosts_finish(self)
+
+        self.overlap_communication = flag
+        self.overlap_triangle_sets = None
+
+
+    def get_overlap_communication(self):
+
+        return self.overlap_communication
+
+
+    def set_persistent_ghost_communication(self, flag=True):
+        """Use MPI persistent requests (Send_init/Recv_init) for the
+        ghost updates, set up once for the domain rather than every update.
+        """
+
+        if flag:
+            generic_comms.setup_persistent_ghost_requests(self)
+        else:
+            generic_comms.free_persistent_ghost_requests(self)
+
+
+    def get_persistent_ghost_communication(self):
+
+        return self.persistent_ghost_requests is not None
+
+
+    def get_overlap_triangle_sets(self):
+        """Triangle index sets used to overlap communication with computation
+        """
+
+        if self.overlap_triangle_sets is None:
+            from anuga.parallel.distribute_mesh import build_overlap_triangle_sets
+            self.overlap_triangle_sets = \
+                build_overlap_triangle_sets(self.neighbours, self.tri_full_flag)
+
+        return self.overlap_triangle_sets
+
+
+    def _using_overlap(self):
+
+        return self.overlap_communication and \
+               self.multiprocessor_mode == 2 and \
+               self.get_using_discontinuous_elevation()
+
 
     def update_ghosts(self, quantities=None):
         """We must send the information from the full cells and
         receive the information for the ghost cells
         """
 
-        #generic_comms.communicate_ghosts_asynchronous(self, quantities)
-        generic_comms.communicate_ghosts_non_blocking(self, quantities)
-        #generic_comms.communicate_ghosts_blocking(self)
+        # Complete any outstanding exchange first
+        generic_comms.communicate_ghosts_finish(self)
+
+        if quantities is None and self._using_overlap():
+            # Completed by the next step (or any other use of the ghosts)
+            generic_comms.communicate_ghosts_start(self)
+        else:
+            #generic_comms.communicate_ghosts_asynchronous(self, quantities)
+            generic_comms.communicate_ghosts_non_blocking(self, quantities)
+            #generic_comms.communicate_ghosts_blocking(self)
+
+
+    def distribute_to_vertices_and_edges(self):
+
+        generic_comms.communicate_ghosts_finish(self)
+
+        Domain.distribute_to_vertices_and_edges(self)
+
+
+    def update_extrema(self):
+
+        if self.quantities_to_be_monitored is not None:
+            generic_comms.communicate_ghosts_finish(self)
+
+        Domain.update_extrema(self)
+
+
+    def distribute_update_boundary_and_compute_fluxes(self, fix_backup=False):
+        """Extrapolate, apply boundary conditions and compute fluxes,
+        completing an outstanding ghost exchange along the way.
+
+        The triangles which do not depend on ghost values are processed
+        before waiting for the ghost data. If fix_backup is set the
+        received ghost values are also copied to the backup of the
+        conserved quantities (which was taken before they arrived).
+        """
+
+        if self.ghost_requests is None or not self._using_overlap():
+            self.distribute_to_vertices_and_edges()
+            self.update_boundary()
+            self.compute_fluxes()
+            return
+
+        if self.precision == 'single':
+            from anuga.shallow_water.sw_domain_openmp_sp_ext import \
+                compute_fluxes_ext_central_indices, \
+                extrapolate_second_order_edge_sw_indices, \
+                protect_new_indices
+        else:
+            from anuga.shallow_water.sw_domain_openmp_ext import \
+                compute_fluxes_ext_central_indices, \
+                extrapolate_second_order_edge_sw_indices, \
+                protect_new_indices
+
+        sets = self.get_overlap_triangle_sets()
+        timers = self.phase_timers
+
+        # Triangles independent of the ghost cells
+        timers.start('distribute_to_vertices_and_edges')
+        mass_error = protect_new_indices(self, sets['extrapolate_interior_closure'])
+        extrapolate_second_order_edge_sw_indices(self,
+                                                 sets['extrapolate_interior'],
+                                                 sets['extrapolate_interior_closure'])
+        timers.stop('distribute_to_vertices_and_edges')
+
+        timers.start('compute_fluxes')
+        timestep = compute_fluxes_ext_central_indices(self,
+                                                      self.evolve_max_timestep,
+                                                      sets['flux_interior'], 1)
+        timers.stop('compute_fluxes')
+
+        # Now wait for the ghost values
+        generic_comms.communicate_ghosts_finish(self)
+
+        if fix_backup:
+            for name in self.conserved_quantities:
+                Q = self.quantities[name]
+                for p in self.ghost_recv_dict:
+                    Idg = self.ghost_recv_dict[p][0]
+                    Q.centroid_backup_values[Idg] = Q.centroid_values[Idg]
+
+        # Triangles which depend on the ghost cells or the boundary
+        timers.start('distribute_to_vertices_and_edges')
+        mass_error = protect_new_indices(self, sets['protect_halo'])
+        extrapolate_second_order_edge_sw_indices(self,
+                                                 sets['extrapolate_halo'],
+                                                 sets['extrapolate_halo_closure'])
+        timers.stop('distribute_to_vertices_and_edges')
+
+        self.update_boundary()
+
+        timers.start('compute_fluxes')
+        self.flux_timestep = compute_fluxes_ext_central_indices(self, timestep,
+                                                                sets['flux_halo'], 0)
+        timers.stop('compute_fluxes')
+
+        if mass_error > 0.0 and self.verbose :
+            print('Cumulative mass protection: {0} m^3'.format(mass_error))
+
+
+    def set_ghost_timestep_frequency(self, frequency):
+
+        generic_comms.setup_ghost_frequency(self, frequency)
+
+
+    def sort_ghosts_by_frequency(self, frequency):
+
+        generic_comms.order_ghosts_by_frequency(self, frequency)
+
+
+    def update_ghosts_by_frequency(self, max_frequency):
+
+        generic_comms.communicate_ghosts_by_frequency(self, max_frequency)
+
+
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+
+        if self.local_timestepping is not None:
+            generic_comms.communicate_ghosts_finish(self)
+            Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+            return
+
+        if not self._using_overlap():
+            Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+            return
+
+        self.distribute_update_boundary_and_compute_fluxes()
+
+        self.compute_forcing_terms()
+
+        self.update_timestep(yieldstep, finaltime)
+
+        if self.max_flux_update_frequency != 1:
+            self.compute_flux_update_frequency()
+
+        self.update_conserved_quantities()
+
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+
+        if self.local_timestepping is not None:
+            generic_comms.communicate_ghosts_finish(self)
+            Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+            return
+
+        if not self._using_overlap():
+            Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+            return
+
+        self.backup_conserved_quantities()
+
+        # First euler step
+        self.distribute_update_boundary_and_compute_fluxes(fix_backup=True)
+
+        self.compute_forcing_terms()
+
+        self.update_timestep(yieldstep, finaltime)
+
+        self.update_conserved_quantities()
+
+        self.set_relative_time(self.get_relative_time() + self.timestep)
+
+        if self.ghost_layer_width < 4:
+            self.update_ghosts()
+
+        # Second euler step using the same timestep
+        self.distribute_update_boundary_and_compute_fluxes()
+
+        self.compute_forcing_terms()
+
+        self.update_conserved_quantities()
+
+        # Combine steps
+        self.saxpy_conserved_quantities(0.5, 0.5)
+
+    def set_batched_structure_exchange(self, flag=True):
+        """Gather the inlet and enquiry point summaries of all parallel
+        structures (culverts, pipes, weirs and internal boundaries) with one
+        allreduce per timestep, instead of point to point messages for each
+        structure. Structures then see the state at the start of the
+        fractional steps. Requires the structures to be created on all
+        processors, set before evolving.
+        """
+
+        self.batched_structure_exchange = flag
+
+        # The other procs of each structure start computing the discharge
+        # from the state of the master proc
+        if flag and self.structure_exchange is not None:
+            for structure in self.structure_exchange.structures:
+                if structure is not None:
+                    structure.share_smoothing_state()
+
+    def get_batched_structure_exchange(self):
+
+        return self.batched_structure_exchange
+
+    def register_parallel_structure(self, structure):
+        """Reserve a slot in the batched structure exchange for structure
+        (None on processors not associated with the structure). Must be
+        called on all processors in the same order.
+        """
+
+        if self.structure_exchange is None:
+            from .parallel_structure_operator import Parallel_structure_exchange
+            self.structure_exchange = Parallel_structure_exchange()
+
+        return self.structure_exchange.register(structure)
 
     def apply_fractional_steps(self):
 
-        for operator in self.fractional_step_operators:
-            operator()
+        exchange = self.structure_exchange
+
+        if self.batched_structure_exchange and exchange is not None:
+            exchange.update()
+            try:
+                Domain.apply_fractional_steps(self)
+            finally:
+                exchange.clear()
+        else:
+            Domain.apply_fractional_steps(self)
 
         # PETE: Make sure that there are no deadlocks here
 
@@ -155,12 +515,20 @@ class Parallel_domain(Domain):
 
 
 
-    def sww_merge(self, verbose=False, delete_old=False):
+    def sww_merge(self, verbose=False, delete_old=False, memory_limit=None,
+                  processes=None, incremental=False):
         """Merge all the sub domain sww files into a global sww file
 
         :param bool verbose: Flag to produce more output
         :param bool delete_old: Flag to delete sub domain sww files after
             creating global sww file
+        :param int memory_limit: Memory (bytes) used for the timesteps merged
+            at a time (default anuga.utilities.sww_merge.default_memory_limit)
+        :param int processes: Number of processes reading the sub domain
+            sww files
+        :param bool incremental: Only append the timesteps not yet in the
+            global sww file, so the merge can be repeated during a run
+            (cannot be used with delete_old)
 
         """
 
@@ -174,7 +542,8 @@ class Parallel_domain(Domain):
 
             global_name = join(self.get_datadir(),self.get_global_name())
 
-            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old)
+            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old,
+                                     memory_limit, processes, incremental)
 
         # make sure all the merge completes on processor 0 before other
         # processors complete (like when finalize is forgotten in main script)
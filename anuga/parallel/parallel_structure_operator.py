@@ -8,6 +8,7 @@ from anuga.utilities import parallel_abstraction as pypar
 from anuga.utilities.system_tools import log_to_file
 from anuga.utilities.numerical_tools import ensure_numeric
 from anuga.structures.inlet_enquiry import Inlet_enquiry
+from .parallel_inlet import inlet_averages
 
 
 class Parallel_Structure_operator(anuga.Operator):
@@ -161,6 +162,10 @@ class Parallel_Structure_operator(anuga.Operator):
         self.outlet_depth = 0.0
         self.delta_total_energy = 0.0
         self.driving_energy = 0.0
+
+        # Smoothed discharge and energy difference of the discharge routine
+        self.smooth_Q = 0.0
+        self.smooth_delta_total_energy = 0.0
         
         if exchange_lines is not None:
             self.__process_skew_culvert()
@@ -250,6 +255,15 @@ class Parallel_Structure_operator(anuga.Operator):
         self.inflow_index = 0
         self.outflow_index = 1
 
+        # Slot in the batched structure exchange of the domain, set by the
+        # parallel operator factory
+        self.structure_exchange = None
+        self.structure_slot = None
+
+        # Inlet depths, xmoms and ymoms on this proc when the batched
+        # structure exchange took the summary (see get_local_summary)
+        self.inlet_snapshots = [None, None]
+
         self.set_parallel_logging(logging)
 
     def __call__(self):
@@ -258,35 +272,27 @@ class Parallel_Structure_operator(anuga.Operator):
 
         Q, barrel_speed, outlet_depth = self.discharge_routine()
 
-        # Get attributes of Inflow inlet, all procs associated with inlet must call
-        if self.myid in self.inlet_procs[self.inflow_index]:
-            old_inflow_depth = self.inlets[self.inflow_index].get_global_average_depth()
-            old_inflow_stage = self.inlets[self.inflow_index].get_global_average_stage()
-            old_inflow_xmom = self.inlets[self.inflow_index].get_global_average_xmom()
-            old_inflow_ymom = self.inlets[self.inflow_index].get_global_average_ymom()
-            inflow_area = self.inlets[self.inflow_index].get_global_area()
+        # With the batched structure exchange all procs of the structure
+        # have the inlet averages and compute the update themselves,
+        # otherwise the master proc of the structure computes the update
+        summary = self.get_structure_summary()
 
-        # Master proc of inflow inlet sends attributes to master proc of structure
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[self.inflow_index]:
-                old_inflow_depth = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_stage = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_xmom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_ymom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                inflow_area = pypar.receive(self.inlet_master_proc[self.inflow_index])
-        elif self.myid == self.inlet_master_proc[self.inflow_index]:
-            pypar.send(old_inflow_depth, self.master_proc)
-            pypar.send(old_inflow_stage, self.master_proc)
-            pypar.send(old_inflow_xmom, self.master_proc)
-            pypar.send(old_inflow_ymom, self.master_proc)
-            pypar.send(inflow_area, self.master_proc)
+        if summary is not None:
+            compute_update = True
+            inflow_averages = inlet_averages(summary[self.inflow_index, :5])
+        else:
+            compute_update = self.myid == self.master_proc
+            inflow_averages = self.gather_inlet_averages(self.inflow_index)
 
         # Implement the update of flow over a timestep by
         # using a semi-implict update. This ensures that
         # the update does not create a negative depth
         
         # Master proc of structure only
-        if self.myid == self.master_proc:
+        if compute_update:
+            inflow_area, old_inflow_depth, old_inflow_stage, \
+                old_inflow_xmom, old_inflow_ymom = inflow_averages
+
             if old_inflow_depth > 0.0 :
                 dt_Q_on_d = timestep*Q/old_inflow_depth
             else:
@@ -347,50 +353,34 @@ class Parallel_Structure_operator(anuga.Operator):
                 new_inflow_xmom = old_inflow_xmom*factor2
                 new_inflow_ymom = old_inflow_ymom*factor2
 
-        # Master proc of structure sends new inflow attributes to all inflow inlet processors
+            new_inflow = num.array([new_inflow_depth, new_inflow_xmom, new_inflow_ymom])
+        else:
+            new_inflow = None
 
-        if self.myid == self.master_proc:
-            for i in self.inlet_procs[self.inflow_index]:
-                if i == self.master_proc: continue
-                pypar.send(new_inflow_depth, i)
-                pypar.send(new_inflow_xmom, i)
-                pypar.send(new_inflow_ymom, i)
-        elif self.myid in self.inlet_procs[self.inflow_index]:
-            new_inflow_depth = pypar.receive(self.master_proc)
-            new_inflow_xmom = pypar.receive(self.master_proc)
-            new_inflow_ymom = pypar.receive(self.master_proc)
+        # Master proc of structure sends new inflow attributes to all inflow inlet processors
+        if summary is None:
+            new_inflow = self.scatter_inlet_values(self.inflow_index, new_inflow)
 
         # Inflow inlet procs sets new attributes
         if self.myid in self.inlet_procs[self.inflow_index]:
-            self.inlets[self.inflow_index].set_depths(new_inflow_depth)
-            self.inlets[self.inflow_index].set_xmoms(new_inflow_xmom)
-            self.inlets[self.inflow_index].set_ymoms(new_inflow_ymom)
-
-        # Get outflow inlet attributes, all processors associated with outflow inlet must call
-        if self.myid in self.inlet_procs[self.outflow_index]:
-            outflow_area = self.inlets[self.outflow_index].get_global_area()
-            outflow_average_depth = self.inlets[self.outflow_index].get_global_average_depth()
-            outflow_outward_culvert_vector = self.inlets[self.outflow_index].outward_culvert_vector
-            outflow_average_xmom = self.inlets[self.outflow_index].get_global_average_xmom()
-            outflow_average_ymom = self.inlets[self.outflow_index].get_global_average_ymom()
+            self.set_inlet_values(self.inflow_index, new_inflow, summary is not None)
 
-        # Master proc of outflow inlet sends attribute to master proc of structure
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[self.outflow_index]:
-                outflow_area = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_depth = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_outward_culvert_vector = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_xmom = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_ymom = pypar.receive(self.inlet_master_proc[self.outflow_index])
-        elif self.myid == self.inlet_master_proc[self.outflow_index]:
-            pypar.send(outflow_area, self.master_proc)
-            pypar.send(outflow_average_depth, self.master_proc)
-            pypar.send(outflow_outward_culvert_vector, self.master_proc)
-            pypar.send(outflow_average_xmom, self.master_proc)
-            pypar.send(outflow_average_ymom, self.master_proc)
+        # Get outflow inlet attributes
+        if summary is not None:
+            outflow_averages = inlet_averages(summary[self.outflow_index, :5])
+        else:
+            outflow_averages = self.gather_inlet_averages(self.outflow_index)
 
         # Master proc of structure computes new outflow attributes
-        if self.myid == self.master_proc:
+        if compute_update:
+            outflow_area, outflow_average_depth, outflow_average_stage, \
+                outflow_average_xmom, outflow_average_ymom = outflow_averages
+
+            if self.outflow_index == 0:
+                outflow_outward_culvert_vector = self.culvert_vector
+            else:
+                outflow_outward_culvert_vector = - self.culvert_vector
+
             loss = (old_inflow_depth - new_inflow_depth)*inflow_area
             xmom_loss = (old_inflow_xmom - new_inflow_xmom)*inflow_area
             ymom_loss = (old_inflow_ymom - new_inflow_ymom)*inflow_area
@@ -450,23 +440,185 @@ class Parallel_Structure_operator(anuga.Operator):
                 new_outflow_xmom = outflow_average_xmom + xmom_loss/outflow_area
                 new_outflow_ymom = outflow_average_ymom + ymom_loss/outflow_area
 
-            # master proc of structure sends outflow attributes to all outflow procs
-            for i in self.inlet_procs[self.outflow_index]:
-                if i == self.myid: continue
-                pypar.send(new_outflow_depth, i)
-                pypar.send(new_outflow_xmom, i)
-                pypar.send(new_outflow_ymom, i)
-        # outflow inlet procs receives new outflow attributes
-        elif self.myid in self.inlet_procs[self.outflow_index]:
-            new_outflow_depth = pypar.receive(self.master_proc)
-            new_outflow_xmom = pypar.receive(self.master_proc)
-            new_outflow_ymom = pypar.receive(self.master_proc)
+            new_outflow = num.array([new_outflow_depth, new_outflow_xmom, new_outflow_ymom])
+        else:
+            new_outflow = None
+
+        # master proc of structure sends outflow attributes to all outflow procs
+        if summary is None:
+            new_outflow = self.scatter_inlet_values(self.outflow_index, new_outflow)
 
         # outflow inlet procs sets new outflow attributes
         if self.myid in self.inlet_procs[self.outflow_index]:
-            self.inlets[self.outflow_index].set_depths(new_outflow_depth)
-            self.inlets[self.outflow_index].set_xmoms(new_outflow_xmom)
-            self.inlets[self.outflow_index].set_ymoms(new_outflow_ymom)
+            self.set_inlet_values(self.outflow_index, new_outflow, summary is not None)
+
+    def set_inlet_values(self, index, values, batched=False):
+        """Set the depth, xmom and ymom of the triangles of inlet index on
+        this proc to the averages in values.
+
+        With the batched structure exchange the averages were computed from
+        the state when the summary was taken, before the operators applied
+        earlier in the fractional steps. So only the change from that
+        state is applied, which keeps the changes made by those operators
+        (or by structures with overlapping inlets) and conserves mass.
+        """
+
+        inlet = self.inlets[index]
+
+        if batched:
+            depths, xmoms, ymoms = self.inlet_snapshots[index]
+            inlet.set_depths(inlet.get_depths() + values[0] - depths)
+            inlet.set_xmoms(inlet.get_xmoms() + values[1] - xmoms)
+            inlet.set_ymoms(inlet.get_ymoms() + values[2] - ymoms)
+        else:
+            inlet.set_depths(values[0])
+            inlet.set_xmoms(values[1])
+            inlet.set_ymoms(values[2])
+
+    def gather_inlet_averages(self, index):
+        """Return the array [area, depth, stage, xmom, ymom] of averages of
+        inlet index on the master proc of the structure, None on the other
+        procs.
+
+        All procs associated with the inlet must call. The master proc of
+        the inlet sends the averages to the master proc of the structure in
+        one message.
+        """
+
+        averages = None
+
+        if self.myid in self.inlet_procs[index]:
+            averages = self.inlets[index].get_global_averages()
+
+        if self.myid == self.master_proc:
+            if self.myid != self.inlet_master_proc[index]:
+                averages = num.empty(5)
+                pypar.receive(self.inlet_master_proc[index], buffer=averages, bypass=True)
+            return averages
+        elif self.myid == self.inlet_master_proc[index]:
+            pypar.send(averages, self.master_proc, bypass=True)
+
+        return None
+
+    def scatter_inlet_values(self, index, values):
+        """Master proc of the structure sends the array of new depth, xmom
+        and ymom to all procs of inlet index, one message per proc. Returns
+        the array on the procs of the inlet.
+        """
+
+        if self.myid == self.master_proc:
+            for i in self.inlet_procs[index]:
+                if i == self.master_proc: continue
+                pypar.send(values, i, bypass=True)
+        elif self.myid in self.inlet_procs[index]:
+            values = num.empty(3)
+            pypar.receive(self.master_proc, buffer=values, bypass=True)
+
+        return values
+
+    def get_local_summary(self):
+        """Return the (2, 9) array of this proc's contribution to the summary
+        of the structure: for each inlet the local sums [area, volume,
+        stage*area, xmom*area, ymom*area] followed by the enquiry
+        [total_energy, stage, depth, specific_energy] on the enquiry proc.
+        Summing over all procs gives the summary of the structure.
+
+        The inlet values are kept, so set_inlet_values can apply the
+        update of the structure as a change from this state.
+        """
+
+        summary = num.zeros((2, 9))
+
+        for i in [0, 1]:
+            if self.myid in self.inlet_procs[i]:
+                summary[i, :5] = self.inlets[i].get_local_sums()
+                self.inlet_snapshots[i] = (self.inlets[i].get_depths(),
+                                           self.inlets[i].get_xmoms(),
+                                           self.inlets[i].get_ymoms())
+            if self.myid == self.enquiry_proc[i]:
+                summary[i, 5:] = self.inlets[i].get_enquiry_summary()
+
+        return summary
+
+    def get_structure_summary(self):
+        """Return the summary of the structure gathered by the batched
+        structure exchange of the domain (see get_local_summary), None if
+        not available. It is only available while the domain applies the
+        fractional step operators.
+        """
+
+        if self.structure_exchange is None:
+            return None
+
+        return self.structure_exchange.get_summary(self.structure_slot)
+
+    def get_enquiry_values(self):
+        """Return the (2, 4) array of [total_energy, stage, depth,
+        specific_energy] at both enquiry points on the procs which compute
+        the discharge, None on the other procs.
+
+        With the batched structure exchange all procs of the structure
+        compute the discharge, otherwise the enquiry procs send their values
+        to the master proc in one message.
+        """
+
+        summary = self.get_structure_summary()
+        if summary is not None:
+            return summary[:, 5:]
+
+        values = num.zeros((2, 4))
+        for i in [0, 1]:
+            if self.myid == self.enquiry_proc[i]:
+                values[i] = self.inlets[i].get_enquiry_summary()
+
+        if self.myid == self.master_proc:
+            buffer = num.empty_like(values)
+            for i in set(self.enquiry_proc):
+                if i == self.master_proc: continue
+                pypar.receive(i, buffer=buffer, bypass=True)
+                values += buffer
+            return values
+        elif self.myid in self.enquiry_proc:
+            pypar.send(values, self.master_proc, bypass=True)
+
+        return None
+
+    def share_smoothing_state(self):
+        """Master proc sends the smoothed discharge and energy difference to
+        the other procs of the structure, which need them to compute the
+        discharge with the batched structure exchange.
+        """
+
+        if self.myid == self.master_proc:
+            state = num.array([self.smooth_Q, self.smooth_delta_total_energy], float)
+            for i in self.procs:
+                if i == self.master_proc: continue
+                pypar.send(state, i, bypass=True)
+        else:
+            state = num.empty(2)
+            pypar.receive(self.master_proc, buffer=state, bypass=True)
+            self.smooth_Q, self.smooth_delta_total_energy = state
+
+    def set_flow_direction(self, reverse):
+        """Set the inflow and outflow inlets. Unless all procs of the structure
+        compute the discharge (batched structure exchange) the master proc
+        sends the direction to the other procs of the structure.
+        """
+
+        if self.get_structure_summary() is None:
+            if self.myid == self.master_proc:
+                for i in self.procs:
+                    if i == self.master_proc: continue
+                    pypar.send(reverse, i)
+            else:
+                reverse = pypar.receive(self.master_proc)
+
+        if reverse:
+            self.inflow_index = 1
+            self.outflow_index = 0
+        else:
+            self.inflow_index = 0
+            self.outflow_index = 1
 
     def __process_non_skew_culvert(self):
         """Create lines at the end of a culvert inlet and outlet.
@@ -1310,3 +1462,69 @@ class Parallel_Structure_operator(anuga.Operator):
         return [enq0, enq1]
 
 
+
+
+class Parallel_structure_exchange(object):
+    """Gather the summaries of all the parallel structures of a domain with
+    a single allreduce per timestep.
+
+    Each structure has a slot holding for both inlets the area, volume,
+    area weighted stage, xmom and ymom and the enquiry total energy,
+    stage, depth and specific energy (see
+    Parallel_Structure_operator.get_local_summary). The slots are
+    registered by the parallel operator factory on all processors, in the
+    same order, with None on the processors not associated with the
+    structure.
+
+    While the summaries are available all processors of a structure
+    compute the discharge and the inlet updates themselves, so no other
+    communication is needed. The structures then see the state at the
+    start of the fractional steps, rather than the state left by the
+    operators applied before them, and apply their inlet updates as
+    changes from that state (see
+    Parallel_Structure_operator.set_inlet_values).
+    """
+
+    def __init__(self):
+
+        self.structures = []
+        self.summaries = None
+
+    def register(self, structure):
+        """Reserve the next slot for structure (None if the structure is not
+        on this processor). Must be called on all processors.
+        """
+
+        slot = len(self.structures)
+        self.structures.append(structure)
+
+        if structure is not None:
+            structure.structure_exchange = self
+            structure.structure_slot = slot
+
+        return slot
+
+    def update(self):
+        """Gather the summaries of all structures. Must be called on all
+        processors.
+        """
+
+        values = num.zeros((len(self.structures), 2, 9))
+        for slot, structure in enumerate(self.structures):
+            if structure is not None:
+                values[slot] = structure.get_local_summary()
+
+        values = pypar.allreduce_values(values.ravel(), ['sum']*values.size)
+
+        self.summaries = values.reshape(len(self.structures), 2, 9)
+
+    def clear(self):
+
+        self.summaries = None
+
+    def get_summary(self, slot):
+
+        if self.summaries is None:
+            return None
+
+        return self.summaries[slot]
@@ -10,13 +10,18 @@ from anuga import Domain
 from anuga.parallel.distribute_mesh  import send_submesh
 from anuga.parallel.distribute_mesh  import rec_submesh
 from anuga.parallel.distribute_mesh  import extract_submesh
+from anuga.parallel.distribute_mesh  import extract_submesh_cell
 
 # Mesh partitioning using Metis
-from anuga.parallel.distribute_mesh import build_submesh
+from anuga.parallel.distribute_mesh import build_submesh_cell
 from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
 
 from anuga.parallel.parallel_shallow_water import Parallel_domain
 
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import boundary_to_arrays
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import arrays_to_boundary
+
 
 
 class Sequential_distribute(object):
@@ -74,23 +79,14 @@ class Sequential_distribute(object):
                pmesh_divide_metis_with_map(domain, numprocs)
 
 
-        # Build the mesh that should be assigned to each processor,
-        # this includes ghost nodes and the communication pattern
-        if verbose: print('sequential_distribute: Build submeshes')
+        # The mesh that should be assigned to each processor (which
+        # includes ghost nodes and the communication pattern) is built
+        # when it is extracted, so only one is held at any time
+        if verbose: print('sequential_distribute: Build partitioned mesh')
         if verbose: print('sequential_distribute: parameters = ',parameters)
 
-        submesh = build_submesh(new_nodes, new_triangles, new_boundary, \
-                                quantities, triangles_per_proc, parameters=parameters)
-
-        if verbose:
-            for p in range(numprocs):
-                N = len(submesh['ghost_nodes'][p])
-                M = len(submesh['ghost_triangles'][p])
-                print('There are %d ghost nodes and %d ghost triangles on proc %d'\
-                      %(N, M, p))
-
-
-        self.submesh = submesh
+        self.mesh = Mesh(new_nodes, new_triangles, new_boundary)
+        self.quantities = quantities
         self.triangles_per_proc = triangles_per_proc
         self.p2s_map =  p2s_map
 
@@ -99,7 +95,6 @@ class Sequential_distribute(object):
         """Build the local mesh for processor p
         """
 
-        submesh = self.submesh
         triangles_per_proc = self.triangles_per_proc
         p2s_map = self.p2s_map
         verbose = self.verbose
@@ -108,15 +103,25 @@ class Sequential_distribute(object):
         assert p>=0
         assert p<self.numprocs
 
+        submesh = build_submesh_cell(self.mesh, self.quantities,
+                                     triangles_per_proc, p,
+                                     parameters=self.parameters)
+
+        if verbose:
+            N = len(submesh['ghost_nodes'])
+            M = len(submesh['ghost_triangles'])
+            print('There are %d ghost nodes and %d ghost triangles on proc %d'\
+                  %(N, M, p))
+
+        number_of_full_nodes = len(submesh['full_nodes'])
+        number_of_full_triangles = len(submesh['full_triangles'])
 
         points, vertices, boundary, quantities, \
             ghost_recv_dict, full_send_dict, \
             tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
-              extract_submesh(submesh, triangles_per_proc, p2s_map, p)
+              extract_submesh_cell(submesh, triangles_per_proc, p2s_map, p)
 
-
-        number_of_full_nodes = len(submesh['full_nodes'][p])
-        number_of_full_triangles = len(submesh['full_triangles'][p])
+        del submesh
 
 
         if debug:
@@ -209,15 +214,228 @@ class Sequential_distribute(object):
 
 
 
+#------------------------------------------------------------------------------
+# Send the extracted submeshes as raw buffers
+#------------------------------------------------------------------------------
+
+class _Array_ref(object):
+    """Placeholder for an array of a submesh which is stored (or sent)
+    separately as a raw buffer
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _split_arrays(obj, arrays):
+    """Replace the numerical arrays in nested tuples, lists and dicts
+    by references to the list arrays
+    """
+
+    if isinstance(obj, num.ndarray) and obj.dtype.kind in 'biuf':
+        arrays.append(num.ascontiguousarray(obj))
+        return _Array_ref(len(arrays)-1)
+    elif type(obj) is dict:
+        return dict((k, _split_arrays(v, arrays)) for k, v in obj.items())
+    elif type(obj) in [list, tuple]:
+        return type(obj)(_split_arrays(v, arrays) for v in obj)
+    else:
+        return obj
+
+
+def _join_arrays(obj, arrays):
+    """Inverse of _split_arrays
+    """
+
+    if isinstance(obj, _Array_ref):
+        return arrays[obj.index]
+    elif type(obj) is dict:
+        return dict((k, _join_arrays(v, arrays)) for k, v in obj.items())
+    elif type(obj) in [list, tuple]:
+        return type(obj)(_join_arrays(v, arrays) for v in obj)
+    else:
+        return obj
+
+
+def submesh_to_buffers(tostore):
+    """Split a submesh, as returned by Sequential_distribute.extract_submesh,
+    into a small (picklable) header and a list of contiguous numerical
+    arrays (points, vertices, boundary, quantities, communication
+    patterns and local to global maps)
+    """
+
+    lst = list(tostore)
+    lst[3] = boundary_to_arrays(lst[3])
+
+    arrays = []
+    structure = _split_arrays(tuple(lst), arrays)
+
+    header = {'structure': structure,
+              'arrays': [(x.shape, x.dtype.str) for x in arrays]}
+
+    return header, arrays
+
+
+def submesh_from_buffers(header, arrays):
+    """Inverse of submesh_to_buffers
+    """
+
+    lst = list(_join_arrays(header['structure'], arrays))
+    lst[3] = arrays_to_boundary(*lst[3])
+
+    return tuple(lst)
+
+
+def isend_submesh(tostore, p):
+    """Send a submesh to processor p, the arrays as raw buffers using
+    nonblocking sends. Returns the requests and the arrays, which must be
+    kept until the requests have completed.
+    """
+
+    from anuga.utilities import parallel_abstraction as pypar
+
+    header, arrays = submesh_to_buffers(tostore)
+
+    pypar.send(header, p)
+    requests = [pypar.isend(x, p) for x in arrays]
+
+    return requests, arrays
+
+
+def receive_submesh(p=0):
+    """Receive a submesh sent by isend_submesh from processor p
+    """
+
+    from anuga.utilities import parallel_abstraction as pypar
+
+    header = pypar.receive(p)
+
+    arrays = []
+    for shape, dtype in header['arrays']:
+        x = num.empty(shape, dtype)
+        pypar.receive(p, buffer=x, bypass=True)
+        arrays.append(x)
+
+    return submesh_from_buffers(header, arrays)
+
+
+
+#------------------------------------------------------------------------------
+# Partition files: one binary file per processor holding the precomputed
+# mesh structure, the communication patterns and the quantities.
+#
+# Layout: magic (8 bytes), offset and length of the header (2 x uint64),
+# the arrays, each aligned to _partition_alignment bytes, and finally the
+# pickled header describing the structure of the submesh and the offset,
+# shape and dtype of each array. The arrays are memory mapped (copy on write)
+# when the partition is loaded.
+#------------------------------------------------------------------------------
+
+_partition_magic = b'ANUGAPT1'
+_partition_alignment = 64
+
+
+def submesh_to_partition(tostore, verbose=False):
+    """Replace the points, vertices and boundary of a submesh, as returned
+    by Sequential_distribute.extract_submesh, by the state of the
+    corresponding mesh (see Mesh.get_state)
+    """
+
+    from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+
+    lst = list(tostore)
+    kwargs, points, vertices, boundary = lst[:4]
+
+    mesh = Mesh(points, vertices, boundary,
+                geo_reference=kwargs['geo_reference'],
+                verbose=verbose)
+
+    lst[1] = mesh.get_state()
+    lst[2] = None
+    lst[3] = None
 
+    return tuple(lst)
 
 
-def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None):
-    """ Distribute the domain, create parallel domain and pickle result
+def write_partition_file(tostore, filename, verbose=False):
+    """Write a submesh, as returned by Sequential_distribute.extract_submesh,
+    to a partition file
+    """
+
+    import pickle
+
+    arrays = []
+    structure = _split_arrays(submesh_to_partition(tostore, verbose=verbose),
+                              arrays)
+
+    align = _partition_alignment
+    offset = align
+    layout = []
+    for x in arrays:
+        layout.append((offset, x.shape, x.dtype.str))
+        offset += -(-x.nbytes//align)*align
+
+    header = pickle.dumps({'structure': structure, 'arrays': layout},
+                          protocol=pickle.HIGHEST_PROTOCOL)
+
+    with open(filename, 'wb') as f:
+        f.write(_partition_magic)
+        f.write(num.array([offset, len(header)], '<u8').tobytes())
+        for x, (start, _, _) in zip(arrays, layout):
+            f.write(b'\0'*(start - f.tell()))
+            f.write(x.tobytes())
+        f.write(b'\0'*(offset - f.tell()))
+        f.write(header)
+
+
+def read_partition_file(filename, verbose=False):
+    """Read a partition file written by write_partition_file. Returns the
+    submesh with the points, vertices and boundary replaced by the
+    (memory mapped) state of the mesh.
+    """
+
+    import pickle
+
+    with open(filename, 'rb') as f:
+        magic = f.read(len(_partition_magic))
+        if magic != _partition_magic:
+            msg = 'File %s is not an anuga partition file' % filename
+            raise Exception(msg)
+
+        offset, length = num.frombuffer(f.read(16), '<u8').tolist()
+        f.seek(offset)
+        header = pickle.loads(f.read(length))
+
+    if verbose: print('read_partition_file: Mapping %s' % filename)
+
+    buf = num.memmap(filename, dtype=num.uint8, mode='c')
+
+    arrays = []
+    for start, shape, dtype in header['arrays']:
+        dtype = num.dtype(dtype)
+        count = int(num.prod(shape, dtype=num.int64))
+        x = buf[start:start + count*dtype.itemsize].view(dtype).reshape(shape)
+        arrays.append(num.asarray(x))
+
+    return _join_arrays(header['structure'], arrays)
+
+
+def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None,
+                               file_format='partition'):
+    """ Distribute the domain, create parallel domain and store result
+
+    file_format: 'partition' (the default) writes a <name>_P<np>_<p>.partition
+                 file per processor, holding the precomputed mesh structure
+                 so that loading does not rebuild the mesh. 'pickle' writes
+                 the older pickle file plus .npy files per processor.
     """
 
     from os.path import join
 
+    if file_format not in ['partition', 'pickle']:
+        msg = 'Unknown partition file format %s' % file_format
+        raise Exception(msg)
+
     partition = Sequential_distribute(domain, verbose, debug, parameters)
 
     partition.distribute(numprocs)
@@ -239,6 +457,15 @@ def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir=
 
         tostore = partition.extract_submesh(p)
 
+        if file_format == 'partition':
+            partition_name = partition.domain_name + '_P%g_%g.partition'% (numprocs,p)
+            partition_name = join(partition_dir, partition_name)
+
+            if verbose: print('sequential_distribute_dump: Writing %s' % partition_name)
+
+            write_partition_file(tostore, partition_name)
+            continue
+
         pickle_name = partition.domain_name + '_P%g_%g.pickle'% (numprocs,p)
         pickle_name = join(partition_dir,pickle_name)
         f = open(pickle_name, 'wb')
@@ -257,22 +484,59 @@ def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir=
             lst[4][k] = pickle_name+".np4."+k+".npy"
 
         pickle.dump( tuple(lst), f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.close()
     return
 
 
 def sequential_distribute_load(filename = 'domain', partition_dir = '.', verbose = False):
-
+    """Load the domain of this processor from the files written by
+    sequential_distribute_dump, preferring a partition file over a pickle file
+    """
 
     from anuga import myid, numprocs
 
+    import os
     from os.path import join
 
+    partition_name = filename+'_P%g_%g.partition'% (numprocs,myid)
+    partition_name = join(partition_dir,partition_name)
+
+    if os.path.exists(partition_name):
+        return sequential_distribute_load_partition_file(partition_name, numprocs, verbose = verbose)
+
     pickle_name = filename+'_P%g_%g.pickle'% (numprocs,myid)
     pickle_name = join(partition_dir,pickle_name)
 
     return sequential_distribute_load_pickle_file(pickle_name, numprocs, verbose = verbose)
 
 
+def sequential_distribute_load_partition_file(partition_name, np=1, verbose = False):
+    """
+    Open partition file. The domain is built on the stored mesh structure
+    """
+
+    from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
+
+    submesh = read_partition_file(partition_name, verbose=verbose)
+
+    kwargs, state = submesh[:2]
+    quantities = submesh[4]
+
+    mesh = Mesh.from_state(state)
+
+    #---------------------------------------------------------------------------
+    # Create domain (parallel if np>1)
+    #---------------------------------------------------------------------------
+    if np>1:
+        domain = Parallel_domain(mesh, None, None, **kwargs)
+    else:
+        domain = Domain(mesh, None, None, **kwargs)
+
+    _setup_loaded_domain(domain, quantities, *submesh[5:])
+
+    return domain
+
+
 def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     """
     Open pickle files
@@ -281,14 +545,11 @@ def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     f = open(pickle_name, 'rb')
     import pickle
 
-    kwargs, points, vertices, boundary, quantities, boundary_map, \
-                   domain_name, domain_dir, domain_store, domain_store_centroids, \
-                   domain_minimum_storable_height, domain_minimum_allowed_height, \
-                   domain_flow_algorithm, domain_georef, \
-                   domain_quantities_to_be_stored, domain_smooth, \
-                   domain_low_froude = pickle.load(f)
+    submesh = pickle.load(f)
     f.close()
 
+    kwargs, points, vertices, boundary, quantities = submesh[:5]
+
     for k in quantities:
         quantities[k] = num.load(quantities[k])
     points = num.load(points)
@@ -302,6 +563,20 @@ def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     else:
         domain = Domain(points, vertices, boundary, **kwargs)
 
+    _setup_loaded_domain(domain, quantities, *submesh[5:])
+
+    return domain
+
+
+def _setup_loaded_domain(domain, quantities, boundary_map, \
+                   domain_name, domain_dir, domain_store, domain_store_centroids, \
+                   domain_minimum_storable_height, domain_minimum_allowed_height, \
+                   domain_flow_algorithm, domain_georef, \
+                   domain_quantities_to_be_stored, domain_smooth, \
+                   domain_low_froude):
+    """Set quantities, boundary and attributes of a loaded domain
+    """
+
     #------------------------------------------------------------------------
     # Copy in quantity data
     #------------------------------------------------------------------------
@@ -330,5 +605,3 @@ def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     domain.geo_reference = domain_georef
     domain.set_quantities_to_be_stored(domain_quantities_to_be_stored)
     domain.smooth = domain_smooth
-
-    return domain
@@ -11,13 +11,16 @@ from anuga import Domain
 from anuga import rectangular_cross
 
 from anuga.parallel.distribute_mesh import pmesh_divide_metis
-from anuga.parallel.distribute_mesh import build_submesh
+from anuga.parallel.distribute_mesh import build_submesh, build_submesh_cell
+from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
 from anuga.parallel.distribute_mesh import (
     submesh_full,
     submesh_ghost,
     submesh_quantities,
 )
 from anuga.parallel.distribute_mesh import extract_submesh, rec_submesh, send_submesh
+from anuga.parallel.distribute_mesh import extract_submesh_cell
+from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
 
 import numpy as num
 
@@ -2890,6 +2893,165 @@ class Test_Distribute_Mesh(unittest.TestCase):
 
         # pprint(submesh_cell_1)
 
+    def test_build_submesh_cell(self):
+        """
+        test building the submesh of each processor on its own
+        against build_submesh
+        """
+
+        points, vertices, boundary = rectangular_cross(13, 9)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity("elevation", topography)
+        domain.set_quantity("xmomentum", xcoord)
+
+        for numprocs, width in [(3, 2), (7, 4), (5, 1)]:
+            nodes, triangles, boundary, triangles_per_proc, quantities, \
+                s2p_map, p2s_map = pmesh_divide_metis_with_map(domain, numprocs)
+            parameters = {"ghost_layer_width": width}
+
+            submesh = build_submesh(nodes, triangles, boundary, quantities,
+                                    triangles_per_proc, parameters=parameters)
+            mesh = Mesh(nodes, triangles, boundary)
+
+            for p in range(numprocs):
+                cell = build_submesh_cell(mesh, quantities, triangles_per_proc,
+                                          p, parameters=parameters)
+
+                assert cell["ghost_layer_width"] == width
+                for key in ["full_nodes", "full_triangles", "ghost_nodes",
+                            "ghost_triangles", "ghost_commun"]:
+                    assert num.all(cell[key] == submesh[key][p])
+                for key in ["full_boundary", "ghost_boundary", "full_commun"]:
+                    assert cell[key] == submesh[key][p]
+                for k in quantities:
+                    assert num.all(cell["full_quan"][k] == submesh["full_quan"][k][p])
+                    assert num.all(cell["ghost_quan"][k] == submesh["ghost_quan"][k][p])
+
+                result = extract_submesh_cell(cell, triangles_per_proc, p2s_map, p)
+                true_result = extract_submesh(submesh, triangles_per_proc, p2s_map, p)
+
+                points, vertices, boundary, quantities_p, ghost_recv, full_send = result[:6]
+                assert num.all(points == true_result[0])
+                assert num.all(vertices == true_result[1])
+                assert boundary == true_result[2]
+                for d, true_d in [(ghost_recv, true_result[4]), (full_send, true_result[5])]:
+                    assert sorted(d.keys()) == sorted(true_d.keys())
+                    for proc in d:
+                        assert num.all(d[proc][0] == true_d[proc][0])
+                        assert num.all(d[proc][1] == true_d[proc][1])
+                assert num.all(result[8] == true_result[8])
+
+    def test_submesh_buffers(self):
+        """
+        test splitting an extracted submesh into raw buffers and back
+        """
+
+        from anuga.parallel.sequential_distribute import Sequential_distribute
+        from anuga.parallel.sequential_distribute import submesh_to_buffers
+        from anuga.parallel.sequential_distribute import submesh_from_buffers
+
+        points, vertices, boundary = rectangular_cross(6, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity("elevation", topography)
+        domain.set_quantity("xmomentum", xcoord)
+
+        partition = Sequential_distribute(domain)
+        partition.distribute(3)
+
+        for p in range(3):
+            tostore = partition.extract_submesh(p)
+
+            header, arrays = submesh_to_buffers(tostore)
+
+            # Only small objects are left in the header
+            for x in arrays:
+                assert x.flags["C_CONTIGUOUS"]
+                assert x.dtype.kind in "if"
+
+            result = submesh_from_buffers(header, arrays)
+
+            kwargs, points, vertices, boundary, quantities = tostore[:5]
+            r_kwargs, r_points, r_vertices, r_boundary, r_quantities = result[:5]
+
+            assert num.all(r_points == points)
+            assert num.all(r_vertices == vertices)
+            assert r_boundary == boundary
+            assert sorted(r_quantities.keys()) == sorted(quantities.keys())
+            for k in quantities:
+                assert num.all(r_quantities[k] == quantities[k])
+
+            for k in ["full_send_dict", "ghost_recv_dict"]:
+                assert sorted(r_kwargs[k].keys()) == sorted(kwargs[k].keys())
+                for proc in kwargs[k]:
+                    for i in range(2):
+                        assert num.all(r_kwargs[k][proc][i] == kwargs[k][proc][i])
+
+            assert num.all(r_kwargs["tri_l2g"] == kwargs["tri_l2g"])
+            assert num.all(r_kwargs["node_l2g"] == kwargs["node_l2g"])
+            assert r_kwargs["number_of_full_triangles"] == kwargs["number_of_full_triangles"]
+            assert result[5:] == tostore[5:]
+
+    def test_partition_files(self):
+        """
+        test loading partition files against the pickle files
+        """
+
+        import os
+        import shutil
+        import tempfile
+        from anuga.parallel.sequential_distribute import sequential_distribute_dump
+        from anuga.parallel.sequential_distribute import sequential_distribute_load_partition_file
+        from anuga.parallel.sequential_distribute import sequential_distribute_load_pickle_file
+
+        points, vertices, boundary = rectangular_cross(6, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name("partition")
+        domain.set_quantity("elevation", topography)
+        domain.set_quantity("xmomentum", xcoord)
+
+        partition_dir = tempfile.mkdtemp()
+        try:
+            sequential_distribute_dump(domain, 3, partition_dir=partition_dir)
+            sequential_distribute_dump(domain, 3, partition_dir=partition_dir,
+                                       file_format="pickle")
+
+            for p in range(3):
+                name = os.path.join(partition_dir, "partition_P3_%g" % p)
+                pdomain = sequential_distribute_load_partition_file(name + ".partition", 3)
+                sdomain = sequential_distribute_load_pickle_file(name + ".pickle", 3)
+
+                # The mesh is restored, not rebuilt
+                assert isinstance(pdomain.neighbours, num.memmap) is False
+                assert isinstance(pdomain.neighbours.base, num.memmap)
+
+                for attribute in pdomain.mesh.state_arrays:
+                    assert num.all(getattr(pdomain.mesh, attribute) ==
+                                   getattr(sdomain.mesh, attribute))
+
+                assert pdomain.boundary == sdomain.boundary
+                assert pdomain.boundary_enumeration == sdomain.boundary_enumeration
+                assert pdomain.boundary_tags == sdomain.boundary_tags
+                for tag in sdomain.boundary_tags:
+                    assert num.all(pdomain.tag_boundary_cells[tag] ==
+                                   sdomain.tag_boundary_cells[tag])
+
+                for k in ["full_send_dict", "ghost_recv_dict"]:
+                    pdict = getattr(pdomain, k)
+                    sdict = getattr(sdomain, k)
+                    assert sorted(pdict.keys()) == sorted(sdict.keys())
+                    for proc in sdict:
+                        for i in range(2):
+                            assert num.all(pdict[proc][i] == sdict[proc][i])
+
+                for q in sdomain.quantities:
+                    assert num.all(pdomain.quantities[q].centroid_values ==
+                                   sdomain.quantities[q].centroid_values)
+
+                assert num.all(pdomain.tri_l2g == sdomain.tri_l2g)
+                assert pdomain.get_name() == sdomain.get_name()
+        finally:
+            shutil.rmtree(partition_dir)
+
 
 # -------------------------------------------------------------
 
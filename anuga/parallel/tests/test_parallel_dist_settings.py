@@ -133,12 +133,10 @@ def run_simulation(parallel=False, verbose=False):
             #os.remove('pdomain.sww')
             #os.remove('sdomain.sww')
             try:
-                os.remove('odomain_P4_0.pickle')
-                os.remove('odomain_P4_1.pickle')
-                os.remove('odomain_P4_2.pickle')
-                os.remove('odomain_P4_3.pickle')
-                import glob
-                [ os.remove(fl) for fl in glob.glob('*.npy') ]
+                os.remove('odomain_P4_0.partition')
+                os.remove('odomain_P4_1.partition')
+                os.remove('odomain_P4_2.partition')
+                os.remove('odomain_P4_3.partition')
             except: 
                 if verbose: print('remove files failed')
 
@@ -0,0 +1,154 @@
+"""
+Check that local timestepping (set_local_timestepping) runs in parallel:
+with one level it gives the same results as the standard timestepping,
+with several levels it conserves water and stays close to the standard
+timestepping.
+
+Run with both an euler (DE0) and a rk2 (DE1) flow algorithm
+using multiprocessor_mode 2.
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+
+import unittest
+import os
+import sys
+import numpy as num
+
+import anuga
+
+from anuga import Reflective_boundary
+from anuga import Dirichlet_boundary
+from anuga import rectangular_cross
+from anuga import Domain
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+
+# Setup to skip test if mpi4py not available
+try:
+    import mpi4py
+except ImportError:
+    pass
+
+import pytest
+
+#--------------------------------------------------------------------------
+# Setup parameters
+#--------------------------------------------------------------------------
+yieldstep = 0.25
+finaltime = 1.0
+nprocs = 3
+N = 11
+M = 21
+verbose = False
+
+#---------------------------------
+# Setup Functions
+#---------------------------------
+def topography(x,y):
+    return -x/2
+
+def stage(x,y):
+    return topography(x,y) + 0.4*(x < 0.3)
+
+###########################################################################
+# Setup Test
+##########################################################################
+def run_simulation(flow_algorithm, nlevels=None, verbose=False):
+
+    # Finer triangles near the left boundary
+    points, vertices, boundary = rectangular_cross(M, N)
+    points[:, 0] = points[:, 0]*(0.1 + 0.9*points[:, 0])
+
+    domain = Domain(points, vertices, boundary)
+
+    domain.set_quantity('elevation', topography, location='centroids')
+    domain.set_quantity('friction', 0.01)
+    domain.set_quantity('stage', stage, location='centroids')
+
+    domain = distribute(domain, verbose=False)
+
+    domain.set_name('local_timestepping_%s' % flow_algorithm)
+    domain.set_datadir('.')
+    domain.set_flow_algorithm(flow_algorithm)
+    domain.set_multiprocessor_mode(2)
+    domain.set_quantities_to_be_stored(None)
+    if nlevels is not None:
+        domain.set_local_timestepping(nlevels=nlevels)
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([-0.2,0.,0.])
+
+    domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+    V0 = domain.get_water_volume()
+
+    steps = 0
+    for t in domain.evolve(yieldstep = yieldstep, finaltime = finaltime):
+        if myid == 0 and verbose : domain.write_time()
+        steps += domain.number_of_steps
+
+    # Mass conservation
+    V, BF, FS = domain.report_water_volume_statistics(verbose=False, returnStats=True)
+    assert_(num.allclose(V - BF - FS, V0))
+
+    full = domain.tri_full_flag == 1
+    result = [domain.quantities[name].centroid_values[full].copy()
+              for name in ['stage', 'xmomentum', 'ymomentum']]
+
+    return steps, result
+
+
+# Test an nprocs-way run with and without local timestepping
+
+@pytest.mark.skipif('mpi4py' not in sys.modules,
+                    reason="requires the mpi4py module")
+class Test_parallel_local_timestepping(unittest.TestCase):
+    def test_parallel_local_timestepping(self):
+        if verbose : print("Expect this test to fail if not run from the parallel directory.")
+
+        cmd = anuga.mpicmd(os.path.abspath(__file__), numprocs=nprocs)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError(msg)
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.TestLoader().loadTestsFromTestCase(Test_parallel_local_timestepping)
+        runner.run(suite)
+    else:
+
+        from anuga.utilities.parallel_abstraction import global_except_hook
+        sys.excepthook = global_except_hook
+
+        for flow_algorithm in ['DE0', 'DE1']:
+            barrier()
+            if myid == 0 and verbose: print('%s STANDARD' % flow_algorithm)
+            expected_steps, expected = run_simulation(flow_algorithm, verbose=verbose)
+
+            barrier()
+            if myid == 0 and verbose: print('%s ONE LEVEL' % flow_algorithm)
+            steps, result = run_simulation(flow_algorithm, nlevels=0, verbose=verbose)
+
+            assert_(steps == expected_steps)
+            for r, e in zip(result, expected):
+                assert_(num.allclose(r, e))
+
+            barrier()
+            if myid == 0 and verbose: print('%s TWO LEVELS' % flow_algorithm)
+            steps, result = run_simulation(flow_algorithm, nlevels=2, verbose=verbose)
+
+            assert_(steps < expected_steps)
+            assert_(num.all(abs(result[0] - expected[0]) < 0.1))
+
+        finalize()
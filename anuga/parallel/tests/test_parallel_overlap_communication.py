@@ -0,0 +1,184 @@
+"""
+Check that overlapping the ghost communication with the
+computation of the interior triangles (set_overlap_communication)
+and persistent ghost requests (set_persistent_ghost_communication)
+give the same results as the standard blocking ghost update.
+
+Run with both an euler (DE0) and a rk2 (DE1) flow algorithm
+using multiprocessor_mode 2.
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+
+import unittest
+import os
+import sys
+import numpy as num
+
+import anuga
+
+from anuga import Reflective_boundary
+from anuga import Dirichlet_boundary
+from anuga import rectangular_cross_domain
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+
+# Setup to skip test if mpi4py not available
+try:
+    import mpi4py
+except ImportError:
+    pass
+
+import pytest
+
+#--------------------------------------------------------------------------
+# Setup parameters
+#--------------------------------------------------------------------------
+yieldstep = 0.25
+finaltime = 1.0
+nprocs = 3
+N = 21
+M = 21
+verbose = False
+
+#---------------------------------
+# Setup Functions
+#---------------------------------
+def topography(x,y):
+    return -x/2
+
+###########################################################################
+# Setup Test
+##########################################################################
+def run_simulation(flow_algorithm, overlap, persistent=False, verbose=False):
+
+    domain = rectangular_cross_domain(M, N)
+    domain.set_quantity('elevation', topography)
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', expression='elevation')
+
+    domain = distribute(domain, verbose=False)
+
+    domain.set_name('overlap_%s_%d' % (flow_algorithm, overlap))
+    domain.set_datadir('.')
+    domain.set_flow_algorithm(flow_algorithm)
+    domain.set_multiprocessor_mode(2)
+    domain.set_quantities_to_be_stored(None)
+    domain.set_overlap_communication(overlap)
+    domain.set_persistent_ghost_communication(persistent)
+    domain.set_phase_timing(file_format=None)
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([-0.2,0.,0.])
+
+    domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+    for t in domain.evolve(yieldstep = yieldstep, finaltime = finaltime):
+        if myid == 0 and verbose : domain.write_time()
+
+    phases = [name for name, seconds, calls in domain.get_phase_timers()]
+    for name in ['compute_fluxes', 'distribute_to_vertices_and_edges',
+                 'ghost_communication', 'allreduce']:
+        assert_(name in phases)
+
+    full = domain.tri_full_flag == 1
+    result = [domain.quantities[name].centroid_values[full].copy()
+              for name in ['stage', 'xmomentum', 'ymomentum']]
+
+    return result
+
+
+# Test an nprocs-way run with and without overlapped communication
+
+@pytest.mark.skipif('mpi4py' not in sys.modules,
+                    reason="requires the mpi4py module")
+class Test_parallel_overlap_communication(unittest.TestCase):
+    def test_parallel_overlap_communication(self):
+        if verbose : print("Expect this test to fail if not run from the parallel directory.")
+
+        cmd = anuga.mpicmd(os.path.abspath(__file__), numprocs=nprocs)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+    def test_overlap_triangle_sets(self):
+
+        from anuga.parallel.distribute_mesh import build_overlap_triangle_sets
+
+        domain = rectangular_cross_domain(4, 4)
+        N = len(domain)
+
+        # Pretend the first row of triangles are ghosts
+        tri_full_flag = num.ones(N, int)
+        tri_full_flag[:8] = 0
+
+        sets = build_overlap_triangle_sets(domain.neighbours, tri_full_flag)
+
+        # Each pair of sets partitions the triangles
+        for a, b in [('extrapolate_interior', 'extrapolate_halo'),
+                     ('extrapolate_interior_closure', 'protect_halo'),
+                     ('flux_interior', 'flux_halo')]:
+            both = num.concatenate((sets[a], sets[b]))
+            assert num.all(num.sort(both) == num.arange(N))
+
+        neighbours = domain.neighbours
+        ghost = tri_full_flag == 0
+
+        # Interior fluxes use neither ghost nor boundary values, nor
+        # edge values extrapolated from ghost values
+        interior = set(sets['extrapolate_interior'])
+        for k in sets['flux_interior']:
+            assert not ghost[k]
+            for n in neighbours[k]:
+                assert n >= 0
+                assert n in interior
+                for m in neighbours[n]:
+                    assert m < 0 or not ghost[m]
+
+        # The closures contain the neighbours
+        for a in ['extrapolate_interior', 'extrapolate_halo']:
+            closure = set(sets[a + '_closure'])
+            for k in sets[a]:
+                assert k in closure
+                for n in neighbours[k]:
+                    assert n < 0 or n in closure
+
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError(msg)
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.TestLoader().loadTestsFromTestCase(Test_parallel_overlap_communication)
+        runner.run(suite)
+    else:
+
+        from anuga.utilities.parallel_abstraction import global_except_hook
+        sys.excepthook = global_except_hook
+
+        for flow_algorithm in ['DE0', 'DE1']:
+            barrier()
+            if myid == 0 and verbose: print('%s BLOCKING' % flow_algorithm)
+            expected = run_simulation(flow_algorithm, False, verbose=verbose)
+
+            barrier()
+            if myid == 0 and verbose: print('%s OVERLAPPED' % flow_algorithm)
+            result = run_simulation(flow_algorithm, True, verbose=verbose)
+
+            for r, e in zip(result, expected):
+                assert_(num.allclose(r, e))
+
+            barrier()
+            if myid == 0 and verbose: print('%s PERSISTENT' % flow_algorithm)
+            result = run_simulation(flow_algorithm, True, persistent=True, verbose=verbose)
+
+            for r, e in zip(result, expected):
+                assert_(num.allclose(r, e))
+
+        finalize()
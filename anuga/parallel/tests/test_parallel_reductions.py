@@ -0,0 +1,212 @@
+"""
+Test the fused reductions: allreduce_values, collect_value and
+the reductions registered on a parallel domain, which are done in
+the same Allreduce as the flux timestep.
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+
+import unittest
+import os
+import sys
+import numpy as num
+
+import anuga
+
+from anuga import Reflective_boundary
+from anuga import Dirichlet_boundary
+from anuga import rectangular_cross_domain
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+from anuga import allreduce_values, collect_value
+
+# Setup to skip test if mpi4py not available
+try:
+    import mpi4py
+except ImportError:
+    pass
+
+import pytest
+
+nprocs = 3
+verbose = False
+
+
+def topography(x,y):
+    return -x/2
+
+
+def create_domain():
+
+    domain = rectangular_cross_domain(10, 10)
+    domain.set_quantity('elevation', topography)
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', expression='elevation + 0.1')
+    domain.set_name('reductions')
+    domain.set_datadir('.')
+    domain.set_quantities_to_be_stored(None)
+
+    return domain
+
+
+class Counting_comm(object):
+    """Count the Allreduce calls of a communicator"""
+
+    def __init__(self, comm):
+        self.comm = comm
+        self.allreduces = 0
+
+    def Allreduce(self, *args, **kwargs):
+        self.allreduces += 1
+        return self.comm.Allreduce(*args, **kwargs)
+
+    def allreduce(self, *args, **kwargs):
+        self.allreduces += 1
+        return self.comm.allreduce(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.comm, name)
+
+
+def run_reductions():
+
+    # Mixed, max only and sum only reductions
+    result = allreduce_values([myid, myid, myid+1, 2.0], ['min', 'max', 'sum', 'sum'])
+    assert_(num.allclose(result, [0, numprocs-1, numprocs*(numprocs+1)/2, 2.0*numprocs]))
+
+    result = allreduce_values([myid, -myid], ['max', 'min'])
+    assert_(num.allclose(result, [numprocs-1, -(numprocs-1)]))
+
+    result = allreduce_values([1.0], ['sum'])
+    assert_(num.allclose(result, [numprocs]))
+
+    assert_(collect_value(1) == numprocs)
+    assert_(num.allclose(collect_value(num.array([1.0, myid])),
+                         [numprocs, numprocs*(numprocs-1)/2]))
+
+    # Sequential reference volume (each processor has the whole
+    # sequential domain, so the volumes of all of them are summed)
+    domain = create_domain()
+    sequential_volume = domain.get_water_volume()/numprocs
+    number_of_triangles = len(domain)
+
+    domain = distribute(create_domain())
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([-0.2,0.,0.])
+    domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+    assert_(num.allclose(domain.get_water_volume(), sequential_volume))
+
+    full = domain.tri_full_flag == 1
+    domain.register_reduction('triangles', lambda : num.sum(full))
+    domain.register_reduction('max_id', lambda : myid, 'max')
+    domain.register_reduction('min_id', lambda : myid, 'min')
+    domain.register_reduction('max_speed',
+                              lambda : num.max(domain.max_speed[full]), 'max')
+
+    for t in domain.evolve(yieldstep = 0.1, finaltime = 0.2):
+        if t == 0.0:
+            # No timestep yet
+            assert_(domain.get_reduced_value('triangles') is None)
+            continue
+
+        assert_(domain.get_reduced_value('triangles') == number_of_triangles)
+        assert_(domain.get_reduced_value('max_id') == numprocs - 1)
+        assert_(domain.get_reduced_value('min_id') == 0)
+
+        max_speed = num.max(domain.max_speed[full])
+        global_max_speed = allreduce_values([max_speed], ['max'])[0]
+        assert_(num.allclose(domain.get_reduced_value('max_speed'), global_max_speed))
+
+    domain.deregister_reduction('triangles')
+    assert_('triangles' not in domain.reductions)
+
+    # The volume and max speed diagnostics share the Allreduce of the
+    # flux timestep, so each timestep makes a single Allreduce
+    domain.set_step_diagnostics()
+
+    local_volumes = []
+    function, op = domain.reductions['water_volume']
+    def local_volume():
+        local_volumes.append(function())
+        return local_volumes[-1]
+    domain.register_reduction('water_volume', local_volume)
+
+    import anuga.utilities.parallel_abstraction as pypar
+    comm = Counting_comm(pypar.comm)
+    pypar.comm = comm
+    try:
+        for t in domain.evolve(yieldstep = 0.1, finaltime = 0.4):
+            steps, allreduces = domain.number_of_steps, comm.allreduces
+
+            pypar.comm = comm.comm
+            if t > 0.2:
+                assert_(steps > 0)
+                assert_(allreduces == steps)
+
+                volume = allreduce_values([local_volumes[-1]], ['sum'])[0]
+                assert_(num.allclose(domain.get_reduced_value('water_volume'), volume))
+
+                max_speed = num.max(domain.max_speed[full])
+                global_max_speed = allreduce_values([max_speed], ['max'])[0]
+                assert_(num.allclose(domain.get_reduced_value('max_speed'), global_max_speed))
+
+            comm.allreduces = 0
+            pypar.comm = comm
+    finally:
+        pypar.comm = comm.comm
+
+    domain.set_step_diagnostics(False)
+    assert_('water_volume' not in domain.reductions)
+    assert_('max_speed' not in domain.reductions)
+
+    # Volume statistics done in one reduction
+    Vol, fluxIntegral, fracIntegral = \
+        domain.report_water_volume_statistics(verbose=False, returnStats=True)
+    assert_(num.allclose(Vol, domain.get_water_volume()))
+    assert_(num.allclose(fluxIntegral, domain.get_boundary_flux_integral()))
+
+
+@pytest.mark.skipif('mpi4py' not in sys.modules,
+                    reason="requires the mpi4py module")
+class Test_parallel_reductions(unittest.TestCase):
+    def test_parallel_reductions(self):
+        if verbose : print("Expect this test to fail if not run from the parallel directory.")
+
+        cmd = anuga.mpicmd(os.path.abspath(__file__), numprocs=nprocs)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+    def test_sequential_allreduce_values(self):
+
+        result = allreduce_values([1.0, 2.0, 3.0], ['min', 'max', 'sum'])
+        assert num.allclose(result, [1.0, 2.0, 3.0])
+
+        with self.assertRaises(Exception):
+            allreduce_values([1.0], ['mean'])
+
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError(msg)
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.TestLoader().loadTestsFromTestCase(Test_parallel_reductions)
+        runner.run(suite)
+    else:
+
+        from anuga.utilities.parallel_abstraction import global_except_hook
+        sys.excepthook = global_except_hook
+
+        run_reductions()
+
+        barrier()
+        finalize()
@@ -0,0 +1,278 @@
+"""
+Check that the batched structure exchange (set_batched_structure_exchange),
+which gathers the summaries of all parallel structures with one allreduce
+per timestep, gives the same results as the point to point communication
+of each structure, and that both agree with the sequential run.
+
+The structures (boyd box, boyd pipe, weir and internal boundary) are
+disjoint so the order in which they are applied does not matter.
+
+Also check that with rain applied by an operator created before the
+structures, and with overlapping inlets, both exchanges conserve mass.
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+
+import unittest
+import os
+import sys
+import numpy as num
+
+import anuga
+
+from anuga import Reflective_boundary
+from anuga import rectangular_cross_domain
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+
+from anuga.parallel.parallel_structure_operator import Parallel_structure_exchange
+
+# Setup to skip test if mpi4py not available
+try:
+    import mpi4py
+except ImportError:
+    pass
+
+import pytest
+
+#--------------------------------------------------------------------------
+# Setup parameters
+#--------------------------------------------------------------------------
+yieldstep = 1.0
+finaltime = 4.0
+nprocs = 3
+length = 40.
+width = 16.
+verbose = False
+
+#---------------------------------
+# Setup Functions
+#---------------------------------
+def topography(x, y):
+    return -x/100.
+
+def stage(x, y):
+    return topography(x, y) + 1.0*(x < 14.)
+
+def internal_boundary_function(h0, h1):
+    return 2.0*(h0 - h1)
+
+###########################################################################
+# Setup Test
+##########################################################################
+def run_simulation(parallel, batched=False, verbose=False):
+
+    domain = rectangular_cross_domain(20, 8, len1=length, len2=width)
+    domain.set_quantity('elevation', topography)
+    domain.set_quantity('friction', 0.01)
+    domain.set_quantity('stage', stage)
+
+    if parallel:
+        domain = distribute(domain, verbose=False)
+        domain.set_batched_structure_exchange(batched)
+
+    domain.set_name('structure_exchange')
+    domain.set_store(False)
+    domain.set_flow_algorithm('DE0')
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    structures = []
+
+    structures.append(anuga.Boyd_box_operator(domain,
+                                              end_points=[[9.0, 2.5], [19.0, 2.5]],
+                                              losses=1.5,
+                                              width=3.0,
+                                              use_momentum_jet=True,
+                                              use_velocity_head=False,
+                                              manning=0.013,
+                                              label='boyd_box',
+                                              verbose=False))
+
+    structures.append(anuga.Boyd_pipe_operator(domain,
+                                               end_points=[[9.0, 6.5], [19.0, 6.5]],
+                                               losses=1.5,
+                                               diameter=1.0,
+                                               use_momentum_jet=True,
+                                               use_velocity_head=True,
+                                               manning=0.013,
+                                               label='boyd_pipe',
+                                               verbose=False))
+
+    structures.append(anuga.Weir_orifice_trapezoid_operator(domain,
+                                                            end_points=[[9.0, 10.0], [19.0, 10.0]],
+                                                            losses=1.5,
+                                                            width=2.0,
+                                                            height=1.0,
+                                                            z1=1.0,
+                                                            z2=1.0,
+                                                            label='weir',
+                                                            verbose=False))
+
+    structures.append(anuga.Internal_boundary_operator(domain,
+                                                       internal_boundary_function,
+                                                       end_points=[[9.0, 14.0], [19.0, 14.0]],
+                                                       width=2.0,
+                                                       label='internal_boundary',
+                                                       verbose=False))
+
+    if parallel:
+        exchange = domain.structure_exchange
+        assert_(len(exchange.structures) == len(structures))
+        for slot, structure in enumerate(structures):
+            if structure is not None:
+                assert_(structure.structure_slot == slot)
+
+    for t in domain.evolve(yieldstep=yieldstep, finaltime=finaltime):
+        if myid == 0 and verbose : domain.write_time()
+
+    if parallel:
+        # Summaries are only available during the fractional steps
+        assert_(domain.structure_exchange.summaries is None)
+
+    # Results in the sequential numbering
+    if parallel:
+        full = domain.tri_full_flag == 1
+        ids = domain.tri_l2g[full]
+    else:
+        full = num.ones(len(domain), bool)
+        ids = num.arange(len(domain))
+
+    result = [ids] + [domain.quantities[name].centroid_values[full].copy()
+                      for name in ['stage', 'xmomentum', 'ymomentum']]
+
+    return result
+
+
+def run_rain_simulation(batched=False, verbose=False):
+
+    domain = rectangular_cross_domain(20, 8, len1=length, len2=width)
+    domain.set_quantity('elevation', topography)
+    domain.set_quantity('friction', 0.01)
+    domain.set_quantity('stage', stage)
+
+    domain = distribute(domain, verbose=False)
+    domain.set_batched_structure_exchange(batched)
+
+    domain.set_name('structure_exchange_rain')
+    domain.set_store(False)
+    domain.set_flow_algorithm('DE0')
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    # Rain applied before the structures change the inlets
+    rate = 0.01
+    anuga.Rate_operator(domain, rate=rate)
+
+    # Two culverts with overlapping inlets
+    for y in [4.0, 5.0]:
+        anuga.Boyd_box_operator(domain,
+                                end_points=[[9.0, y], [19.0, y]],
+                                losses=1.5,
+                                width=3.0,
+                                manning=0.013,
+                                label='boyd_box_%g' % y,
+                                verbose=False)
+
+    initial_volume = domain.get_water_volume()
+
+    for t in domain.evolve(yieldstep=yieldstep, finaltime=finaltime):
+        if myid == 0 and verbose : domain.write_time()
+
+    gained = domain.get_water_volume() - initial_volume
+    rain = rate*length*width*finaltime
+
+    if myid == 0 and verbose:
+        print('BATCHED %s: gained %g rain %g' % (batched, gained, rain))
+
+    assert_(num.allclose(gained, rain, rtol=1.0e-10, atol=1.0e-8))
+
+
+# Test an nprocs-way run with and without the batched structure exchange
+
+@pytest.mark.skipif('mpi4py' not in sys.modules,
+                    reason="requires the mpi4py module")
+class Test_parallel_structure_exchange(unittest.TestCase):
+    def test_parallel_structure_exchange(self):
+        if verbose : print("Expect this test to fail if not run from the parallel directory.")
+
+        cmd = anuga.mpicmd(os.path.abspath(__file__), numprocs=nprocs)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+    def test_exchange_slots(self):
+
+        class Dummy_structure(object):
+            def __init__(self, value):
+                self.value = value
+                self.structure_exchange = None
+                self.structure_slot = None
+
+            def get_local_summary(self):
+                return num.full((2, 9), self.value)
+
+        exchange = Parallel_structure_exchange()
+
+        s0 = Dummy_structure(1.0)
+        s2 = Dummy_structure(2.0)
+
+        assert exchange.register(s0) == 0
+        assert exchange.register(None) == 1
+        assert exchange.register(s2) == 2
+
+        assert s0.structure_exchange is exchange
+        assert s2.structure_slot == 2
+        assert exchange.get_summary(0) is None
+
+        exchange.update()
+
+        assert num.allclose(exchange.get_summary(0), 1.0)
+        assert num.allclose(exchange.get_summary(1), 0.0)
+        assert num.allclose(exchange.get_summary(2), 2.0)
+
+        exchange.clear()
+        assert exchange.get_summary(2) is None
+
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError(msg)
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.TestLoader().loadTestsFromTestCase(Test_parallel_structure_exchange)
+        runner.run(suite)
+    else:
+
+        from anuga.utilities.parallel_abstraction import global_except_hook
+        sys.excepthook = global_except_hook
+
+        # Sequential run on each processor
+        expected = None
+        if myid == 0:
+            expected = run_simulation(False, verbose=verbose)
+
+        from anuga.utilities import parallel_abstraction as pypar
+        expected = pypar.broadcast(expected, 0)
+
+        for batched in [False, True]:
+            barrier()
+            if myid == 0 and verbose: print('BATCHED %s' % batched)
+            result = run_simulation(True, batched=batched, verbose=verbose)
+
+            ids = result[0]
+            for r, e in zip(result[1:], expected[1:]):
+                assert_(num.allclose(r, e[ids]))
+
+            barrier()
+            run_rain_simulation(batched=batched, verbose=verbose)
+
+        finalize()
@@ -6,6 +6,7 @@ import fnmatch
 from anuga.file.netcdf import NetCDFFile
 
 from anuga.rain.raster_time_slice_data import Raster_time_slice_data
+from anuga.rain.time_slice_rate import Netcdf_raster_slices
 
 class Calibrated_radar_rain(Raster_time_slice_data):
     
@@ -13,11 +14,14 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                  radar_dir = None,
                  start_time = None,
                  final_time = None,
+                 lazy = False,
                  verbose=False, 
                  debug=False):
         """
         start_time: seconds since epoch  or string of form 20120229_1210
         final_time: seconds since epoch  or string of form 20120229_1210
+        lazy: If True the time slices are only read from the radar files
+              when they are used (see read_data_files)
         
         The BoM data is assumed to be stored as a raster, ie. columns  
         in the x direction (eastings) and rows in the vertical y direction
@@ -38,14 +42,18 @@ class Calibrated_radar_rain(Raster_time_slice_data):
         
         # process the radar files
         if not radar_dir is None:
-            self.read_data_files(radar_dir)
+            self.read_data_files(radar_dir, lazy=lazy)
             
 
     
-    def read_data_files(self, radar_dir, pattern = '*.nc'):
+    def read_data_files(self, radar_dir, pattern = '*.nc', lazy = False):
         """
         Given a radar_dir walk through all sub directories to find 
         radar raster files
+
+        If lazy is True the time slices are not kept in memory.
+        data_slices is then a Netcdf_raster_slices sequence which reads
+        the file of a time slice when it is accessed.
         """
         
         
@@ -54,6 +62,8 @@ class Calibrated_radar_rain(Raster_time_slice_data):
         data_max_in_period = 0.0
         
         data_slices = []
+        filenames = []
+        precip_names = []
         times = []
         
         self.radar_dir = radar_dir
@@ -167,7 +177,13 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                     assert np.allclose(self.time_step,new_time_step), "Timesteps not equal"
 
                     
-                data_slices.append(data_slice)
+                if lazy:
+                    filenames.append(os.path.join(root, filename))
+                    precip_names.append(precip_name)
+                else:
+                    data_slices.append(data_slice)
+
+                data.close()
         
         
         self.data_max_in_period = data_max_in_period
@@ -178,14 +194,15 @@ class Calibrated_radar_rain(Raster_time_slice_data):
         #pdb.set_trace()
         if len(times) > 0:
             self.times = times[ids]   
-            self.data_slices = np.array([ data_slices[tid] for tid in ids ])
+            if lazy:
+                self.data_slices = Netcdf_raster_slices([filenames[tid] for tid in ids],
+                                                        [precip_names[tid] for tid in ids],
+                                                        scale=1.0/1000)
+            else:
+                self.data_slices = np.array([ data_slices[tid] for tid in ids ])
             self.start_time = self.times[0]-self.time_step
             self.data_accumulated = data_accumulated 
-            print("+++++", np.sum(data_accumulated))
-            # Test sorting
-            for i, tid in enumerate(ids):
-                np.allclose(times[tid], self.times[i])
-                np.allclose(data_slices[tid], self.data_slices[i])
+            if self.verbose: print("+++++", np.sum(data_accumulated))
         else:
             self.times = []  
             self.data_slices = []
@@ -53,6 +53,22 @@ class Raster_time_slice_data(object):
 
         pass
 
+    def get_time_slices(self):
+        """
+        Time_slices of the rate (m/s) over each time step, for use
+        as the rate of a Rate_operator.
+
+        The data of a slice is the accumulation over the time step
+        ending at the slice time.
+        """
+
+        from anuga.rain.time_slice_rate import Time_slices
+
+        times = np.array(self.times, float) - self.time_step
+
+        return Time_slices(times, self.data_slices, x=self.x, y=self.y,
+                           scale=1.0/self.time_step)
+
     def ungzip_data_files(self, data_dir):
         """
         Given a data_dir walk through all sub directories to find 
@@ -0,0 +1,512 @@
+"""
+Rates (such as rain) given as a sequence of raster or point time slices.
+
+The slices are read one at a time when they are needed, so that long
+records of radar rainfall over large catchments do not have to fit in
+memory. A Time_slices object describes the data: the start times of the
+slices, the pixel locations and an indexable sequence of slices (numpy
+array, np.memmap, netcdf variable, Netcdf_raster_slices, ...).
+
+Time_slice_rate maps the slice valid at a given time onto the centroids
+of a domain, either by taking the value of the nearest pixel or by
+area weighting with the overlap of triangles and pixels (which conserves
+the volume of rain falling on the domain).
+"""
+
+import threading
+
+import numpy as num
+
+from anuga.utilities.sparse import Sparse_CSR
+from anuga.file.netcdf import netcdf_lock
+
+
+class Time_slices(object):
+    """Time slices of a rate at pixel locations.
+
+    times:  start time (seconds since epoch, UTC) from which each slice
+            is valid. Need not be sorted.
+    slices: sequence of slices. slices[i] is either a raster of shape
+            (len(y), len(x)) or has one value per point.
+    x, y:   coordinates of the pixel centres of a raster. As for
+            Raster_time_slice_data rows run from north to south when y is
+            increasing.
+    points: (n, 2) array of pixel centres, used instead of x, y.
+    pixel_size: (dx, dy) size of the pixels. Only needed for
+            conservative remapping of points which do not form a grid.
+    scale:  values are multiplied by scale when read (e.g. to convert
+            the depth of rain in each slice to a rate)
+
+    Coordinates are absolute (i.e. UTM).
+    """
+
+    def __init__(self, times, slices, x=None, y=None, points=None,
+                 pixel_size=None, scale=1.0):
+
+        times = num.array(times, float).reshape(-1)
+
+        if slices is not None:
+            msg = 'Number of times %d does not match number of slices %d' \
+                  % (len(times), len(slices))
+            assert len(times) == len(slices), msg
+
+        self.order = num.argsort(times, kind='stable')
+        self.times = times[self.order]
+        self.slices = slices
+        self.scale = scale
+
+        if len(self.times) > 1:
+            self.time_step = float(num.min(num.diff(self.times)))
+        else:
+            self.time_step = None
+
+        if points is None:
+            msg = 'Either x and y or points must be specified'
+            assert x is not None and y is not None, msg
+
+            x = num.array(x, float).reshape(-1)
+            y = num.array(y, float).reshape(-1)
+
+            # Rows of the raster run from north to south
+            if len(y) > 1 and y[0] < y[-1]:
+                row_y = y[::-1]
+            else:
+                row_y = y
+
+            self.points = num.zeros((len(x)*len(y), 2), float)
+            self.points[:, 0] = num.tile(x, len(y))
+            self.points[:, 1] = num.repeat(row_y, len(x))
+
+            if pixel_size is None and len(x) > 1 and len(y) > 1:
+                pixel_size = (abs(x[1] - x[0]), abs(y[1] - y[0]))
+        else:
+            self.points = num.array(points, float).reshape((-1, 2))
+
+            if pixel_size is None:
+                dx = _grid_spacing(self.points[:, 0])
+                dy = _grid_spacing(self.points[:, 1])
+                if dx is not None and dy is not None:
+                    pixel_size = (dx, dy)
+
+        self.pixel_size = pixel_size
+
+    def __len__(self):
+
+        return len(self.times)
+
+    def get_slice(self, i):
+        """Return the values of the i-th slice (in time order) as a
+        flat array with one value per pixel. Masked values are zero.
+        """
+
+        values = self.read_slice(self.order[i])
+        values = num.ma.filled(values, 0.0)
+        values = num.array(values, float).reshape(-1)
+
+        if self.scale != 1.0:
+            values *= self.scale
+
+        return values
+
+    def read_slice(self, i):
+        """Read the i-th slice in the order of the given slices.
+
+        Slices may be read by the prefetch thread of Time_slice_rate
+        and be backed by netcdf files, so reads hold the netcdf lock.
+        """
+
+        with netcdf_lock:
+            return self.slices[i]
+
+
+class Xarray_time_slices(Time_slices):
+    """Time slices from an xarray DataArray with a time dimension and
+    eastings and northings coordinates for the pixels. The DataArray is
+    not loaded, so a DataArray opened from file (or backed by dask) is
+    read one slice at a time.
+    """
+
+    def __init__(self, xa, pixel_size=None, scale=1.0):
+
+        self.xa = xa
+
+        times = num.asarray(xa['time'].values)
+        if num.issubdtype(times.dtype, num.datetime64):
+            times = times.astype('datetime64[ns]').astype('int64')/1.0e9
+
+        eastings = num.asarray(xa['eastings'].values, float).reshape(-1)
+        northings = num.asarray(xa['northings'].values, float).reshape(-1)
+        points = num.column_stack([eastings, northings])
+
+        Time_slices.__init__(self, times, None, points=points,
+                             pixel_size=pixel_size, scale=scale)
+
+    def read_slice(self, i):
+
+        with netcdf_lock:
+            return self.xa.isel(time=i).values
+
+
+class Netcdf_raster_slices(object):
+    """Sequence of raster slices stored one per netcdf file. A file
+    is only read when its slice is accessed.
+
+    filenames:      one file per slice
+    variable_names: name of the data variable in each file (a single
+                    name or one name per file)
+    scale:          values are multiplied by scale when read
+    """
+
+    def __init__(self, filenames, variable_names, scale=1.0):
+
+        self.filenames = list(filenames)
+
+        if isinstance(variable_names, str):
+            variable_names = [variable_names]*len(self.filenames)
+        self.variable_names = list(variable_names)
+
+        self.scale = scale
+
+    def __len__(self):
+
+        return len(self.filenames)
+
+    def __getitem__(self, i):
+
+        from anuga.file.netcdf import NetCDFFile
+
+        filename = self.filenames[i]
+
+        with netcdf_lock:
+            fid = NetCDFFile(filename, 'r')
+            try:
+                values = num.ma.filled(fid.variables[self.variable_names[i]][:], 0.0)
+                values = num.array(values, float)
+            finally:
+                fid.close()
+
+        return values*self.scale
+
+
+class Time_slice_rate(object):
+    """Map time slices onto the centroids of a domain.
+
+    domain:      domain providing the centroids
+    time_slices: Time_slices object
+    indices:     triangles for which the rate is needed (None for all)
+    remap:       'nearest' to use the value of the nearest pixel,
+                 'conservative' to area weight the values of the pixels
+                 overlapping each triangle, or a precomputed Sparse_CSR
+                 matrix (see raster_overlap_matrix) with a row for each
+                 triangle in indices and a column for each pixel
+    tolerance:   the slice starting at t0 is used up to time t0 + tolerance.
+                 Defaults to the time step of the slices.
+    prefetch:    read the next slice in a background thread
+
+    Calling the object with a time (seconds since epoch) returns an array
+    of rates for all triangles (zero for triangles not in indices), or
+    None if no slice is valid at that time.
+    """
+
+    def __init__(self, domain, time_slices, indices=None, remap='nearest',
+                 tolerance=None, prefetch=True, verbose=False):
+
+        self.domain = domain
+        self.time_slices = time_slices
+        self.number_of_triangles = domain.number_of_triangles
+        self.prefetch = prefetch
+        self.verbose = verbose
+
+        if indices is None:
+            indices = num.arange(self.number_of_triangles)
+        self.indices = num.array(indices, int).reshape(-1)
+
+        if tolerance is None:
+            tolerance = time_slices.time_step
+        if tolerance is None:
+            tolerance = num.inf
+        self.tolerance = tolerance
+
+        points = time_slices.points
+
+        self.pixel_ids = None
+        self.overlap_matrix = None
+
+        if isinstance(remap, Sparse_CSR):
+            msg = 'Overlap matrix has shape (%d, %d), expected (%d, %d)' \
+                  % (remap.M, remap.N, len(self.indices), len(points))
+            assert (remap.M, remap.N) == (len(self.indices), len(points)), msg
+            self.overlap_matrix = remap
+        elif remap == 'nearest':
+            from scipy.spatial import KDTree
+
+            centroids = domain.get_centroid_coordinates(absolute=True)[self.indices]
+            if len(centroids) > 0:
+                _, self.pixel_ids = KDTree(points).query(centroids)
+            else:
+                self.pixel_ids = num.zeros(0, int)
+        elif remap == 'conservative':
+            msg = 'The pixel size is needed for conservative remapping'
+            assert time_slices.pixel_size is not None, msg
+
+            vertices = domain.get_vertex_coordinates(absolute=True)
+            triangles = vertices.reshape((-1, 3, 2))[self.indices]
+            self.overlap_matrix = raster_overlap_matrix(triangles, points,
+                                                        time_slices.pixel_size,
+                                                        verbose=verbose)
+        else:
+            msg = "remap must be 'nearest', 'conservative' or a Sparse_CSR matrix, got %s" \
+                  % str(remap)
+            raise Exception(msg)
+
+        self.slice_index = None
+        self.values = None
+
+        self._prefetch_thread = None
+        self._prefetched = None
+
+    def get_slice_index(self, t):
+        """Return the index of the slice valid at time t, or None
+        """
+
+        times = self.time_slices.times
+
+        i = num.searchsorted(times, t, side='right') - 1
+        if i < 0 or t - times[i] > self.tolerance:
+            return None
+
+        return int(i)
+
+    def __call__(self, t):
+
+        i = self.get_slice_index(t)
+        if i is None:
+            return None
+
+        if i != self.slice_index:
+            self._update_slice(i)
+
+        return self.values
+
+    def _update_slice(self, i):
+        """Remap slice i, using the prefetched values if available, and
+        start reading the next slice.
+        """
+
+        values = None
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+
+            prefetch_index, prefetched = self._prefetched
+            self._prefetched = None
+            if prefetch_index == i:
+                if isinstance(prefetched, Exception):
+                    raise prefetched
+                values = prefetched
+
+        if values is None:
+            values = self._remap_slice(i)
+
+        self.values = values
+        self.slice_index = i
+
+        if self.verbose:
+            print('Time slice %d of %d' % (i, len(self.time_slices)))
+
+        # Read the next slice while the model evolves
+        if self.prefetch and i + 1 < len(self.time_slices):
+            self._start_prefetch(i + 1)
+
+    def _start_prefetch(self, i):
+        """Remap slice i in a separate thread.
+        """
+
+        def prefetch():
+            try:
+                values = self._remap_slice(i)
+            except Exception as e:
+                values = e
+            self._prefetched = (i, values)
+
+        self._prefetch_thread = threading.Thread(target=prefetch,
+                                                 name='time_slice_prefetch',
+                                                 daemon=True)
+        self._prefetch_thread.start()
+
+    def _remap_slice(self, i):
+        """Return the rate for all triangles from slice i
+        """
+
+        pixel_values = self.time_slices.get_slice(i)
+
+        values = num.zeros(self.number_of_triangles, float)
+
+        if self.pixel_ids is not None:
+            values[self.indices] = pixel_values[self.pixel_ids]
+        elif self.overlap_matrix.nonzeros() > 0:
+            values[self.indices] = self.overlap_matrix*pixel_values
+
+        return values
+
+
+def raster_overlap_matrix(triangles, points, pixel_size, verbose=False):
+    """Sparse matrix of the fraction of the area of each triangle
+    covered by each pixel.
+
+    triangles:  (m, 3, 2) array of triangle vertices
+    points:     (n, 2) array of pixel centres, lying on a grid
+    pixel_size: (dx, dy) size of the pixels
+
+    Returns a Sparse_CSR matrix A of shape (m, n). If v are the pixel
+    values, A*v is the area weighted average over each triangle, so the
+    integral over the triangles equals the integral of the pixel values
+    over the region covered by the triangles.
+    """
+
+    triangles = num.array(triangles, float).reshape((-1, 3, 2))
+    points = num.array(points, float).reshape((-1, 2))
+    dx, dy = float(pixel_size[0]), float(pixel_size[1])
+
+    m = len(triangles)
+    n = len(points)
+
+    # Locate pixels by their position in the grid
+    x0 = points[:, 0].min() if n > 0 else 0.0
+    y0 = points[:, 1].min() if n > 0 else 0.0
+    ix = num.rint((points[:, 0] - x0)/dx).astype(int)
+    iy = num.rint((points[:, 1] - y0)/dy).astype(int)
+
+    nx = ix.max() + 1 if n > 0 else 0
+    ny = iy.max() + 1 if n > 0 else 0
+    grid = -num.ones((ny, nx), int)
+    grid[iy, ix] = num.arange(n)
+
+    # Range of grid cells overlapping the bounding box of each triangle
+    xmin = (triangles[:, :, 0].min(axis=1) - x0)/dx
+    xmax = (triangles[:, :, 0].max(axis=1) - x0)/dx
+    ymin = (triangles[:, :, 1].min(axis=1) - y0)/dy
+    ymax = (triangles[:, :, 1].max(axis=1) - y0)/dy
+
+    i0 = num.maximum(num.ceil(xmin - 0.5).astype(int), 0)
+    i1 = num.minimum(num.floor(xmax + 0.5).astype(int), nx - 1)
+    j0 = num.maximum(num.ceil(ymin - 0.5).astype(int), 0)
+    j1 = num.minimum(num.floor(ymax + 0.5).astype(int), ny - 1)
+
+    ni = num.maximum(i1 - i0 + 1, 0)
+    nj = num.maximum(j1 - j0 + 1, 0)
+    counts = ni*nj
+
+    # All (triangle, grid cell) candidate pairs
+    pair_tri = num.repeat(num.arange(m), counts)
+    offsets = num.cumsum(counts) - counts
+    k = num.arange(len(pair_tri)) - num.repeat(offsets, counts)
+    pair_i = i0[pair_tri] + k % ni[pair_tri]
+    pair_j = j0[pair_tri] + k // ni[pair_tri]
+
+    pair_pix = grid[pair_j, pair_i] if len(pair_tri) > 0 else num.zeros(0, int)
+    keep = pair_pix >= 0
+    pair_tri = pair_tri[keep]
+    pair_pix = pair_pix[keep]
+
+    if verbose:
+        print('Computing overlap of %d triangles and %d pixels (%d pairs)'
+              % (m, n, len(pair_tri)))
+
+    tri_areas = 0.5*num.abs(
+        (triangles[:, 1, 0] - triangles[:, 0, 0])*(triangles[:, 2, 1] - triangles[:, 0, 1])
+        - (triangles[:, 2, 0] - triangles[:, 0, 0])*(triangles[:, 1, 1] - triangles[:, 0, 1]))
+
+    overlap = num.zeros(len(pair_tri), float)
+    block_size = 65536
+    for start in range(0, len(pair_tri), block_size):
+        block = slice(start, start + block_size)
+
+        # Triangles relative to the pixel centre
+        polygons = triangles[pair_tri[block]] - points[pair_pix[block]][:, None, :]
+        overlap[block] = _clipped_areas(polygons, 0.5*dx, 0.5*dy)
+
+    data = overlap/tri_areas[pair_tri]
+
+    keep = data > 0.0
+    pair_tri = pair_tri[keep]
+    pair_pix = pair_pix[keep]
+    data = data[keep]
+
+    # Pairs are ordered by triangle
+    row_ptr = num.zeros(m + 1, int)
+    row_ptr[1:] = num.cumsum(num.bincount(pair_tri, minlength=m))
+
+    return Sparse_CSR(None, data, pair_pix.astype(int), row_ptr, m, n)
+
+
+def _clipped_areas(polygons, half_dx, half_dy):
+    """Areas of triangles clipped to the box [-half_dx, half_dx] x
+    [-half_dy, half_dy] (Sutherland-Hodgman, vectorised over triangles).
+    """
+
+    count = num.full(len(polygons), 3, int)
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        for axis, value, sign in [(0, half_dx, -1.0), (0, -half_dx, 1.0),
+                                  (1, half_dy, -1.0), (1, -half_dy, 1.0)]:
+            polygons, count = _clip_polygons(polygons, count, axis, value, sign)
+
+        k = num.arange(polygons.shape[1])
+        valid = k[None, :] < count[:, None]
+        nxt = num.where(k[None, :] + 1 < count[:, None], k[None, :] + 1, 0)
+        following = num.take_along_axis(polygons, nxt[:, :, None], axis=1)
+
+        cross = polygons[:, :, 0]*following[:, :, 1] - following[:, :, 0]*polygons[:, :, 1]
+        cross = num.where(valid, cross, 0.0)
+
+    return 0.5*num.abs(cross.sum(axis=1))
+
+
+def _clip_polygons(polygons, count, axis, value, sign):
+    """Clip convex polygons (with count vertices) to the half plane
+    sign*(p[axis] - value) >= 0. The result has one more vertex slot.
+    """
+
+    m, V = polygons.shape[:2]
+
+    k = num.arange(V)
+    valid = k[None, :] < count[:, None]
+    nxt = num.where(k[None, :] + 1 < count[:, None], k[None, :] + 1, 0)
+    following = num.take_along_axis(polygons, nxt[:, :, None], axis=1)
+
+    d_current = sign*(polygons[:, :, axis] - value)
+    d_following = sign*(following[:, :, axis] - value)
+    inside_current = d_current >= 0.0
+    inside_following = d_following >= 0.0
+
+    s = d_current/(d_current - d_following)
+    crossing = polygons + s[:, :, None]*(following - polygons)
+    crossing[:, :, axis] = value
+
+    candidates = num.empty((m, 2*V, 2), float)
+    candidates[:, 0::2] = polygons
+    candidates[:, 1::2] = crossing
+
+    mask = num.empty((m, 2*V), bool)
+    mask[:, 0::2] = valid & inside_current
+    mask[:, 1::2] = valid & (inside_current != inside_following)
+
+    # Move the kept vertices to the front, keeping their order
+    order = num.argsort(~mask, axis=1, kind='stable')[:, :V + 1]
+    polygons = num.take_along_axis(candidates, order[:, :, None], axis=1)
+
+    return polygons, mask.sum(axis=1)
+
+
+def _grid_spacing(coordinates):
+    """Smallest positive spacing of the given coordinates, or None.
+    """
+
+    differences = num.diff(num.unique(coordinates))
+    differences = differences[differences > 0.0]
+
+    if len(differences) == 0:
+        return None
+
+    return float(differences.min())
@@ -933,14 +933,13 @@ class Inflow_boundary(Boundary):
         # First find all segments having the same tag is vol_id, edge_id
         # This will be done the first time evaluate is called.
         if self.tag is None:
-            boundary = self.domain.boundary
-            self.tag = boundary[(vol_id, edge_id)]        
-            
+            domain = self.domain
+            self.tag = domain.boundary[(vol_id, edge_id)]
+
             # Find total length of boundary with this tag
-            length = 0.0
-            for v_id, e_id in boundary:
-                if self.tag == boundary[(v_id, e_id)]:
-                    length += self.domain.mesh.get_edgelength(v_id, e_id)            
+            ids = domain.tag_boundary_cells[self.tag]
+            length = float(np.sum(domain.mesh.edgelengths[domain.boundary_cells[ids],
+                                                          domain.boundary_edges[ids]]))
 
             self.length = length
             self.average_momentum = self.rate/length
@@ -1018,7 +1017,8 @@ class Field_boundary(Boundary):
                  boundary_polygon=None,
                  default_boundary=None,
                  use_cache=False,
-                 verbose=False):
+                 verbose=False,
+                 time_window=None):
         """Constructor
 
         :param filename: Name of sww file containing stage and x/ymomentum
@@ -1039,6 +1039,8 @@ class Field_boundary(Boundary):
 
         :param verbose:          True if this method is to be verbose.
 
+        :param time_window:      Number of timesteps read from the sww file and interpolated at a time (default all of them)
+
         For example if
         the sww file has 1 second time steps and is 24 hours
         in length it has 86400 time steps. If you set
@@ -1058,7 +1060,8 @@ class Field_boundary(Boundary):
                                            boundary_polygon=boundary_polygon,
                                            default_boundary=default_boundary,
                                            use_cache=use_cache,
-                                           verbose=verbose)
+                                           verbose=verbose,
+                                           time_window=time_window)
 
         # Record information from File_boundary
         self.F = self.file_boundary.F
@@ -1090,6 +1093,26 @@ class Field_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """ Set the 'field' boundary values of all the edges in
+            segment_edges at once, using the file boundary and
+            then adjusting the stage.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        # Evaluate file boundary
+        self.file_boundary.evaluate_segment(domain, segment_edges)
+
+        # Adjust stage
+        if 'stage' in domain.conserved_quantities:
+            Stage = domain.quantities['stage']
+            Stage.boundary_values[segment_edges] += self.mean_stage
+
+
 
 
 
@@ -8,22 +8,218 @@ Setup with  domain.set_checkpointing(checkpoint_step, checkpoint_dir)
 checkpoint_step: the number of yieldsteps between saving a checkpoint file
 checkpoint_dir: the name of the directory where teh checkpoint files are stored.
 
+Each (sub)domain writes its static data (mesh, boundaries, operators, ...)
+once, to <name>_base.npz, and then at each checkpoint only the evolving
+state, as raw arrays in <name>_<time>.npz:
+the centroid values of the quantities, the elevation vertex and edge values,
+the time and the state of the fractional step operators. The sww writer
+recomputes its position from the sww file when it is reopened. The numeric
+arrays of the domain are stored in the base file as native arrays, next to
+a small pickled header of the rest of the domain which refers to them.
 
 But if we are restarting a calculation there is no domain yet available, so we must
 read in the last stored domain. Do that via
 
-domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
+domain = load_checkpoint_file(domain_name, checkpoint_dir)
 
+Alternatively a domain can be rebuilt (e.g. from the partition files of
+sequential_distribute_dump, with the same boundaries and operators) and
+the state of the latest checkpoint loaded into it via
+
+domain = load_checkpoint_file(domain_name, checkpoint_dir, domain=domain)
+
+Checkpoints stored as pickles of the whole domain (<name>_<time>.pickle)
+by earlier versions can still be loaded.
 """
 
 from anuga import send, receive, myid, numprocs, barrier
 from time import time as walltime
 
+import numpy as num
+import os
+
+
+def save_checkpoint_file(domain, checkpoint_dir=None):
+    """Save the evolving state of the domain to checkpoint_dir
+    (default domain.checkpoint_dir).
+
+    The static data of the domain is saved the first time a checkpoint
+    is saved.
+    """
+
+    from os.path import join
+
+    if checkpoint_dir is None:
+        checkpoint_dir = domain.checkpoint_dir
+
+    name = join(checkpoint_dir, domain.get_name())
+
+    base_name = name + '_base.npz'
+    if not getattr(domain, 'checkpoint_base_saved', False) or \
+       not os.path.exists(base_name):
+        domain.checkpoint_base_saved = True
+        with open(base_name + '.tmp', 'wb') as fid:
+            save_base(domain, fid)
+        os.replace(base_name + '.tmp', base_name)
+
+    state = get_checkpoint_state(domain)
+
+    # Write to a temporary file so an interrupted write does not
+    # leave a corrupt checkpoint
+    checkpoint_name = name + '_' + str(domain.get_time()) + '.npz'
+    with open(checkpoint_name + '.tmp', 'wb') as fid:
+        num.savez(fid, **state)
+    os.replace(checkpoint_name + '.tmp', checkpoint_name)
+
+    return checkpoint_name
+
+
+def save_base(domain, fid):
+    """Save the domain to the open file fid as an npz file of its numeric
+    arrays and a pickled header of the rest of the domain, where the
+    arrays are replaced by the names of their entries in the npz file.
+    """
+
+    try:
+        import dill as pickle
+    except:
+        import pickle
+
+    arrays = {}
+    names = {}
+
+    class Base_pickler(pickle.Pickler):
+
+        def persistent_id(self, obj):
+            if type(obj) is not num.ndarray or obj.dtype.hasobject:
+                return None
+
+            # Arrays shared between objects are stored once
+            if id(obj) not in names:
+                names[id(obj)] = 'array.%d' % len(names)
+                arrays[names[id(obj)]] = obj
+            return names[id(obj)]
+
+    import io
+    header = io.BytesIO()
+    Base_pickler(header).dump(domain)
+
+    arrays['header'] = num.frombuffer(header.getvalue(), num.uint8)
+    num.savez(fid, **arrays)
+
+
+def load_base(filename):
+    """Return the domain saved by save_base to filename
+    """
+
+    try:
+        import dill as pickle
+    except:
+        import pickle
+
+    arrays = {}
+
+    with num.load(filename) as base:
+
+        class Base_unpickler(pickle.Unpickler):
 
+            def persistent_load(self, name):
+                # Keep arrays shared between objects shared
+                if name not in arrays:
+                    arrays[name] = base[name]
+                return arrays[name]
 
-def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None):
+        import io
+        header = io.BytesIO(base['header'].tobytes())
+        return Base_unpickler(header).load()
+
+
+def get_checkpoint_state(domain):
+    """Return a dictionary of the arrays which make up the evolving
+    state of the domain
+    """
+
+    state = {}
+
+    state['starttime'] = domain.starttime
+    state['relative_time'] = domain.relative_time
+    state['evolve_starttime'] = domain.evolve_starttime
+    state['timestep'] = domain.timestep
+    state['yieldstep_counter'] = domain.yieldstep_counter
+    state['fractional_step_volume_integral'] = domain.fractional_step_volume_integral
+    state['volume_history'] = num.array(domain.volume_history, float)
+
+    for name, Q in domain.quantities.items():
+        state['centroid_values.' + name] = Q.centroid_values
+
+    # The elevation at vertices and edges is not recomputed from the
+    # centroid values
+    Elev = domain.quantities['elevation']
+    state['vertex_values.elevation'] = Elev.vertex_values
+    state['edge_values.elevation'] = Elev.edge_values
+
+    for i, operator in enumerate(domain.fractional_step_operators):
+        for key, value in operator.get_checkpoint_state().items():
+            state['operator.%d.%s' % (i, key)] = value
+
+    state['number_of_operators'] = len(domain.fractional_step_operators)
+
+    return state
+
+
+def set_checkpoint_state(domain, state):
+    """Restore the evolving state of the domain from a dictionary
+    (or npz file) produced by get_checkpoint_state
+    """
+
+    domain.starttime = float(state['starttime'])
+    domain.relative_time = float(state['relative_time'])
+    domain.evolve_starttime = float(state['evolve_starttime'])
+    domain.timestep = float(state['timestep'])
+    domain.yieldstep_counter = int(state['yieldstep_counter'])
+    domain.fractional_step_volume_integral = float(state['fractional_step_volume_integral'])
+    domain.volume_history = list(state['volume_history'])
+
+    for key in state:
+        if key.startswith('centroid_values.'):
+            name = key[len('centroid_values.'):]
+            if name in domain.quantities:
+                domain.quantities[name].centroid_values[:] = state[key]
+
+    Elev = domain.quantities['elevation']
+    Elev.vertex_values[:] = state['vertex_values.elevation']
+    Elev.edge_values[:] = state['edge_values.elevation']
+
+    operators = domain.fractional_step_operators
+    if int(state['number_of_operators']) != len(operators):
+        msg = ('Checkpoint has %d operators but the domain has %d'
+               % (int(state['number_of_operators']), len(operators)))
+        raise Exception(msg)
+
+    operator_states = [dict() for operator in operators]
+    for key in state:
+        if key.startswith('operator.'):
+            _, i, attribute = key.split('.', 2)
+            operator_states[int(i)][attribute] = state[key]
+
+    for operator, operator_state in zip(operators, operator_states):
+        operator.set_checkpoint_state(operator_state)
+
+    # Checkpoints are stored at yieldsteps, where the domain has been
+    # evolved and the edge and vertex values updated
+    domain.evolved_called = True
+    domain.distribute_to_vertices_and_edges()
+
+
+def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None, domain = None):
 
     from os.path import join
+    import zipfile
+
+    try:
+        import dill as pickle
+    except:
+        import pickle
 
     if numprocs > 1:
         domain_name = domain_name+'_P{}_{}'.format(numprocs,myid)
@@ -40,32 +236,36 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     if len(times) == 0: raise Exception("Unable to open checkpoint file")
 
+    overall = False
     for time in reversed(times):
 
-        pickle_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.pickle'
-        #print pickle_name
+        name = join(checkpoint_dir,domain_name)+'_'+str(time)
+        #print name
 
+        # Missing or corrupt files are skipped (trying the previous
+        # checkpoint), other errors (e.g. a domain which does not match
+        # the checkpoint) are raised
         try:
-            try:
-                import dill as pickle
-            except:
-                import pickle
-            domain = pickle.load(open(pickle_name, 'rb'))
+            if os.path.exists(name + '.npz'):
+                with num.load(name + '.npz') as state:
+                    if domain is None:
+                        base_name = join(checkpoint_dir,domain_name)+'_base'
+                        domain = load_base(base_name + '.npz')
+                    set_checkpoint_state(domain, state)
+            else:
+                # Older checkpoint of the whole domain
+                with open(name + '.pickle', 'rb') as fid:
+                    domain = pickle.load(fid)
             success = True
-        except:
+        except (OSError, EOFError, KeyError, ValueError,
+                zipfile.BadZipFile, pickle.UnpicklingError):
             success = False
 
         #print success
         overall = success
-        for cpu in range(numprocs):
-            if cpu != myid:
-                send(success,cpu)
-
-        for cpu in range(numprocs):
-            if cpu != myid:
-                overall = overall & receive(cpu)
-
-        barrier()
+        if numprocs > 1:
+            from anuga import allreduce_values
+            overall = bool(allreduce_values([success], ['min'])[0])
 
         #print myid, overall, success, time
 
@@ -73,6 +273,7 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     if not overall: raise Exception("Unable to open checkpoint file")
 
+    domain.checkpoint_base_saved = True
     domain.last_walltime = walltime()
     domain.communication_time = 0.0
     domain.communication_reduce_time = 0.0
@@ -83,38 +284,26 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
 def _get_checkpoint_times(domain_name, checkpoint_dir):
 
-    import os
     times = set()
 
-    for (path, directory, filenames) in os.walk(checkpoint_dir):
-        #print filenames
-        #print directory
-
-        if len(filenames) == 0:
-            return None
-        else:
-            for filename in filenames:
-                filebase = os.path.splitext(filename)[0].rpartition("_")
-                time = filebase[-1]
-                domain_name_base = filebase[0]
-                if domain_name_base == domain_name :
-                    #print domain_name_base, time
-                    times.add(float(time))
-
+    if os.path.isdir(checkpoint_dir):
+        for filename in os.listdir(checkpoint_dir):
+            filebase, ext = os.path.splitext(filename)
+            if ext not in ['.npz', '.pickle']:
+                continue
 
-    #times.sort()
-    #times = set(times)
-
-    #print times
-    combined = times
-    for cpu in range(numprocs):
-        if myid != cpu:
-            send(times,cpu)
-            rec = receive(cpu)
-            #print rec
-            combined = combined & rec
+            domain_name_base, _, time = filebase.rpartition("_")
+            if domain_name_base == domain_name:
+                try:
+                    times.add(float(time))
+                except ValueError:
+                    # e.g. the base file
+                    pass
 
-    #combined = list(combined).sort()
-    #print combined
+    # Times available on all processors
+    if numprocs > 1:
+        from anuga.utilities.parallel_abstraction import comm
+        for remote_times in comm.allgather(times):
+            times = times & remote_times
 
-    return combined
+    return times
@@ -37,7 +37,10 @@ def manning_friction_implicit_cpu(domain):
     in sw_domain_orig_ext.py
     """
 
-    if domain.multiprocessor_mode == 2:
+    if domain.multiprocessor_mode == 2 and domain.precision == 'single':
+        from .sw_domain_openmp_sp_ext import manning_friction_flat
+        from .sw_domain_openmp_sp_ext import manning_friction_sloped
+    elif domain.multiprocessor_mode == 2:
         from .sw_domain_openmp_ext import manning_friction_flat
         from .sw_domain_openmp_ext import manning_friction_sloped
     else:
@@ -90,7 +93,10 @@ def manning_friction_explicit_cpu(domain):
     Wrapper for c version
     """
 
-    if domain.multiprocessor_mode == 2:
+    if domain.multiprocessor_mode == 2 and domain.precision == 'single':
+        from .sw_domain_openmp_sp_ext import manning_friction_flat
+        from .sw_domain_openmp_sp_ext import manning_friction_sloped
+    elif domain.multiprocessor_mode == 2:
         from .sw_domain_openmp_ext import manning_friction_flat
         from .sw_domain_openmp_ext import manning_friction_sloped
     else:
@@ -0,0 +1,393 @@
+"""
+Multi-rate local timestepping for the discontinuous elevation (DE)
+algorithms.
+
+Triangles are grouped into levels with timesteps dt, 2 dt, 4 dt, ..,
+2**nlevels dt according to their own CFL condition, where dt is the
+global CFL timestep (the timestep of the smallest triangles). A macro step
+of 2**nlevels dt is made of 2**nlevels substeps:
+
+* At substep s the triangles whose frequency (timestep/dt) divides s start
+  a timestep: they are extrapolated and their forcing terms evaluated.
+* The flux across an edge is computed at the substeps which are multiples
+  of the smaller frequency of the two triangles sharing the edge, and the
+  flux integrated over that edge timestep is accumulated in both
+  triangles. So the scheme conserves mass between levels.
+* A triangle is updated from its accumulated fluxes at the end of its
+  timestep, and its level lowered if its next timestep would violate the
+  CFL condition (e.g. water has arrived).
+
+With euler timestepping a step of the domain is one macro step M, with
+rk2 it is 0.5 Q + 0.5 M(M(Q)). With nlevels = 0 these are the usual euler
+and rk2 steps.
+
+Neighbouring triangles differ by at most one level. In parallel the
+levels of the ghost triangles are those of the full triangles they copy,
+and the ghost exchange after each substep only sends the triangles which
+have finished a timestep. The levels are smoothed locally, the ghost
+levels being exchanged once every ghost layer width passes.
+
+Usage:
+
+    domain.set_local_timestepping(nlevels=3)
+"""
+
+import numpy as num
+
+from .sw_domain_openmp_ext import compute_fluxes_lts, \
+    accumulate_fluxes_lts, accumulate_forcing_lts, \
+    update_conserved_quantities_lts, refine_frequency_lts, protect_new_indices, \
+    extrapolate_second_order_edge_sw_indices
+
+
+class Local_timestepping(object):
+    """Drive the multi-rate timestepping of a shallow water domain
+    """
+
+    def __init__(self, domain, nlevels=3):
+
+        nlevels = int(nlevels)
+        if nlevels < 0:
+            msg = 'Number of local timestepping levels must be non negative'
+            raise Exception(msg)
+
+        self.domain = domain
+        self.nlevels = nlevels
+        self.number_of_substeps = 2**nlevels
+
+        N = len(domain)
+
+        self.all_indices = num.arange(N, dtype=num.int64)
+        self.neighbours = num.asarray(domain.neighbours, dtype=num.int64)
+        self.boundary_edges = self.neighbours < 0
+
+        # Timestep of each triangle in units of the substep timestep
+        self.frequency = num.ones(N, dtype=num.int64)
+
+        # Time integrated fluxes and semi implicit rates of
+        # stage, xmomentum and ymomentum
+        self.accum = num.zeros((3, N), float)
+        self.semi = num.zeros((3, N), float)
+
+        self.timestep = 0.0
+        self.macro_timestep = 0.0
+
+        self._set_index_sets()
+
+    def _neighbour_frequency_min(self, frequency):
+
+        neighbour_frequency = frequency[self.neighbours]
+        neighbour_frequency[self.boundary_edges] = self.number_of_substeps
+
+        return neighbour_frequency.min(axis=1)
+
+    def _neighbour_frequency_max(self, frequency):
+
+        neighbour_frequency = frequency[self.neighbours]
+        neighbour_frequency[self.boundary_edges] = 0
+
+        return neighbour_frequency.max(axis=1)
+
+    def _smooth(self, frequency, smoothing_pass):
+        """Apply smoothing_pass to frequency over nlevels - 1 passes (a
+        level cannot constrain triangles further away), returning the
+        result with the ghost levels set to those of the full triangles.
+
+        In parallel the passes are done locally and the ghost levels
+        exchanged once every ghost layer width passes, as the full
+        triangles then only depend on triangles within the ghost layer.
+        """
+
+        domain = self.domain
+
+        if domain.numproc > 1:
+            width = max(domain.ghost_layer_width, 1)
+        else:
+            width = 1
+
+        passes = self.nlevels - 1
+        while passes > 0:
+            for _ in range(min(width, passes)):
+                frequency = smoothing_pass(frequency)
+            passes -= width
+            domain.set_ghost_timestep_frequency(frequency)
+
+        return frequency
+
+    def _set_index_sets(self):
+        """Triangles starting a timestep, with their closure, and triangles
+        with active edges for each level j, i.e. those with frequency
+        (respectively edge frequency) at most 2**j.
+        """
+
+        frequency = self.frequency
+        edge_frequency = num.minimum(frequency, self._neighbour_frequency_min(frequency))
+
+        bounds = 2**num.arange(self.nlevels + 1)
+
+        order = num.argsort(frequency, kind='stable').astype(num.int64)
+        counts = num.searchsorted(frequency[order], bounds, side='right')
+
+        edge_order = num.argsort(edge_frequency, kind='stable').astype(num.int64)
+        edge_counts = num.searchsorted(edge_frequency[edge_order], bounds, side='right')
+
+        self.start_sets = []
+        self.closure_sets = []
+        self.edge_sets = []
+        for j in range(self.nlevels + 1):
+            if j == self.nlevels:
+                self.start_sets.append(self.all_indices)
+                self.closure_sets.append(self.all_indices)
+                self.edge_sets.append(self.all_indices)
+                continue
+
+            start = order[:counts[j]]
+            neighbours = self.neighbours[start].flatten()
+            closure = num.union1d(start, neighbours[neighbours >= 0]).astype(num.int64)
+
+            self.start_sets.append(start)
+            self.closure_sets.append(closure)
+            self.edge_sets.append(edge_order[:edge_counts[j]])
+
+    def _level(self, substep):
+        """Highest level starting (or finishing) a timestep at substep"""
+
+        if substep % self.number_of_substeps == 0:
+            return self.nlevels
+
+        return (substep & -substep).bit_length() - 1
+
+    def update_timestep_and_levels(self, yieldstep, finaltime):
+        """Set the macro timestep and substep timestep of the domain from
+        the edge timesteps of the latest flux computation and assign the
+        triangles to levels.
+        """
+
+        domain = self.domain
+        nlevels = self.nlevels
+        M = self.number_of_substeps
+
+        tri_timestep = domain.edge_timestep.reshape(-1, 3).min(axis=1)
+
+        full = domain.tri_full_flag == 1
+        if num.any(full):
+            local_timestep = tri_timestep[full].min()
+        else:
+            local_timestep = domain.evolve_max_timestep
+
+        # Macro step from the smallest triangle timestep (reduced over
+        # processors in parallel and aligned with the yieldsteps)
+        domain.flux_timestep = M*local_timestep
+        domain.update_timestep(yieldstep, finaltime)
+
+        self.macro_timestep = domain.timestep
+        self.timestep = domain.timestep/M
+
+        # Largest frequency f (a power of 2) with f*dt within the
+        # triangle's CFL timestep
+        if self.timestep > 0.0:
+            ratio = num.maximum(domain.CFL*tri_timestep/self.timestep, 1.0)
+            levels = num.minimum(num.floor(num.log2(ratio)), nlevels)
+            frequency = (2**levels.astype(num.int64)).astype(num.int64)
+        else:
+            frequency = num.ones(len(domain), dtype=num.int64)
+
+        # Neighbouring triangles differ by at most one level (in parallel
+        # the ghosts start with the levels of their full triangles)
+        domain.set_ghost_timestep_frequency(frequency)
+        frequency = self._smooth(frequency,
+            lambda f: num.minimum(f, 2*self._neighbour_frequency_min(f)))
+
+        self.frequency = frequency
+        domain.sort_ghosts_by_frequency(self.frequency)
+        self._set_index_sets()
+
+    def refine_levels(self, indices, level=None):
+        """Lower the levels of the triangles listed in indices if their
+        next timestep would violate the CFL condition (e.g. water has
+        arrived since the levels were set).
+
+        The triangles listed in indices are those starting a timestep, the
+        others are in the middle of a timestep and keep their levels. The
+        levels are then smoothed again so that neighbouring triangles
+        differ by at most one level: the lowered levels propagate to the
+        neighbours starting a timestep, and a triangle next to one in the
+        middle of a timestep is lowered to at most one level below it
+        (its refinement waits until that neighbour finishes).
+
+        level is that of the triangles finishing their timestep. The
+        triangles of level 0 cannot be refined, so nothing is done (and
+        nothing communicated) when only those finish.
+        """
+
+        domain = self.domain
+
+        if level == 0:
+            return
+
+        old_frequency = self.frequency.copy()
+
+        changes = refine_frequency_lts(domain, indices, self.frequency,
+                                       self.timestep, domain.CFL)
+
+        # In parallel the smoothing exchanges ghost levels, so all the
+        # processors take part if any triangle has changed
+        if domain.numproc > 1:
+            from anuga.utilities.parallel_abstraction import allreduce_values
+            changes = allreduce_values([changes], ['sum'])[0]
+
+        if changes == 0:
+            return
+
+        starting = num.zeros(len(domain), bool)
+        starting[indices] = True
+
+        # Lowest levels allowed by the triangles in the middle of a
+        # timestep. The refined levels of the ghosts are those of their
+        # full triangles, as they are computed from the same values
+        lower = self._smooth(num.where(starting, 0, old_frequency),
+            lambda f: num.where(starting, num.maximum(f, self._neighbour_frequency_max(f)//2), f))
+
+        frequency = self._smooth(num.maximum(self.frequency, lower),
+            lambda f: num.where(starting, num.minimum(f, 2*self._neighbour_frequency_min(f)), f))
+
+        self.frequency[:] = frequency
+        domain.sort_ghosts_by_frequency(self.frequency)
+        self._set_index_sets()
+
+    def macro_step(self, yieldstep=None, finaltime=None, update_levels=True):
+        """Evolve the conserved quantities over one macro step, starting at
+        the current time of the domain. If update_levels the macro timestep
+        and levels are computed from the fluxes of the first substep,
+        otherwise those of the previous macro step are used.
+
+        Returns the time integrated boundary flux.
+        """
+
+        domain = self.domain
+        timers = domain.phase_timers
+
+        start_time = domain.get_relative_time()
+        mass_error = 0.0
+        boundary_flux = 0.0
+        num_negative_cells = 0
+
+        for substep in range(self.number_of_substeps):
+
+            domain.set_relative_time(start_time + substep*self.timestep)
+
+            level = self._level(substep)
+
+            # Triangles starting a timestep
+            start = self.start_sets[level]
+
+            timers.start('distribute_to_vertices_and_edges')
+            mass_error = protect_new_indices(domain, start)
+            extrapolate_second_order_edge_sw_indices(domain, start,
+                                                     self.closure_sets[level])
+            timers.stop('distribute_to_vertices_and_edges')
+
+            domain.update_boundary()
+
+            timers.start('compute_fluxes')
+            compute_fluxes_lts(domain, self.edge_sets[level], self.frequency, substep)
+            timers.stop('compute_fluxes')
+
+            if substep == 0 and update_levels:
+                self.update_timestep_and_levels(yieldstep, finaltime)
+
+            timers.start('compute_fluxes')
+            boundary_flux += accumulate_fluxes_lts(domain, self.edge_sets[level],
+                                                   self.frequency, substep,
+                                                   self.timestep, self.accum)
+            timers.stop('compute_fluxes')
+
+            for name in domain.conserved_quantities:
+                Q = domain.quantities[name]
+                Q.explicit_update[:] = 0.0
+                Q.semi_implicit_update[:] = 0.0
+
+            domain.compute_forcing_terms()
+
+            # Triangles finishing a timestep
+            finish_level = self._level(substep + 1)
+            finish = self.start_sets[finish_level]
+
+            timers.start('update_conserved_quantities')
+            accumulate_forcing_lts(domain, start, self.frequency, self.timestep,
+                                   self.accum, self.semi)
+            num_negative_cells += update_conserved_quantities_lts(domain, finish,
+                                                                  self.frequency,
+                                                                  self.timestep,
+                                                                  self.accum, self.semi)
+            timers.stop('update_conserved_quantities')
+
+            domain.update_ghosts_by_frequency(2**finish_level)
+
+            # Triangles starting their next timestep within this macro step
+            if finish_level < self.nlevels:
+                self.refine_levels(finish, finish_level)
+
+        domain.set_relative_time(start_time)
+
+        if mass_error > 0.0 and domain.verbose:
+            print('Cumulative mass protection: {0} m^3'.format(mass_error))
+
+        if num_negative_cells > 0:
+            import warnings
+            msg = 'Negative cells being set to zero depth, possible loss of conservation. \n' +\
+                  'Consider using domain.report_water_volume_statistics() to check the extent of the problem'
+            warnings.warn(msg)
+
+        return boundary_flux
+
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+        """One euler step Q^{n+1} = M Q^n"""
+
+        domain = self.domain
+
+        boundary_flux = self.macro_step(yieldstep, finaltime)
+
+        if domain.timestep > 0.0:
+            domain.boundary_flux_sum[0] = boundary_flux/domain.timestep
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+        """One 2nd order RK step Q^{n+1} = 0.5 Q^n + 0.5 M^2 Q^n,
+        both macro steps with the same timesteps and levels
+        """
+
+        domain = self.domain
+
+        domain.backup_conserved_quantities()
+
+        boundary_flux_0 = self.macro_step(yieldstep, finaltime)
+
+        domain.set_relative_time(domain.get_relative_time() + domain.timestep)
+
+        self.refine_levels(self.all_indices)
+
+        boundary_flux_1 = self.macro_step(update_levels=False)
+
+        domain.saxpy_conserved_quantities(0.5, 0.5)
+
+        if domain.timestep > 0.0:
+            domain.boundary_flux_sum[0] = boundary_flux_0/domain.timestep
+            domain.boundary_flux_sum[1] = boundary_flux_1/domain.timestep
+
+    def get_level_counts(self):
+        """Return the number of full triangles at each level"""
+
+        full = self.domain.tri_full_flag == 1
+        levels = num.log2(self.frequency[full]).astype(int)
+
+        return num.bincount(levels, minlength=self.nlevels + 1)
+
+    def statistics(self):
+        """Return string with the number of triangles at each level"""
+
+        msg = '  Local timestepping: substep dt = %.8f (s), triangles per level:\n' \
+            % self.timestep
+        for j, count in enumerate(self.get_level_counts()):
+            msg += '    %5d dt: %d\n' % (2**j, count)
+
+        return msg
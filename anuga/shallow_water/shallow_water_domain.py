@@ -249,6 +249,7 @@ class Domain(Generic_Domain):
                  number_of_full_nodes=None,
                  number_of_full_triangles=None,
                  ghost_layer_width=2,
+                 reorder_triangles=None,
                  **kwargs):
 
         """Instantiate a shallow water domain.
@@ -256,6 +257,8 @@ class Domain(Generic_Domain):
         :param coordinates: vertex locations for the mesh
         :param vertices: vertex indices defining the triangles of the mesh
         :param boundary: boundaries of the mesh
+        :param reorder_triangles: renumber the triangles for better cache reuse,
+            one of 'hilbert', 'morton' or 'rcm'. None keeps the given numbering
         """
 
         # Define quantities for the shallow_water domain
@@ -269,9 +272,8 @@ class Domain(Generic_Domain):
             other_quantities = ['elevation', 'friction', 'height',
                                 'xvelocity', 'yvelocity', 'x', 'y']
 
-
-
-
+        # Storage precision of the evolved quantities (see set_precision)
+        self.precision = 'double'
 
         Generic_Domain.__init__(self,
                             coordinates,
@@ -293,7 +295,15 @@ class Domain(Generic_Domain):
                             numproc,
                             number_of_full_nodes=number_of_full_nodes,
                             number_of_full_triangles=number_of_full_triangles,
-                            ghost_layer_width=ghost_layer_width)
+                            ghost_layer_width=ghost_layer_width,
+                            reorder_triangles=reorder_triangles)
+
+        #-------------------------------
+        # Persistent C struct holding pointers to the
+        # domain arrays (used by the C extensions)
+        #-------------------------------
+        from .sw_domain_struct_ext import Domain_struct
+        self.domain_struct = Domain_struct()
 
         #-------------------------------
         # Operator Data Structures
@@ -339,6 +349,8 @@ class Domain(Generic_Domain):
         self.set_store(True)
         self.set_store_centroids(True)
         self.set_store_vertices_uniquely(False)
+        self.set_store_buffering(False)
+        self.set_store_asynchronous(False)
         self.quantities_to_be_stored = {'elevation': 1,
                                         'friction':1,
                                         'stage': 2,
@@ -425,6 +437,12 @@ class Domain(Generic_Domain):
         # extrapolation/flux updating is used)
         self.allow_timestep_increase=num.zeros(1).astype(int)+1
 
+        # Multi-rate local timestepping (see set_local_timestepping)
+        self.local_timestepping = None
+
+        # Fused update sweep for the batch steps (see set_fused_kernel)
+        self.fused_kernel = False
+
 
         #-----------------------------------
         # parameters for structures
@@ -1120,6 +1138,78 @@ class Domain(Generic_Domain):
 
         return self.store_centroids
 
+    def set_store_buffering(self, flag=True, max_frames=None, max_bytes=None):
+        """Set whether the sww file is kept open during evolve with
+        timesteps buffered in memory and written in blocks.
+
+        :param bool flag: Turn buffering on or off
+        :param int max_frames: Number of timesteps to buffer before writing
+        :param int max_bytes: Write the buffer once it holds this many bytes
+
+        Buffered timesteps are written at the end of each call to evolve.
+        """
+
+        from anuga.config import sww_buffer_max_frames, sww_buffer_max_bytes
+
+        if max_frames is None:
+            max_frames = sww_buffer_max_frames
+
+        if max_bytes is None:
+            max_bytes = sww_buffer_max_bytes
+
+        msg = 'max_frames should be a positive integer'
+        assert int(max_frames) >= 1, msg
+
+        self.store_buffered = flag
+        self.buffer_max_frames = int(max_frames)
+        self.buffer_max_bytes = max_bytes
+
+        if hasattr(self, 'writer'):
+            self.writer.close()
+            self.writer.store_buffered = flag
+            self.writer.buffer_max_frames = self.buffer_max_frames
+            self.writer.buffer_max_bytes = self.buffer_max_bytes
+
+    def get_store_buffering(self):
+        """Get whether sww output is buffered.
+        """
+
+        return self.store_buffered
+
+    def set_store_asynchronous(self, flag=True, queue_size=None):
+        """Set whether sww output is written by a background thread.
+
+        :param bool flag: Turn asynchronous output on or off
+        :param int queue_size: Number of staging buffers. store_timestep
+            waits for the writer thread when all are in use.
+
+        At each output step the centroid and vertex values are copied to
+        a staging buffer and evolve continues while the writer thread
+        stores them. Can be combined with set_store_buffering.
+        """
+
+        from anuga.config import sww_async_queue_size
+
+        if queue_size is None:
+            queue_size = sww_async_queue_size
+
+        msg = 'queue_size should be a positive integer'
+        assert int(queue_size) >= 1, msg
+
+        self.store_asynchronous = flag
+        self.async_queue_size = int(queue_size)
+
+        if hasattr(self, 'writer'):
+            self.writer.close()
+            self.writer.store_asynchronous = flag
+            self.writer.queue_size = self.async_queue_size
+
+    def get_store_asynchronous(self):
+        """Get whether sww output is written by a background thread.
+        """
+
+        return self.store_asynchronous
+
     def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
         """Set up checkpointing.
 
@@ -1213,6 +1303,60 @@ class Domain(Generic_Domain):
                 raise Exception('Local extrapolation and flux updating only supported for discontinuous flow algorithms')
 
 
+    def set_local_timestepping(self, flag=True, nlevels=3):
+        """
+            Use multi-rate local timestepping
+
+            Triangles are grouped into levels with timesteps 1, 2, 4, ..
+            2**nlevels times the global CFL timestep according to their
+            own CFL condition, and the fluxes of each edge are only updated
+            at the rate of the finer of its two triangles. So a few small
+            triangles do not force the whole domain to take small timesteps.
+            The scheme conserves mass.
+
+            For example, to allow timesteps up to 8 times the smallest
+            timestep, do:
+
+                    domain.set_local_timestepping(nlevels=3)
+
+            Supported with the discontinuous elevation algorithms with
+            euler or rk2 timestepping (e.g. DE0 and DE1) and in parallel.
+            See anuga.shallow_water.local_timestepping.
+        """
+
+        if not flag:
+            self.local_timestepping = None
+            return
+
+        self._check_local_timestepping()
+
+        from anuga.shallow_water.local_timestepping import Local_timestepping
+        self.local_timestepping = Local_timestepping(self, nlevels)
+
+
+    def get_local_timestepping(self):
+        """Return the number of local timestepping levels
+        (None if local timestepping is not used)
+        """
+
+        if self.local_timestepping is None:
+            return None
+
+        return self.local_timestepping.nlevels
+
+
+    def _check_local_timestepping(self):
+
+        if self.precision != 'double':
+            raise Exception('Local timestepping only supported with double precision')
+        if self.compute_fluxes_method != 'DE':
+            raise Exception('Local timestepping only supported for discontinuous flow algorithms')
+        if self.timestepping_method not in ['euler', 'rk2']:
+            raise Exception('Local timestepping only supported with euler or rk2 timestepping')
+        if self.max_flux_update_frequency != 1:
+            raise Exception('Local timestepping cannot be used with local extrapolation and flux updating')
+
+
     def get_compute_fluxes_method(self):
         """Get method for computing fluxes.
 
@@ -1297,6 +1441,12 @@ class Domain(Generic_Domain):
         if self.flow_algorithm == 'DE1_7':
             self._set_DE1_7_defaults()
 
+        # The defaults reallocate the edge coordinates
+        self.domain_struct.unbind()
+
+        if self.precision != 'double' and self.compute_fluxes_method != 'DE':
+            raise Exception('Single precision only supported for discontinuous flow algorithms')
+
 
     def get_flow_algorithm(self):
         """
@@ -1627,6 +1777,22 @@ class Domain(Generic_Domain):
 
         from anuga import numprocs
 
+        volume = self._get_local_water_volume()
+
+        if numprocs == 1:
+            self.volume_history.append(volume)
+            return volume
+
+        # isolated parallel code
+        from anuga import allreduce_values
+
+        water_volume = allreduce_values([volume], ['sum'])[0]
+
+        self.volume_history.append(water_volume)
+        return water_volume
+
+    def _get_local_water_volume(self):
+
         #print self.evolved_called
 
         if not self.evolved_called:
@@ -1648,31 +1814,14 @@ class Domain(Generic_Domain):
             Height = Stage-Elev
             volume = Height.get_integral()
 
-        if numprocs == 1:
-            self.volume_history.append(volume)
-            return volume
+        return volume
 
-        # isolated parallel code
-        from anuga import myid, send, receive, barrier
+    def _check_boundary_flux_integral(self):
 
-        if myid == 0:
-            water_volume = volume
-            for i in range(1,numprocs):
-                remote_volume = receive(i)
-                water_volume = water_volume + remote_volume
-        else:
-            send(volume,0)
-
-        #barrier()
-
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(water_volume,i)
-        else:
-            water_volume = receive(0)
-
-        self.volume_history.append(water_volume)
-        return water_volume
+        if not self.compute_fluxes_method=='DE':
+            msg='Boundary flux integral only supported for DE fluxes '+\
+                '(because computation of boundary_flux_sum is only implemented there)'
+            raise Exception(msg)
 
     def get_boundary_flux_integral(self):
         """Compute the boundary flux integral.
@@ -1682,10 +1831,7 @@ class Domain(Generic_Domain):
 
         from anuga import numprocs
 
-        if not self.compute_fluxes_method=='DE':
-            msg='Boundary flux integral only supported for DE fluxes '+\
-                '(because computation of boundary_flux_sum is only implemented there)'
-            raise Exception(msg)
+        self._check_boundary_flux_integral()
 
         flux_integral = self.boundary_flux_integral.boundary_flux_integral[0]
 
@@ -1693,24 +1839,9 @@ class Domain(Generic_Domain):
             return flux_integral
 
         # isolate parallel code
-        from anuga import myid, send, receive, barrier
-
-        if myid == 0:
-            for i in range(1,numprocs):
-                remote_flux_integral = receive(i)
-                flux_integral = flux_integral + remote_flux_integral
-        else:
-            send(flux_integral,0)
+        from anuga import allreduce_values
 
-        #barrier()
-
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(flux_integral,i)
-        else:
-            flux_integral = receive(0)
-
-        return flux_integral
+        return allreduce_values([flux_integral], ['sum'])[0]
 
     def get_fractional_step_volume_integral(self):
         """Compute the integrated flows from fractional steps.
@@ -1728,24 +1859,9 @@ class Domain(Generic_Domain):
             return flux_integral
 
         # isolate parallel code
-        from anuga import myid, send, receive, barrier
+        from anuga import allreduce_values
 
-        if myid == 0:
-            for i in range(1,numprocs):
-                remote_flux_integral = receive(i)
-                flux_integral = flux_integral + remote_flux_integral
-        else:
-            send(flux_integral,0)
-
-        #barrier()
-
-        if myid == 0:
-            for i in range(1,numprocs):
-                send(flux_integral,i)
-        else:
-            flux_integral = receive(0)
-
-        return flux_integral
+        return allreduce_values([flux_integral], ['sum'])[0]
 
     def get_flow_through_cross_section(self, polyline, verbose=False):
         """Get the total flow through an arbitrary poly line.
@@ -1851,6 +1967,8 @@ class Domain(Generic_Domain):
         # procedure
 
         # nvtxRangePush("Compute Fluxes (Domain)")
+        self.phase_timers.start('compute_fluxes')
+
         # Choose the correct extension module
         if self.multiprocessor_mode == 0:
             from .sw_domain_orig_ext import compute_fluxes_ext_central
@@ -1859,7 +1977,10 @@ class Domain(Generic_Domain):
             from .sw_domain_simd_ext import compute_fluxes_ext_central
 
         elif self.multiprocessor_mode == 2:
-            from .sw_domain_openmp_ext import compute_fluxes_ext_central
+            if self.precision == 'single':
+                from .sw_domain_openmp_sp_ext import compute_fluxes_ext_central
+            else:
+                from .sw_domain_openmp_ext import compute_fluxes_ext_central
 
         elif self.multiprocessor_mode == 3:
             from .sw_domain_openacc_ext import compute_fluxes_ext_central
@@ -1876,12 +1997,15 @@ class Domain(Generic_Domain):
         timestep = self.evolve_max_timestep
         self.flux_timestep = compute_fluxes_ext_central(self, timestep)
 
+        self.phase_timers.stop('compute_fluxes')
         # nvtxRangePop()
 
         
     def distribute_to_vertices_and_edges(self):
         """ extrapolate centroid values to vertices and edges"""
 
+        self.phase_timers.start('distribute_to_vertices_and_edges')
+
         # Do protection step
         nvtxRangePush('protect_against_infinities')
         self.protect_against_infinitesimal_and_negative_heights()
@@ -1899,7 +2023,10 @@ class Domain(Generic_Domain):
             extrapolate_second_order_edge_sw(self)
 
         elif self.multiprocessor_mode == 2:
-            from .sw_domain_openmp_ext import extrapolate_second_order_edge_sw
+            if self.precision == 'single':
+                from .sw_domain_openmp_sp_ext import extrapolate_second_order_edge_sw
+            else:
+                from .sw_domain_openmp_ext import extrapolate_second_order_edge_sw
             extrapolate_second_order_edge_sw(self)
 
         elif self.multiprocessor_mode == 3:
@@ -1914,6 +2041,7 @@ class Domain(Generic_Domain):
         else:
             raise Exception('Not implemented')
 
+        self.phase_timers.stop('distribute_to_vertices_and_edges')
         # nvtxRangePop()
 
 
@@ -2026,7 +2154,10 @@ class Domain(Generic_Domain):
             from .sw_domain_simd_ext import protect_new
 
         elif self.multiprocessor_mode == 2:
-            from .sw_domain_openmp_ext import  protect_new
+            if self.precision == 'single':
+                from .sw_domain_openmp_sp_ext import protect_new
+            else:
+                from .sw_domain_openmp_ext import protect_new
 
         elif self.multiprocessor_mode == 3:
             from .sw_domain_openacc_ext import  protect_new
@@ -2092,6 +2223,7 @@ class Domain(Generic_Domain):
         """
 
         # nvtxRangePush('update_conserved_quantities')
+        self.phase_timers.start('update_conserved_quantities')
 
         timestep = self.timestep
 
@@ -2126,10 +2258,13 @@ class Domain(Generic_Domain):
                 num_negative_ids = fix_negative_cells(self)
 
             elif self.multiprocessor_mode == 2:
-                Stage.update(timestep)
-                Xmom.update(timestep)
-                Ymom.update(timestep)                
-                from .sw_domain_openmp_ext import fix_negative_cells
+                if self.precision == 'single':
+                    from .sw_domain_openmp_sp_ext import update_conserved_quantities
+                    from .sw_domain_openmp_sp_ext import fix_negative_cells
+                else:
+                    from .sw_domain_openmp_ext import update_conserved_quantities
+                    from .sw_domain_openmp_ext import fix_negative_cells
+                update_conserved_quantities(self, timestep)
                 num_negative_ids = fix_negative_cells(self)
 
             elif self.multiprocessor_mode == 3:
@@ -2160,6 +2295,7 @@ class Domain(Generic_Domain):
                       'Consider using domain.report_water_volume_statistics() to check the extent of the problem'
                 warnings.warn(msg)
 
+        self.phase_timers.stop('update_conserved_quantities')
         # nvtxRangePop()
 
     def update_other_quantities(self):
@@ -2297,6 +2433,257 @@ class Domain(Generic_Domain):
 
     
 
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+
+        if self.local_timestepping is None:
+            Generic_Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+            return
+
+        self._check_local_timestepping()
+        self.local_timestepping.evolve_one_euler_step(yieldstep, finaltime)
+
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+
+        if self.local_timestepping is None:
+            Generic_Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+            return
+
+        self._check_local_timestepping()
+        self.local_timestepping.evolve_one_rk2_step(yieldstep, finaltime)
+
+
+    def set_ghost_timestep_frequency(self, frequency):
+        """Local timestepping: set the timestep frequency of the ghost
+        triangles to that of the full triangles they copy
+        """
+
+        iproc = self.processor
+        if iproc in self.full_send_dict:
+            Idf = self.full_send_dict[iproc][0]
+            Idg = self.ghost_recv_dict[iproc][0]
+            frequency[Idg] = frequency[Idf]
+
+
+    def sort_ghosts_by_frequency(self, frequency):
+        """Local timestepping: order the ghost triangles by timestep
+        frequency (only needed in parallel)
+        """
+
+        pass
+
+
+    def update_ghosts_by_frequency(self, max_frequency):
+        """Local timestepping: update the ghost triangles with timestep
+        frequency at most max_frequency
+        """
+
+        self.update_ghosts()
+
+
+    def set_fused_kernel(self, flag=True):
+        """Switch on (or off) the fused OpenMP kernel for the batch steps
+        (see set_batch_steps), which switches on batch steps.
+
+        The friction, update of the conserved quantities, fixing of
+        negative cells and protection of each substep are then done in a
+        single sweep over the triangles, which reduces the memory traffic.
+        """
+
+        self.fused_kernel = bool(flag)
+        if self.fused_kernel:
+            self.set_batch_steps(True)
+
+    def get_fused_kernel(self):
+
+        return self.fused_kernel
+
+
+    def set_precision(self, precision='single'):
+        """Set the storage precision, 'single' or 'double', of the
+        centroid, edge and vertex values of stage, xmomentum and ymomentum.
+
+        In single precision these are float32 arrays, halving the memory
+        traffic of the flux, extrapolation and update kernels, while the
+        fluxes, updates and boundary flux integral are still accumulated
+        in double precision. Check the conservation error with
+        volumetric_balance_statistics.
+
+        Supported with multiprocessor mode 2 and the discontinuous
+        elevation algorithms, without local timestepping. Set the
+        precision before setting the quantities for best accuracy, and
+        before creating any operators (which keep references to the
+        value arrays).
+        """
+
+        if precision not in ['single', 'double']:
+            raise Exception('Precision %s not supported, use single or double' % precision)
+
+        if precision == 'single':
+            if self.multiprocessor_mode != 2:
+                raise Exception('Single precision only supported with multiprocessor mode 2')
+            if self.compute_fluxes_method != 'DE':
+                raise Exception('Single precision only supported for discontinuous flow algorithms')
+            if self.local_timestepping is not None:
+                raise Exception('Single precision cannot be used with local timestepping')
+
+        dtype = num.float32 if precision == 'single' else float
+
+        from anuga.abstract_2d_finite_volumes.quantity import state_arrays
+
+        changed = [(name, array_name)
+                   for name in self.evolved_quantities
+                   for array_name in state_arrays
+                   if getattr(self.quantities[name], array_name).dtype != dtype]
+
+        if len(changed) == 0:
+            self.precision = precision
+            return
+
+        # The boundary flux integral operator does not use the value arrays
+        operators = [operator for operator in self.fractional_step_operators
+                     if operator is not self.boundary_flux_integral]
+        if len(operators) > 0:
+            msg = ('Set the precision before creating any operators, as they '
+                   'keep references to the value arrays being reallocated')
+            raise Exception(msg)
+
+        for name, array_name in changed:
+            Q = self.quantities[name]
+            setattr(Q, array_name, getattr(Q, array_name).astype(dtype, copy=False))
+
+        self.precision = precision
+
+        # The value arrays have been reallocated
+        self.domain_struct.unbind()
+
+    def get_precision(self):
+        """Return the storage precision of the evolved quantities
+        """
+
+        return self.precision
+
+
+    def _get_batch_boundaries(self):
+        """Batch steps: return the boundary ids and edges (3*vol_id +
+        edge_id) of the Reflective boundaries and the ids, edges and
+        values of the Dirichlet boundaries, or None if there are other
+        types of boundaries.
+        """
+
+        from anuga.shallow_water.boundaries import Reflective_boundary
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+            import Dirichlet_boundary
+
+        reflective_ids = []
+        dirichlet_ids = []
+        dirichlet_values = []
+        for tag in self.tag_boundary_cells:
+            B = self.boundary_map[tag]
+            ids = num.asarray(self.tag_boundary_cells[tag], dtype=num.int64)
+
+            if B is None:
+                continue
+            elif type(B) is Reflective_boundary:
+                reflective_ids.append(ids)
+            elif type(B) is Dirichlet_boundary and len(B.dirichlet_values) == 3:
+                dirichlet_ids.append(ids)
+                dirichlet_values.append(num.tile(B.dirichlet_values, (len(ids), 1)))
+            else:
+                return None
+
+        def concatenate(arrays, shape, dtype):
+            if len(arrays) == 0:
+                return num.zeros(shape, dtype=dtype)
+            return num.ascontiguousarray(num.concatenate(arrays), dtype=dtype)
+
+        reflective_ids = concatenate(reflective_ids, (0,), num.int64)
+        dirichlet_ids = concatenate(dirichlet_ids, (0,), num.int64)
+        dirichlet_values = concatenate(dirichlet_values, (0, 3), float)
+
+        def edges(ids):
+            return (3*self.boundary_cells[ids] + self.boundary_edges[ids]).astype(num.int64)
+
+        return reflective_ids, edges(reflective_ids), \
+            dirichlet_ids, edges(dirichlet_ids), dirichlet_values
+
+
+    def _batch_steps_possible(self):
+        """Batch steps need the DE algorithms with euler or rk2 timestepping
+        in multiprocessor_mode 2 on a single processor, and no per step
+        python callbacks other than manning friction and the boundary flux
+        integral.
+        """
+
+        from anuga.shallow_water.friction import manning_friction_implicit
+
+        return self.multiprocessor_mode == 2 and \
+            self.get_using_discontinuous_elevation() and \
+            self.get_timestepping_method() in ['euler', 'rk2'] and \
+            self.local_timestepping is None and \
+            self.numproc == 1 and \
+            self.processor not in self.full_send_dict and \
+            self.max_flux_update_frequency == 1 and \
+            not self.protect_against_isolated_degenerate_timesteps and \
+            self.quantities_to_be_monitored is None and \
+            self.forcing_terms == [manning_friction_implicit] and \
+            all(operator is self.boundary_flux_integral
+                for operator in self.fractional_step_operators)
+
+
+    def evolve_batch_steps(self, yieldstep, finaltime):
+        """Take all the timesteps up to the next yield (or final) time in
+        compiled code (see set_batch_steps).
+
+        Returns the number of steps taken, 0 if the steps must be taken one
+        at a time.
+        """
+
+        if not self._batch_steps_possible():
+            return 0
+
+        boundaries = self._get_batch_boundaries()
+        if boundaries is None:
+            return 0
+
+        from anuga.config import epsilon
+        if self.precision == 'single':
+            from .sw_domain_openmp_sp_ext import evolve_batch
+        else:
+            from .sw_domain_openmp_ext import evolve_batch
+
+        timestepping_order = 2 if self.get_timestepping_method() == 'rk2' else 1
+
+        relative_finaltime = self.relative_finaltime
+        if relative_finaltime is None:
+            relative_finaltime = float('inf')
+
+        self.phase_timers.start('batch_steps')
+        number_of_steps, cfl_timestep, num_negative_cells, status = \
+            evolve_batch(self, timestepping_order, self.relative_yieldtime,
+                         relative_finaltime, epsilon, *boundaries)
+        self.phase_timers.stop('batch_steps')
+
+        if status < 0:
+            msg = 'Division by zero in semi implicit update at time %f' % self.get_time()
+            raise Exception(msg)
+
+        self.number_of_steps += number_of_steps
+        if self._order_ == 1:
+            self.number_of_first_order_steps += number_of_steps
+
+        # Count small timesteps (only the last step can be one)
+        self._protect_against_degenerate_timesteps(cfl_timestep)
+
+        if num_negative_cells > 0:
+            import warnings
+            msg = 'Negative cells being set to zero depth, possible loss of conservation. \n' +\
+                  'Consider using domain.report_water_volume_statistics() to check the extent of the problem'
+            warnings.warn(msg)
+
+        return number_of_steps
+
+
     def evolve(self,
                yieldstep=None,
                outputstep=None,
@@ -2345,12 +2732,25 @@ class Domain(Generic_Domain):
         msg = 'Attribute self.beta_w must be in the interval [0, 2]'
         assert 0 <= self.beta_w <= 2.0, msg
 
+        # Arrays may have been reallocated since the C domain struct
+        # was bound, so bind it again at the start of each evolve
+        self.domain_struct.unbind()
+
         # Initial update of vertex and edge values before any STORAGE
         # and or visualisation.
         # This is done again in the initialisation of the Generic_Domain
         # evolve loop but we do it here to ensure the values are ok for storage.
         self.distribute_to_vertices_and_edges()
 
+        # Initial volume of the conservation error
+        # (see volumetric_balance_statistics)
+        if len(self.volume_history) == 0 and self.get_using_discontinuous_elevation():
+            if self.numproc == 1:
+                # Sequential domains may be evolved on a single process
+                self.volume_history.append(self._get_local_water_volume())
+            else:
+                self.get_water_volume()
+
         if self.store is True and (self.get_relative_time() == 0.0 or self.evolved_called is False):
             self.initialise_storage()
 
@@ -2360,48 +2760,56 @@ class Domain(Generic_Domain):
         nvtxRangePush('_evolve_base')
 
         # Call basic machinery from parent class
-        for t in self._evolve_base(yieldstep=yieldstep,
-                                   finaltime=finaltime, duration=duration,
-                                   skip_initial_step=skip_initial_step):
+        try:
+            for t in self._evolve_base(yieldstep=yieldstep,
+                                       finaltime=finaltime, duration=duration,
+                                       skip_initial_step=skip_initial_step):
 
 
-            walltime = time.time()
+                walltime = time.time()
 
-            #print t , self.get_time()
-            # Store model data, e.g. for subsequent visualisation
-            if self.store:
-                if self.yieldstep_counter%self.output_frequency == 0:
-                    self.store_timestep()
+                #print t , self.get_time()
+                # Store model data, e.g. for subsequent visualisation
+                if self.store:
+                    if self.yieldstep_counter%self.output_frequency == 0:
+                        self.store_timestep()
 
-            if self.checkpoint:
-                save_checkpoint=False
-                if self.checkpoint_step == 0:
-                    if rank() == 0:
-                        if walltime - self.walltime_prev > self.checkpoint_time:
+                if self.checkpoint:
+                    from anuga import myid, numprocs
+                    save_checkpoint=False
+                    if self.checkpoint_step == 0:
+                        if myid == 0:
+                            if walltime - self.walltime_prev > self.checkpoint_time:
 
-                            save_checkpoint = True
-                        for cpu in range(size()):
-                            if cpu != rank():
-                                send(save_checkpoint, cpu)
-                    else:
-                        save_checkpoint = receive(0)
+                                save_checkpoint = True
+                        if numprocs > 1:
+                            from anuga.utilities.parallel_abstraction import broadcast
+                            save_checkpoint = broadcast(save_checkpoint, 0)
 
-                elif self.yieldstep_counter%self.checkpoint_step == 0:
-                        save_checkpoint = True
+                    elif self.yieldstep_counter%self.checkpoint_step == 0:
+                            save_checkpoint = True
 
-                if save_checkpoint:
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    pickle.dump(self, open(pickle_name, 'wb'))
+                    if save_checkpoint:
+                        from anuga.shallow_water.checkpoint import save_checkpoint_file
+                        self.phase_timers.start('checkpoint')
+                        save_checkpoint_file(self)
+                        self.phase_timers.stop('checkpoint')
 
-                    barrier()
-                    self.walltime_prev = time.time()
+                        if numprocs > 1:
+                            barrier()
+                        self.walltime_prev = time.time()
 
-                    #print 'Stored Checkpoint File '+pickle_name
+                        #print 'Stored Checkpoint File '+pickle_name
 
-            # Pass control on to outer loop for more specific actions
-            yield(t)
+                # Pass control on to outer loop for more specific actions
+                yield(t)
 
-            self.yieldstep_counter += 1
+                self.yieldstep_counter += 1
+        finally:
+            # Write out any buffered output, also when evolve
+            # is interrupted by an exception
+            self.finalise_storage()
+            self.write_phase_timers()
 
         #nvtx marker
         nvtxRangePop()
@@ -2431,10 +2839,25 @@ class Domain(Generic_Domain):
         """
 
         nvtxRangePush('store_timestep')
+        self.phase_timers.start('storage')
         self.writer.store_timestep()
+        self.phase_timers.stop('storage')
         nvtxRangePop()
 
 
+    def finalise_storage(self):
+        """Write any buffered timesteps and close the sww file.
+
+        Called at the end of evolve. Storage will be reopened by
+        a subsequent call to store_timestep.
+        """
+
+        if hasattr(self, 'writer'):
+            self.phase_timers.start('storage')
+            self.writer.close()
+            self.phase_timers.stop('storage')
+
+
     def sww_merge(self,  *args, **kwargs):
         """Dummy function for sequential algorithms where the sww produced is the final products.
 
@@ -2477,6 +2900,9 @@ class Domain(Generic_Domain):
                                                      time_unit=time_unit,
                                                      datetime=datetime)
 
+        if self.local_timestepping is not None:
+            msg += '\n' + self.local_timestepping.statistics().rstrip('\n')
+
         if track_speeds is True:
             # qwidth determines the text field used for quantities
             qwidth = self.qwidth
@@ -2632,40 +3058,29 @@ class Domain(Generic_Domain):
         uh = self.get_quantity('xmomentum').get_values(location='edges')
         vh = self.get_quantity('ymomentum').get_values(location='edges')
 
-        # Loop through edges that lie on the boundary and calculate
-        # flows
-        boundary_flows = {}
-        total_boundary_inflow = 0.0
-        total_boundary_outflow = 0.0
-        for vol_id, edge_id in self.boundary:
-            # Compute normal flow across edge. Since normal vector points
-            # away from triangle, a positive sign means that water
-            # flows *out* from this triangle.
-
-            momentum = [uh[vol_id, edge_id], vh[vol_id, edge_id]]
-            normal = self.mesh.get_normal(vol_id, edge_id)
-            length = self.mesh.get_edgelength(vol_id, edge_id)
-            normal_flow = num.dot(momentum, normal)*length
-
-            # Reverse sign so that + is taken to mean inflow
-            # and - means outflow. This is more intuitive.
-            edge_flow = -normal_flow
-
-            # Tally up inflows and outflows separately
-            if edge_flow > 0:
-                # Flow is inflow
-                total_boundary_inflow += edge_flow
-            else:
-                # Flow is outflow
-                total_boundary_outflow += edge_flow
+        # Compute normal flow across the edges that lie on the boundary.
+        # Since normal vector points away from triangle, a positive sign
+        # means that water flows *out* from this triangle.
+        vol_ids = self.boundary_cells
+        edge_ids = self.boundary_edges
 
-            # Tally up flows by boundary tag
-            tag = self.boundary[(vol_id, edge_id)]
+        normals = self.mesh.normals
+        normal_flow = (uh[vol_ids, edge_ids]*normals[vol_ids, 2*edge_ids] +
+                       vh[vol_ids, edge_ids]*normals[vol_ids, 2*edge_ids+1])
+        normal_flow *= self.mesh.edgelengths[vol_ids, edge_ids]
 
-            if tag not in boundary_flows:
-                boundary_flows[tag] = 0.0
-            boundary_flows[tag] += edge_flow
+        # Reverse sign so that + is taken to mean inflow
+        # and - means outflow. This is more intuitive.
+        edge_flow = -normal_flow
 
+        # Tally up inflows and outflows separately
+        total_boundary_inflow = float(num.sum(edge_flow[edge_flow > 0]))
+        total_boundary_outflow = float(num.sum(edge_flow[edge_flow <= 0]))
+
+        # Tally up flows by boundary tag
+        boundary_flows = {}
+        for tag in self.boundary_tags:
+            boundary_flows[tag] = float(num.sum(edge_flow[self.tag_boundary_cells[tag]]))
 
         return boundary_flows, total_boundary_inflow, total_boundary_outflow
 
@@ -2702,6 +3117,19 @@ class Domain(Generic_Domain):
         message += 'Total volume in domain [m^3]: %.2f\n' % \
                     self.compute_total_volume()
 
+        # Conservation error of the discontinuous elevation algorithms,
+        # relative to the volume at the start of the evolve
+        if self.get_using_discontinuous_elevation() and len(self.volume_history) > 0:
+            from anuga.config import epsilon
+
+            V, BF, FS = self.report_water_volume_statistics(verbose=False,
+                                                            returnStats=True)
+            error = V - BF - FS - self.volume_history[0]
+            message += 'Storage precision of evolved quantities: %s\n' % self.precision
+            message += 'Conservation error [m^3]: %.6g\n' % error
+            message += 'Relative conservation error: %.6g\n' % \
+                       (error/max(abs(self.volume_history[0]), epsilon))
+
         # The go through explicit forcing update and record the rate of change
         # for stage and
         # record into forcing_inflow and forcing_outflow. Finally compute
@@ -2730,7 +3158,10 @@ class Domain(Generic_Domain):
             from .sw_domain_simd_ext import compute_flux_update_frequency
 
         elif self.multiprocessor_mode == 2:
-            from .sw_domain_openmp_ext import compute_flux_update_frequency
+            if self.precision == 'single':
+                from .sw_domain_openmp_sp_ext import compute_flux_update_frequency
+            else:
+                from .sw_domain_openmp_ext import compute_flux_update_frequency
 
         elif self.multiprocessor_mode == 3:
             from .sw_domain_openacc_ext import compute_flux_update_frequency
@@ -2760,12 +3191,27 @@ class Domain(Generic_Domain):
                 print('Water_volume_statistics only supported for DE algorithm ')
             return
 
-        # Compute the volume
-        Vol = self.get_water_volume()
+        from anuga import numprocs
 
-        # Compute the boundary flux integral
-        fluxIntegral=self.get_boundary_flux_integral()
-        fracIntegral=self.get_fractional_step_volume_integral()
+        if numprocs == 1:
+            # Compute the volume
+            Vol = self.get_water_volume()
+
+            # Compute the boundary flux integral
+            fluxIntegral=self.get_boundary_flux_integral()
+            fracIntegral=self.get_fractional_step_volume_integral()
+        else:
+            # All three in one reduction
+            from anuga import allreduce_values
+
+            self._check_boundary_flux_integral()
+
+            Vol, fluxIntegral, fracIntegral = allreduce_values(
+                [self._get_local_water_volume(),
+                 self.boundary_flux_integral.boundary_flux_integral[0],
+                 self.fractional_step_volume_integral], ['sum']*3)
+
+            self.volume_history.append(Vol)
 
         if(verbose and myid==0):
             print(' ')
@@ -2868,6 +3314,9 @@ class Domain(Generic_Domain):
         """
 
         if multiprocessor_mode in [0,1,2,3,4]:
+            if self.precision != 'double' and multiprocessor_mode != 2:
+                raise Exception('Single precision only supported with multiprocessor mode 2')
+
             self.multiprocessor_mode = multiprocessor_mode
 
             if multiprocessor_mode == 4:
@@ -10,6 +10,15 @@
 #include <stdint.h>
 #include <stdio.h>
 
+// Storage type of the evolved quantities (the centroid, edge and vertex
+// values of stage, xmomentum and ymomentum). The single precision variant
+// is sw_domain_openmp_sp_ext, compiled with SW_SINGLE_PRECISION.
+#ifdef SW_SINGLE_PRECISION
+typedef float state_t;
+#else
+typedef double state_t;
+#endif
+
 // structures
 struct domain {
     // Changing these don't change the data in python object
@@ -59,21 +68,21 @@ struct domain {
     double* centroid_coordinates;
 
     int64_t*   number_of_boundaries;
-    double* stage_edge_values;
-    double* xmom_edge_values;
-    double* ymom_edge_values;
+    state_t* stage_edge_values;
+    state_t* xmom_edge_values;
+    state_t* ymom_edge_values;
     double* bed_edge_values;
     double* height_edge_values;
 
-    double* stage_centroid_values;
-    double* xmom_centroid_values;
-    double* ymom_centroid_values;
+    state_t* stage_centroid_values;
+    state_t* xmom_centroid_values;
+    state_t* ymom_centroid_values;
     double* bed_centroid_values;
     double* height_centroid_values;
 
-    double* stage_vertex_values;
-    double* xmom_vertex_values;
-    double* ymom_vertex_values;
+    state_t* stage_vertex_values;
+    state_t* xmom_vertex_values;
+    state_t* ymom_vertex_values;
     double* bed_vertex_values;
     double* height_vertex_values;
 
@@ -1086,6 +1086,9 @@ class GPU_interface(object):
         domain.x_centroid_work = self.cpu_x_centroid_work
         domain.y_centroid_work = self.cpu_y_centroid_work
 
+        # The C domain struct must point to the new arrays
+        domain.domain_struct.unbind()
+
         return domain
 
 
@@ -452,17 +452,41 @@ double __openmp__adjust_edgeflux_with_weir(double *edgeflux0, double *edgeflux1,
   return ierr;
 }
 
-// Computational function for flux computation
-double _openmp_compute_fluxes_central(struct domain *D,
-                                      double timestep)
+// Which substep of the timestepping method are we on?
+// new_call flags the start of a new flux calculation. A flux
+// calculation split over several calls (see
+// _openmp_compute_fluxes_central_indices) only sets it on the first call.
+static int64_t __openmp_flux_substep_count(struct domain *D, int64_t new_call)
 {
-  // Local variables
-  int64_t K = D->number_of_elements;
-  // int64_t KI, KI2, KI3, B, RW, RW5, SubSteps;
-  int64_t substep_count;
+  static int64_t call = 0; // Static local variable flagging already computed flux
+  static int64_t timestep_fluxcalls = 1;
+  static int64_t base_call = 1;
 
-  double max_speed_local, length, inv_area, zl, zr;
-  double h_left, h_right, z_half; // For andusse scheme
+  if (new_call)
+  {
+    call++; // Flag 'id' of flux calculation for this timestep
+  }
+
+  if (D->timestep_fluxcalls != timestep_fluxcalls)
+  {
+    timestep_fluxcalls = D->timestep_fluxcalls;
+    base_call = call;
+  }
+
+  return (call - base_call) % D->timestep_fluxcalls;
+}
+
+// Flux across edge i of triangle k multiplied by the edge length (in
+// edgeflux), the gravity related terms of the edge (in pressuregrad_work)
+// and the maximal wave speed of the edge.
+// Returns the neighbour of the edge (negative for a boundary edge).
+static inline int64_t __openmp_edge_flux(struct domain *D,
+                                         int64_t k,
+                                         int64_t i,
+                                         double *edgeflux,
+                                         double *pressuregrad_work,
+                                         double *max_speed_local)
+{
   // FIXME: limiting_threshold is not used for DE1
   double limiting_threshold = 10 * D->H0;
   int64_t low_froude = D->low_froude;
@@ -470,196 +494,214 @@ double _openmp_compute_fluxes_central(struct domain *D,
   double epsilon = D->epsilon;
   int64_t ncol_riverwall_hydraulic_properties = D->ncol_riverwall_hydraulic_properties;
 
-  // Workspace (making them static actually made function slightly slower (Ole))
   double ql[3];
   double qr[3];
-  double edgeflux[3]; // Work array for summing up fluxes
-  double pressuregrad_work;
-  double edge_timestep;
+  double length, zl, zr;
+  double h_left, h_right, z_half; // For andusse scheme
   double normal_x, normal_y;
-  // static double local_timestep;
-
   double hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2;
   double pressure_flux, hc, hc_n;
-  double h_left_tmp, h_right_tmp;
-  double speed_max_last, weir_height;
+  double h_left_tmp, h_right_tmp, weir_height;
   int64_t RiverWall_count;
-
-  //
-  int64_t k, i, m, n, ii;
-  int64_t ki, nm = 0, ki2; // Index shorthands
-
-  static int64_t call = 0; // Static local variable flagging already computed flux
-  static int64_t timestep_fluxcalls = 1;
-  static int64_t base_call = 1;
-
-  call++; // Flag 'id' of flux calculation for this timestep
-
-  if (D->timestep_fluxcalls != timestep_fluxcalls)
+  int64_t n, m, nm, ii, ki, ki2;
+
+  ki = 3 * k + i; // Linear index to edge i of triangle k
+  ki2 = 2 * ki;   // k*6 + i*2
+
+  // Get left hand side values from triangle k, edge i
+  ql[0] = D->stage_edge_values[ki];
+  ql[1] = D->xmom_edge_values[ki];
+  ql[2] = D->ymom_edge_values[ki];
+  zl    = D->bed_edge_values[ki];
+  hle   = D->height_edge_values[ki];
+
+  hc = D->height_centroid_values[k];
+  zc = D->bed_centroid_values[k];
+
+  // Get right hand side values either from neighbouring triangle
+  // or from boundary array (Quantities at neighbour on nearest face).
+  n = D->neighbours[ki];
+  hc_n = hc;
+  zc_n = D->bed_centroid_values[k];
+  if (n < 0)
   {
-    timestep_fluxcalls = D->timestep_fluxcalls;
-    base_call = call;
+    // Neighbour is a boundary condition
+    m = -n - 1; // Convert negative flag to boundary index
+
+    qr[0] = D->stage_boundary_values[m];
+    qr[1] = D->xmom_boundary_values[m];
+    qr[2] = D->ymom_boundary_values[m];
+    zr = zl;                   // Extend bed elevation to boundary
+    hre = fmax(qr[0] - zr, 0.0); // hle;
+  }
+  else
+  {
+    // Neighbour is a real triangle
+    hc_n = D->height_centroid_values[n];
+    zc_n = D->bed_centroid_values[n];
+
+    m = D->neighbour_edges[ki];
+    nm = n * 3 + m; // Linear index (triangle n, edge m)
+
+    qr[0] = D->stage_edge_values[nm];
+    qr[1] = D->xmom_edge_values[nm];
+    qr[2] = D->ymom_edge_values[nm];
+    zr = D->bed_edge_values[nm];
+    hre = D->height_edge_values[nm];
   }
 
-  // Which substep of the timestepping method are we on?
-  substep_count = (call - base_call) % D->timestep_fluxcalls;
-
-  double local_timestep = 1.0e+100;
-  double boundary_flux_sum_substep = 0.0; 
+  // Audusse magic for well balancing
+  z_half = fmax(zl, zr);
 
-// For all triangles
-#pragma omp parallel for simd default(none) schedule(static) shared(D, substep_count, K) \
-                                     firstprivate(ncol_riverwall_hydraulic_properties, epsilon, g, low_froude, limiting_threshold) \
-                                     private(i, ki, ki2, n, m, nm, ii,                                                  \
-                                     max_speed_local, length, inv_area, zl, zr,                                         \
-                                     h_left, h_right,                                                                   \
-                                     z_half, ql,  pressuregrad_work,                                                    \
-                                     qr, edgeflux, edge_timestep, normal_x, normal_y,                                   \
-                                     hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2, pressure_flux, hc, hc_n,              \
-                                     h_left_tmp, h_right_tmp, speed_max_last, weir_height, RiverWall_count)             \
-                                     reduction(min : local_timestep) reduction(+:boundary_flux_sum_substep)
-  for (k = 0; k < K; k++)
+  // Account for riverwalls
+  if (D->edge_flux_type[ki] == 1)
   {
-    speed_max_last = 0.0;
-    // Set explicit_update to zero for all conserved_quantities.
-    // This assumes compute_fluxes called before forcing terms
-    D->stage_explicit_update[k] = 0.0;
-    D->xmom_explicit_update[k] = 0.0;
-    D->ymom_explicit_update[k] = 0.0;
+    RiverWall_count = D->edge_river_wall_counter[ki];
 
-    // Loop through neighbours and compute edge flux for each
-    for (i = 0; i < 3; i++)
-    {
-      ki = 3 * k + i; // Linear index to edge i of triangle k
-      ki2 = 2 * ki;   // k*6 + i*2
+    // Set central bed to riverwall elevation
+    z_half = fmax(D->riverwall_elevation[RiverWall_count - 1], z_half);
+  }
 
-      // Get left hand side values from triangle k, edge i
-      ql[0] = D->stage_edge_values[ki];
-      ql[1] = D->xmom_edge_values[ki];
-      ql[2] = D->ymom_edge_values[ki];
-      zl    = D->bed_edge_values[ki];
-      hle   = D->height_edge_values[ki];
+  // Define h left/right for Audusse flux method
+  h_left = fmax(hle + zl - z_half, 0.);
+  h_right = fmax(hre + zr - z_half, 0.);
 
-      hc = D->height_centroid_values[k];
-      zc = D->bed_centroid_values[k];
+  normal_x = D->normals[ki2];
+  normal_y = D->normals[ki2 + 1];
 
-      // Get right hand side values either from neighbouring triangle
-      // or from boundary array (Quantities at neighbour on nearest face).
-      n = D->neighbours[ki];
-      hc_n = hc;
-      zc_n = D->bed_centroid_values[k];
-      if (n < 0)
-      {
-        // Neighbour is a boundary condition
-        m = -n - 1; // Convert negative flag to boundary index
+  // Edge flux computation (triangle k, edge i)
+  __flux_function_central(ql, qr,
+                          h_left, h_right,
+                          hle, hre,
+                          normal_x, normal_y,
+                          epsilon, z_half, limiting_threshold, g,
+                          edgeflux, max_speed_local, &pressure_flux,
+                          hc, hc_n, low_froude);
 
-        qr[0] = D->stage_boundary_values[m];
-        qr[1] = D->xmom_boundary_values[m];
-        qr[2] = D->ymom_boundary_values[m];
-        zr = zl;                   // Extend bed elevation to boundary
-        hre = fmax(qr[0] - zr, 0.0); // hle;
-      }
-      else
-      {
-        // Neighbour is a real triangle
-        hc_n = D->height_centroid_values[n];
-        zc_n = D->bed_centroid_values[n];
+  // Force weir discharge to match weir theory
+  if (D->edge_flux_type[ki] == 1)
+  {
 
-        m = D->neighbour_edges[ki];
-        nm = n * 3 + m; // Linear index (triangle n, edge m)
+    RiverWall_count = D->edge_river_wall_counter[ki];
 
-        qr[0] = D->stage_edge_values[nm];
-        qr[1] = D->xmom_edge_values[nm];
-        qr[2] = D->ymom_edge_values[nm];
-        zr = D->bed_edge_values[nm];
-        hre = D->height_edge_values[nm];
-      }
+    // printf("RiverWall_count %ld\n", RiverWall_count);
 
-      // Audusse magic for well balancing
-      z_half = fmax(zl, zr);
+    ii = D->riverwall_rowIndex[RiverWall_count - 1] * ncol_riverwall_hydraulic_properties;
 
-      // Account for riverwalls
-      if (D->edge_flux_type[ki] == 1)
-      {
-        RiverWall_count = D->edge_river_wall_counter[ki];
+    // Get Qfactor index - multiply the idealised weir discharge by this constant factor
+    // Get s1, submergence ratio at which we start blending with the shallow water solution
+    // Get s2, submergence ratio at which we entirely use the shallow water solution
+    // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
+    // Get h2, tailwater head / weir height at which we entirely use the shallow water solution
+    Qfactor = D->riverwall_hydraulic_properties[ii];
+    s1 = D->riverwall_hydraulic_properties[ii + 1];
+    s2 = D->riverwall_hydraulic_properties[ii + 2];
+    h1 = D->riverwall_hydraulic_properties[ii + 3];
+    h2 = D->riverwall_hydraulic_properties[ii + 4];
 
-        // Set central bed to riverwall elevation
-        z_half = fmax(D->riverwall_elevation[RiverWall_count - 1], z_half);
-      }
+    weir_height = fmax(D->riverwall_elevation[RiverWall_count - 1] - fmin(zl, zr), 0.); // Reference weir height
 
-      // Define h left/right for Audusse flux method
-      h_left = fmax(hle + zl - z_half, 0.);
-      h_right = fmax(hre + zr - z_half, 0.);
+    // Use first-order h's for weir -- as the 'upstream/downstream' heads are
+    //  measured away from the weir itself
+    h_left_tmp = fmax(D->stage_centroid_values[k] - z_half, 0.);
 
-      normal_x = D->normals[ki2];
-      normal_y = D->normals[ki2 + 1];
+    if (n >= 0)
+    {
+      h_right_tmp = fmax(D->stage_centroid_values[n] - z_half, 0.);
+    }
+    else
+    {
+      h_right_tmp = fmax(hc_n + zr - z_half, 0.);
+    }
 
-      // Edge flux computation (triangle k, edge i)
-      __flux_function_central(ql, qr,
-                              h_left, h_right,
-                              hle, hre,
-                              normal_x, normal_y,
-                              epsilon, z_half, limiting_threshold, g,
-                              edgeflux, &max_speed_local, &pressure_flux,
-                              hc, hc_n, low_froude);
+    // If the weir is not higher than both neighbouring cells, then
+    // do not try to match the weir equation. If we do, it seems we
+    // can get mass conservation issues (caused by large weir
+    // fluxes in such situations)
+    if (D->riverwall_elevation[RiverWall_count - 1] > fmax(zc, zc_n))
+    {
+      // Weir flux adjustment
+      __adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, g,
+                                         weir_height, Qfactor,
+                                         s1, s2, h1, h2, max_speed_local);
+    }
+  }
 
-      // Force weir discharge to match weir theory
-      if (D->edge_flux_type[ki] == 1)
-      {
+  // Multiply edgeflux by edgelength
+  length = D->edgelengths[ki];
+  edgeflux[0] = -edgeflux[0]*length;
+  edgeflux[1] = -edgeflux[1]*length;
+  edgeflux[2] = -edgeflux[2]*length;
 
-        RiverWall_count = D->edge_river_wall_counter[ki];
+  // bedslope_work contains all gravity related terms
+  *pressuregrad_work = length * (-g * 0.5 * (h_left * h_left - hle * hle - (hle + hc) * (zl - zc)) + pressure_flux);
 
-        // printf("RiverWall_count %ld\n", RiverWall_count);
+  return n;
+}
 
-        ii = D->riverwall_rowIndex[RiverWall_count - 1] * ncol_riverwall_hydraulic_properties;
+// Computational function for flux computation
+// restricted to the triangles listed in indices
+// (all triangles if indices is NULL).
+//
+// The flux calculation for one substep can be split over several calls,
+// e.g. to compute fluxes for triangles away from ghost cells while ghost
+// values are communicated. The first call should set first_call = 1,
+// subsequent calls first_call = 0 and pass in the timestep returned by the
+// previous call.
+double _openmp_compute_fluxes_central_indices(struct domain *D,
+                                              double timestep,
+                                              int64_t *indices,
+                                              int64_t number_of_indices,
+                                              int64_t first_call)
+{
+  // Local variables
+  int64_t K = number_of_indices;
+  int64_t substep_count;
 
-        // Get Qfactor index - multiply the idealised weir discharge by this constant factor
-        // Get s1, submergence ratio at which we start blending with the shallow water solution
-        // Get s2, submergence ratio at which we entirely use the shallow water solution
-        // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
-        // Get h2, tailwater head / weir height at which we entirely use the shallow water solution
-        Qfactor = D->riverwall_hydraulic_properties[ii];
-        s1 = D->riverwall_hydraulic_properties[ii + 1];
-        s2 = D->riverwall_hydraulic_properties[ii + 2];
-        h1 = D->riverwall_hydraulic_properties[ii + 3];
-        h2 = D->riverwall_hydraulic_properties[ii + 4];
+  double max_speed_local, inv_area;
+  double epsilon = D->epsilon;
 
-        weir_height = fmax(D->riverwall_elevation[RiverWall_count - 1] - fmin(zl, zr), 0.); // Reference weir height
+  // Workspace (making them static actually made function slightly slower (Ole))
+  double edgeflux[3]; // Work array for summing up fluxes
+  double pressuregrad_work;
+  double edge_timestep;
+  double speed_max_last;
 
-        // Use first-order h's for weir -- as the 'upstream/downstream' heads are
-        //  measured away from the weir itself
-        h_left_tmp = fmax(D->stage_centroid_values[k] - z_half, 0.);
+  //
+  int64_t kk, k, i, n;
+  int64_t ki, ki2; // Index shorthands
 
-        if (n >= 0)
-        {
-          h_right_tmp = fmax(D->stage_centroid_values[n] - z_half, 0.);
-        }
-        else
-        {
-          h_right_tmp = fmax(hc_n + zr - z_half, 0.);
-        }
+  // Which substep of the timestepping method are we on?
+  substep_count = __openmp_flux_substep_count(D, first_call);
 
-        // If the weir is not higher than both neighbouring cells, then
-        // do not try to match the weir equation. If we do, it seems we
-        // can get mass conservation issues (caused by large weir
-        // fluxes in such situations)
-        if (D->riverwall_elevation[RiverWall_count - 1] > fmax(zc, zc_n))
-        {
-          // Weir flux adjustment
-          __adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, g,
-                                             weir_height, Qfactor,
-                                             s1, s2, h1, h2, &max_speed_local);
-        }
-      }
+  double local_timestep = 1.0e+100;
+  double boundary_flux_sum_substep = 0.0; 
 
-      // Multiply edgeflux by edgelength
-      length = D->edgelengths[ki];
-      edgeflux[0] = -edgeflux[0]*length;
-      edgeflux[1] = -edgeflux[1]*length;
-      edgeflux[2] = -edgeflux[2]*length;
+// For all triangles
+#pragma omp parallel for simd default(none) schedule(static) shared(D, substep_count, K, indices) \
+                                     firstprivate(epsilon)                                                              \
+                                     private(k, i, ki, ki2, n, max_speed_local, inv_area,                               \
+                                     pressuregrad_work, edgeflux, edge_timestep, speed_max_last)                        \
+                                     reduction(min : local_timestep) reduction(+:boundary_flux_sum_substep)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = (indices == NULL) ? kk : indices[kk];
 
-      // bedslope_work contains all gravity related terms
-      pressuregrad_work = length * (-g * 0.5 * (h_left * h_left - hle * hle - (hle + hc) * (zl - zc)) + pressure_flux);
+    speed_max_last = 0.0;
+    // Set explicit_update to zero for all conserved_quantities.
+    // This assumes compute_fluxes called before forcing terms
+    D->stage_explicit_update[k] = 0.0;
+    D->xmom_explicit_update[k] = 0.0;
+    D->ymom_explicit_update[k] = 0.0;
+
+    // Loop through neighbours and compute edge flux for each
+    for (i = 0; i < 3; i++)
+    {
+      ki = 3 * k + i; // Linear index to edge i of triangle k
+      ki2 = 2 * ki;   // k*6 + i*2
+
+      // Edge flux computation (triangle k, edge i)
+      n = __openmp_edge_flux(D, k, i, edgeflux, &pressuregrad_work, &max_speed_local);
 
       // Update timestep based on edge i and possibly neighbour n
       // NOTE: We should only change the timestep on the 'first substep'
@@ -737,38 +779,325 @@ double _openmp_compute_fluxes_central(struct domain *D,
 //       D->xmom_explicit_update[k] += D->edge_flux_work[ki3 + 1];
 //       D->ymom_explicit_update[k] += D->edge_flux_work[ki3 + 2];
 
-//       // If this cell is not a ghost, and the neighbour is a
-//       // boundary condition OR a ghost cell, then add the flux to the
-//       // boundary_flux_integral
-//       if (((n < 0) & (D->tri_full_flag[k] == 1)) | ((n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[n] == 0))))
-//       {
-//         // boundary_flux_sum is an array with length = timestep_fluxcalls
-//         // For each sub-step, we put the boundary flux sum in.
-//         boundary_flux_sum_substep += D->edge_flux_work[ki3];
-//       }
+//       // If this cell is not a ghost, and the neighbour is a
+//       // boundary condition OR a ghost cell, then add the flux to the
+//       // boundary_flux_integral
+//       if (((n < 0) & (D->tri_full_flag[k] == 1)) | ((n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[n] == 0))))
+//       {
+//         // boundary_flux_sum is an array with length = timestep_fluxcalls
+//         // For each sub-step, we put the boundary flux sum in.
+//         boundary_flux_sum_substep += D->edge_flux_work[ki3];
+//       }
+
+//       D->xmom_explicit_update[k] -= D->normals[ki2] * D->pressuregrad_work[ki];
+//       D->ymom_explicit_update[k] -= D->normals[ki2 + 1] * D->pressuregrad_work[ki];
+
+//     } // end edge i
+
+//     // Normalise triangle k by area and store for when all conserved
+//     // quantities get updated
+//     inv_area = 1.0 / D->areas[k];
+//     D->stage_explicit_update[k] *= inv_area;
+//     D->xmom_explicit_update[k] *= inv_area;
+//     D->ymom_explicit_update[k] *= inv_area;
+
+//   } // end cell k
+
+  // variable to accumulate D->boundary_flux_sum[substep_count]
+  if (first_call)
+    D->boundary_flux_sum[substep_count] = boundary_flux_sum_substep;
+  else
+    D->boundary_flux_sum[substep_count] += boundary_flux_sum_substep;
+
+  // Ensure we only update the timestep on the first call within each rk2/rk3 step
+  if (substep_count == 0)
+  {
+    if (first_call)
+      timestep = local_timestep;
+    else
+      timestep = fmin(timestep, local_timestep);
+  }
+
+  return timestep;
+}
+
+// Computational function for flux computation
+double _openmp_compute_fluxes_central(struct domain *D,
+                                      double timestep)
+{
+  return _openmp_compute_fluxes_central_indices(D, timestep, NULL, D->number_of_elements, 1);
+}
+
+// Local timestepping
+//
+// Each triangle k is updated with its own timestep frequency[k]*timestep,
+// where frequency[k] is a power of 2. The flux across an edge is computed
+// at the substeps which are multiples of the edge frequency, the minimum of
+// the frequencies of the two triangles sharing the edge, and integrated over
+// edge frequency*timestep. The time integrated fluxes are accumulated in
+// stage_accum, xmom_accum and ymom_accum until the end of the triangle's
+// timestep. As both sides of an edge use the same integrated flux, mass is
+// conserved across levels.
+
+static inline int64_t __lts_edge_frequency(struct domain *D, int64_t *frequency,
+                                           int64_t k, int64_t n)
+{
+  if (n < 0)
+    return frequency[k];
+
+  return (frequency[n] < frequency[k]) ? frequency[n] : frequency[k];
+}
+
+// Compute the fluxes of the edges of the triangles listed in indices which
+// are active at this substep, storing them in edge_flux_work (with the
+// gravity terms included in the momentum fluxes) and the edge timesteps in
+// edge_timestep. At substep 0 all edges are active.
+void _openmp_compute_fluxes_central_lts(struct domain *D,
+                                        int64_t *indices,
+                                        int64_t number_of_indices,
+                                        int64_t *frequency,
+                                        int64_t substep)
+{
+  int64_t K = number_of_indices;
+  int64_t kk, k, i, n, ki, ki2, ki3;
+  double max_speed_local, speed_max_last, pressuregrad_work;
+  double edgeflux[3];
+  double epsilon = D->epsilon;
+
+#pragma omp parallel for schedule(static) firstprivate(epsilon) \
+                         private(k, i, n, ki, ki2, ki3, max_speed_local, speed_max_last, pressuregrad_work, edgeflux)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = indices[kk];
+    speed_max_last = 0.0;
+
+    for (i = 0; i < 3; i++)
+    {
+      ki = 3 * k + i;
+      n = D->neighbours[ki];
+
+      if (substep % __lts_edge_frequency(D, frequency, k, n) != 0)
+        continue;
+
+      ki2 = 2 * ki;
+      ki3 = 3 * ki;
+
+      n = __openmp_edge_flux(D, k, i, edgeflux, &pressuregrad_work, &max_speed_local);
+
+      D->edge_flux_work[ki3 + 0] = edgeflux[0];
+      D->edge_flux_work[ki3 + 1] = edgeflux[1] - D->normals[ki2] * pressuregrad_work;
+      D->edge_flux_work[ki3 + 2] = edgeflux[2] - D->normals[ki2 + 1] * pressuregrad_work;
+
+      D->edge_timestep[ki] = D->radii[k] / fmax(max_speed_local, epsilon);
+
+      if (max_speed_local > epsilon)
+        speed_max_last = fmax(speed_max_last, max_speed_local);
+    }
+
+    // All the edges are active at the start of the triangle's timestep
+    if (substep % frequency[k] == 0)
+      D->max_speed[k] = speed_max_last;
+  }
+}
+
+// Add the edge fluxes computed at this substep, integrated over the edge
+// timestep, to the accumulators of the triangles listed in indices.
+// Returns the time integrated flux through the boundary (and into the full
+// triangles from ghost triangles).
+double _openmp_accumulate_fluxes_lts(struct domain *D,
+                                     int64_t *indices,
+                                     int64_t number_of_indices,
+                                     int64_t *frequency,
+                                     int64_t substep,
+                                     double timestep,
+                                     double *stage_accum,
+                                     double *xmom_accum,
+                                     double *ymom_accum)
+{
+  int64_t K = number_of_indices;
+  int64_t kk, k, i, n, e, ki, ki3;
+  double dt_edge, inv_area;
+  double boundary_flux = 0.0;
+
+#pragma omp parallel for schedule(static) private(k, i, n, e, ki, ki3, dt_edge, inv_area) \
+                         reduction(+:boundary_flux)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = indices[kk];
+    inv_area = 1.0 / D->areas[k];
+
+    for (i = 0; i < 3; i++)
+    {
+      ki = 3 * k + i;
+      n = D->neighbours[ki];
+      e = __lts_edge_frequency(D, frequency, k, n);
+
+      if (substep % e != 0)
+        continue;
+
+      ki3 = 3 * ki;
+      dt_edge = e * timestep;
+
+      stage_accum[k] += dt_edge * D->edge_flux_work[ki3 + 0] * inv_area;
+      xmom_accum[k] += dt_edge * D->edge_flux_work[ki3 + 1] * inv_area;
+      ymom_accum[k] += dt_edge * D->edge_flux_work[ki3 + 2] * inv_area;
+
+      // See _openmp_compute_fluxes_central_indices
+      if (((n < 0) & (D->tri_full_flag[k] == 1)) | ((n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[n] == 0))))
+      {
+        boundary_flux += dt_edge * D->edge_flux_work[ki3 + 0];
+      }
+    }
+  }
+
+  return boundary_flux;
+}
+
+// Add the explicit forcing terms, integrated over the triangle's timestep,
+// to the accumulators of the triangles listed in indices (those starting a
+// timestep) and store their semi implicit forcing rates, as in Quantity.update.
+void _openmp_accumulate_forcing_lts(struct domain *D,
+                                    int64_t *indices,
+                                    int64_t number_of_indices,
+                                    int64_t *frequency,
+                                    double timestep,
+                                    double *stage_accum,
+                                    double *xmom_accum,
+                                    double *ymom_accum,
+                                    double *stage_semi,
+                                    double *xmom_semi,
+                                    double *ymom_semi)
+{
+  int64_t K = number_of_indices;
+  int64_t kk, k;
+  double dt_k;
+
+#pragma omp parallel for schedule(static) private(k, dt_k)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = indices[kk];
+    dt_k = frequency[k] * timestep;
+
+    stage_accum[k] += dt_k * D->stage_explicit_update[k];
+    xmom_accum[k] += dt_k * D->xmom_explicit_update[k];
+    ymom_accum[k] += dt_k * D->ymom_explicit_update[k];
+
+    stage_semi[k] = (D->stage_centroid_values[k] == 0.0) ? 0.0 : D->stage_semi_implicit_update[k] / D->stage_centroid_values[k];
+    xmom_semi[k] = (D->xmom_centroid_values[k] == 0.0) ? 0.0 : D->xmom_semi_implicit_update[k] / D->xmom_centroid_values[k];
+    ymom_semi[k] = (D->ymom_centroid_values[k] == 0.0) ? 0.0 : D->ymom_semi_implicit_update[k] / D->ymom_centroid_values[k];
+  }
+}
+
+static inline double __lts_update(double q, double accum, double semi, double dt_k)
+{
+  double denominator = 1.0 - dt_k * semi;
+
+  q += accum;
+  if (denominator > 0.0)
+    q /= denominator;
+
+  return q;
+}
+
+// Update the conserved quantities of the triangles listed in indices (those
+// finishing a timestep) from the accumulated fluxes and forcing terms, reset
+// their accumulators and fix negative depths as _openmp_fix_negative_cells.
+// Returns the number of negative cells.
+int64_t _openmp_update_conserved_quantities_lts(struct domain *D,
+                                                int64_t *indices,
+                                                int64_t number_of_indices,
+                                                int64_t *frequency,
+                                                double timestep,
+                                                double *stage_accum,
+                                                double *xmom_accum,
+                                                double *ymom_accum,
+                                                double *stage_semi,
+                                                double *xmom_semi,
+                                                double *ymom_semi)
+{
+  int64_t K = number_of_indices;
+  int64_t kk, k;
+  int64_t num_negative_cells = 0;
+  double dt_k;
+
+#pragma omp parallel for schedule(static) private(k, dt_k) reduction(+:num_negative_cells)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = indices[kk];
+    dt_k = frequency[k] * timestep;
+
+    D->stage_centroid_values[k] = __lts_update(D->stage_centroid_values[k], stage_accum[k], stage_semi[k], dt_k);
+    D->xmom_centroid_values[k] = __lts_update(D->xmom_centroid_values[k], xmom_accum[k], xmom_semi[k], dt_k);
+    D->ymom_centroid_values[k] = __lts_update(D->ymom_centroid_values[k], ymom_accum[k], ymom_semi[k], dt_k);
+
+    stage_accum[k] = 0.0;
+    xmom_accum[k] = 0.0;
+    ymom_accum[k] = 0.0;
+
+    if ((D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) & (D->tri_full_flag[k] > 0))
+    {
+      num_negative_cells = num_negative_cells + 1;
+      D->stage_centroid_values[k] = D->bed_centroid_values[k];
+      D->xmom_centroid_values[k] = 0.0;
+      D->ymom_centroid_values[k] = 0.0;
+    }
+  }
+
+  return num_negative_cells;
+}
+
+// Halve the frequency of the triangles listed in indices (those which have
+// just finished a timestep) until their next timestep satisfies the CFL
+// condition estimated from their centroid values. This catches water
+// arriving in a triangle after its level was set. Changing the frequency at
+// the start of a timestep keeps the edge flux integrals conservative. As it
+// only uses centroid values the ghost triangles (once updated) get the same
+// frequency as the full triangles they copy.
+// Returns the number of triangles whose frequency changed.
+int64_t _openmp_refine_frequency_lts(struct domain *D,
+                                     int64_t *indices,
+                                     int64_t number_of_indices,
+                                     int64_t *frequency,
+                                     double timestep,
+                                     double cfl)
+{
+  int64_t K = number_of_indices;
+  int64_t kk, k, f;
+  int64_t number_of_changes = 0;
+  double h, u, v, speed, tri_timestep;
+  double g = D->g;
+  double minimum_allowed_height = D->minimum_allowed_height;
 
-//       D->xmom_explicit_update[k] -= D->normals[ki2] * D->pressuregrad_work[ki];
-//       D->ymom_explicit_update[k] -= D->normals[ki2 + 1] * D->pressuregrad_work[ki];
+#pragma omp parallel for schedule(static) firstprivate(g, minimum_allowed_height) \
+                         private(k, f, h, u, v, speed, tri_timestep) reduction(+:number_of_changes)
+  for (kk = 0; kk < K; kk++)
+  {
+    k = indices[kk];
+    f = frequency[k];
 
-//     } // end edge i
+    if (f == 1)
+      continue;
 
-//     // Normalise triangle k by area and store for when all conserved
-//     // quantities get updated
-//     inv_area = 1.0 / D->areas[k];
-//     D->stage_explicit_update[k] *= inv_area;
-//     D->xmom_explicit_update[k] *= inv_area;
-//     D->ymom_explicit_update[k] *= inv_area;
+    h = D->stage_centroid_values[k] - D->bed_centroid_values[k];
+    if (h <= minimum_allowed_height)
+      continue;
 
-//   } // end cell k
+    u = D->xmom_centroid_values[k] / h;
+    v = D->ymom_centroid_values[k] / h;
+    speed = sqrt(u * u + v * v) + sqrt(g * h);
+    tri_timestep = cfl * D->radii[k] / speed;
 
-  // variable to accumulate D->boundary_flux_sum[substep_count]
-  D->boundary_flux_sum[substep_count] = boundary_flux_sum_substep;  
+    while ((f > 1) && (f * timestep > tri_timestep))
+      f = f / 2;
 
-  // Ensure we only update the timestep on the first call within each rk2/rk3 step
-  if (substep_count == 0)
-    timestep = local_timestep;
+    if (f != frequency[k])
+    {
+      frequency[k] = f;
+      number_of_changes = number_of_changes + 1;
+    }
+  }
 
-  return timestep;
+  return number_of_changes;
 }
 
 // Computational function for flux computation
@@ -1092,84 +1421,78 @@ double _compute_fluxes_central_parallel_data_flow(struct domain *D, double times
 
 
 
+// Protect triangle k against the water elevation falling below the
+// triangle bed, returns the mass added
+static inline double __openmp_protect_triangle(struct domain *D, int64_t k,
+                                               double minimum_allowed_height)
+{
+  int64_t k3 = 3 * k;
+  double hc, bmin;
+  double mass_error = 0.0;
+
+  hc = D->stage_centroid_values[k] - D->bed_centroid_values[k];
+  if (hc < minimum_allowed_height * 1.0)
+  {
+    // Set momentum to zero and ensure h is non negative
+    D->xmom_centroid_values[k] = 0.;
+    D->xmom_centroid_values[k] = 0.;
+    if (hc <= 0.0)
+    {
+      bmin = D->bed_centroid_values[k];
+      // Minimum allowed stage = bmin
+
+      // WARNING: ADDING MASS if wc[k]<bmin
+      if (D->stage_centroid_values[k] < bmin)
+      {
+        mass_error += (bmin - D->stage_centroid_values[k]) * D->areas[k];
+
+        D->stage_centroid_values[k] = bmin;
+
+        // FIXME: Set vertex values as well. Seems that this shouldn't be
+        // needed. However, from memory this is important at the first
+        // time step, for 'dry' areas where the designated stage is
+        // less than the bed centroid value
+        D->stage_vertex_values[k3] = bmin;
+        D->stage_vertex_values[k3 + 1] = bmin;
+        D->stage_vertex_values[k3 + 2] = bmin;
+      }
+    }
+  }
+
+  return mass_error;
+}
+
 // Protect against the water elevation falling below the triangle bed
-double _openmp_protect(struct domain *D)
+// for the triangles listed in indices (all triangles if indices is NULL)
+double _openmp_protect_indices(struct domain *D, int64_t *indices, int64_t number_of_indices)
 {
 
-  int64_t k, k3, K;
-  double hc, bmin;
+  int64_t kk, k, K;
   double mass_error = 0.;
 
-  // double *wc;
-  // double *zc;
-  // double *wv;
-  // double *xmomc;
-  // double *ymomc;
-  // double *areas;
-
   double minimum_allowed_height;
 
   minimum_allowed_height = D->minimum_allowed_height;
 
-  K = D->number_of_elements;
-
-  // wc = D->stage_centroid_values;
-  // zc = D->bed_centroid_values;
-  // wv = D->stage_vertex_values;
-  // xmomc = D->xmom_centroid_values;
-  // ymomc = D->xmom_centroid_values;
-  // areas = D->areas;
-
-  // This acts like minimum_allowed height, but scales with the vertical
-  // distance between the bed_centroid_value and the max bed_edge_value of
-  // every triangle.
-  // double minimum_relative_height=0.05;
-  // int64_t mass_added = 0;
+  K = number_of_indices;
 
   // Protect against inifintesimal and negative heights
-  // if (maximum_allowed_speed < epsilon) {
-#pragma omp parallel for private(k, k3, hc, bmin ) schedule(static) reduction(+ : mass_error) firstprivate (minimum_allowed_height)
-  for (k = 0; k < K; k++)
+#pragma omp parallel for private(k) schedule(static) reduction(+ : mass_error) firstprivate (minimum_allowed_height)
+  for (kk = 0; kk < K; kk++)
   {
-    k3 = 3*k;
-    hc = D->stage_centroid_values[k] - D->bed_centroid_values[k];
-    if (hc < minimum_allowed_height * 1.0)
-    {
-      // Set momentum to zero and ensure h is non negative
-      D->xmom_centroid_values[k] = 0.;
-      D->xmom_centroid_values[k] = 0.;
-      if (hc <= 0.0)
-      {
-        bmin = D->bed_centroid_values[k];
-        // Minimum allowed stage = bmin
-
-        // WARNING: ADDING MASS if wc[k]<bmin
-        if (D->stage_centroid_values[k] < bmin)
-        {
-          mass_error += (bmin - D->stage_centroid_values[k]) * D->areas[k];
-          // mass_added = 1; //Flag to warn of added mass
-
-          D->stage_centroid_values[k] = bmin;
-
-          // FIXME: Set vertex values as well. Seems that this shouldn't be
-          // needed. However, from memory this is important at the first
-          // time step, for 'dry' areas where the designated stage is
-          // less than the bed centroid value
-          D->stage_vertex_values[k3] = bmin;     // min(bmin, wc[k]); //zv[3*k]-minimum_allowed_height);
-          D->stage_vertex_values[k3 + 1] = bmin; // min(bmin, wc[k]); //zv[3*k+1]-minimum_allowed_height);
-          D->stage_vertex_values[k3 + 2] = bmin; // min(bmin, wc[k]); //zv[3*k+2]-minimum_allowed_height);
-        }
-      }
-    }
+    k = (indices == NULL) ? kk : indices[kk];
+    mass_error += __openmp_protect_triangle(D, k, minimum_allowed_height);
   }
 
-  // if(mass_added == 1){
-  //   printf("Cumulative mass protection: %f m^3 \n", mass_error);
-  // }
-
   return mass_error;
 }
 
+// Protect against the water elevation falling below the triangle bed
+double _openmp_protect(struct domain *D)
+{
+  return _openmp_protect_indices(D, NULL, D->number_of_elements);
+}
+
 
 static inline int64_t __find_qmin_and_qmax(double dq0, double dq1, double dq2,
                          double *qmin, double *qmax)
@@ -1333,12 +1656,20 @@ static inline void __calc_edge_values_2_bdy(double beta, double cv_k, double cv_
 
 
 // Computational routine
-int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
+// Extrapolation restricted to the triangles listed in indices. The centroid
+// conversions between momenta and velocities are applied to the triangles
+// listed in closure, which must contain indices and all their neighbours.
+// (If indices or closure are NULL all triangles are used.)
+int64_t _openmp_extrapolate_second_order_edge_sw_indices(struct domain *D,
+                                                         int64_t *indices,
+                                                         int64_t number_of_indices,
+                                                         int64_t *closure,
+                                                         int64_t number_of_closure)
 {
 
   // Local variables
   double a, b; // Gradient vector used to calculate edge values from centroids
-  int64_t k, k0, k1, k2, k3, k6, coord_index, i;
+  int64_t kk, k, k0, k1, k2, k3, k6, coord_index, i;
   double x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2; // Vertices of the auxiliary triangle
   double dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, dq1, area2, inv_area2;
   double dqv[3], qmin, qmax, hmin, hmax;
@@ -1353,7 +1684,6 @@ int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
   double ymom_centroid_values;
 
   double minimum_allowed_height = D->minimum_allowed_height;
-  int64_t number_of_elements = D->number_of_elements;
   int64_t extrapolate_velocity_second_order = D->extrapolate_velocity_second_order;
 
 
@@ -1370,9 +1700,10 @@ int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
   // Need to calculate height xmom and ymom centroid values for all triangles 
   // before extrapolation and limiting
 
-#pragma omp parallel for simd shared(D) default(none) schedule(static) private(dk, dk_inv) firstprivate(number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order)
-    for (k = 0; k < number_of_elements; k++)
+#pragma omp parallel for simd shared(D, closure) default(none) schedule(static) private(k, dk, dk_inv) firstprivate(number_of_closure, minimum_allowed_height, extrapolate_velocity_second_order)
+    for (kk = 0; kk < number_of_closure; kk++)
     {
+    k = (closure == NULL) ? kk : closure[kk];
     dk = fmax(D->stage_centroid_values[k] - D->bed_centroid_values[k], 0.0);
 
     D->height_centroid_values[k] = dk;
@@ -1413,10 +1744,12 @@ int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
                           x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2, \
                           dqv, qmin, qmax, hmin, hmax, \
                           hc, h0, h1, h2, beta_tmp, hfactor, \
-                          dk, dk_inv, a, b) default(none) shared(D) schedule(static) \
-                          firstprivate(number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order, c_tmp, d_tmp)
-  for (k = 0; k < number_of_elements; k++)
+                          k, dk, dk_inv, a, b) default(none) shared(D, indices) schedule(static) \
+                          firstprivate(number_of_indices, minimum_allowed_height, extrapolate_velocity_second_order, c_tmp, d_tmp)
+  for (kk = 0; kk < number_of_indices; kk++)
   {
+    k = (indices == NULL) ? kk : indices[kk];
+
 
     //printf("%ld, %e \n",k, D->height_centroid_values[k]);
     //printf("%ld,  %e, %e, %e, %e \n",k, x_centroid_work,xmom_centroid_values,y_centroid_work,ymom_centroid_values);
@@ -1896,9 +2229,10 @@ int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
   }   // for k=0 to number_of_elements-1
 
 // Fix xmom and ymom centroid values
-#pragma omp parallel for simd schedule(static) private(k3, i, dk) firstprivate(extrapolate_velocity_second_order)
-  for (k = 0; k < D->number_of_elements; k++)
+#pragma omp parallel for simd schedule(static) private(k, k3, i, dk) firstprivate(extrapolate_velocity_second_order)
+  for (kk = 0; kk < number_of_closure; kk++)
   {
+    k = (closure == NULL) ? kk : closure[kk];
     if (extrapolate_velocity_second_order == 1)
     {
       // Convert velocity back to momenta at centroids
@@ -1951,18 +2285,23 @@ int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
   return 0;
 }
 
-void _openmp_manning_friction_flat(double g, double eps, int64_t N,
-  double* w, double* zv,
-  double* uh, double* vh,
-  double* eta, double* xmom_update, double* ymom_update) {
+// Computational routine
+int64_t _openmp_extrapolate_second_order_edge_sw(struct domain *D)
+{
+  return _openmp_extrapolate_second_order_edge_sw_indices(D, NULL, D->number_of_elements,
+                                                          NULL, D->number_of_elements);
+}
 
-int64_t k, k3;
-double S, h, z, abs_mom;
-const double one_third = 1.0/3.0; 
-const double seven_thirds = 7.0/3.0;
+// Manning friction term S of triangle k (the momentum semi implicit
+// updates are S*uh and S*vh) for a flat bed
+static inline double __openmp_manning_friction_flat_term(double g, double eps, int64_t k,
+                                                         state_t* w, double* zv,
+                                                         state_t* uh, state_t* vh,
+                                                         double* eta)
+{
+  double S, h, z, abs_mom;
+  const double seven_thirds = 7.0/3.0;
 
-#pragma omp parallel for schedule(static) private(k,k3,z,h,S) firstprivate(eps,g,seven_thirds)
-for (k = 0; k < N; k++) {
   abs_mom = sqrt((uh[k] * uh[k] + vh[k] * vh[k]));
   S = 0.0;
 
@@ -1974,30 +2313,24 @@ for (k = 0; k < N; k++) {
           S /= pow(h, seven_thirds); //Expensive (on Ole's home computer)
           //S /= exp((7.0/3.0)*log(h));      //seems to save about 15% over manning_friction
           //S /= h*h*(1 + h/3.0 - h*h/9.0); //FIXME: Could use a Taylor expansion
-
-
-          //Update momentum
-          
       }
   }
-  xmom_update[k] += S * uh[k];
-  ymom_update[k] += S * vh[k];
-}
-}
 
-void _openmp_manning_friction_sloped(double g, double eps, int64_t N,
-  double* x, double* w, double* zv,
-  double* uh, double* vh,
-  double* eta, double* xmom_update, double* ymom_update) {
+  return S;
+}
 
-int64_t k, k3, k6;
-double S, h, z, z0, z1, z2, zs, zx, zy;
-double x0, y0, x1, y1, x2, y2;
-const double one_third = 1.0/3.0; 
-const double seven_thirds = 7.0/3.0;
+// Manning friction term S of triangle k for a sloped bed
+static inline double __openmp_manning_friction_sloped_term(double g, double eps, int64_t k,
+                                                           double* x, state_t* w, double* zv,
+                                                           state_t* uh, state_t* vh,
+                                                           double* eta)
+{
+  int64_t k3, k6;
+  double S, h, z, z0, z1, z2, zs, zx, zy;
+  double x0, y0, x1, y1, x2, y2;
+  const double one_third = 1.0/3.0;
+  const double seven_thirds = 7.0/3.0;
 
-#pragma omp parallel for schedule(static) private(k,k3,z0,z1,z2,x0,y0,x1,y1,x2,y2,zs,zx,zy,h,S) firstprivate(eps,g,one_third,seven_thirds)
-for (k = 0; k < N; k++) {
   S = 0.0;
   k3 = 3 * k;
   // Get bathymetry
@@ -2013,7 +2346,7 @@ for (k = 0; k < N; k++) {
   x1 = x[k6 + 2];
   y1 = x[k6 + 3];
   x2 = x[k6 + 4];
-  y2 = x[k6 + 5]; 
+  y2 = x[k6 + 5];
 
   if (eta[k] > eps) {
       _gradient(x0, y0, x1, y1, x2, y2, z0, z1, z2, &zx, &zy);
@@ -2028,29 +2361,516 @@ for (k = 0; k < N; k++) {
           //S /= h*h*(1 + h/3.0 - h*h/9.0); //FIXME: Could use a Taylor expansion
       }
   }
+
+  return S;
+}
+
+void _openmp_manning_friction_flat(double g, double eps, int64_t N,
+  state_t* w, double* zv,
+  state_t* uh, state_t* vh,
+  double* eta, double* xmom_update, double* ymom_update) {
+
+int64_t k;
+double S;
+
+#pragma omp parallel for schedule(static) private(k,S) firstprivate(eps,g)
+for (k = 0; k < N; k++) {
+  S = __openmp_manning_friction_flat_term(g, eps, k, w, zv, uh, vh, eta);
+
+  //Update momentum
+  xmom_update[k] += S * uh[k];
+  ymom_update[k] += S * vh[k];
+}
+}
+
+void _openmp_manning_friction_sloped(double g, double eps, int64_t N,
+  double* x, state_t* w, double* zv,
+  state_t* uh, state_t* vh,
+  double* eta, double* xmom_update, double* ymom_update) {
+
+int64_t k;
+double S;
+
+#pragma omp parallel for schedule(static) private(k,S) firstprivate(eps,g)
+for (k = 0; k < N; k++) {
+  S = __openmp_manning_friction_sloped_term(g, eps, k, x, w, zv, uh, vh, eta);
+
   xmom_update[k] += S * uh[k];
   ymom_update[k] += S * vh[k];
 }
 }
 
+// Set the depth of full triangle k to zero if negative, returns 1 if
+// the triangle was negative
+static inline int64_t __openmp_fix_negative_cell(struct domain *D, int64_t k)
+{
+  int64_t tff = D->tri_full_flag[k];
+
+  if ((D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) & (tff > 0))
+  {
+    D->stage_centroid_values[k] = D->bed_centroid_values[k];
+    D->xmom_centroid_values[k] = 0.0;
+    D->ymom_centroid_values[k] = 0.0;
+    return 1;
+  }
+
+  return 0;
+}
+
 // Computational function for flux computation
 int64_t _openmp_fix_negative_cells(struct domain *D)
 {
   int64_t k;
-  int64_t tff;
   int64_t num_negative_cells = 0;
 
-  #pragma omp parallel for schedule(static) private(k, tff) reduction(+:num_negative_cells)
+  #pragma omp parallel for schedule(static) private(k) reduction(+:num_negative_cells)
   for (k = 0; k < D->number_of_elements; k++)
   {
-    tff = D->tri_full_flag[k];
-    if ((D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) & (tff > 0)) 
+    num_negative_cells += __openmp_fix_negative_cell(D, k);
+  }
+  return num_negative_cells;
+}
+
+// Batch steps
+//
+// Evolve the domain with euler (timestepping_order 1) or rk2
+// (timestepping_order 2) steps without returning to python, until the
+// relative time reaches relative_yieldtime or relative_finaltime. Only
+// Reflective and (constant) Dirichlet boundaries and implicit manning
+// friction are supported, these are the only per step callbacks.
+//
+// Each step reproduces the python evolve loop of the DE algorithms
+// (protect, extrapolate, update_boundary, compute_fluxes, manning friction,
+// update_timestep, update_conserved_quantities and the boundary flux
+// integral operator).
+//
+// If fused, the triangle local work of a substep (manning friction, the
+// update of the conserved quantities, fixing negative cells, the rk2
+// average and backup and the protection at the start of the next substep)
+// is done in a single sweep over the triangles after the fluxes, so each
+// substep makes three sweeps (extrapolation, fluxes and the fused update)
+// instead of about ten.
+//
+// Returns the number of steps taken, with the timestep and the CFL
+// timestep (before alignment with the yield and final times) of the last
+// step. status is set to
+//   0 if the yield or final time was reached,
+//   1 if the last step was smaller than evolve_min_timestep (to be handled
+//     by python),
+//  -1 if the semi implicit update failed.
+
+static void __openmp_batch_update_boundary(struct domain *D,
+                                           int64_t *reflective_ids,
+                                           int64_t *reflective_edges,
+                                           int64_t number_of_reflective_ids,
+                                           int64_t *dirichlet_ids,
+                                           int64_t *dirichlet_edges,
+                                           double *dirichlet_values,
+                                           int64_t number_of_dirichlet_ids)
+{
+  int64_t j, id, ki;
+  double n1, n2, q1, q2, r1, r2;
+
+#pragma omp parallel for schedule(static) private(j, id, ki, n1, n2, q1, q2, r1, r2)
+  for (j = 0; j < number_of_reflective_ids; j++)
+  {
+    id = reflective_ids[j];
+    ki = reflective_edges[j];
+
+    n1 = D->normals[2 * ki];
+    n2 = D->normals[2 * ki + 1];
+
+    D->stage_boundary_values[id] = D->stage_edge_values[ki];
+    D->bed_boundary_values[id] = D->bed_edge_values[ki];
+
+    // Rotate and negate momentum
+    q1 = D->xmom_edge_values[ki];
+    q2 = D->ymom_edge_values[ki];
+
+    r1 = -q1 * n1 - q2 * n2;
+    r2 = -q1 * n2 + q2 * n1;
+
+    D->xmom_boundary_values[id] = n1 * r1 - n2 * r2;
+    D->ymom_boundary_values[id] = n2 * r1 + n1 * r2;
+  }
+
+#pragma omp parallel for schedule(static) private(j, id, ki)
+  for (j = 0; j < number_of_dirichlet_ids; j++)
+  {
+    id = dirichlet_ids[j];
+    ki = dirichlet_edges[j];
+
+    D->bed_boundary_values[id] = D->bed_edge_values[ki];
+    D->stage_boundary_values[id] = dirichlet_values[3 * j + 0];
+    D->xmom_boundary_values[id] = dirichlet_values[3 * j + 1];
+    D->ymom_boundary_values[id] = dirichlet_values[3 * j + 2];
+  }
+}
+
+// Semi implicit update of the centroid value k of a conserved quantity,
+// returns 1 if the update failed (non positive denominator)
+static inline int64_t __openmp_update_centroid_value(int64_t k,
+                                                     double timestep,
+                                                     state_t *centroid_values,
+                                                     double *explicit_update,
+                                                     double *semi_implicit_update)
+{
+  int64_t err = 0;
+  double x, denominator;
+
+  // Computed in double precision, stored once
+  x = centroid_values[k];
+  if (x == 0.0)
+    semi_implicit_update[k] = 0.0;
+  else
+    semi_implicit_update[k] /= x;
+
+  x += timestep * explicit_update[k];
+
+  denominator = 1.0 - timestep * semi_implicit_update[k];
+  if (denominator <= 0.0)
+    err = 1;
+  else
+    x /= denominator;
+
+  centroid_values[k] = x;
+
+  semi_implicit_update[k] = 0.0;
+
+  return err;
+}
+
+static int64_t __openmp_batch_update_quantity(int64_t N,
+                                              double timestep,
+                                              state_t *centroid_values,
+                                              double *explicit_update,
+                                              double *semi_implicit_update)
+{
+  int64_t k;
+  int64_t err = 0;
+
+#pragma omp parallel for schedule(static) private(k) reduction(+:err)
+  for (k = 0; k < N; k++)
+  {
+    err += __openmp_update_centroid_value(k, timestep, centroid_values,
+                                          explicit_update, semi_implicit_update);
+  }
+
+  return err;
+}
+
+// Semi implicit update of stage, xmomentum and ymomentum,
+// returns the number of failed updates
+int64_t _openmp_update_conserved_quantities(struct domain *D, double timestep)
+{
+  int64_t err;
+
+  err = __openmp_batch_update_quantity(D->number_of_elements, timestep, D->stage_centroid_values,
+                                       D->stage_explicit_update, D->stage_semi_implicit_update);
+  err += __openmp_batch_update_quantity(D->number_of_elements, timestep, D->xmom_centroid_values,
+                                        D->xmom_explicit_update, D->xmom_semi_implicit_update);
+  err += __openmp_batch_update_quantity(D->number_of_elements, timestep, D->ymom_centroid_values,
+                                        D->ymom_explicit_update, D->ymom_semi_implicit_update);
+
+  return err;
+}
+
+static void __openmp_batch_friction(struct domain *D,
+                                    double *friction,
+                                    int64_t use_sloped_mannings)
+{
+  if (use_sloped_mannings)
+    _openmp_manning_friction_sloped(D->g, D->minimum_allowed_height, D->number_of_elements,
+                                    D->vertex_coordinates, D->stage_centroid_values,
+                                    D->bed_vertex_values, D->xmom_centroid_values,
+                                    D->ymom_centroid_values, friction,
+                                    D->xmom_semi_implicit_update, D->ymom_semi_implicit_update);
+  else
+    _openmp_manning_friction_flat(D->g, D->minimum_allowed_height, D->number_of_elements,
+                                  D->stage_centroid_values, D->bed_centroid_values,
+                                  D->xmom_centroid_values, D->ymom_centroid_values, friction,
+                                  D->xmom_semi_implicit_update, D->ymom_semi_implicit_update);
+}
+
+// Number of triangles per block of the fused update
+#define FUSED_BLOCK_SIZE 256
+
+// Fused update of a substep: the manning friction, the update of the
+// conserved quantities and fixing negative cells, then if average the rk2
+// average with the backup values, if backup the backup for the rk2
+// average of the next step and if protect the protection against negative
+// heights at the start of the next substep.
+//
+// The triangles are processed in blocks small enough to stay in cache
+// between the passes over a block, so the data is read from memory once
+// per substep while the passes still vectorise.
+//
+// Returns the number of failed updates.
+static int64_t __openmp_fused_update(struct domain *D,
+                                     double timestep,
+                                     double *friction,
+                                     int64_t use_sloped_mannings,
+                                     int64_t average,
+                                     int64_t backup,
+                                     int64_t protect,
+                                     state_t *stage_backup_values,
+                                     state_t *xmom_backup_values,
+                                     state_t *ymom_backup_values,
+                                     int64_t *num_negative_cells)
+{
+  int64_t N = D->number_of_elements;
+  int64_t number_of_blocks = (N + FUSED_BLOCK_SIZE - 1) / FUSED_BLOCK_SIZE;
+  int64_t block, k, k0, k1;
+  int64_t err = 0;
+  int64_t num_negative = 0;
+  double S;
+  double g = D->g;
+  double eps = D->minimum_allowed_height;
+
+  state_t *w = D->stage_centroid_values;
+  state_t *uh = D->xmom_centroid_values;
+  state_t *vh = D->ymom_centroid_values;
+  double *xmom_semi = D->xmom_semi_implicit_update;
+  double *ymom_semi = D->ymom_semi_implicit_update;
+
+#pragma omp parallel for schedule(static) private(block, k, k0, k1, S) firstprivate(g, eps) reduction(+:err, num_negative)
+  for (block = 0; block < number_of_blocks; block++)
+  {
+    k0 = block * FUSED_BLOCK_SIZE;
+    k1 = (k0 + FUSED_BLOCK_SIZE < N) ? k0 + FUSED_BLOCK_SIZE : N;
+
+    if (use_sloped_mannings)
     {
-      num_negative_cells = num_negative_cells + 1;
-      D->stage_centroid_values[k] = D->bed_centroid_values[k];
-      D->xmom_centroid_values[k] = 0.0;
-      D->ymom_centroid_values[k] = 0.0;
+      for (k = k0; k < k1; k++)
+      {
+        S = __openmp_manning_friction_sloped_term(g, eps, k, D->vertex_coordinates, w,
+                                                  D->bed_vertex_values, uh, vh, friction);
+        xmom_semi[k] += S * uh[k];
+        ymom_semi[k] += S * vh[k];
+      }
+    }
+    else
+    {
+      for (k = k0; k < k1; k++)
+      {
+        S = __openmp_manning_friction_flat_term(g, eps, k, w, D->bed_centroid_values,
+                                                uh, vh, friction);
+        xmom_semi[k] += S * uh[k];
+        ymom_semi[k] += S * vh[k];
+      }
+    }
+
+    for (k = k0; k < k1; k++)
+      err += __openmp_update_centroid_value(k, timestep, w, D->stage_explicit_update,
+                                            D->stage_semi_implicit_update);
+    for (k = k0; k < k1; k++)
+      err += __openmp_update_centroid_value(k, timestep, uh, D->xmom_explicit_update,
+                                            xmom_semi);
+    for (k = k0; k < k1; k++)
+      err += __openmp_update_centroid_value(k, timestep, vh, D->ymom_explicit_update,
+                                            ymom_semi);
+
+    for (k = k0; k < k1; k++)
+      num_negative += __openmp_fix_negative_cell(D, k);
+
+    if (average)
+    {
+      for (k = k0; k < k1; k++)
+      {
+        w[k] = 0.5 * w[k] + 0.5 * stage_backup_values[k];
+        uh[k] = 0.5 * uh[k] + 0.5 * xmom_backup_values[k];
+        vh[k] = 0.5 * vh[k] + 0.5 * ymom_backup_values[k];
+      }
+    }
+
+    if (backup)
+    {
+      for (k = k0; k < k1; k++)
+      {
+        stage_backup_values[k] = w[k];
+        xmom_backup_values[k] = uh[k];
+        ymom_backup_values[k] = vh[k];
+      }
+    }
+
+    if (protect)
+    {
+      for (k = k0; k < k1; k++)
+        __openmp_protect_triangle(D, k, eps);
     }
   }
-  return num_negative_cells;
+
+  *num_negative_cells += num_negative;
+
+  return err;
+}
+
+int64_t _openmp_evolve_batch(struct domain *D,
+                             int64_t timestepping_order,
+                             double *relative_time,
+                             double relative_yieldtime,
+                             double relative_finaltime,
+                             double time_epsilon,
+                             double CFL,
+                             double evolve_min_timestep,
+                             double fixed_flux_timestep,
+                             int64_t *reflective_ids,
+                             int64_t *reflective_edges,
+                             int64_t number_of_reflective_ids,
+                             int64_t *dirichlet_ids,
+                             int64_t *dirichlet_edges,
+                             double *dirichlet_values,
+                             int64_t number_of_dirichlet_ids,
+                             double *friction,
+                             int64_t use_sloped_mannings,
+                             int64_t fused,
+                             state_t *stage_backup_values,
+                             state_t *xmom_backup_values,
+                             state_t *ymom_backup_values,
+                             double *timestep,
+                             double *cfl_timestep,
+                             double *recorded_min_timestep,
+                             double *recorded_max_timestep,
+                             double *boundary_flux_integral,
+                             int64_t *num_negative_cells,
+                             int64_t *status)
+{
+  int64_t N = D->number_of_elements;
+  int64_t number_of_steps = 0;
+  int64_t substep, number_of_substeps, err, k;
+  int64_t last_substep, last_step;
+  double flux_timestep, dt, boundary_flux;
+
+  number_of_substeps = (timestepping_order == 2) ? 2 : 1;
+
+  *status = 0;
+  *num_negative_cells = 0;
+
+  // The fused update does the backup and protection for the next step
+  if (fused)
+  {
+    if (number_of_substeps == 2)
+    {
+      memcpy(stage_backup_values, D->stage_centroid_values, N * sizeof(state_t));
+      memcpy(xmom_backup_values, D->xmom_centroid_values, N * sizeof(state_t));
+      memcpy(ymom_backup_values, D->ymom_centroid_values, N * sizeof(state_t));
+    }
+    _openmp_protect(D);
+  }
+
+  while (1)
+  {
+    if ((number_of_substeps == 2) && !fused)
+    {
+      memcpy(stage_backup_values, D->stage_centroid_values, N * sizeof(state_t));
+      memcpy(xmom_backup_values, D->xmom_centroid_values, N * sizeof(state_t));
+      memcpy(ymom_backup_values, D->ymom_centroid_values, N * sizeof(state_t));
+    }
+
+    dt = 0.0;
+    for (substep = 0; substep < number_of_substeps; substep++)
+    {
+      if (!fused)
+        _openmp_protect(D);
+      _openmp_extrapolate_second_order_edge_sw(D);
+
+      __openmp_batch_update_boundary(D, reflective_ids, reflective_edges, number_of_reflective_ids,
+                                     dirichlet_ids, dirichlet_edges, dirichlet_values,
+                                     number_of_dirichlet_ids);
+
+      flux_timestep = _openmp_compute_fluxes_central(D, D->evolve_max_timestep);
+
+      if (!fused)
+        __openmp_batch_friction(D, friction, use_sloped_mannings);
+
+      // Timestep from the first substep (as in update_timestep)
+      if (substep == 0)
+      {
+        if (fixed_flux_timestep > 0.0)
+          flux_timestep = fixed_flux_timestep;
+
+        dt = fmin(CFL * flux_timestep, D->evolve_max_timestep);
+        *cfl_timestep = dt;
+
+        *recorded_max_timestep = fmax(dt, *recorded_max_timestep);
+        *recorded_min_timestep = fmin(dt, *recorded_min_timestep);
+
+        if (dt < evolve_min_timestep)
+          *status = 1;
+
+        if (*relative_time + dt > relative_finaltime)
+          dt = relative_finaltime - *relative_time;
+
+        if (*relative_time + dt > relative_yieldtime)
+          dt = relative_yieldtime - *relative_time;
+      }
+
+      if (fused)
+      {
+        // Is this the last substep before returning to python
+        last_substep = (substep == number_of_substeps - 1);
+        last_step = last_substep &&
+                    ((*status != 0) ||
+                     (*relative_time + dt >= relative_finaltime - time_epsilon) ||
+                     (*relative_time + dt >= relative_yieldtime));
+
+        err = __openmp_fused_update(D, dt, friction, use_sloped_mannings,
+                                    last_substep && (number_of_substeps == 2),
+                                    last_substep && (number_of_substeps == 2) && !last_step,
+                                    !last_step,
+                                    stage_backup_values, xmom_backup_values, ymom_backup_values,
+                                    num_negative_cells);
+      }
+      else
+      {
+        err = __openmp_batch_update_quantity(N, dt, D->stage_centroid_values,
+                                             D->stage_explicit_update, D->stage_semi_implicit_update);
+        err += __openmp_batch_update_quantity(N, dt, D->xmom_centroid_values,
+                                              D->xmom_explicit_update, D->xmom_semi_implicit_update);
+        err += __openmp_batch_update_quantity(N, dt, D->ymom_centroid_values,
+                                              D->ymom_explicit_update, D->ymom_semi_implicit_update);
+      }
+
+      if (err > 0)
+      {
+        *status = -1;
+        *timestep = dt;
+        return number_of_steps;
+      }
+
+      if (!fused)
+        *num_negative_cells += _openmp_fix_negative_cells(D);
+    }
+
+    if ((number_of_substeps == 2) && !fused)
+    {
+#pragma omp parallel for schedule(static) private(k)
+      for (k = 0; k < N; k++)
+      {
+        D->stage_centroid_values[k] = 0.5 * D->stage_centroid_values[k] + 0.5 * stage_backup_values[k];
+        D->xmom_centroid_values[k] = 0.5 * D->xmom_centroid_values[k] + 0.5 * xmom_backup_values[k];
+        D->ymom_centroid_values[k] = 0.5 * D->ymom_centroid_values[k] + 0.5 * ymom_backup_values[k];
+      }
+    }
+
+    // Boundary flux integral operator
+    if (number_of_substeps == 2)
+      boundary_flux = 0.5 * dt * (D->boundary_flux_sum[0] + D->boundary_flux_sum[1]);
+    else
+      boundary_flux = dt * D->boundary_flux_sum[0];
+    *boundary_flux_integral = *boundary_flux_integral + boundary_flux;
+    for (substep = 0; substep < D->timestep_fluxcalls; substep++)
+      D->boundary_flux_sum[substep] = 0.0;
+
+    *relative_time = *relative_time + dt;
+    *timestep = dt;
+    number_of_steps++;
+
+    if ((*status != 0) ||
+        (*relative_time >= relative_finaltime - time_epsilon) ||
+        (*relative_time >= relative_yieldtime))
+      break;
+  }
+
+  return number_of_steps;
 }
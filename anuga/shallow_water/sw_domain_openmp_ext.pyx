@@ -2,12 +2,16 @@
 
 import cython
 from libc.stdint cimport int64_t
+from cpython.pycapsule cimport *
 
 # import both numpy and the Cython declarations for numpy
 import numpy as np
 cimport numpy as np
 
 cdef extern from "sw_domain_openmp.c" nogil:
+	# double, or float in the single precision variant sw_domain_openmp_sp_ext
+	ctypedef double state_t
+
 	struct domain:
 		# these shouldn't change within a single timestep
 		# they are set once before the evolve loop
@@ -50,19 +54,19 @@ cdef extern from "sw_domain_openmp.c" nogil:
 		double* edge_coordinates
 		double* centroid_coordinates
 		int64_t* number_of_boundaries
-		double* stage_edge_values
-		double* xmom_edge_values
-		double* ymom_edge_values
+		state_t* stage_edge_values
+		state_t* xmom_edge_values
+		state_t* ymom_edge_values
 		double* bed_edge_values
 		double* height_edge_values
-		double* stage_centroid_values
-		double* xmom_centroid_values
-		double* ymom_centroid_values
+		state_t* stage_centroid_values
+		state_t* xmom_centroid_values
+		state_t* ymom_centroid_values
 		double* bed_centroid_values
 		double* height_centroid_values
-		double* stage_vertex_values
-		double* xmom_vertex_values
-		double* ymom_vertex_values
+		state_t* stage_vertex_values
+		state_t* xmom_vertex_values
+		state_t* ymom_vertex_values
 		double* bed_vertex_values
 		double* height_vertex_values
 		double* stage_boundary_values
@@ -96,319 +100,340 @@ cdef extern from "sw_domain_openmp.c" nogil:
 		pass
 
 	double _openmp_compute_fluxes_central(domain* D, double timestep)
+	double _openmp_compute_fluxes_central_indices(domain* D, double timestep, int64_t* indices, int64_t number_of_indices, int64_t first_call)
 	double _openmp_protect(domain* D)
+	double _openmp_protect_indices(domain* D, int64_t* indices, int64_t number_of_indices)
 	int64_t _openmp_extrapolate_second_order_edge_sw(domain* D)
+	int64_t _openmp_extrapolate_second_order_edge_sw_indices(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* closure, int64_t number_of_closure)
 	int64_t _openmp_fix_negative_cells(domain* D)
+	void _openmp_compute_fluxes_central_lts(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* frequency, int64_t substep)
+	double _openmp_accumulate_fluxes_lts(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* frequency, int64_t substep, double timestep, double* stage_accum, double* xmom_accum, double* ymom_accum)
+	void _openmp_accumulate_forcing_lts(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* frequency, double timestep, double* stage_accum, double* xmom_accum, double* ymom_accum, double* stage_semi, double* xmom_semi, double* ymom_semi)
+	int64_t _openmp_refine_frequency_lts(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* frequency, double timestep, double cfl)
+	int64_t _openmp_update_conserved_quantities_lts(domain* D, int64_t* indices, int64_t number_of_indices, int64_t* frequency, double timestep, double* stage_accum, double* xmom_accum, double* ymom_accum, double* stage_semi, double* xmom_semi, double* ymom_semi)
+	int64_t _openmp_evolve_batch(domain* D, int64_t timestepping_order, double* relative_time, double relative_yieldtime, double relative_finaltime, double time_epsilon, double CFL, double evolve_min_timestep, double fixed_flux_timestep, int64_t* reflective_ids, int64_t* reflective_edges, int64_t number_of_reflective_ids, int64_t* dirichlet_ids, int64_t* dirichlet_edges, double* dirichlet_values, int64_t number_of_dirichlet_ids, double* friction, int64_t use_sloped_mannings, int64_t fused, state_t* stage_backup_values, state_t* xmom_backup_values, state_t* ymom_backup_values, double* timestep, double* cfl_timestep, double* recorded_min_timestep, double* recorded_max_timestep, double* boundary_flux_integral, int64_t* num_negative_cells, int64_t* status)
 	# FIXME SR: Change over to domain* D argument
-	void _openmp_manning_friction_flat(double g, double eps, int64_t N, double* w, double* zv, double* uh, double* vh, double* eta, double* xmom, double* ymom)
-	void _openmp_manning_friction_sloped(double g, double eps, int64_t N, double* x, double* w, double* zv, double* uh, double* vh, double* eta, double* xmom_update, double* ymom_update)
-
-
-
-
-cdef int64_t pointer_flag = 0
-cdef int64_t parameter_flag = 0
-
-cdef inline get_python_domain_parameters(domain *D, object domain_object):
-
-	# these shouldn't change within a single timestep
-	# they are set once before the evolve loop
-	D.number_of_elements = domain_object.number_of_elements
-	D.boundary_length = domain_object.boundary_length 
-	D.number_of_riverwall_edges = domain_object.number_of_riverwall_edges
-	D.epsilon = domain_object.epsilon
-	D.H0 = domain_object.H0
-	D.g = domain_object.g
-	D.optimise_dry_cells = domain_object.optimise_dry_cells
-	D.evolve_max_timestep = domain_object.evolve_max_timestep
-	D.minimum_allowed_height = domain_object.minimum_allowed_height
-	D.maximum_allowed_speed = domain_object.maximum_allowed_speed
-	D.timestep_fluxcalls = domain_object.timestep_fluxcalls
-	D.low_froude = domain_object.low_froude
-	D.extrapolate_velocity_second_order = domain_object.extrapolate_velocity_second_order
-	D.beta_w = domain_object.beta_w
-	D.beta_w_dry = domain_object.beta_w_dry
-	D.beta_uh = domain_object.beta_uh
-	D.beta_uh_dry = domain_object.beta_uh_dry
-	D.beta_vh = domain_object.beta_vh
-	D.beta_vh_dry = domain_object.beta_vh_dry
-	D.max_flux_update_frequency = domain_object.max_flux_update_frequency
-		
+	void _openmp_manning_friction_flat(double g, double eps, int64_t N, state_t* w, double* zv, state_t* uh, state_t* vh, double* eta, double* xmom, double* ymom)
+	void _openmp_manning_friction_sloped(double g, double eps, int64_t N, double* x, state_t* w, double* zv, state_t* uh, state_t* vh, double* eta, double* xmom_update, double* ymom_update)
+	int64_t _openmp_update_conserved_quantities(domain* D, double timestep)
 
-cdef inline get_python_domain_pointers(domain *D, object domain_object):
-
-	# these arraypointers are set once the domain is created
-	# and are used in the evolve loop
-	cdef int64_t[:,::1]   neighbours
-	cdef int64_t[:,::1]   neighbour_edges
-	cdef double[:,::1] normals
-	cdef double[:,::1] edgelengths
-	cdef double[::1]   radii
-	cdef double[::1]   areas
-	cdef int64_t[::1]  edge_flux_type
-	cdef int64_t[::1]  tri_full_flag
-	cdef int64_t[:,::1] already_computed_flux
-	cdef double[:,::1] vertex_coordinates
-	cdef double[:,::1] edge_coordinates
-	cdef double[:,::1] centroid_coordinates
-	cdef int64_t[::1]  number_of_boundaries
-	cdef int64_t[:,::1] surrogate_neighbours
-	cdef double[::1]   max_speed
-	cdef int64_t[::1]  flux_update_frequency
-	cdef int64_t[::1]  update_next_flux
-	cdef int64_t[::1]  update_extrapolation
-	cdef int64_t[::1]  allow_timestep_increase
-	cdef double[::1]   edge_timestep
-	cdef double[::1]   edge_flux_work
-	cdef double[::1]   neigh_work
-	cdef double[::1]   pressuregrad_work
-	cdef double[::1]   x_centroid_work
-	cdef double[::1]   y_centroid_work
-	cdef double[::1]   boundary_flux_sum
-	cdef double[::1]   riverwall_elevation
-	cdef int64_t[::1]  riverwall_rowIndex
-	cdef double[:,::1] riverwall_hydraulic_properties
-	cdef int64_t[::1]  edge_river_wall_counter
-	cdef double[:,::1] edge_values
-	cdef double[::1]   centroid_values
-	cdef double[:,::1] vertex_values
-	cdef double[::1]   boundary_values
-	cdef double[::1]   explicit_update
-	cdef double[::1]   semi_implicit_update
-	
-	cdef object quantities
-	cdef object riverwallData
-
-	#------------------------------------------------------
-	# Domain structures
-	#------------------------------------------------------
-	neighbours = domain_object.neighbours
-	D.neighbours = &neighbours[0,0]
-	
-	surrogate_neighbours = domain_object.surrogate_neighbours
-	D.surrogate_neighbours = &surrogate_neighbours[0,0]
 
-	neighbour_edges = domain_object.neighbour_edges
-	D.neighbour_edges = &neighbour_edges[0,0]
 
-	normals = domain_object.normals
-	D.normals = &normals[0,0]
 
-	edgelengths = domain_object.edgelengths
-	D.edgelengths = &edgelengths[0,0]
+# Storage type of the evolved quantities in this extension
+state_dtype = np.dtype(np.float32) if sizeof(state_t) == 4 else np.dtype(np.float64)
 
-	radii = domain_object.radii
-	D.radii = &radii[0]
+cdef state_t* state_data(np.ndarray A) except NULL:
+	"""Pointer to the data of A, the values of an evolved quantity"""
 
-	areas = domain_object.areas
-	D.areas = &areas[0]
+	if A.dtype != state_dtype or not A.flags.c_contiguous:
+		raise ValueError('Expected contiguous %s array, got %s' % (state_dtype, A.dtype))
 
-	edge_flux_type = domain_object.edge_flux_type
-	D.edge_flux_type = &edge_flux_type[0]
+	return <state_t*> np.PyArray_DATA(A)
 
-	tri_full_flag = domain_object.tri_full_flag
-	D.tri_full_flag = &tri_full_flag[0]
+# Name of the capsule holding the persistent struct (see sw_domain_struct_ext)
+cdef const char* domain_struct_capsule_name = "anuga.shallow_water.domain_struct"
 
-	already_computed_flux = domain_object.already_computed_flux
-	D.already_computed_flux = &already_computed_flux[0,0]
+cdef inline domain* get_domain_struct(object domain_object) except NULL:
+	"""Return the persistent struct domain of domain_object, shared with the
+	other backends and bound to the arrays of domain_object
+	"""
 
-	vertex_coordinates = domain_object.vertex_coordinates
-	D.vertex_coordinates = &vertex_coordinates[0,0]
+	capsule = domain_object.domain_struct.get_capsule(domain_object)
 
-	edge_coordinates = domain_object.edge_coordinates
-	D.edge_coordinates = &edge_coordinates[0,0]
+	return <domain*> PyCapsule_GetPointer(capsule, domain_struct_capsule_name)
 
-	centroid_coordinates = domain_object.centroid_coordinates
-	D.centroid_coordinates = &centroid_coordinates[0,0]
+#===============================================================================
 
-	max_speed = domain_object.max_speed
-	D.max_speed = &max_speed[0]
+def compute_fluxes_ext_central(object domain_object, double timestep):
 
-	number_of_boundaries = domain_object.number_of_boundaries
-	D.number_of_boundaries = &number_of_boundaries[0]
+	cdef domain* D
 
-	flux_update_frequency = domain_object.flux_update_frequency
-	D.flux_update_frequency = &flux_update_frequency[0]
 
-	update_next_flux = domain_object.update_next_flux
-	D.update_next_flux = &update_next_flux[0]
+	D = get_domain_struct(domain_object)
 
-	update_extrapolation = domain_object.update_extrapolation
-	D.update_extrapolation = &update_extrapolation[0]
+	with nogil:
+		timestep =  _openmp_compute_fluxes_central(D, timestep)
 
-	allow_timestep_increase = domain_object.allow_timestep_increase
-	D.allow_timestep_increase = &allow_timestep_increase[0]
+	return timestep
 
-	edge_timestep = domain_object.edge_timestep
-	D.edge_timestep = &edge_timestep[0]
+def extrapolate_second_order_edge_sw(object domain_object):
 
-	edge_flux_work = domain_object.edge_flux_work
-	D.edge_flux_work = &edge_flux_work[0]
+	cdef domain* D
+	cdef int64_t e
 
-	neigh_work = domain_object.neigh_work
-	D.neigh_work = &neigh_work[0]
+	D = get_domain_struct(domain_object)
 
-	pressuregrad_work = domain_object.pressuregrad_work
-	D.pressuregrad_work = &pressuregrad_work[0]
+	with nogil:
+		e = _openmp_extrapolate_second_order_edge_sw(D)
 
-	x_centroid_work = domain_object.x_centroid_work
-	D.x_centroid_work = &x_centroid_work[0]
+	if e == -1:
+		return None
 
-	y_centroid_work = domain_object.y_centroid_work
-	D.y_centroid_work = &y_centroid_work[0]
+def protect_new(object domain_object):
 
-	boundary_flux_sum = domain_object.boundary_flux_sum
-	D.boundary_flux_sum = &boundary_flux_sum[0]
+	cdef domain* D
 
-	edge_river_wall_counter = domain_object.edge_river_wall_counter
-	D.edge_river_wall_counter  = &edge_river_wall_counter[0]
+	cdef double mass_error
 
-	#------------------------------------------------------
-	# Quantity structures
-	#------------------------------------------------------
-	quantities = domain_object.quantities
-	stage = quantities["stage"]
-	xmomentum = quantities["xmomentum"]
-	ymomentum = quantities["ymomentum"]
-	elevation = quantities["elevation"]
-	height = quantities["height"]
+	D = get_domain_struct(domain_object)
 
-	edge_values = stage.edge_values
-	D.stage_edge_values = &edge_values[0,0]
+	with nogil:
+		mass_error = _openmp_protect(D)
 
-	edge_values = xmomentum.edge_values
-	D.xmom_edge_values = &edge_values[0,0]
 
-	edge_values = ymomentum.edge_values
-	D.ymom_edge_values = &edge_values[0,0]
+	return mass_error
 
-	edge_values = elevation.edge_values
-	D.bed_edge_values = &edge_values[0,0]
+def compute_fluxes_ext_central_indices(object domain_object, double timestep, int64_t[::1] indices not None, int64_t first_call):
+	"""Compute fluxes for the triangles listed in indices.
 
-	edge_values = height.edge_values
-	D.height_edge_values = &edge_values[0,0]
+	The flux computation of a substep can be split over several calls.
+	Set first_call to 1 on the first call and 0 on subsequent calls, passing
+	in the timestep returned by the previous call.
+	"""
 
-	centroid_values = stage.centroid_values
-	D.stage_centroid_values = &centroid_values[0]
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
+	cdef int64_t* indices_ptr = NULL
 
-	centroid_values = xmomentum.centroid_values
-	D.xmom_centroid_values = &centroid_values[0]
+	if n > 0:
+		indices_ptr = &indices[0]
 
-	centroid_values = ymomentum.centroid_values
-	D.ymom_centroid_values = &centroid_values[0]
+	D = get_domain_struct(domain_object)
 
-	centroid_values = elevation.centroid_values
-	D.bed_centroid_values = &centroid_values[0]
+	with nogil:
+		timestep = _openmp_compute_fluxes_central_indices(D, timestep, indices_ptr, n, first_call)
 
-	centroid_values = height.centroid_values
-	D.height_centroid_values = &centroid_values[0]
+	return timestep
 
-	vertex_values = stage.vertex_values
-	D.stage_vertex_values = &vertex_values[0,0]
+def extrapolate_second_order_edge_sw_indices(object domain_object, int64_t[::1] indices not None, int64_t[::1] closure not None):
+	"""Extrapolate to edges of the triangles listed in indices.
 
-	vertex_values = xmomentum.vertex_values
-	D.xmom_vertex_values = &vertex_values[0,0]
+	closure must contain indices and all their neighbours.
+	"""
 
-	vertex_values = ymomentum.vertex_values
-	D.ymom_vertex_values = &vertex_values[0,0]
+	cdef domain* D
+	cdef int64_t e
+	cdef int64_t n = indices.shape[0]
+	cdef int64_t m = closure.shape[0]
+	cdef int64_t* indices_ptr = NULL
+	cdef int64_t* closure_ptr = NULL
 
-	vertex_values = elevation.vertex_values
-	D.bed_vertex_values = &vertex_values[0,0]
+	if n > 0:
+		indices_ptr = &indices[0]
 
-	vertex_values = height.vertex_values
-	D.height_vertex_values = &vertex_values[0,0]
+	if m > 0:
+		closure_ptr = &closure[0]
 
-	boundary_values = stage.boundary_values
-	D.stage_boundary_values = &boundary_values[0]
+	D = get_domain_struct(domain_object)
 
-	boundary_values = xmomentum.boundary_values
-	D.xmom_boundary_values = &boundary_values[0]
+	with nogil:
+		e = _openmp_extrapolate_second_order_edge_sw_indices(D, indices_ptr, n, closure_ptr, m)
 
-	boundary_values = ymomentum.boundary_values
-	D.ymom_boundary_values = &boundary_values[0]
+	if e == -1:
+		return None
 
-	boundary_values = elevation.boundary_values
-	D.bed_boundary_values = &boundary_values[0]
+def protect_new_indices(object domain_object, int64_t[::1] indices not None):
 
-	explicit_update = stage.explicit_update
-	D.stage_explicit_update = &explicit_update[0]
+	cdef domain* D
+	cdef double mass_error
+	cdef int64_t n = indices.shape[0]
+	cdef int64_t* indices_ptr = NULL
 
-	explicit_update = xmomentum.explicit_update
-	D.xmom_explicit_update = &explicit_update[0]
+	if n > 0:
+		indices_ptr = &indices[0]
 
-	explicit_update = ymomentum.explicit_update
-	D.ymom_explicit_update = &explicit_update[0]
+	D = get_domain_struct(domain_object)
 
-	semi_implicit_update = stage.semi_implicit_update
-	D.stage_semi_implicit_update = &semi_implicit_update[0]
+	with nogil:
+		mass_error = _openmp_protect_indices(D, indices_ptr, n)
 
-	semi_implicit_update = xmomentum.semi_implicit_update
-	D.xmom_semi_implicit_update = &semi_implicit_update[0]
+	return mass_error
 
-	semi_implicit_update = ymomentum.semi_implicit_update
-	D.ymom_semi_implicit_update = &semi_implicit_update[0]	
+def compute_fluxes_lts(object domain_object, int64_t[::1] indices not None, int64_t[::1] frequency not None, int64_t substep):
+	"""Local timestepping: compute the fluxes of the edges of the triangles
+	listed in indices which are active at substep, storing them in
+	domain.edge_flux_work.
+	"""
 
-	#------------------------------------------------------
-	# Riverwall structures
-	#------------------------------------------------------
-	riverwallData = domain_object.riverwallData
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
 
-	riverwall_elevation = riverwallData.riverwall_elevation
-	D.riverwall_elevation = &riverwall_elevation[0]
+	if n == 0:
+		return
 
-	riverwall_rowIndex = riverwallData.hydraulic_properties_rowIndex
-	D.riverwall_rowIndex = &riverwall_rowIndex[0]
+	D = get_domain_struct(domain_object)
 
-	D.ncol_riverwall_hydraulic_properties = riverwallData.ncol_hydraulic_properties
+	with nogil:
+		_openmp_compute_fluxes_central_lts(D, &indices[0], n, &frequency[0], substep)
 
-	riverwall_hydraulic_properties = riverwallData.hydraulic_properties
-	D.riverwall_hydraulic_properties = &riverwall_hydraulic_properties[0,0]
+def accumulate_fluxes_lts(object domain_object, int64_t[::1] indices not None, int64_t[::1] frequency not None,
+		int64_t substep, double timestep, double[:, ::1] accum not None):
+	"""Local timestepping: add the time integrated fluxes of the edges active
+	at substep to the rows (stage, xmomentum, ymomentum) of accum.
 
+	Returns the time integrated boundary flux.
+	"""
 
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
+	cdef double boundary_flux
 
-#===============================================================================
+	if n == 0:
+		return 0.0
 
-def compute_fluxes_ext_central(object domain_object, double timestep):
+	D = get_domain_struct(domain_object)
+
+	with nogil:
+		boundary_flux = _openmp_accumulate_fluxes_lts(D, &indices[0], n, &frequency[0], substep, timestep,
+				&accum[0, 0], &accum[1, 0], &accum[2, 0])
+
+	return boundary_flux
 
-	cdef domain D
+def accumulate_forcing_lts(object domain_object, int64_t[::1] indices not None, int64_t[::1] frequency not None,
+		double timestep, double[:, ::1] accum not None, double[:, ::1] semi not None):
+	"""Local timestepping: add the forcing terms of the triangles listed in
+	indices, integrated over their timestep, to accum and store their semi
+	implicit rates in semi.
+	"""
 
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	if n == 0:
+		return
+
+	D = get_domain_struct(domain_object)
 
 	with nogil:
-		timestep =  _openmp_compute_fluxes_central(&D, timestep)
+		_openmp_accumulate_forcing_lts(D, &indices[0], n, &frequency[0], timestep,
+				&accum[0, 0], &accum[1, 0], &accum[2, 0],
+				&semi[0, 0], &semi[1, 0], &semi[2, 0])
 
-	return timestep
+def update_conserved_quantities_lts(object domain_object, int64_t[::1] indices not None, int64_t[::1] frequency not None,
+		double timestep, double[:, ::1] accum not None, double[:, ::1] semi not None):
+	"""Local timestepping: update the conserved quantities of the triangles
+	listed in indices from accum and semi.
 
-def extrapolate_second_order_edge_sw(object domain_object):
+	Returns the number of negative cells fixed.
+	"""
 
-	cdef domain D
-	cdef int64_t e
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
+	cdef int64_t num_negative_cells
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	if n == 0:
+		return 0
+
+	D = get_domain_struct(domain_object)
 
 	with nogil:
-		e = _openmp_extrapolate_second_order_edge_sw(&D)
+		num_negative_cells = _openmp_update_conserved_quantities_lts(D, &indices[0], n, &frequency[0], timestep,
+				&accum[0, 0], &accum[1, 0], &accum[2, 0],
+				&semi[0, 0], &semi[1, 0], &semi[2, 0])
 
-	if e == -1:
-		return None
+	return num_negative_cells
 
-def protect_new(object domain_object):
+def refine_frequency_lts(object domain_object, int64_t[::1] indices not None, int64_t[::1] frequency not None,
+		double timestep, double cfl):
+	"""Local timestepping: reduce the frequency of the triangles listed in
+	indices if their next timestep would violate the CFL condition.
 
-	cdef domain D
+	Returns the number of triangles whose frequency changed.
+	"""
 
-	cdef double mass_error
+	cdef domain* D
+	cdef int64_t n = indices.shape[0]
+	cdef int64_t number_of_changes
+
+	if n == 0:
+		return 0
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	D = get_domain_struct(domain_object)
 
 	with nogil:
-		mass_error = _openmp_protect(&D)
+		number_of_changes = _openmp_refine_frequency_lts(D, &indices[0], n, &frequency[0], timestep, cfl)
+
+	return number_of_changes
+
+def evolve_batch(object domain_object, int64_t timestepping_order,
+		double relative_yieldtime, double relative_finaltime, double time_epsilon,
+		int64_t[::1] reflective_ids not None, int64_t[::1] reflective_edges not None,
+		int64_t[::1] dirichlet_ids not None, int64_t[::1] dirichlet_edges not None,
+		double[:, ::1] dirichlet_values not None):
+	"""Batch steps: evolve the domain with euler (timestepping_order 1)
+	or rk2 (timestepping_order 2) steps in compiled code until the relative
+	time reaches relative_yieldtime or relative_finaltime, using the fused
+	update sweep if domain.fused_kernel.
+
+	Updates domain.relative_time, domain.timestep, the recorded min and max
+	timesteps and the boundary flux integral.
+
+	Returns (number_of_steps, cfl_timestep, num_negative_cells, status), see
+	_openmp_evolve_batch.
+	"""
+
+	cdef domain* D
+	cdef int64_t number_of_steps, num_negative_cells, status
+	cdef double relative_time, timestep, cfl_timestep
+	cdef double recorded_min_timestep, recorded_max_timestep, boundary_flux_integral
+	cdef double fixed_flux_timestep = 0.0
+	cdef double CFL = domain_object.CFL
+	cdef double evolve_min_timestep = domain_object.evolve_min_timestep
+	cdef int64_t use_sloped_mannings = domain_object.use_sloped_mannings
+	cdef int64_t fused = domain_object.fused_kernel
+	cdef int64_t nr = reflective_ids.shape[0]
+	cdef int64_t nd = dirichlet_ids.shape[0]
+	cdef int64_t* reflective_ids_ptr = NULL
+	cdef int64_t* reflective_edges_ptr = NULL
+	cdef int64_t* dirichlet_ids_ptr = NULL
+	cdef int64_t* dirichlet_edges_ptr = NULL
+	cdef double* dirichlet_values_ptr = NULL
+
+	cdef double[::1] friction = domain_object.quantities['friction'].centroid_values
+	cdef state_t* stage_backup = state_data(domain_object.quantities['stage'].centroid_backup_values)
+	cdef state_t* xmom_backup = state_data(domain_object.quantities['xmomentum'].centroid_backup_values)
+	cdef state_t* ymom_backup = state_data(domain_object.quantities['ymomentum'].centroid_backup_values)
+	cdef double[::1] flux_integral = domain_object.boundary_flux_integral.boundary_flux_integral
+
+	if nr > 0:
+		reflective_ids_ptr = &reflective_ids[0]
+		reflective_edges_ptr = &reflective_edges[0]
+	if nd > 0:
+		dirichlet_ids_ptr = &dirichlet_ids[0]
+		dirichlet_edges_ptr = &dirichlet_edges[0]
+		dirichlet_values_ptr = &dirichlet_values[0, 0]
+
+	if domain_object.fixed_flux_timestep is not None:
+		fixed_flux_timestep = domain_object.fixed_flux_timestep
+
+	relative_time = domain_object.relative_time
+	timestep = domain_object.timestep
+	recorded_min_timestep = domain_object.recorded_min_timestep
+	recorded_max_timestep = domain_object.recorded_max_timestep
+	boundary_flux_integral = flux_integral[0]
+
+	D = get_domain_struct(domain_object)
 
+	with nogil:
+		number_of_steps = _openmp_evolve_batch(D, timestepping_order, &relative_time,
+				relative_yieldtime, relative_finaltime, time_epsilon,
+				CFL, evolve_min_timestep, fixed_flux_timestep,
+				reflective_ids_ptr, reflective_edges_ptr, nr,
+				dirichlet_ids_ptr, dirichlet_edges_ptr, dirichlet_values_ptr, nd,
+				&friction[0], use_sloped_mannings, fused,
+				stage_backup, xmom_backup, ymom_backup,
+				&timestep, &cfl_timestep, &recorded_min_timestep, &recorded_max_timestep,
+				&boundary_flux_integral, &num_negative_cells, &status)
+
+	domain_object.relative_time = relative_time
+	domain_object.timestep = timestep
+	domain_object.recorded_min_timestep = recorded_min_timestep
+	domain_object.recorded_max_timestep = recorded_max_timestep
+	flux_integral[0] = boundary_flux_integral
+
+	return number_of_steps, cfl_timestep, num_negative_cells, status
 
-	return mass_error
 
 def compute_flux_update_frequency(object domain_object, double timestep):
 
@@ -416,9 +441,9 @@ def compute_flux_update_frequency(object domain_object, double timestep):
 
 
 def manning_friction_flat(double g, double eps,
-            np.ndarray[double, ndim=1, mode="c"] w not None,
-			np.ndarray[double, ndim=1, mode="c"] uh not None,
-			np.ndarray[double, ndim=1, mode="c"] vh not None,
+			np.ndarray w not None,
+			np.ndarray uh not None,
+			np.ndarray vh not None,
 			np.ndarray[double, ndim=1, mode="c"] z not None,
 			np.ndarray[double, ndim=1, mode="c"] eta not None,
 			np.ndarray[double, ndim=1, mode="c"] xmom not None,
@@ -427,13 +452,13 @@ def manning_friction_flat(double g, double eps,
 	cdef int64_t N
 	
 	N = w.shape[0]
-	_openmp_manning_friction_flat(g, eps, N, &w[0], &z[0], &uh[0], &vh[0], &eta[0], &xmom[0], &ymom[0])
+	_openmp_manning_friction_flat(g, eps, N, state_data(w), &z[0], state_data(uh), state_data(vh), &eta[0], &xmom[0], &ymom[0])
 
 def manning_friction_sloped(double g, double eps,
-        np.ndarray[double, ndim=2, mode="c"] x not None,
-		np.ndarray[double, ndim=1, mode="c"] w not None,
-		np.ndarray[double, ndim=1, mode="c"] uh not None,
-		np.ndarray[double, ndim=1, mode="c"] vh not None,
+		np.ndarray[double, ndim=2, mode="c"] x not None,
+		np.ndarray w not None,
+		np.ndarray uh not None,
+		np.ndarray vh not None,
 		np.ndarray[double, ndim=2, mode="c"] z not None,
 		np.ndarray[double, ndim=1, mode="c"] eta not None,
 		np.ndarray[double, ndim=1, mode="c"] xmom not None,
@@ -442,19 +467,35 @@ def manning_friction_sloped(double g, double eps,
 	cdef int64_t N
 	
 	N = w.shape[0]
-	_openmp_manning_friction_sloped(g, eps, N, &x[0,0], &w[0], &z[0,0], &uh[0], &vh[0], &eta[0], &xmom[0], &ymom[0])
+	_openmp_manning_friction_sloped(g, eps, N, &x[0,0], state_data(w), &z[0,0], state_data(uh), state_data(vh), &eta[0], &xmom[0], &ymom[0])
+
+
+def update_conserved_quantities(object domain_object, double timestep):
+	"""Update the centroid values of stage, xmomentum and ymomentum from
+	their explicit and semi implicit updates (computed in double precision
+	whatever the storage precision)
+	"""
+
+	cdef domain* D
+	cdef int64_t err
+
+	D = get_domain_struct(domain_object)
+
+	with nogil:
+		err = _openmp_update_conserved_quantities(D, timestep)
+
+	assert err == 0, "update: division by zero in semi implicit update - call Stephen :)"
 
 
 def fix_negative_cells(object domain_object):
 
-	cdef domain D
+	cdef domain* D
 	cdef int64_t num_negative_cells
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	D = get_domain_struct(domain_object)
 
 	with nogil:
-		num_negative_cells = _openmp_fix_negative_cells(&D)
+		num_negative_cells = _openmp_fix_negative_cells(D)
 
 	return num_negative_cells
 
@@ -0,0 +1,7 @@
+#cython: wraparound=False, boundscheck=True, cdivision=True, profile=False, nonecheck=False, overflowcheck=False, cdivision_warnings=False, unraisable_tracebacks=False
+
+# Single precision variant of sw_domain_openmp_ext: the same wrappers compiled
+# with SW_SINGLE_PRECISION, so the stage, xmomentum and ymomentum
+# centroid, edge and vertex values are float32 arrays.
+
+include "sw_domain_openmp_ext.pyx"
@@ -0,0 +1,481 @@
+#cython: wraparound=False, boundscheck=True, cdivision=True, profile=False, nonecheck=False, overflowcheck=False, cdivision_warnings=False, unraisable_tracebacks=False
+"""
+Persistent C domain struct shared by the orig, simd and openmp
+shallow water extensions.
+
+The struct holds the parameters of the domain and pointers to its
+numpy arrays. The pointers are set when the struct is bound to the
+domain, and only need to be rebound when the arrays are reallocated
+(call unbind, the struct is bound again on the next kernel call).
+The parameters are cheap to copy and are refreshed on each call.
+"""
+
+import cython
+from libc.stdint cimport int64_t
+from cpython.pycapsule cimport *
+
+import numpy as np
+cimport numpy as np
+
+cdef extern from "sw_domain.h" nogil:
+    # double, or float in the single precision openmp extension
+    ctypedef double state_t
+
+    struct domain:
+        # parameters, copied from the domain on each call
+        int64_t number_of_elements
+        int64_t boundary_length
+        int64_t number_of_riverwall_edges
+        double epsilon
+        double H0
+        double g
+        int64_t optimise_dry_cells
+        double evolve_max_timestep
+        int64_t extrapolate_velocity_second_order
+        double minimum_allowed_height
+        double maximum_allowed_speed
+        int64_t low_froude
+        int64_t timestep_fluxcalls
+        double beta_w
+        double beta_w_dry
+        double beta_uh
+        double beta_uh_dry
+        double beta_vh
+        double beta_vh_dry
+        int64_t max_flux_update_frequency
+        int64_t ncol_riverwall_hydraulic_properties
+
+        # array pointers, set when the struct is bound
+        int64_t* neighbours
+        int64_t* neighbour_edges
+        int64_t* surrogate_neighbours
+        double* normals
+        double* edgelengths
+        double* radii
+        double* areas
+        int64_t* edge_flux_type
+        int64_t* tri_full_flag
+        int64_t* already_computed_flux
+        double* max_speed
+        double* vertex_coordinates
+        double* edge_coordinates
+        double* centroid_coordinates
+        int64_t* number_of_boundaries
+        state_t* stage_edge_values
+        state_t* xmom_edge_values
+        state_t* ymom_edge_values
+        double* bed_edge_values
+        double* height_edge_values
+        state_t* stage_centroid_values
+        state_t* xmom_centroid_values
+        state_t* ymom_centroid_values
+        double* bed_centroid_values
+        double* height_centroid_values
+        state_t* stage_vertex_values
+        state_t* xmom_vertex_values
+        state_t* ymom_vertex_values
+        double* bed_vertex_values
+        double* height_vertex_values
+        double* stage_boundary_values
+        double* xmom_boundary_values
+        double* ymom_boundary_values
+        double* bed_boundary_values
+        double* stage_explicit_update
+        double* xmom_explicit_update
+        double* ymom_explicit_update
+        int64_t* flux_update_frequency
+        int64_t* update_next_flux
+        int64_t* update_extrapolation
+        double* edge_timestep
+        double* edge_flux_work
+        double* neigh_work
+        double* pressuregrad_work
+        double* x_centroid_work
+        double* y_centroid_work
+        double* boundary_flux_sum
+        int64_t* allow_timestep_increase
+        double* riverwall_elevation
+        int64_t* riverwall_rowIndex
+        double* riverwall_hydraulic_properties
+        int64_t* edge_river_wall_counter
+        double* stage_semi_implicit_update
+        double* xmom_semi_implicit_update
+        double* ymom_semi_implicit_update
+
+
+cdef void* state_data(object A) except NULL:
+    """Pointer to the data of the values of an evolved quantity, stored
+    in double or single precision (see set_precision of the domain)
+    """
+
+    if not isinstance(A, np.ndarray) or \
+            A.dtype not in (np.float64, np.float32) or \
+            not A.flags.c_contiguous or A.size == 0:
+        raise ValueError('Values of evolved quantities must be contiguous '
+                         'float64 or float32 arrays')
+
+    return np.PyArray_DATA(A)
+
+
+# Name of the capsule holding a pointer to the struct
+cdef const char* capsule_name = "anuga.shallow_water.domain_struct"
+
+
+cdef class Domain_struct:
+    """Hold the C struct domain of a shallow water domain
+
+    Each kernel call uses get_capsule(domain) to obtain the struct, which
+    binds the array pointers the first time and refreshes the parameters.
+    """
+
+    cdef domain D
+    cdef readonly object capsule
+    cdef readonly bint bound
+    cdef readonly int64_t number_of_binds
+
+    # References to the bound arrays, so they stay valid while bound
+    cdef list arrays
+
+    def __cinit__(self):
+
+        self.capsule = PyCapsule_New(<void*> &self.D, capsule_name, NULL)
+        self.bound = False
+        self.number_of_binds = 0
+        self.arrays = []
+
+    def __reduce__(self):
+        # Pointers cannot be pickled, unpickled structs are bound on first use
+        return (Domain_struct, ())
+
+    def get_capsule(self, object domain_object):
+        """Return a capsule holding a pointer to the struct, binding the
+        arrays of domain_object if not bound and refreshing the parameters
+        """
+
+        if not self.bound:
+            self.bind(domain_object)
+        else:
+            self.set_parameters(domain_object)
+
+        return self.capsule
+
+    def unbind(self):
+        """Release the arrays, the struct is bound again on the next
+        call of get_capsule (e.g. after arrays have been reallocated)
+        """
+
+        self.bound = False
+        self.arrays = []
+
+    def bind(self, object domain_object):
+        """Set the parameters and array pointers from domain_object"""
+
+        self.set_parameters(domain_object)
+        self.set_pointers(domain_object)
+
+        self.bound = True
+        self.number_of_binds += 1
+
+    def set_parameters(self, object domain_object):
+
+        cdef domain* D = &self.D
+
+        # Parameters can be changed between calls (e.g. by set_beta)
+        D.number_of_elements = domain_object.number_of_elements
+        D.boundary_length = domain_object.boundary_length
+        D.number_of_riverwall_edges = domain_object.number_of_riverwall_edges
+        D.epsilon = domain_object.epsilon
+        D.H0 = domain_object.H0
+        D.g = domain_object.g
+        D.optimise_dry_cells = domain_object.optimise_dry_cells
+        D.evolve_max_timestep = domain_object.evolve_max_timestep
+        D.minimum_allowed_height = domain_object.minimum_allowed_height
+        D.maximum_allowed_speed = domain_object.maximum_allowed_speed
+        D.timestep_fluxcalls = domain_object.timestep_fluxcalls
+        D.low_froude = domain_object.low_froude
+        D.extrapolate_velocity_second_order = domain_object.extrapolate_velocity_second_order
+        D.beta_w = domain_object.beta_w
+        D.beta_w_dry = domain_object.beta_w_dry
+        D.beta_uh = domain_object.beta_uh
+        D.beta_uh_dry = domain_object.beta_uh_dry
+        D.beta_vh = domain_object.beta_vh
+        D.beta_vh_dry = domain_object.beta_vh_dry
+        D.max_flux_update_frequency = domain_object.max_flux_update_frequency
+
+    def set_pointers(self, object domain_object):
+
+        cdef domain* D = &self.D
+        cdef list arrays = []
+
+        cdef int64_t[:,::1]   neighbours
+        cdef int64_t[:,::1]   neighbour_edges
+        cdef double[:,::1] normals
+        cdef double[:,::1] edgelengths
+        cdef double[::1]   radii
+        cdef double[::1]   areas
+        cdef int64_t[::1]  edge_flux_type
+        cdef int64_t[::1]  tri_full_flag
+        cdef int64_t[:,::1] already_computed_flux
+        cdef double[:,::1] vertex_coordinates
+        cdef double[:,::1] edge_coordinates
+        cdef double[:,::1] centroid_coordinates
+        cdef int64_t[::1]  number_of_boundaries
+        cdef int64_t[:,::1] surrogate_neighbours
+        cdef double[::1]   max_speed
+        cdef int64_t[::1]  flux_update_frequency
+        cdef int64_t[::1]  update_next_flux
+        cdef int64_t[::1]  update_extrapolation
+        cdef int64_t[::1]  allow_timestep_increase
+        cdef double[::1]   edge_timestep
+        cdef double[::1]   edge_flux_work
+        cdef double[::1]   neigh_work
+        cdef double[::1]   pressuregrad_work
+        cdef double[::1]   x_centroid_work
+        cdef double[::1]   y_centroid_work
+        cdef double[::1]   boundary_flux_sum
+        cdef double[::1]   riverwall_elevation
+        cdef int64_t[::1]  riverwall_rowIndex
+        cdef double[:,::1] riverwall_hydraulic_properties
+        cdef int64_t[::1]  edge_river_wall_counter
+        cdef double[:,::1] edge_values
+        cdef double[::1]   centroid_values
+        cdef double[:,::1] vertex_values
+        cdef double[::1]   boundary_values
+        cdef double[::1]   explicit_update
+        cdef double[::1]   semi_implicit_update
+
+        cdef object quantities
+        cdef object riverwallData
+
+        #------------------------------------------------------
+        # Domain structures
+        #------------------------------------------------------
+        neighbours = domain_object.neighbours
+        arrays.append(neighbours)
+        D.neighbours = &neighbours[0,0]
+
+        surrogate_neighbours = domain_object.surrogate_neighbours
+        arrays.append(surrogate_neighbours)
+        D.surrogate_neighbours = &surrogate_neighbours[0,0]
+
+        neighbour_edges = domain_object.neighbour_edges
+        arrays.append(neighbour_edges)
+        D.neighbour_edges = &neighbour_edges[0,0]
+
+        normals = domain_object.normals
+        arrays.append(normals)
+        D.normals = &normals[0,0]
+
+        edgelengths = domain_object.edgelengths
+        arrays.append(edgelengths)
+        D.edgelengths = &edgelengths[0,0]
+
+        radii = domain_object.radii
+        arrays.append(radii)
+        D.radii = &radii[0]
+
+        areas = domain_object.areas
+        arrays.append(areas)
+        D.areas = &areas[0]
+
+        edge_flux_type = domain_object.edge_flux_type
+        arrays.append(edge_flux_type)
+        D.edge_flux_type = &edge_flux_type[0]
+
+        tri_full_flag = domain_object.tri_full_flag
+        arrays.append(tri_full_flag)
+        D.tri_full_flag = &tri_full_flag[0]
+
+        already_computed_flux = domain_object.already_computed_flux
+        arrays.append(already_computed_flux)
+        D.already_computed_flux = &already_computed_flux[0,0]
+
+        vertex_coordinates = domain_object.vertex_coordinates
+        arrays.append(vertex_coordinates)
+        D.vertex_coordinates = &vertex_coordinates[0,0]
+
+        edge_coordinates = domain_object.edge_coordinates
+        arrays.append(edge_coordinates)
+        D.edge_coordinates = &edge_coordinates[0,0]
+
+        centroid_coordinates = domain_object.centroid_coordinates
+        arrays.append(centroid_coordinates)
+        D.centroid_coordinates = &centroid_coordinates[0,0]
+
+        max_speed = domain_object.max_speed
+        arrays.append(max_speed)
+        D.max_speed = &max_speed[0]
+
+        number_of_boundaries = domain_object.number_of_boundaries
+        arrays.append(number_of_boundaries)
+        D.number_of_boundaries = &number_of_boundaries[0]
+
+        flux_update_frequency = domain_object.flux_update_frequency
+        arrays.append(flux_update_frequency)
+        D.flux_update_frequency = &flux_update_frequency[0]
+
+        update_next_flux = domain_object.update_next_flux
+        arrays.append(update_next_flux)
+        D.update_next_flux = &update_next_flux[0]
+
+        update_extrapolation = domain_object.update_extrapolation
+        arrays.append(update_extrapolation)
+        D.update_extrapolation = &update_extrapolation[0]
+
+        allow_timestep_increase = domain_object.allow_timestep_increase
+        arrays.append(allow_timestep_increase)
+        D.allow_timestep_increase = &allow_timestep_increase[0]
+
+        edge_timestep = domain_object.edge_timestep
+        arrays.append(edge_timestep)
+        D.edge_timestep = &edge_timestep[0]
+
+        edge_flux_work = domain_object.edge_flux_work
+        arrays.append(edge_flux_work)
+        D.edge_flux_work = &edge_flux_work[0]
+
+        neigh_work = domain_object.neigh_work
+        arrays.append(neigh_work)
+        D.neigh_work = &neigh_work[0]
+
+        pressuregrad_work = domain_object.pressuregrad_work
+        arrays.append(pressuregrad_work)
+        D.pressuregrad_work = &pressuregrad_work[0]
+
+        x_centroid_work = domain_object.x_centroid_work
+        arrays.append(x_centroid_work)
+        D.x_centroid_work = &x_centroid_work[0]
+
+        y_centroid_work = domain_object.y_centroid_work
+        arrays.append(y_centroid_work)
+        D.y_centroid_work = &y_centroid_work[0]
+
+        boundary_flux_sum = domain_object.boundary_flux_sum
+        arrays.append(boundary_flux_sum)
+        D.boundary_flux_sum = &boundary_flux_sum[0]
+
+        edge_river_wall_counter = domain_object.edge_river_wall_counter
+        arrays.append(edge_river_wall_counter)
+        D.edge_river_wall_counter  = &edge_river_wall_counter[0]
+
+        #------------------------------------------------------
+        # Quantity structures
+        #------------------------------------------------------
+        quantities = domain_object.quantities
+        stage = quantities["stage"]
+        xmomentum = quantities["xmomentum"]
+        ymomentum = quantities["ymomentum"]
+        elevation = quantities["elevation"]
+        height = quantities["height"]
+
+        arrays.append(stage.edge_values)
+        D.stage_edge_values = <state_t*> state_data(stage.edge_values)
+
+        arrays.append(xmomentum.edge_values)
+        D.xmom_edge_values = <state_t*> state_data(xmomentum.edge_values)
+
+        arrays.append(ymomentum.edge_values)
+        D.ymom_edge_values = <state_t*> state_data(ymomentum.edge_values)
+
+        edge_values = elevation.edge_values
+        arrays.append(edge_values)
+        D.bed_edge_values = &edge_values[0,0]
+
+        edge_values = height.edge_values
+        arrays.append(edge_values)
+        D.height_edge_values = &edge_values[0,0]
+
+        arrays.append(stage.centroid_values)
+        D.stage_centroid_values = <state_t*> state_data(stage.centroid_values)
+
+        arrays.append(xmomentum.centroid_values)
+        D.xmom_centroid_values = <state_t*> state_data(xmomentum.centroid_values)
+
+        arrays.append(ymomentum.centroid_values)
+        D.ymom_centroid_values = <state_t*> state_data(ymomentum.centroid_values)
+
+        centroid_values = elevation.centroid_values
+        arrays.append(centroid_values)
+        D.bed_centroid_values = &centroid_values[0]
+
+        centroid_values = height.centroid_values
+        arrays.append(centroid_values)
+        D.height_centroid_values = &centroid_values[0]
+
+        arrays.append(stage.vertex_values)
+        D.stage_vertex_values = <state_t*> state_data(stage.vertex_values)
+
+        arrays.append(xmomentum.vertex_values)
+        D.xmom_vertex_values = <state_t*> state_data(xmomentum.vertex_values)
+
+        arrays.append(ymomentum.vertex_values)
+        D.ymom_vertex_values = <state_t*> state_data(ymomentum.vertex_values)
+
+        vertex_values = elevation.vertex_values
+        arrays.append(vertex_values)
+        D.bed_vertex_values = &vertex_values[0,0]
+
+        vertex_values = height.vertex_values
+        arrays.append(vertex_values)
+        D.height_vertex_values = &vertex_values[0,0]
+
+        boundary_values = stage.boundary_values
+        arrays.append(boundary_values)
+        D.stage_boundary_values = &boundary_values[0]
+
+        boundary_values = xmomentum.boundary_values
+        arrays.append(boundary_values)
+        D.xmom_boundary_values = &boundary_values[0]
+
+        boundary_values = ymomentum.boundary_values
+        arrays.append(boundary_values)
+        D.ymom_boundary_values = &boundary_values[0]
+
+        boundary_values = elevation.boundary_values
+        arrays.append(boundary_values)
+        D.bed_boundary_values = &boundary_values[0]
+
+        explicit_update = stage.explicit_update
+        arrays.append(explicit_update)
+        D.stage_explicit_update = &explicit_update[0]
+
+        explicit_update = xmomentum.explicit_update
+        arrays.append(explicit_update)
+        D.xmom_explicit_update = &explicit_update[0]
+
+        explicit_update = ymomentum.explicit_update
+        arrays.append(explicit_update)
+        D.ymom_explicit_update = &explicit_update[0]
+
+        semi_implicit_update = stage.semi_implicit_update
+        arrays.append(semi_implicit_update)
+        D.stage_semi_implicit_update = &semi_implicit_update[0]
+
+        semi_implicit_update = xmomentum.semi_implicit_update
+        arrays.append(semi_implicit_update)
+        D.xmom_semi_implicit_update = &semi_implicit_update[0]
+
+        semi_implicit_update = ymomentum.semi_implicit_update
+        arrays.append(semi_implicit_update)
+        D.ymom_semi_implicit_update = &semi_implicit_update[0]
+
+        #------------------------------------------------------
+        # Riverwall structures
+        #------------------------------------------------------
+        riverwallData = domain_object.riverwallData
+
+        riverwall_elevation = riverwallData.riverwall_elevation
+        arrays.append(riverwall_elevation)
+        D.riverwall_elevation = &riverwall_elevation[0]
+
+        riverwall_rowIndex = riverwallData.hydraulic_properties_rowIndex
+        arrays.append(riverwall_rowIndex)
+        D.riverwall_rowIndex = &riverwall_rowIndex[0]
+
+        D.ncol_riverwall_hydraulic_properties = riverwallData.ncol_hydraulic_properties
+
+        riverwall_hydraulic_properties = riverwallData.hydraulic_properties
+        arrays.append(riverwall_hydraulic_properties)
+        D.riverwall_hydraulic_properties = &riverwall_hydraulic_properties[0,0]
+
+        self.arrays = arrays
@@ -0,0 +1,148 @@
+import unittest
+import anuga
+import numpy
+
+verbose = False
+
+
+class Test_batch_steps(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def create_domain(self, flowalg, batch_steps=False, fused_kernel=False,
+                      sloped_mannings=False):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=10.0, len2=10.0)
+
+        domain.set_flow_algorithm(flowalg)
+        domain.set_multiprocessor_mode(2)
+        domain.set_name('test_batch_steps')
+        domain.set_store(False)
+
+        def topography(x, y):
+            return -x/20.
+
+        def stage(x, y):
+            return topography(x, y) + 0.5*(x < 3.)
+
+        domain.set_quantity('elevation', topography)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', stage)
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([-0.4, 0., 0.])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        domain.set_sloped_mannings_function(sloped_mannings)
+        domain.set_batch_steps(batch_steps)
+        domain.set_fused_kernel(fused_kernel)
+
+        return domain
+
+    def evolve(self, domain):
+
+        max_speed = domain.max_speed
+
+        steps = []
+        for t in domain.evolve(yieldstep=1.0, finaltime=5.0):
+            steps.append(domain.number_of_steps)
+
+        # Work arrays are reused between yields
+        assert domain.max_speed is max_speed
+
+        V, BF, FS = domain.report_water_volume_statistics(verbose=verbose, returnStats=True)
+
+        return steps, BF
+
+    def check_batch_steps(self, flowalg, fused_kernel=False, sloped_mannings=False):
+
+        domain = self.create_domain(flowalg, sloped_mannings=sloped_mannings)
+        steps, BF = self.evolve(domain)
+
+        domain_batch = self.create_domain(flowalg, batch_steps=True,
+                                          fused_kernel=fused_kernel,
+                                          sloped_mannings=sloped_mannings)
+        steps_batch, BF_batch = self.evolve(domain_batch)
+
+        assert steps_batch == steps
+        assert numpy.allclose(BF_batch, BF)
+        assert numpy.allclose(domain_batch.recorded_min_timestep, domain.recorded_min_timestep)
+        assert numpy.allclose(domain_batch.recorded_max_timestep, domain.recorded_max_timestep)
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert numpy.allclose(domain_batch.quantities[name].centroid_values,
+                                  domain.quantities[name].centroid_values)
+            assert numpy.allclose(domain_batch.quantities[name].edge_values,
+                                  domain.quantities[name].edge_values)
+
+    def test_batch_steps_DE0(self):
+
+        self.check_batch_steps('DE0')
+
+    def test_batch_steps_DE1(self):
+
+        self.check_batch_steps('DE1')
+
+    def test_fused_kernel_DE0(self):
+
+        self.check_batch_steps('DE0', fused_kernel=True)
+
+    def test_fused_kernel_DE1(self):
+
+        self.check_batch_steps('DE1', fused_kernel=True)
+
+    def test_fused_kernel_sloped_mannings(self):
+
+        self.check_batch_steps('DE1', fused_kernel=True, sloped_mannings=True)
+
+        domain = self.create_domain('DE0', fused_kernel=True)
+        assert domain.get_fused_kernel()
+        assert domain.get_batch_steps()
+
+        domain.set_fused_kernel(False)
+        assert not domain.get_fused_kernel()
+
+    def test_batch_steps_not_possible(self):
+
+        domain = self.create_domain('DE0', batch_steps=True)
+        assert domain.get_batch_steps()
+
+        # Operators need per step callbacks
+        op = anuga.Rate_operator(domain, rate=0.001)
+        assert not domain._batch_steps_possible()
+
+        domain_ref = self.create_domain('DE0')
+        op_ref = anuga.Rate_operator(domain_ref, rate=0.001)
+
+        steps, BF = self.evolve(domain)
+        steps_ref, BF_ref = self.evolve(domain_ref)
+
+        assert steps == steps_ref
+        assert numpy.allclose(domain.quantities['stage'].centroid_values,
+                              domain_ref.quantities['stage'].centroid_values)
+
+        # As do boundaries other than Reflective and Dirichlet
+        domain = self.create_domain('DE0', batch_steps=True)
+        assert domain._batch_steps_possible()
+        assert domain._get_batch_boundaries() is not None
+
+        Bt = anuga.Transmissive_boundary(domain)
+        domain.set_boundary({'right': Bt})
+        assert domain._get_batch_boundaries() is None
+
+        # And the other multiprocessor modes
+        domain = self.create_domain('DE0', batch_steps=True)
+        domain.set_multiprocessor_mode(0)
+        assert not domain._batch_steps_possible()
+
+        domain.set_batch_steps(False)
+        assert not domain.get_batch_steps()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_batch_steps)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
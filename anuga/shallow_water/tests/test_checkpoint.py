@@ -0,0 +1,177 @@
+"""  Test checkpointing and restarting from checkpoint files
+"""
+
+
+import unittest, os
+import shutil
+import tempfile
+
+import anuga
+from anuga.shallow_water.checkpoint import load_checkpoint_file
+from anuga.shallow_water.checkpoint import save_checkpoint_file
+
+import numpy as num
+
+
+def create_domain(name, checkpoint_dir):
+
+    domain = anuga.rectangular_cross_domain(10, 5, len1=10.0, len2=5.0)
+    domain.set_name(name)
+    domain.set_datadir(checkpoint_dir)
+    domain.set_quantity('elevation', lambda x, y: -x/10.0)
+    domain.set_quantity('friction', 0.01)
+    domain.set_quantity('stage', expression='elevation + 0.2')
+
+    Br = anuga.Reflective_boundary(domain)
+    Bd = anuga.Dirichlet_boundary([0.0, 0.0, 0.0])
+    domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+    # An operator with state
+    anuga.Rate_operator(domain, rate=0.01, polygon=[[1,1],[3,1],[3,3],[1,3]])
+
+    return domain
+
+
+class Test_checkpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir)
+
+    def evolve_with_checkpoints(self, name):
+
+        domain = create_domain(name, self.checkpoint_dir)
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir, checkpoint_step=2)
+
+        for t in domain.evolve(yieldstep=0.25, finaltime=1.0):
+            pass
+
+        return domain
+
+    def test_checkpoint_files(self):
+
+        domain = self.evolve_with_checkpoints('checkpoint_files')
+
+        files = sorted(os.listdir(self.checkpoint_dir))
+
+        # Static data saved once, state at the checkpoints as npz
+        assert 'checkpoint_files_base.npz' in files
+        assert 'checkpoint_files_0.5.npz' in files
+        assert 'checkpoint_files_1.0.npz' in files
+        assert 'checkpoint_files_0.25.npz' not in files
+        assert len([f for f in files if f.endswith('.pickle')]) == 0
+
+        # The arrays of the domain are stored natively, only a small
+        # header is pickled
+        with num.load(os.path.join(self.checkpoint_dir, 'checkpoint_files_base.npz')) as base:
+            header_size = base['header'].size
+            array_size = sum(base[key].nbytes for key in base.files if key != 'header')
+            assert any(num.array_equal(base[key], domain.triangles) for key in base.files)
+        assert header_size < array_size/4
+
+        with num.load(os.path.join(self.checkpoint_dir, 'checkpoint_files_1.0.npz')) as state:
+            assert num.allclose(state['centroid_values.stage'],
+                                domain.quantities['stage'].centroid_values)
+            assert num.allclose(float(state['relative_time']), 1.0)
+            assert int(state['number_of_operators']) == len(domain.fractional_step_operators)
+
+    def test_restart_from_checkpoint(self):
+
+        domain = create_domain('restart', self.checkpoint_dir)
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir, checkpoint_step=2)
+        domain.set_store(False)
+
+        for t in domain.evolve(yieldstep=0.25, finaltime=2.0):
+            if t == 1.0:
+                stage_1 = domain.quantities['stage'].centroid_values.copy()
+
+        stage = domain.quantities['stage'].centroid_values.copy()
+        xmom = domain.quantities['xmomentum'].centroid_values.copy()
+        fractional_volume = domain.fractional_step_volume_integral
+
+        # Restart from the saved static data
+        domain = load_checkpoint_file('restart', self.checkpoint_dir, time=1.0)
+
+        # Arrays shared by the domain and its mesh are still shared
+        assert domain.mesh.triangles is domain.triangles
+
+        assert num.allclose(domain.get_time(), 1.0)
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage_1)
+
+        for t in domain.evolve(yieldstep=0.25, finaltime=2.0):
+            pass
+
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage)
+        assert num.allclose(domain.quantities['xmomentum'].centroid_values, xmom)
+        assert num.allclose(domain.fractional_step_volume_integral, fractional_volume)
+
+        # Restart a rebuilt domain from the latest checkpoint
+        domain = create_domain('restart', self.checkpoint_dir)
+        domain.set_store(False)
+        domain = load_checkpoint_file('restart', self.checkpoint_dir, domain=domain)
+
+        assert num.allclose(domain.get_time(), 2.0)
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage)
+
+    def test_load_pickle_checkpoint(self):
+        """Checkpoints of the whole domain from earlier versions
+        """
+
+        try:
+            import dill as pickle
+        except:
+            import pickle
+
+        domain = create_domain('pickled', self.checkpoint_dir)
+        domain.set_store(False)
+
+        for t in domain.evolve(yieldstep=0.25, finaltime=0.5):
+            pass
+
+        pickle_name = os.path.join(self.checkpoint_dir, 'pickled_0.5.pickle')
+        with open(pickle_name, 'wb') as fid:
+            pickle.dump(domain, fid)
+
+        restored = load_checkpoint_file('pickled', self.checkpoint_dir)
+
+        assert num.allclose(restored.get_time(), 0.5)
+        assert num.allclose(restored.quantities['stage'].centroid_values,
+                            domain.quantities['stage'].centroid_values)
+
+    def test_mismatched_operators(self):
+
+        domain = create_domain('mismatch', self.checkpoint_dir)
+        domain.set_store(False)
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir)
+        save_checkpoint_file(domain)
+
+        domain = create_domain('mismatch', self.checkpoint_dir)
+        anuga.Rate_operator(domain, rate=0.02)
+
+        try:
+            load_checkpoint_file('mismatch', self.checkpoint_dir, domain=domain)
+        except Exception as e:
+            assert 'operators' in str(e)
+        else:
+            raise Exception('Mismatched operators should raise an exception')
+
+    def test_corrupt_checkpoint(self):
+        """A corrupt latest checkpoint is skipped for the previous one
+        """
+
+        domain = self.evolve_with_checkpoints('corrupt')
+
+        with open(os.path.join(self.checkpoint_dir, 'corrupt_1.0.npz'), 'wb') as fid:
+            fid.write(b'truncated')
+
+        domain = load_checkpoint_file('corrupt', self.checkpoint_dir)
+
+        assert num.allclose(domain.get_time(), 0.5)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_checkpoint)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
@@ -0,0 +1,100 @@
+import unittest
+import pickle
+import anuga
+import numpy
+
+verbose = False
+
+
+class Test_domain_struct(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def create_domain(self, multiprocessor_mode):
+
+        domain = anuga.rectangular_cross_domain(6, 6, len1=6.0, len2=6.0)
+
+        domain.set_flow_algorithm('DE0')
+        domain.set_multiprocessor_mode(multiprocessor_mode)
+        domain.set_name('test_domain_struct')
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/10.)
+        domain.set_quantity('stage', lambda x, y: -x/10. + 0.5*(x < 2.))
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+    def test_bound_once_per_evolve(self):
+
+        results = []
+        for mode in [0, 1, 2]:
+            domain = self.create_domain(mode)
+            domain_struct = domain.domain_struct
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            # Bound once at the start of evolve, not at each kernel call
+            assert domain.domain_struct is domain_struct
+            assert domain_struct.bound
+            assert domain_struct.number_of_binds == 1
+            assert domain.number_of_steps > 1
+
+            results.append(domain.quantities['stage'].centroid_values.copy())
+
+        for result in results[1:]:
+            assert numpy.allclose(result, results[0])
+
+    def test_rebind(self):
+
+        domain = self.create_domain(2)
+        domain.distribute_to_vertices_and_edges()
+
+        domain_struct = domain.domain_struct
+        assert domain_struct.bound
+        binds = domain_struct.number_of_binds
+
+        # Reallocate the stage centroid values, the struct must be rebound
+        stage = domain.quantities['stage']
+        old_centroid_values = stage.centroid_values
+        stage.centroid_values = old_centroid_values + 0.1
+        domain_struct.unbind()
+        assert not domain_struct.bound
+
+        domain.distribute_to_vertices_and_edges()
+
+        assert domain_struct.bound
+        assert domain_struct.number_of_binds == binds + 1
+        assert numpy.allclose(stage.edge_values.mean(axis=1), stage.centroid_values)
+
+        # Parameters are refreshed on each call
+        domain.set_minimum_allowed_height(0.2)
+        domain.distribute_to_vertices_and_edges()
+        assert domain_struct.number_of_binds == binds + 1
+
+    def test_pickle(self):
+
+        domain = self.create_domain(2)
+        domain.distribute_to_vertices_and_edges()
+        assert domain.domain_struct.bound
+
+        # Unpickled structs are bound on first use
+        domain_struct = pickle.loads(pickle.dumps(domain.domain_struct))
+        assert not domain_struct.bound
+        assert domain_struct.number_of_binds == 0
+
+        domain.domain_struct = domain_struct
+        domain.distribute_to_vertices_and_edges()
+        assert domain_struct.bound
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_domain_struct)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
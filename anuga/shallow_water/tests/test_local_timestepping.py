@@ -0,0 +1,190 @@
+import unittest
+import anuga
+import numpy
+import os
+
+boundaryPolygon = [[0., 0.], [0., 100.], [100.0, 100.0], [100.0, 0.0]]
+
+# Small triangles in the middle of the domain
+fineRegion = [[40., 40.], [50., 40.], [50., 50.], [40., 50.]]
+
+verbose = False
+
+
+class Test_local_timestepping(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for file in ['test_local_timestepping.msh', 'test_local_timestepping.sww']:
+            try:
+                os.remove(file)
+            except:
+                pass
+
+    def create_domain(self, flowalg, nlevels=None):
+
+        anuga.create_mesh_from_regions(boundaryPolygon,
+                                       boundary_tags={'left': [0],
+                                                      'top': [1],
+                                                      'right': [2],
+                                                      'bottom': [3]},
+                                       maximum_triangle_area=200.,
+                                       interior_regions=[[fineRegion, 2.0]],
+                                       minimum_triangle_angle=28.0,
+                                       filename='test_local_timestepping.msh',
+                                       use_cache=False,
+                                       verbose=verbose)
+
+        domain = anuga.create_domain_from_file('test_local_timestepping.msh')
+
+        domain.set_flow_algorithm(flowalg)
+        domain.set_multiprocessor_mode(2)
+        domain.set_name('test_local_timestepping')
+        domain.set_store(False)
+
+        def topography(x, y):
+            return -x/150.
+
+        def stage(x, y):
+            return topography(x, y) + 0.5*(x < 30.)
+
+        domain.set_quantity('elevation', topography, location='centroids')
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', stage, location='centroids')
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([0., 0., 0.])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        if nlevels is not None:
+            domain.set_local_timestepping(nlevels=nlevels)
+
+        return domain
+
+    def evolve(self, domain):
+
+        self.initial_volume = domain.get_water_volume()
+
+        steps = 0
+        for t in domain.evolve(yieldstep=1.0, finaltime=10.0):
+            steps += domain.number_of_steps
+
+        # Mass conservation
+        V, BF, FS = domain.report_water_volume_statistics(verbose=verbose, returnStats=True)
+        assert numpy.allclose(V - BF - FS, self.initial_volume)
+
+        return steps
+
+    def check_local_timestepping(self, flowalg):
+
+        domain = self.create_domain(flowalg)
+        steps = self.evolve(domain)
+        stage = domain.quantities['stage'].centroid_values
+
+        # One level is the usual timestepping
+        domain0 = self.create_domain(flowalg, nlevels=0)
+        steps0 = self.evolve(domain0)
+        stage0 = domain0.quantities['stage'].centroid_values
+
+        assert steps0 == steps
+        assert numpy.allclose(stage0, stage)
+
+        domain3 = self.create_domain(flowalg, nlevels=3)
+        steps3 = self.evolve(domain3)
+        stage3 = domain3.quantities['stage'].centroid_values
+
+        counts = domain3.local_timestepping.get_level_counts()
+        assert len(counts) == 4
+        assert counts[1:].sum() > 0
+
+        assert steps3 < steps/2
+        assert numpy.all(abs(stage3 - stage) < 0.1)
+
+    def test_local_timestepping_DE0(self):
+
+        self.check_local_timestepping('DE0')
+
+    def test_local_timestepping_DE1(self):
+
+        self.check_local_timestepping('DE1')
+
+    def check_neighbour_levels(self, lts):
+
+        frequency = lts.frequency
+        neighbours = lts.neighbours
+        neighbour_frequency = numpy.where(neighbours >= 0, frequency[neighbours], frequency[:, None])
+
+        assert numpy.all(neighbour_frequency <= 2*frequency[:, None])
+        assert numpy.all(2*neighbour_frequency >= frequency[:, None])
+
+    def test_refine_levels(self):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=10., len2=10.)
+        domain.set_flow_algorithm('DE0')
+        domain.set_multiprocessor_mode(2)
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 0.0)
+        domain.set_local_timestepping(nlevels=3)
+
+        lts = domain.local_timestepping
+
+        # Water arrives in a dry triangle, which needs the smallest timestep
+        k = 110
+        domain.quantities['stage'].centroid_values[k] = 1.0
+        lts.timestep = 0.9*domain.CFL*domain.radii[k]/numpy.sqrt(domain.g)
+
+        # All the triangles start a timestep, so the lowered level of k
+        # propagates to the triangles two and three levels coarser
+        lts.frequency[:] = 8
+
+        # Triangles finishing at level 0 cannot be refined
+        lts.refine_levels(lts.all_indices, 0)
+        assert numpy.all(lts.frequency == 8)
+
+        lts.refine_levels(lts.all_indices)
+
+        assert lts.frequency[k] == 1
+        assert numpy.all(lts.frequency[lts.neighbours[k]] == 2)
+        self.check_neighbour_levels(lts)
+
+        # Only the triangles near k start a timestep, the others are
+        # in the middle of their timesteps and keep their levels
+        distance = numpy.linalg.norm(domain.centroid_coordinates -
+                                     domain.centroid_coordinates[k], axis=1)
+
+        # With only k and its neighbours starting, k can only go one level
+        # below its neighbours, which are next to the coarser triangles
+        near = numpy.flatnonzero(distance < 4.0)
+        next_to_k = numpy.append(k, lts.neighbours[k])
+
+        for starting, level in [(near, 1), (next_to_k, 2)]:
+            lts.frequency[:] = 8
+            lts.frequency[starting] = 4
+            lts.refine_levels(starting)
+
+            assert lts.frequency[k] == level
+            assert numpy.all(numpy.delete(lts.frequency, starting) == 8)
+            self.check_neighbour_levels(lts)
+
+            # The sets of triangles starting a timestep follow the levels
+            assert k in lts.start_sets[level - 1]
+
+    def test_local_timestepping_checks(self):
+
+        domain = self.create_domain('DE0', nlevels=2)
+        assert domain.get_local_timestepping() == 2
+        assert 'Local timestepping' in domain.timestepping_statistics()
+
+        domain.set_local_timestepping(False)
+        assert domain.get_local_timestepping() is None
+
+        domain.set_flow_algorithm('DE2')
+        with self.assertRaises(Exception):
+            domain.set_local_timestepping(nlevels=2)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_local_timestepping)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
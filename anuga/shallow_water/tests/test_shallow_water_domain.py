@@ -6612,6 +6612,67 @@ class Test_Shallow_Water(unittest.TestCase):
         # Cleanup
         os.remove(domain1.get_name() + '.sww')
 
+    def test_spatio_temporal_boundary_segment(self):
+        """Test that evaluating a file based boundary for a whole segment
+        at once gives the same boundary values as evaluating it edge by edge
+        """
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular
+
+        # Create sww file of simple propagation from left to right
+        points, vertices, boundary = rectangular(3, 3)
+        domain1 = Domain(points, vertices, boundary)
+        domain1.reduction = mean
+        domain1.smooth = True
+        domain1.set_datadir('.')
+        domain1.set_name('spatio_temporal_boundary_segment' + str(time.time()))
+        domain1.set_quantity('elevation', 0)
+        domain1.set_quantity('friction', 0)
+        domain1.set_quantity('stage', 0)
+
+        Br = Reflective_boundary(domain1)
+        Bd = Dirichlet_boundary([0.3, 0, 0])
+        domain1.set_boundary({'left': Bd, 'top': Bd, 'right': Br, 'bottom': Br})
+
+        for t in domain1.evolve(yieldstep=1, finaltime=3):
+            pass
+
+        # Domain with the same boundary points
+        points, vertices, boundary = rectangular(3, 3)
+        domain2 = Domain(points, vertices, boundary)
+        domain2.set_quantity('elevation', 0)
+        domain2.set_quantity('friction', 0)
+        domain2.set_quantity('stage', 0.1)
+        domain2.set_quantity('xmomentum', 0.2)
+
+        filename = domain1.get_name() + '.sww'
+        Bd = Dirichlet_boundary([0.5, 0, 0])
+        boundaries = [File_boundary(filename, domain2, default_boundary=Bd),
+                      Field_boundary(filename, domain2, mean_stage=1.5,
+                                     default_boundary=Bd),
+                      AWI_boundary(filename, domain2)]
+
+        segment_edges = num.arange(len(domain2.boundary_cells))
+
+        for B in boundaries:
+            for t in [0.0, 1.0, 1.3, 2.75, 3.0, 4.0]:
+                if t > 3.0 and isinstance(B, AWI_boundary):
+                    continue
+
+                domain2.set_time(t)
+
+                B.evaluate_segment(domain2, segment_edges)
+                segment_values = [domain2.quantities[name].boundary_values.copy()
+                                  for name in domain2.evolved_quantities]
+
+                for i in segment_edges:
+                    q = B.evaluate(domain2.boundary_cells[i],
+                                   domain2.boundary_edges[i])
+                    for j, name in enumerate(domain2.evolved_quantities):
+                        assert num.allclose(segment_values[j][i], q[j])
+
+        os.remove(filename)
+
     def test_spatio_temporal_boundary_3(self):
         """Test that boundary values can be read from file and interpolated
         in both time and space.
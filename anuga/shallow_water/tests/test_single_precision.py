@@ -0,0 +1,176 @@
+import unittest
+import os
+import anuga
+import numpy
+
+from anuga.file.netcdf import NetCDFFile
+
+verbose = False
+
+
+class Test_single_precision(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for name in ['test_single_precision.sww']:
+            if os.path.exists(name):
+                os.remove(name)
+
+    def create_domain(self, flowalg, precision='double', batch_steps=False,
+                      fused_kernel=False):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=10.0, len2=10.0)
+
+        domain.set_flow_algorithm(flowalg)
+        domain.set_multiprocessor_mode(2)
+        domain.set_name('test_single_precision')
+        domain.set_store(False)
+        domain.set_precision(precision)
+
+        def topography(x, y):
+            return -x/20.
+
+        def stage(x, y):
+            return topography(x, y) + 0.5*(x < 3.)
+
+        domain.set_quantity('elevation', topography)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', stage)
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([-0.4, 0., 0.])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        domain.set_batch_steps(batch_steps)
+        domain.set_fused_kernel(fused_kernel)
+
+        return domain
+
+    def check_single_precision(self, flowalg, batch_steps=False, fused_kernel=False):
+
+        domain = self.create_domain(flowalg)
+        domain_single = self.create_domain(flowalg, 'single', batch_steps, fused_kernel)
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=5.0):
+            pass
+
+        for t in domain_single.evolve(yieldstep=1.0, finaltime=5.0):
+            pass
+
+        assert domain_single.get_precision() == 'single'
+        assert domain_single.number_of_steps == domain.number_of_steps
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain_single.quantities[name]
+            assert Q.centroid_values.dtype == numpy.float32
+            assert Q.edge_values.dtype == numpy.float32
+            assert Q.vertex_values.dtype == numpy.float32
+
+            # Fluxes and updates are accumulated in double precision
+            assert Q.explicit_update.dtype == numpy.float64
+
+            assert numpy.allclose(Q.centroid_values,
+                                  domain.quantities[name].centroid_values,
+                                  atol=1.0e-3)
+
+        # Conservation error
+        V, BF, FS = domain_single.report_water_volume_statistics(verbose=verbose,
+                                                                 returnStats=True)
+        V0 = domain_single.volume_history[0]
+        assert abs(V - BF - FS - V0) < 1.0e-5*V0
+
+    def test_single_precision_DE0(self):
+
+        self.check_single_precision('DE0')
+
+    def test_single_precision_DE1(self):
+
+        self.check_single_precision('DE1')
+
+    def test_single_precision_batch_steps(self):
+
+        self.check_single_precision('DE0', batch_steps=True)
+        self.check_single_precision('DE1', fused_kernel=True)
+
+    def test_volumetric_balance_statistics(self):
+
+        domain = self.create_domain('DE0', 'single')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            pass
+
+        message = domain.volumetric_balance_statistics()
+
+        assert 'Storage precision of evolved quantities: single' in message
+        assert 'Conservation error [m^3]' in message
+
+    def test_store(self):
+
+        domain = self.create_domain('DE0', 'single')
+        domain.set_store(True)
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            pass
+
+        fid = NetCDFFile('test_single_precision.sww')
+        stage_c = fid.variables['stage_c'][:]
+        fid.close()
+
+        assert stage_c.shape == (3, len(domain))
+        assert numpy.allclose(stage_c[-1], domain.quantities['stage'].centroid_values)
+
+    def test_not_supported(self):
+
+        domain = anuga.rectangular_cross_domain(2, 2)
+
+        # Single precision requires multiprocessor mode 2
+        self.assertRaises(Exception, domain.set_precision, 'single')
+        self.assertRaises(Exception, domain.set_precision, 'half')
+
+        domain.set_multiprocessor_mode(2)
+        domain.set_precision('single')
+        assert domain.quantities['stage'].centroid_values.dtype == numpy.float32
+
+        self.assertRaises(Exception, domain.set_multiprocessor_mode, 1)
+        self.assertRaises(Exception, domain.set_local_timestepping)
+
+        domain.set_precision('double')
+        assert domain.quantities['stage'].centroid_values.dtype == numpy.float64
+        domain.set_multiprocessor_mode(1)
+
+    def test_operator_before_set_precision(self):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=10.0, len2=10.0)
+        domain.set_flow_algorithm('DE0')
+        domain.set_multiprocessor_mode(2)
+        domain.set_store(False)
+        domain.set_quantity('stage', 0.1)
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        operator = anuga.Rate_operator(domain, rate=1.0)
+        stage_c = domain.quantities['stage'].centroid_values
+
+        # Already in double precision, so nothing is reallocated
+        domain.set_precision('double')
+        assert domain.quantities['stage'].centroid_values is stage_c
+        assert operator.stage_c is stage_c
+
+        # The operator would update an orphaned copy of the stage
+        self.assertRaises(Exception, domain.set_precision, 'single')
+        assert domain.get_precision() == 'double'
+        assert domain.quantities['stage'].centroid_values is stage_c
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=1.0):
+            pass
+
+        # The rain is added to the domain
+        assert numpy.allclose(domain.get_water_volume(), 10.0 + 100.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_single_precision)
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
@@ -467,6 +467,9 @@ class RiverWall(object):
        
         # Define the hydraulic properties 
         self.hydraulic_properties=hydraulicTmp
+
+        # The riverwall arrays have been reallocated
+        domain.domain_struct.unbind()
       
         # Check for riverwall 'connectedness' errors (e.g. theoretically possible
         # to miss an edge due to round-off)
@@ -559,9 +562,7 @@ class RiverWall(object):
         domain=self.domain
 
         # Get edge/vertex indices for boundaries
-        boundary_index_info=list(domain.boundary.keys())
-        boundary_edges=[ boundary_index_info[i][0]*3+boundary_index_info[i][1] for i in range(len(boundary_index_info))]
-        boundary_edges=numpy.array(boundary_edges)
+        boundary_edges=domain.boundary_cells*3+domain.boundary_edges
         tmp=self.get_vertices_corresponding_to_edgeInds(boundary_edges, checkCoords=False)
         boundary_vertices=numpy.hstack([tmp[0], tmp[1]]).tolist()
 
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy
+
+import anuga
+from anuga.structures.boyd_box_operator import Boyd_box_operator
+from anuga.structures.boyd_box_operator import boyd_box_function
+from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
+from anuga.structures.boyd_pipe_operator import boyd_pipe_function
+from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
+from anuga.structures.weir_orifice_trapezoid_operator import weir_orifice_trapezoid_function
+from anuga.structures.structure_set_operator import Structure_set_operator
+from anuga.structures.structure_set_operator import boyd_box_discharges
+from anuga.structures.structure_set_operator import boyd_pipe_discharges
+from anuga.structures.structure_set_operator import weir_orifice_trapezoid_discharges
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+
+verbose = False
+
+
+class Test_structure_set_operator(unittest.TestCase):
+    """
+    Test that a structure set gives the same results as the individual
+    structures
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def _create_domain(self):
+
+        points, vertices, boundary = rectangular_cross(30, 20, len1=60.0, len2=40.0)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name('Test_structure_set')
+        domain.set_store(False)
+
+        def elevation(x, y):
+            return -x/30.0 + 0.2*numpy.sin(y/5.0)
+
+        def stage(x, y):
+            # Water high on the left for the lower half, on the right
+            # for the upper half, so that structures flow both ways
+            z = elevation(x, y)
+            return numpy.where(y < 20.0,
+                               numpy.maximum(z, 1.0 - 2.0*(x > 30.0)),
+                               numpy.maximum(z, -1.0 + 0.5*(x > 30.0)))
+
+        domain.set_quantity('elevation', elevation)
+        domain.set_quantity('stage', stage)
+        domain.set_quantity('friction', 0.01)
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+
+    def _create_structures(self, domain, structure_class):
+
+        # (y position, reversed, extra keyword arguments)
+        layout = [(3.0, False, {}),
+                  (9.0, True, {'use_velocity_head': False}),
+                  (15.0, False, {'smoothing_timescale': 1.0}),
+                  (21.0, False, {'blockage': 0.5, 'use_momentum_jet': False}),
+                  (27.0, True, {'invert_elevations': [-1.1, -0.5]}),
+                  (33.0, False, {'barrels': 2.0})]
+
+        structures = []
+        for y, reverse, kwargs in layout:
+            end_points = [[20.0, y], [40.0, y]]
+            if reverse:
+                end_points = end_points[::-1]
+
+            if structure_class in [Boyd_pipe_operator, anuga.Boyd_pipe_operator]:
+                kwargs['diameter'] = 1.5
+            elif structure_class in [Weir_orifice_trapezoid_operator,
+                                     anuga.Weir_orifice_trapezoid_operator]:
+                kwargs.update(width=1.5, height=1.0, z1=0.5, z2=1.0)
+            else:
+                kwargs.update(width=1.5, height=1.0)
+
+            structures.append(structure_class(domain,
+                                              losses=1.5,
+                                              end_points=end_points,
+                                              enquiry_gap=1.0,
+                                              **kwargs))
+
+        return structures
+
+
+    def _run(self, structure_class, use_set):
+
+        domain = self._create_domain()
+        structures = self._create_structures(domain, structure_class)
+
+        if use_set:
+            operator = Structure_set_operator(domain, structures)
+            for structure in structures:
+                assert structure not in domain.fractional_step_operators
+            assert operator in domain.fractional_step_operators
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=5.0):
+            if verbose: domain.print_timestepping_statistics()
+
+        if use_set:
+            operator.update_structure_statistics()
+
+        flows = [s.accumulated_flow for s in structures]
+        discharges = [s.discharge for s in structures]
+        quantities = [domain.quantities[name].centroid_values.copy()
+                      for name in ['stage', 'xmomentum', 'ymomentum']]
+
+        return flows, discharges, quantities
+
+
+    def _check_structure_set(self, structure_class):
+
+        flows, discharges, quantities = self._run(structure_class, False)
+        set_flows, set_discharges, set_quantities = self._run(structure_class, True)
+
+        if verbose:
+            print(flows)
+            print(set_flows)
+
+        # Make sure the culverts actually did something, in both directions
+        assert numpy.any(numpy.array(discharges) > 0.0)
+        assert numpy.all(numpy.array(flows)[[0, 1, 2]] > 0.0)
+
+        assert numpy.allclose(set_flows, flows)
+        assert numpy.allclose(set_discharges, discharges)
+
+        for q_set, q in zip(set_quantities, quantities):
+            assert numpy.allclose(q_set, q)
+
+
+    def test_boyd_box_set(self):
+
+        self._check_structure_set(Boyd_box_operator)
+
+
+    def test_boyd_pipe_set(self):
+
+        self._check_structure_set(Boyd_pipe_operator)
+
+
+    def test_weir_orifice_trapezoid_set(self):
+
+        self._check_structure_set(Weir_orifice_trapezoid_operator)
+
+
+    def test_structure_set_from_factories(self):
+
+        # The structures created by anuga.Boyd_box_operator etc are parallel
+        # structures if mpi4py is available
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            pass
+        else:
+            # The parallel structures communicate even on one processor
+            if MPI.Is_finalized():
+                self.skipTest('MPI has been finalized')
+
+        for factory in [anuga.Boyd_box_operator,
+                        anuga.Boyd_pipe_operator,
+                        anuga.Weir_orifice_trapezoid_operator]:
+            self._check_structure_set(factory)
+
+
+    def test_vectorised_discharge_functions(self):
+
+        # Cover inlet and outlet control, submerged outlets and blockages
+        n = 400
+        rng = numpy.random.RandomState(17)
+
+        width = rng.uniform(0.5, 4.0, n)
+        depth = rng.uniform(0.5, 3.0, n)
+        blockage = rng.choice([0.0, 0.3, 0.95, 1.0], n)
+        barrels = rng.choice([1.0, 2.0], n)
+        z1 = rng.uniform(0.0, 2.0, n)
+        z2 = rng.uniform(0.0, 2.0, n)
+        length = rng.uniform(5.0, 50.0, n)
+        driving_energy = rng.uniform(0.02, 5.0, n)
+        delta_total_energy = driving_energy*rng.uniform(0.01, 2.0, n)
+        outlet_enquiry_depth = rng.uniform(0.0, 4.0, n)
+        sum_loss = rng.uniform(0.5, 2.0, n)
+        manning = rng.uniform(0.01, 0.03, n)
+
+        Q, v, d, a = boyd_box_discharges(width, depth, blockage, barrels, length,
+                                         driving_energy, delta_total_energy,
+                                         outlet_enquiry_depth, sum_loss, manning)
+        for k in range(n):
+            expected = boyd_box_function(width[k], depth[k], blockage[k], barrels[k],
+                                         width[k], length[k], driving_energy[k],
+                                         delta_total_energy[k], outlet_enquiry_depth[k],
+                                         sum_loss[k], manning[k])
+            assert numpy.allclose([Q[k], v[k], d[k], a[k]], expected[:4])
+
+        Q, v, d, a = boyd_pipe_discharges(width, blockage, barrels, length,
+                                          driving_energy, delta_total_energy,
+                                          outlet_enquiry_depth, sum_loss, manning)
+        for k in range(n):
+            expected = boyd_pipe_function(depth[k], width[k], blockage[k], barrels[k],
+                                          length[k], driving_energy[k],
+                                          delta_total_energy[k], outlet_enquiry_depth[k],
+                                          sum_loss[k], manning[k])
+            assert numpy.allclose([Q[k], v[k], d[k], a[k]], expected[:4])
+
+        Q, v, d, a = weir_orifice_trapezoid_discharges(width, depth, blockage, barrels,
+                                                       z1, z2, length,
+                                                       driving_energy, delta_total_energy,
+                                                       outlet_enquiry_depth, sum_loss, manning)
+        for k in range(n):
+            expected = weir_orifice_trapezoid_function(width[k], depth[k], blockage[k],
+                                                       barrels[k], z1[k], z2[k],
+                                                       width[k], length[k],
+                                                       driving_energy[k],
+                                                       delta_total_energy[k],
+                                                       outlet_enquiry_depth[k],
+                                                       sum_loss[k], manning[k])
+            assert numpy.allclose([Q[k], v[k], d[k], a[k]], expected[:4])
+
+
+    def test_structure_set_errors(self):
+
+        domain = self._create_domain()
+
+        box = Boyd_box_operator(domain, losses=1.5, width=1.5,
+                                end_points=[[20.0, 3.0], [40.0, 3.0]], enquiry_gap=1.0)
+        pipe = Boyd_pipe_operator(domain, losses=1.5, diameter=1.5,
+                                  end_points=[[20.0, 9.0], [40.0, 9.0]], enquiry_gap=1.0)
+        overlap = Boyd_box_operator(domain, losses=1.5, width=1.5,
+                                    end_points=[[20.0, 3.5], [40.0, 3.5]], enquiry_gap=1.0)
+
+        with self.assertRaises(Exception):
+            Structure_set_operator(domain, [box, pipe])
+
+        with self.assertRaises(Exception):
+            Structure_set_operator(domain, [box, overlap])
+
+        with self.assertRaises(Exception):
+            Structure_set_operator(domain, [])
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_structure_set_operator, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -295,6 +295,134 @@ class Test_eq(unittest.TestCase):
         #print 'hello',stage   
         assert num.allclose(stage,tmp,atol=1.e-3)
 
+    def _fortran_comparison(self, name, **kwargs):
+        """Vertical displacement from Okada_func and from the original
+        okada fortran script (listed in tests/data/fullokada_<name>.txt)
+        at the same points.
+        """
+
+        from os import sep
+        from anuga.abstract_2d_finite_volumes.mesh_factory \
+             import rectangular_cross
+        from anuga.abstract_2d_finite_volumes.quantity import Quantity
+        from anuga.utilities.system_tools import get_pathname_from_package
+
+        path = get_pathname_from_package('anuga.tsunami_source')
+        filename = path+sep+'tests'+sep+'data'+sep+'fullokada_%s.txt' % name
+
+        tmp = []
+        with open(filename) as fid:
+            for line in fid:
+                tmp.append(float(line.split('    ')[2]))
+
+        points, vertices, boundary = rectangular_cross(25, 25,
+                                                       len1=100000, len2=100000)
+        domain = Domain(points, vertices, boundary)
+
+        zrec0 = Quantity(domain)
+        zrec0.set_values(0.0)
+        zrec = zrec0.get_vertex_values(xy=True)
+
+        Ts = Okada_func(zrec=zrec, **kwargs)
+
+        tsunami = Quantity(domain)
+        tsunami.set_values(Ts)
+
+        interpolation_points = [[i*4000.0, j*4000.0]
+                                for i in range(6) for j in range(6)]
+        Z = tsunami.get_values(interpolation_points=interpolation_points,
+                               location='edges')
+
+        return -Z, num.array(tmp)
+
+    def test_Okada_func_point_source(self):
+
+        stage, tmp = self._fortran_comparison('SP', ns=1, NSMAX=1,
+                                              length=0.0, width=0.0,
+                                              dip=15.0, x0=7000.0, y0=10000.0,
+                                              strike=0.0, depth=15.0,
+                                              slip=10.0, rake=90.0)
+
+        assert num.allclose(stage, tmp, atol=1.e-4)
+
+    def test_Okada_func_multiple_sources(self):
+
+        # The fortran output is single precision
+        stage, tmp = self._fortran_comparison('MS', ns=2, NSMAX=2,
+                                              length=[10.0, 10.0],
+                                              width=[6.0, 6.0],
+                                              dip=[15.0, 15.0],
+                                              x0=[7000.0, 10000.0],
+                                              y0=[10000.0, 7000.0],
+                                              strike=[0.0, 0.0],
+                                              depth=[15.0, 15.0],
+                                              slip=[10.0, 10.0],
+                                              rake=[90.0, 90.0])
+
+        assert num.allclose(stage, tmp, atol=2.e-3)
+
+    def test_vectorised_dc3d(self):
+        from anuga.tsunami_source.tsunami_okada import dc3d, dc3d0
+
+        names = ['UX', 'UY', 'UZ', 'UXX', 'UYX', 'UZX',
+                 'UXY', 'UYY', 'UZY', 'UXZ', 'UYZ', 'UZZ']
+
+        Ts = Okada_func(ns=1, NSMAX=1, length=10.0, width=6.0, dip=15.0,
+                        x0=0.0, y0=0.0, strike=0.0, depth=15.0,
+                        slip=10.0, rake=90.0, zrec=[[0.0], [0.0], [0.0]])
+
+        rng = num.random.RandomState(13)
+        n = 40
+        X = rng.uniform(-30.0, 30.0, n)
+        Y = rng.uniform(-30.0, 30.0, n)
+        Z = rng.choice([0.0, -0.5, -3.0], n)
+        # Points on the lines through the fault edges
+        X[:5] = 5.0
+        Y[5:10] = 3.0
+
+        for dip in [15.0, 90.0, 120.0]:
+            for disl in [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.3, -0.7, 0.2)]:
+                U, singular = dc3d(0.5, X, Y, Z, 15.0, dip,
+                                   -5.0, 5.0, -3.0, 3.0, *disl)
+                U0, singular0 = dc3d0(0.5, X, Y, Z, 15.0, dip, *(disl + (0.4,)))
+
+                assert U.shape == (12, n)
+                assert not num.any(singular)
+                assert not num.any(singular0)
+
+                for k in range(n):
+                    Ts.DC3D(0.5, X[k], Y[k], Z[k], 15.0, dip,
+                            -5.0, 5.0, -3.0, 3.0, *disl)
+                    expected = [float(num.squeeze(getattr(Ts, a))) for a in names]
+                    assert num.allclose(U[:, k], expected, rtol=1.e-10, atol=1.e-14)
+
+                    Ts.DC3D0(0.5, X[k], Y[k], Z[k], 15.0, dip, *(disl + (0.4,)))
+                    expected = [float(num.squeeze(getattr(Ts, a))) for a in names]
+                    assert num.allclose(U0[:, k], expected, rtol=1.e-10, atol=1.e-14)
+
+        # Only some components
+        U, singular = dc3d(0.5, X, Y, Z, 15.0, 30.0, -5.0, 5.0, -3.0, 3.0,
+                           0.3, -0.7, 0.2)
+        U0, singular0 = dc3d0(0.5, X, Y, Z, 15.0, 30.0, 0.3, -0.7, 0.2, 0.4)
+        for components in [[2], [0, 4], [11]]:
+            others = [I for I in range(12) if I not in components]
+
+            V, _ = dc3d(0.5, X, Y, Z, 15.0, 30.0, -5.0, 5.0, -3.0, 3.0,
+                        0.3, -0.7, 0.2, components=components)
+            assert num.allclose(V[components], U[components], rtol=1.e-12)
+            assert num.all(V[others] == 0.0)
+
+            V, _ = dc3d0(0.5, X, Y, Z, 15.0, 30.0, 0.3, -0.7, 0.2, 0.4,
+                         components=components)
+            assert num.allclose(V[components], U0[components], rtol=1.e-12)
+            assert num.all(V[others] == 0.0)
+
+        # Receiver on the fault edge
+        U, singular = dc3d(0.5, [0.0, 1.0], [0.0, 1.0], 0.0, 0.0, 90.0,
+                           -5.0, 5.0, -3.0, 0.0, 1.0, 0.0, 0.0)
+        assert num.all(singular == [True, False])
+        assert num.all(U[:, 0] == 0.0)
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
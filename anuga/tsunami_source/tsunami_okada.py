@@ -130,208 +130,136 @@ class Okada_func(object):
         If called as a function, this object returns z values representing
         the initial 3D distribution of water heights at the points (x,y,z)
         produced by a submarine mass failure.
+
+        All points and all sub faults are evaluated in array form (see
+        dc3d and dc3d0), in blocks of points to limit memory use.
         """
 
-        from math import sin, cos, radians, exp, cosh
+        x = num.array(x, float).reshape(-1)
+        y = num.array(y, float).reshape(-1)
+
         # ensure vectors x and y have the same length
         N = len(x)
         assert N == len(y)
-        # nrec=N*N
-        depth = self.depth
-        dip = self.dip
-        length = self.length
-        width = self.width
-        y0 = self.x0
-        x0 = self.y0
-        strike = self.strike
-        dip = self.dip
-        rake = self.rake
-        dislocation = self.slip
+
         ns = self.ns
+
+        if N == 0:
+            return num.zeros(0, float)
+
+        # Depth (km) of the receivers, taken from the first vertex of zrec
+        # which lies on the x and y coordinates
         zrec = self.zrec
-        # initialization
-        disp0 = num.zeros(3, float)
-        strain0 = num.zeros(6, float)
-        tilt0 = num.zeros(2, float)
-
-        dislocations = num.zeros(ns, float)
-        depths = num.zeros(ns, float)
-        strikes = num.zeros(ns, float)
-        lengths = num.zeros(ns, float)
-        slips = num.zeros(ns, float)
-        rakes = num.zeros(ns, float)
-        widths = num.zeros(ns, float)
-        dips = num.zeros(ns, float)
+        found = num.isin(zrec[0], x) & num.isin(zrec[1], y)
+        if not num.any(found):
+            msg = 'None of the points lie on the vertices of zrec'
+            raise Exception(msg)
+        Z = 0.001*zrec[2][num.argmax(found)]
+
+        # Parameters of each sub fault. Note that x is attributed to north
+        # and y to east to match the OKADA axis
         xs = num.zeros(ns, float)
         ys = num.zeros(ns, float)
+        xs[:] = self.y0
+        ys[:] = self.x0
 
-        strain = num.zeros((N, 6), float)
-        disp = num.zeros((N, 3), float)
-        tilt = num.zeros((N, 2), float)
-
-        z = []
-
-        dislocations[:] = dislocation
-        depths[:] = depth
-        strikes[:] = strike
-        lengths[:] = length
-        rakes[:] = rake
-        widths[:] = width
-        dips[:] = dip
-        xs[:] = x0
-        ys[:] = y0
-        
-
-        # double Gaussian calculation assumes water displacement is oriented
-        # E-W, so, for displacement at some angle alpha clockwise from the E-W
-        # direction, rotate (x,y) coordinates anti-clockwise by alpha
-        ALPHA = 0.5
-        POT3 = 0.0
-        POT4 = 0.0
-        DISL3 = 0.0
-        AL1 = 0.0
-        AW2 = 0.0
-        # rad=1.745329252e-2
-        # zrec = domain.get_quantity('elevation').get_values(interpolation_points=[[x, y]])   #get Zrec... has to be constant!!!
-        #zrec=zreci.get_values(interpolation_points=[[x, y]])
-        # zrec=0
-        # Z=-zrec
-        eps = 1.0e-6
+        sources = {}
+        for name, value in [('dislocation', self.slip), ('depth', self.depth),
+                            ('strike', self.strike), ('length', self.length),
+                            ('rake', self.rake), ('width', self.width),
+                            ('dip', self.dip)]:
+            sources[name] = num.zeros(ns, float)
+            sources[name][:] = value
 
-#
-        for irec in range(0, N):
-            xrec = y
-            yrec = x
-            for i in range(0, len(zrec[0])):
-                if (num.any(zrec[0][i] == yrec) and num.any(zrec[1][i] == xrec)):
-                    Z = zrec[2][i]
-                    Z = 0.001*Z
-                    break
-                else:
-                    continue
-            # zrec=zreci.get_values(interpolation_points=[[xrec[irec],yrec[irec]]],location='edges')
-
-            for ist in range(0, ns):
-                #st = radians(strikes[ist])
-                st = radians(strikes[ist])
-                csst = cos(st)
-                ssst = sin(st)
-                cs2st = cos(2.0*st)
-                ss2st = sin(2.0*st)
-#
-                #di = radians(dips[ist])
-                di = radians(dips[ist])
-                csdi = cos(di)
-                ssdi = sin(di)
-#
-                #ra= radians(rakes[ist])
-                ra = radians(rakes[ist])
-                csra = cos(ra)
-                ssra = sin(ra)
-                # transform from Aki's to Okada's system
-                # first attribute x to north and y to east to match OKADA axis
-
-                # X=0.001*(x[irec]-xs[ist])*ssst+0.001*(y[irec]-ys[ist])*csst
-                # Y=-0.001*(x[irec]-xs[ist])*csst+0.001*(y[irec]-ys[ist])*ssst
-
-                X = 0.001*((xrec[irec]-xs[ist])*csst+(yrec[irec]-ys[ist])*ssst)
-                Y = 0.001*((xrec[irec]-xs[ist])*ssst-(yrec[irec]-ys[ist])*csst)
-                DEPTH = depths[ist]
-                DIP = dips[ist]
-                if lengths[ist] == 0 and widths[ist] == 0:
-                    #
-                    #	      point source
-                    #
-                    POT1 = dislocations[ist]*csra
-                    POT2 = dislocations[ist]*ssra
-                    IRET = 1
-                    self.DC3D0(ALPHA, X, Y, Z, DEPTH, DIP,
-                               POT1, POT2, POT3, POT4)
-                    UX = self.UX
-                    UY = self.UY
-                    UZ = self.UZ
-                    UXX = self.UXX
-                    UYX = self.UYX
-                    UZX = self.UZX
-                    UXY = self.UXY
-                    UYY = self.UYY
-                    UZY = self.UZY
-                    UXZ = self.UXZ
-                    UYZ = self.UYZ
-                    UZZ = self.UZZ
-                    IRET = self.IRET
-                    if IRET == 1:
-                        log.critical('There is a problem in Okada subroutine!')
-                        break
-                else:
-                    #	        finite source
-                    AL2 = lengths[ist]
-                    AW1 = -widths[ist]
-                    DISL1 = dislocations[ist]*csra
-                    DISL2 = dislocations[ist]*ssra
-                    if lengths[ist] == 0:
-                        AL2 = widths[ist]*eps
-                        DISL1 = DISL1/ AL2
-                        DISL2 = DISL2/ AL2
-                    elif widths[ist] == 0.0:
-                        AW1 = -lengths[ist]*eps
-                        DISL1 = DISL1/ (-AW1)
-                        DISL2 = DISL2/ (-AW1)
-                    IRET = 1
-                    self.DC3D(ALPHA, X, Y, Z, DEPTH, DIP, AL1, AL2, AW1, AW2,
-                              DISL1, DISL2, DISL3)
-                    UX = self.UX
-                    UY = self.UY
-                    UZ = self.UZ
-                    UXX = self.UXX
-                    UYX = self.UYX
-                    UZX = self.UZX
-                    UXY = self.UXY
-                    UYY = self.UYY
-                    UZY = self.UZY
-                    UXZ = self.UXZ
-                    UYZ = self.UYZ
-                    UZZ = self.UZZ
-                    IRET = self.IRET
-                    # if X==-6 and Y==-1:
-                    # print UY
-                    # print 'hello'
-                    if IRET == 1:
-                        print(' There is a problem in Okada subroutine!')
-                        break
-#
-#	    transform from Okada's to Aki's system
-#
-                disp0[0] = UX*csst+UY*ssst
-                disp0[1] = UX*ssst-UY*csst
-                disp0[2] = -UZ
+        z = num.zeros(N, float)
+
+        block_size = max(1, okada_block_size//ns)
+        for start in range(0, N, block_size):
+            block = slice(start, start + block_size)
+            z[block] = self._vertical_displacement(y[block], x[block], Z,
+                                                   xs, ys, sources)
 
-                tilt0[0] = -(UXZ*csst+UYZ*ssst)
-                tilt0[1] = -(UXZ*ssst-UYZ*csst)
-#
-                strain0[0] = (UXX*csst*csst+UYY*ssst*ssst
-                              + 0.5*(UXY+UYX)*ss2st)
-                strain0[1] = (UXX*ssst*ssst+UYY*csst*csst
-                              - 0.5*(UXY+UYX)*ss2st)
-                strain0[2] = (UZZ)
-                strain0[3] = (0.5*(UXX-UYY)*ss2st
-                              - 0.5*(UXY+UYX)*cs2st)
-                strain0[4] = (-0.5*(UZX+UXZ)*ssst
-                              + 0.5*(UYZ+UZY)*csst)
-                strain0[5] = (-0.5*(UZX+UXZ)*csst
-                              - 0.5*(UYZ+UZY)*ssst)
-                for j in range(0, 3):
-                    disp[irec][j] = disp[irec][j] + disp0[j]
-                for j in range(0, 2):
-                    tilt[irec][j] = tilt[irec][j] + tilt0[j]
-                for j in range(0, 6):
-                    strain[irec][j] = strain[irec][j] + strain0[j]
-            z.append(-disp[irec][2])
         return z
 
-        # works on nautilus when have already done
-        # f2py -c okada.f -m okada
-        #z1 = okada(xr,yr,depth,length,width,dip,rake,slip)
+    def _vertical_displacement(self, xrec, yrec, Z, xs, ys, sources):
+        """Sum over the sub faults of the vertical displacement at the
+        receivers (xrec, yrec), in Aki's system.
+        """
+
+        ALPHA = 0.5
+        eps = 1.0e-6
+
+        strike = num.radians(sources['strike'])
+        csst = num.cos(strike)
+        ssst = num.sin(strike)
+
+        rake = num.radians(sources['rake'])
+        csra = num.cos(rake)
+        ssra = num.sin(rake)
+
+        lengths = sources['length']
+        widths = sources['width']
+        dislocations = sources['dislocation']
+
+        # transform from Aki's to Okada's system, (receivers, sub faults)
+        dx = xrec[:, None] - xs[None, :]
+        dy = yrec[:, None] - ys[None, :]
+        X = 0.001*(dx*csst + dy*ssst)
+        Y = 0.001*(dx*ssst - dy*csst)
+
+        shape = X.shape
+        DEPTH = num.broadcast_to(sources['depth'], shape)
+        DIP = num.broadcast_to(sources['dip'], shape)
+
+        UZ = num.zeros(shape, float)
+        singular = num.zeros(shape, bool)
+
+        # point sources
+        point = (lengths == 0) & (widths == 0)
+        if num.any(point):
+            POT1 = dislocations*csra
+            POT2 = dislocations*ssra
+            U, iret = dc3d0(ALPHA, X[:, point], Y[:, point], Z,
+                            DEPTH[:, point], DIP[:, point],
+                            POT1[point], POT2[point], 0.0, 0.0,
+                            components=[2])
+            UZ[:, point] = U[2]
+            singular[:, point] = iret
+
+        # finite sources
+        finite = ~point
+        if num.any(finite):
+            AL2 = lengths.copy()
+            AW1 = -widths
+            DISL1 = dislocations*csra
+            DISL2 = dislocations*ssra
+
+            no_length = lengths == 0
+            AL2[no_length] = widths[no_length]*eps
+            DISL1[no_length] /= AL2[no_length]
+            DISL2[no_length] /= AL2[no_length]
+
+            no_width = (widths == 0) & ~no_length
+            AW1[no_width] = -lengths[no_width]*eps
+            DISL1[no_width] /= -AW1[no_width]
+            DISL2[no_width] /= -AW1[no_width]
+
+            U, iret = dc3d(ALPHA, X[:, finite], Y[:, finite], Z,
+                           DEPTH[:, finite], DIP[:, finite],
+                           0.0, AL2[finite], AW1[finite], 0.0,
+                           DISL1[finite], DISL2[finite], 0.0,
+                           components=[2])
+            UZ[:, finite] = U[2]
+            singular[:, finite] = iret
+
+        # A singular sub fault stops the summation for that receiver
+        if num.any(singular):
+            log.critical('There is a problem in Okada subroutine!')
+            UZ[num.logical_or.accumulate(singular, axis=1)] = 0.0
+
+        # The vertical displacement in Aki's system is -UZ, and z is
+        # minus the displacement
+        return UZ.sum(axis=1)
 
     def DC3D0(self, ALPHA, X, Y, Z, DEPTH, DIP, POT1, POT2, POT3, POT4):
         """********************************************************************
@@ -1909,3 +1837,945 @@ class Okada_func(object):
         self.HY = HY
         self.HZ = HZ
         self.ET2 = ET2
+
+
+#
+# Array versions of DC3D and DC3D0 (and of the UA/UB/UC helpers) of
+# Okada_func. The receiver coordinates and the source parameters can be
+# arrays of any shape which broadcast together (i.e. receivers by sub
+# faults). The displacements and their derivatives are returned as an
+# array U of shape (12,) + shape, ordered as
+# UX, UY, UZ, UXX, UYX, UZX, UXY, UYY, UZY, UXZ, UYZ, UZZ,
+# together with a boolean array which is True where the receiver is at
+# a singular point (where U is zero).
+#
+
+# Number of (receiver, sub fault) pairs evaluated at once by Okada_func
+okada_block_size = 2**14
+
+_PI2 = 6.283185307179586
+_EPS = 1.0e-6
+
+
+class _Constants(object):
+    """Holds the values shared between the Okada subroutines (the
+    COMMON blocks of the Fortran code).
+    """
+
+    pass
+
+
+def _dccon0(ALPHA, DIP):
+    """Medium constants and fault-dip constants. If cos(dip) is
+    sufficiently small it is set to zero.
+    """
+
+    c = _Constants()
+
+    c.ALP1 = (1.0 - ALPHA)/2.0
+    c.ALP2 = ALPHA/2.0
+    c.ALP3 = (1.0 - ALPHA)/ALPHA
+    c.ALP4 = 1.0 - ALPHA
+    c.ALP5 = ALPHA
+
+    SD = num.sin(num.radians(DIP))
+    CD = num.cos(num.radians(DIP))
+    vertical = num.abs(CD) < _EPS
+    CD = num.where(vertical, 0.0, CD)
+    SD = num.where(vertical, num.sign(SD), SD)
+
+    c.SD = SD
+    c.CD = CD
+    c.SDSD = SD*SD
+    c.CDCD = CD*CD
+    c.SDCD = SD*CD
+    c.S2D = 2.0*c.SDCD
+    c.C2D = c.CDCD - c.SDSD
+
+    return c
+
+
+def _small_to_zero(value):
+
+    return num.where(num.abs(value) < _EPS, 0.0, value)
+
+
+def _dccon1(c, X, Y, D):
+    """Station geometry constants for a point source.
+    """
+
+    X = _small_to_zero(X)
+    Y = _small_to_zero(Y)
+    D = _small_to_zero(D)
+
+    SD = c.SD
+    CD = c.CD
+
+    g = _Constants()
+    g.X = X
+    g.Y = Y
+    g.D = D
+    g.P = Y*CD + D*SD
+    g.Q = Y*SD - D*CD
+    g.S = g.P*SD + g.Q*CD
+    g.T = g.P*CD - g.Q*SD
+    g.XY = X*Y
+    g.X2 = X*X
+    g.Y2 = Y*Y
+    g.D2 = D*D
+    g.R2 = g.X2 + g.Y2 + g.D2
+    g.R = num.sqrt(g.R2)
+    g.R3 = g.R*g.R2
+    g.R5 = g.R3*g.R2
+    g.R7 = g.R5*g.R2
+
+    g.A3 = 1.0 - 3.0*g.X2/g.R2
+    g.A5 = 1.0 - 5.0*g.X2/g.R2
+    g.B3 = 1.0 - 3.0*g.Y2/g.R2
+    g.C3 = 1.0 - 3.0*g.D2/g.R2
+
+    g.QR = 3.0*g.Q/g.R5
+    g.QRX = 5.0*g.QR*X/g.R2
+
+    g.UY = SD - 5.0*Y*g.Q/g.R2
+    g.UZ = CD + 5.0*D*g.Q/g.R2
+    g.VY = g.S - 5.0*Y*g.P*g.Q/g.R2
+    g.VZ = g.T + 5.0*D*g.P*g.Q/g.R2
+    g.WY = g.UY + SD
+    g.WZ = g.UZ + CD
+
+    return g
+
+
+def _add_contributions(U, potencies, contributions, components):
+    """Add potency/2pi times each contribution to the given components
+    of U, skipping zero potencies as the Fortran code does. Each
+    contribution is a list of 12 functions, so that only the requested
+    components are evaluated.
+    """
+
+    for POT, DU in zip(potencies, contributions):
+        nonzero = num.asarray(POT, float) != 0.0
+        if not num.any(nonzero):
+            continue
+        factor = POT/_PI2
+        if num.all(nonzero):
+            for I in components:
+                U[I] += factor*DU[I]()
+        else:
+            for I in components:
+                U[I] += num.where(nonzero, factor*DU[I](), 0.0)
+
+
+def _ua0(c, g, POT1, POT2, POT3, POT4, components):
+    """Displacement and strain at depth (part A) due to a buried point
+    source in a semi-infinite medium.
+    """
+
+    ALP1, ALP2 = c.ALP1, c.ALP2
+    SD, CD, S2D, C2D = c.SD, c.CD, c.S2D, c.C2D
+    X, Y, D = g.X, g.Y, g.D
+    P, Q, S, T = g.P, g.Q, g.S, g.T
+    XY, X2 = g.XY, g.X2
+    R3, R5, QR, QRX = g.R3, g.R5, g.QR, g.QRX
+    A3, A5, B3, C3 = g.A3, g.A5, g.B3, g.C3
+    UY, VY, WY, UZ, VZ, WZ = g.UY, g.VY, g.WY, g.UZ, g.VZ, g.WZ
+
+    U = num.zeros((12,) + num.shape(X), float)
+
+    # strike-slip, dip-slip, tensile-fault and inflate source contributions
+    contributions = []
+
+    contributions.append([
+        lambda: ALP1*Q/R3 + ALP2*X2*QR,
+        lambda: ALP1*X/R3*SD + ALP2*XY*QR,
+        lambda: -ALP1*X/R3*CD + ALP2*X*D*QR,
+        lambda: X*QR*(-ALP1 + ALP2*(1.0 + A5)),
+        lambda: ALP1*A3/R3*SD + ALP2*Y*QR*A5,
+        lambda: -ALP1*A3/R3*CD + ALP2*D*QR*A5,
+        lambda: ALP1*(SD/R3 - Y*QR) + ALP2*3.0*X2/R5*UY,
+        lambda: 3.0*X/R5*(-ALP1*Y*SD + ALP2*(Y*UY + Q)),
+        lambda: 3.0*X/R5*(ALP1*Y*CD + ALP2*D*UY),
+        lambda: ALP1*(CD/R3 + D*QR) + ALP2*3.0*X2/R5*UZ,
+        lambda: 3.0*X/R5*(ALP1*D*SD + ALP2*Y*UZ),
+        lambda: 3.0*X/R5*(-ALP1*D*CD + ALP2*(D*UZ - Q))])
+
+    contributions.append([
+        lambda: ALP2*X*P*QR,
+        lambda: ALP1*S/R3 + ALP2*Y*P*QR,
+        lambda: -ALP1*T/R3 + ALP2*D*P*QR,
+        lambda: ALP2*P*QR*A5,
+        lambda: -ALP1*3.0*X*S/R5 - ALP2*Y*P*QRX,
+        lambda: ALP1*3.0*X*T/R5 - ALP2*D*P*QRX,
+        lambda: ALP2*3.0*X/R5*VY,
+        lambda: ALP1*(S2D/R3 - 3.0*Y*S/R5) + ALP2*(3.0*Y/R5*VY + P*QR),
+        lambda: -ALP1*(C2D/R3 - 3.0*Y*T/R5) + ALP2*3.0*D/R5*VY,
+        lambda: ALP2*3.0*X/R5*VZ,
+        lambda: ALP1*(C2D/R3 + 3.0*D*S/R5) + ALP2*3.0*Y/R5*VZ,
+        lambda: ALP1*(S2D/R3 - 3.0*D*T/R5) + ALP2*(3.0*D/R5*VZ - P*QR)])
+
+    contributions.append([
+        lambda: ALP1*X/R3 - ALP2*X*Q*QR,
+        lambda: ALP1*T/R3 - ALP2*Y*Q*QR,
+        lambda: ALP1*S/R3 - ALP2*D*Q*QR,
+        lambda: ALP1*A3/R3 - ALP2*Q*QR*A5,
+        lambda: -ALP1*3.0*X*T/R5 + ALP2*Y*Q*QRX,
+        lambda: -ALP1*3.0*X*S/R5 + ALP2*D*Q*QRX,
+        lambda: -ALP1*3.0*XY/R5 - ALP2*X*QR*WY,
+        lambda: ALP1*(C2D/R3 - 3.0*Y*T/R5) - ALP2*(Y*WY + Q)*QR,
+        lambda: ALP1*(S2D/R3 - 3.0*Y*S/R5) - ALP2*D*QR*WY,
+        lambda: ALP1*3.0*X*D/R5 - ALP2*X*QR*WZ,
+        lambda: -ALP1*(S2D/R3 - 3.0*D*T/R5) - ALP2*Y*QR*WZ,
+        lambda: ALP1*(C2D/R3 + 3.0*D*S/R5) - ALP2*(D*WZ - Q)*QR])
+
+    def inflate():
+        DU4 = lambda: ALP1*3.0*XY/R5
+        DU5 = lambda: ALP1*3.0*X*D/R5
+        DU8 = lambda: ALP1*3.0*Y*D/R5
+        return [
+            lambda: -ALP1*X/R3,
+            lambda: -ALP1*Y/R3,
+            lambda: -ALP1*D/R3,
+            lambda: -ALP1*A3/R3,
+            DU4,
+            DU5,
+            DU4,
+            lambda: -ALP1*B3/R3,
+            DU8,
+            lambda: -DU5(),
+            lambda: -DU8(),
+            lambda: ALP1*C3/R3]
+    contributions.append(inflate())
+
+    _add_contributions(U, [POT1, POT2, POT3, POT4], contributions, components)
+
+    return U
+
+
+def _ub0(c, g, Z, POT1, POT2, POT3, POT4, components):
+    """Displacement and strain at depth (part B) due to a buried point
+    source in a semi-infinite medium.
+    """
+
+    ALP3 = c.ALP3
+    SD, SDSD, SDCD = c.SD, c.SDSD, c.SDCD
+    X, Y, D = g.X, g.Y, g.D
+    P, Q = g.P, g.Q
+    XY, X2, Y2, D2 = g.XY, g.X2, g.Y2, g.D2
+    R, R2, R3, R5, QR, QRX = g.R, g.R2, g.R3, g.R5, g.QR, g.QRX
+    A3, A5, B3, C3 = g.A3, g.A5, g.B3, g.C3
+    UY, VY, WY, UZ, VZ, WZ = g.UY, g.VY, g.WY, g.UZ, g.VZ, g.WZ
+
+    C = D + Z
+    RD = R + D
+    D12 = 1.0/(R*RD*RD)
+    D32 = D12*(2.0*R + D)/R2
+    D33 = D12*(3.0*R + D)/(R2*RD)
+    D53 = D12*(8.0*R2 + 9.0*R*D + 3.0*D2)/(R2*R2*RD)
+    D54 = D12*(5.0*R2 + 4.0*R*D + D2)/R3*D12
+
+    FI1 = Y*(D12 - X2*D33)
+    FI2 = X*(D12 - Y2*D33)
+    FI3 = X/R3 - FI2
+    FI4 = -XY*D32
+    FI5 = 1.0/(R*RD) - X2*D32
+    FJ1 = -3.0*XY*(D33 - X2*D54)
+    FJ2 = 1.0/R3 - 3.0*D12 + 3.0*X2*Y2*D54
+    FJ3 = A3/R3 - FJ2
+    FJ4 = -3.0*XY/R5 - FJ1
+    FK1 = -Y*(D32 - X2*D53)
+    FK2 = -X*(D32 - Y2*D53)
+    FK3 = -3.0*X*D/R5 - FK2
+
+    U = num.zeros((12,) + num.shape(X), float)
+
+    contributions = []
+
+    contributions.append([
+        lambda: -X2*QR - ALP3*FI1*SD,
+        lambda: -XY*QR - ALP3*FI2*SD,
+        lambda: -C*X*QR - ALP3*FI4*SD,
+        lambda: -X*QR*(1.0 + A5) - ALP3*FJ1*SD,
+        lambda: -Y*QR*A5 - ALP3*FJ2*SD,
+        lambda: -C*QR*A5 - ALP3*FK1*SD,
+        lambda: -3.0*X2/R5*UY - ALP3*FJ2*SD,
+        lambda: -3.0*XY/R5*UY - X*QR - ALP3*FJ4*SD,
+        lambda: -3.0*C*X/R5*UY - ALP3*FK2*SD,
+        lambda: -3.0*X2/R5*UZ + ALP3*FK1*SD,
+        lambda: -3.0*XY/R5*UZ + ALP3*FK2*SD,
+        lambda: 3.0*X/R5*(-C*UZ + ALP3*Y*SD)])
+
+    contributions.append([
+        lambda: -X*P*QR + ALP3*FI3*SDCD,
+        lambda: -Y*P*QR + ALP3*FI1*SDCD,
+        lambda: -C*P*QR + ALP3*FI5*SDCD,
+        lambda: -P*QR*A5 + ALP3*FJ3*SDCD,
+        lambda: Y*P*QRX + ALP3*FJ1*SDCD,
+        lambda: C*P*QRX + ALP3*FK3*SDCD,
+        lambda: -3.0*X/R5*VY + ALP3*FJ1*SDCD,
+        lambda: -3.0*Y/R5*VY - P*QR + ALP3*FJ2*SDCD,
+        lambda: -3.0*C/R5*VY + ALP3*FK1*SDCD,
+        lambda: -3.0*X/R5*VZ - ALP3*FK3*SDCD,
+        lambda: -3.0*Y/R5*VZ - ALP3*FK1*SDCD,
+        lambda: -3.0*C/R5*VZ + ALP3*A3/R3*SDCD])
+
+    contributions.append([
+        lambda: X*Q*QR - ALP3*FI3*SDSD,
+        lambda: Y*Q*QR - ALP3*FI1*SDSD,
+        lambda: C*Q*QR - ALP3*FI5*SDSD,
+        lambda: Q*QR*A5 - ALP3*FJ3*SDSD,
+        lambda: -Y*Q*QRX - ALP3*FJ1*SDSD,
+        lambda: -C*Q*QRX - ALP3*FK3*SDSD,
+        lambda: X*QR*WY - ALP3*FJ1*SDSD,
+        lambda: QR*(Y*WY + Q) - ALP3*FJ2*SDSD,
+        lambda: C*QR*WY - ALP3*FK1*SDSD,
+        lambda: X*QR*WZ + ALP3*FK3*SDSD,
+        lambda: Y*QR*WZ + ALP3*FK1*SDSD,
+        lambda: C*QR*WZ - ALP3*A3/R3*SDSD])
+
+    def inflate():
+        DU4 = lambda: -ALP3*3.0*XY/R5
+        DU5 = lambda: -ALP3*3.0*X*D/R5
+        DU8 = lambda: -ALP3*3.0*Y*D/R5
+        return [
+            lambda: ALP3*X/R3,
+            lambda: ALP3*Y/R3,
+            lambda: ALP3*D/R3,
+            lambda: ALP3*A3/R3,
+            DU4,
+            DU5,
+            DU4,
+            lambda: ALP3*B3/R3,
+            DU8,
+            lambda: -DU5(),
+            lambda: -DU8(),
+            lambda: -ALP3*C3/R3]
+    contributions.append(inflate())
+
+    _add_contributions(U, [POT1, POT2, POT3, POT4], contributions, components)
+
+    return U
+
+
+def _uc0(c, g, Z, POT1, POT2, POT3, POT4, components):
+    """Displacement and strain at depth (part C) due to a buried point
+    source in a semi-infinite medium.
+    """
+
+    ALP4, ALP5 = c.ALP4, c.ALP5
+    SD, CD, SDSD, SDCD, S2D, C2D = c.SD, c.CD, c.SDSD, c.SDCD, c.S2D, c.C2D
+    X, Y, D = g.X, g.Y, g.D
+    P, Q, S, T = g.P, g.Q, g.S, g.T
+    XY, X2, Y2, D2 = g.XY, g.X2, g.Y2, g.D2
+    R2, R3, R5, QR, QRX = g.R2, g.R3, g.R5, g.QR, g.QRX
+    A3, A5, C3 = g.A3, g.A5, g.C3
+
+    C = D + Z
+    Q2 = Q*Q
+    R7 = R5*R2
+    A7 = 1.0 - 7.0*X2/R2
+    B5 = 1.0 - 5.0*Y2/R2
+    B7 = 1.0 - 7.0*Y2/R2
+    C5 = 1.0 - 5.0*D2/R2
+    C7 = 1.0 - 7.0*D2/R2
+    D7 = 2.0 - 7.0*Q2/R2
+    QR5 = 5.0*Q/R2
+    QR7 = 7.0*Q/R2
+    DR5 = 5.0*D/R2
+
+    U = num.zeros((12,) + num.shape(X), float)
+
+    contributions = []
+
+    def strike_slip():
+        DU4 = lambda: 3.0/R5*(ALP4*Y*A5*CD + ALP5*C*(A5*SD - Y*QR5*A7))
+        return [
+            lambda: -ALP4*A3/R3*CD + ALP5*C*QR*A5,
+            lambda: 3.0*X/R5*(ALP4*Y*CD + ALP5*C*(SD - Y*QR5)),
+            lambda: 3.0*X/R5*(-ALP4*Y*SD + ALP5*C*(CD + D*QR5)),
+            lambda: ALP4*3.0*X/R5*(2.0 + A5)*CD - ALP5*C*QRX*(2.0 + A7),
+            DU4,
+            lambda: 3.0/R5*(-ALP4*Y*A5*SD + ALP5*C*(A5*CD + D*QR5*A7)),
+            DU4,
+            lambda: 3.0*X/R5*(ALP4*B5*CD - ALP5*5.0*C/R2*(2.0*Y*SD + Q*B7)),
+            lambda: 3.0*X/R5*(-ALP4*B5*SD + ALP5*5.0*C/R2*(D*B7*SD - Y*C7*CD)),
+            lambda: 3.0/R5*(-ALP4*D*A5*CD + ALP5*C*(A5*CD + D*QR5*A7)),
+            lambda: 15.0*X/R7*(ALP4*Y*D*CD + ALP5*C*(D*B7*SD - Y*C7*CD)),
+            lambda: 15.0*X/R7*(-ALP4*Y*D*SD + ALP5*C*(2.0*D*CD - Q*C7))]
+    contributions.append(strike_slip())
+
+    def dip_slip():
+        DU4 = lambda: 3.0*X/R5*(ALP4*(C2D - 5.0*Y*T/R2) - ALP5*5.0*C/R2*(S - Y*P*QR7))
+        return [
+            lambda: ALP4*3.0*X*T/R5 - ALP5*C*P*QRX,
+            lambda: -ALP4/R3*(C2D - 3.0*Y*T/R2) + ALP5*3.0*C/R5*(S - Y*P*QR5),
+            lambda: -ALP4*A3/R3*SDCD + ALP5*3.0*C/R5*(T + D*P*QR5),
+            lambda: ALP4*3.0*T/R5*A5 - ALP5*5.0*C*P*QR/R2*A7,
+            DU4,
+            lambda: 3.0*X/R5*(ALP4*(2.0 + A5)*SDCD - ALP5*5.0*C/R2*(T + D*P*QR7)),
+            DU4,
+            lambda: 3.0/R5*(ALP4*(2.0*Y*C2D + T*B5)
+                            + ALP5*C*(S2D - 10.0*Y*S/R2 - P*QR5*B7)),
+            lambda: 3.0/R5*(ALP4*Y*A5*SDCD - ALP5*C*((3.0 + A5)*C2D + Y*P*DR5*QR7)),
+            lambda: 3.0*X/R5*(-ALP4*(S2D - T*DR5) - ALP5*5.0*C/R2*(T + D*P*QR7)),
+            lambda: 3.0/R5*(-ALP4*(D*B5*C2D + Y*C5*S2D)
+                            - ALP5*C*((3.0 + A5)*C2D + Y*P*DR5*QR7)),
+            lambda: 3.0/R5*(-ALP4*D*A5*SDCD - ALP5*C*(S2D - 10.0*D*T/R2 + P*QR5*C7))]
+    contributions.append(dip_slip())
+
+    def tensile():
+        DU4 = lambda: 3.0*X/R5*(-ALP4*(S2D - 5.0*Y*S/R2)
+                                - ALP5*5.0/R2*(C*(T - Y + Y*Q*QR7) - Y*Z))
+        return [
+            lambda: 3.0*X/R5*(-ALP4*S + ALP5*(C*Q*QR5 - Z)),
+            lambda: ALP4/R3*(S2D - 3.0*Y*S/R2) + ALP5*3.0/R5*(C*(T - Y + Y*Q*QR5) - Y*Z),
+            lambda: -ALP4/R3*(1.0 - A3*SDSD) - ALP5*3.0/R5*(C*(S - D + D*Q*QR5) - D*Z),
+            lambda: -ALP4*3.0*S/R5*A5 + ALP5*(C*QR*QR5*A7 - 3.0*Z/R5*A5),
+            DU4,
+            lambda: 3.0*X/R5*(ALP4*(1.0 - (2.0 + A5)*SDSD)
+                              + ALP5*5.0/R2*(C*(S - D + D*Q*QR7) - D*Z)),
+            DU4,
+            lambda: 3.0/R5*(-ALP4*(2.0*Y*S2D + S*B5)
+                            - ALP5*(C*(2.0*SDSD + 10.0*Y*(T - Y)/R2 - Q*QR5*B7) + Z*B5)),
+            lambda: 3.0/R5*(ALP4*Y*(1.0 - A5*SDSD)
+                            + ALP5*(C*(3.0 + A5)*S2D - Y*DR5*(C*D7 + Z))),
+            lambda: 3.0*X/R5*(-ALP4*(C2D + S*DR5)
+                              + ALP5*(5.0*C/R2*(S - D + D*Q*QR7) - 1.0 - Z*DR5)),
+            lambda: 3.0/R5*(ALP4*(D*B5*S2D - Y*C5*C2D)
+                            + ALP5*(C*((3.0 + A5)*S2D - Y*DR5*D7) - Y*(1.0 + Z*DR5))),
+            lambda: 3.0/R5*(-ALP4*D*(1.0 - A5*SDSD)
+                            - ALP5*(C*(C2D + 10.0*D*(S - D)/R2 - Q*QR5*C7) + Z*(1.0 + C5)))]
+    contributions.append(tensile())
+
+    def inflate():
+        DU4 = lambda: -ALP4*15.0*XY*D/R7
+        DU5 = lambda: -ALP4*3.0*X/R5*C5
+        DU8 = lambda: -ALP4*3.0*Y/R5*C5
+        return [
+            lambda: ALP4*3.0*X*D/R5,
+            lambda: ALP4*3.0*Y*D/R5,
+            lambda: ALP4*C3/R3,
+            lambda: ALP4*3.0*D/R5*A5,
+            DU4,
+            DU5,
+            DU4,
+            lambda: ALP4*3.0*D/R5*B5,
+            DU8,
+            DU5,
+            DU8,
+            lambda: ALP4*3.0*D/R5*(2.0 + C5)]
+    contributions.append(inflate())
+
+    _add_contributions(U, [POT1, POT2, POT3, POT4], contributions, components)
+
+    return U
+
+
+def _others(components):
+    """Indices of the components of U which were not requested.
+    """
+
+    return [I for I in range(12) if I not in components]
+
+
+def dc3d0(ALPHA, X, Y, Z, DEPTH, DIP, POT1, POT2, POT3, POT4,
+          components=None):
+    """Displacement and strain at depth due to a buried point source in
+    a semi-infinite medium (array version of Okada_func.DC3D0).
+
+    ALPHA : medium constant (lambda+myu)/(lambda+2*myu)
+    X,Y,Z : coordinates of the observing points
+    DEPTH : source depth
+    DIP   : dip angle (degrees)
+    POT1-POT4 : strike-, dip-, tensile- and inflate-potency
+    components : indices of the components of U to calculate (default
+                 all), the other components are returned as zero
+
+    Returns U (12 components) and the singular flags.
+    """
+
+    if components is None:
+        components = range(12)
+    components = sorted(set(components))
+
+    # The z-derivatives also need the first three components of DUC
+    needed = sorted(set(components) | set(I - 9 for I in components if I >= 9))
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        X, Y, Z, DEPTH, DIP = num.broadcast_arrays(*[num.asarray(v, float)
+                                                     for v in [X, Y, Z, DEPTH, DIP]])
+        POT1, POT2, POT3, POT4 = [num.broadcast_to(num.asarray(v, float), X.shape)
+                                  for v in [POT1, POT2, POT3, POT4]]
+
+        if num.any(Z > 0):
+            log.critical('** POSITIVE Z WAS GIVEN IN SUB-DC3D0')
+
+        c = _dccon0(ALPHA, DIP)
+
+        # real-source contribution
+        g = _dccon1(c, X, Y, DEPTH + Z)
+        singular = g.R == 0.0
+
+        DUA = _ua0(c, g, POT1, POT2, POT3, POT4, needed)
+        U = -DUA
+        U[10:] = DUA[10:]
+
+        # image-source contribution
+        g = _dccon1(c, X, Y, DEPTH - Z)
+        DUA = _ua0(c, g, POT1, POT2, POT3, POT4, needed)
+        DUB = _ub0(c, g, Z, POT1, POT2, POT3, POT4, needed)
+        DUC = _uc0(c, g, Z, POT1, POT2, POT3, POT4, needed)
+
+        U += DUA + DUB + Z*DUC
+        U[9:] += DUC[:3]
+
+        U[_others(components)] = 0.0
+        U[:, singular] = 0.0
+
+    return U, singular
+
+
+def _dccon2(c, XI, ET, Q, KXI, KET):
+    """Station geometry constants for a finite source. KXI, KET are
+    True where R+XI < EPS, R+ET < EPS respectively.
+    """
+
+    SD = c.SD
+    CD = c.CD
+
+    XI = _small_to_zero(XI)
+    ET = _small_to_zero(ET)
+    Q = _small_to_zero(Q)
+
+    g = _Constants()
+    g.XI = XI
+    g.ET = ET
+    g.Q = Q
+    g.XI2 = XI*XI
+    g.ET2 = ET*ET
+    g.Q2 = Q*Q
+    g.R2 = g.XI2 + g.ET2 + g.Q2
+    g.R = num.sqrt(g.R2)
+    R = g.R
+    g.R3 = R*g.R2
+    g.R5 = g.R3*g.R2
+    g.Y = ET*CD + Q*SD
+    g.D = ET*SD - Q*CD
+
+    g.TT = num.where(Q == 0.0, 0.0, num.arctan(XI*ET/(Q*R)))
+
+    RXI = R + XI
+    g.ALX = num.where(KXI, -num.log(R - XI), num.log(RXI))
+    g.X11 = num.where(KXI, 0.0, 1.0/(R*RXI))
+    g.X32 = num.where(KXI, 0.0, (R + RXI)*g.X11*g.X11/R)
+
+    RET = R + ET
+    g.ALE = num.where(KET, -num.log(R - ET), num.log(RET))
+    g.Y11 = num.where(KET, 0.0, 1.0/(R*RET))
+    g.Y32 = num.where(KET, 0.0, (R + RET)*g.Y11*g.Y11/R)
+
+    g.EY = SD/R - g.Y*Q/g.R3
+    g.EZ = CD/R + g.D*Q/g.R3
+    g.FY = g.D/g.R3 + g.XI2*g.Y32*SD
+    g.FZ = g.Y/g.R3 + g.XI2*g.Y32*CD
+    g.GY = 2.0*g.X11*SD - g.Y*Q*g.X32
+    g.GZ = 2.0*g.X11*CD + g.D*Q*g.X32
+    g.HY = g.D*Q*g.X32 + XI*Q*g.Y32*SD
+    g.HZ = g.Y*Q*g.X32 + XI*Q*g.Y32*CD
+
+    return g
+
+
+def _ua(c, g, XI, ET, Q, DISL1, DISL2, DISL3, components):
+    """Displacement and strain at depth (part A) due to a buried finite
+    fault in a semi-infinite medium.
+    """
+
+    ALP1, ALP2 = c.ALP1, c.ALP2
+    SD, CD = c.SD, c.CD
+    XI2, Q2 = g.XI2, g.Q2
+    R, R3 = g.R, g.R3
+    Y, D, TT, ALX, ALE = g.Y, g.D, g.TT, g.ALX, g.ALE
+    X11, Y11, Y32 = g.X11, g.Y11, g.Y32
+    EY, EZ, FY, FZ, GY, GZ, HY, HZ = g.EY, g.EZ, g.FY, g.FZ, g.GY, g.GZ, g.HY, g.HZ
+
+    XY = XI*Y11
+    QX = Q*X11
+    QY = Q*Y11
+
+    U = num.zeros((12,) + num.shape(XI), float)
+
+    contributions = []
+
+    contributions.append([
+        lambda: TT/2.0 + ALP2*XI*QY,
+        lambda: ALP2*Q/R,
+        lambda: ALP1*ALE - ALP2*Q*QY,
+        lambda: -ALP1*QY - ALP2*XI2*Q*Y32,
+        lambda: -ALP2*XI*Q/R3,
+        lambda: ALP1*XY + ALP2*XI*Q2*Y32,
+        lambda: ALP1*XY*SD + ALP2*XI*FY + D/2.0*X11,
+        lambda: ALP2*EY,
+        lambda: ALP1*(CD/R + QY*SD) - ALP2*Q*FY,
+        lambda: ALP1*XY*CD + ALP2*XI*FZ + Y/2.0*X11,
+        lambda: ALP2*EZ,
+        lambda: -ALP1*(SD/R - QY*CD) - ALP2*Q*FZ])
+
+    contributions.append([
+        lambda: ALP2*Q/R,
+        lambda: TT/2.0 + ALP2*ET*QX,
+        lambda: ALP1*ALX - ALP2*Q*QX,
+        lambda: -ALP2*XI*Q/R3,
+        lambda: -QY/2.0 - ALP2*ET*Q/R3,
+        lambda: ALP1/R + ALP2*Q2/R3,
+        lambda: ALP2*EY,
+        lambda: ALP1*D*X11 + XY/2.0*SD + ALP2*ET*GY,
+        lambda: ALP1*Y*X11 - ALP2*Q*GY,
+        lambda: ALP2*EZ,
+        lambda: ALP1*Y*X11 + XY/2.0*CD + ALP2*ET*GZ,
+        lambda: -ALP1*D*X11 - ALP2*Q*GZ])
+
+    contributions.append([
+        lambda: -ALP1*ALE - ALP2*Q*QY,
+        lambda: -ALP1*ALX - ALP2*Q*QX,
+        lambda: TT/2.0 - ALP2*(ET*QX + XI*QY),
+        lambda: -ALP1*XY + ALP2*XI*Q2*Y32,
+        lambda: -ALP1/R + ALP2*Q2/R3,
+        lambda: -ALP1*QY - ALP2*Q*Q2*Y32,
+        lambda: -ALP1*(CD/R + QY*SD) - ALP2*Q*FY,
+        lambda: -ALP1*Y*X11 - ALP2*Q*GY,
+        lambda: ALP1*(D*X11 + XY*SD) + ALP2*Q*HY,
+        lambda: ALP1*(SD/R - QY*CD) - ALP2*Q*FZ,
+        lambda: ALP1*D*X11 - ALP2*Q*GZ,
+        lambda: ALP1*(Y*X11 + XY*CD) + ALP2*Q*HZ])
+
+    _add_contributions(U, [DISL1, DISL2, DISL3], contributions, components)
+
+    return U
+
+
+def _ub(c, g, XI, ET, Q, DISL1, DISL2, DISL3, components):
+    """Displacement and strain at depth (part B) due to a buried finite
+    fault in a semi-infinite medium.
+    """
+
+    ALP3 = c.ALP3
+    SD, CD, SDSD, CDCD, SDCD = c.SD, c.CD, c.SDSD, c.CDCD, c.SDCD
+    XI2, Q2 = g.XI2, g.Q2
+    R, R3 = g.R, g.R3
+    Y, D, TT, ALE = g.Y, g.D, g.TT, g.ALE
+    X11, Y11, Y32 = g.X11, g.Y11, g.Y32
+    EY, EZ, FY, FZ, GY, GZ, HY, HZ = g.EY, g.EZ, g.FY, g.FZ, g.GY, g.GZ, g.HY, g.HZ
+
+    RD = R + D
+    D11 = 1.0/(R*RD)
+    AJ2 = XI*Y/RD*D11
+    AJ5 = -(D + Y*Y/RD)*D11
+
+    # cos(dip) != 0
+    X = num.sqrt(XI2 + Q2)
+    AI4_dip = num.where(XI == 0.0, 0.0,
+                        1.0/CDCD*(XI/RD*SDCD
+                                  + 2.0*num.arctan((ET*(X + Q*CD) + X*(R + X)*SD)
+                                                   / (XI*(R + X)*CD))))
+    AI3_dip = (Y*CD/RD - ALE + SD*num.log(RD))/CDCD
+    AK1_dip = XI*(D11 - Y11*SD)/CD
+    AK3_dip = (Q*Y11 - Y*D11)/CD
+    AJ3_dip = (AK1_dip - AJ2*SD)/CD
+    AJ6_dip = (AK3_dip - AJ5*SD)/CD
+
+    # vertical fault
+    RD2 = RD*RD
+    AI3_vertical = (ET/RD + Y*Q/RD2 - ALE)/2.0
+    AI4_vertical = XI*Y/RD2/2.0
+    AK1_vertical = XI*Q/RD*D11
+    AK3_vertical = SD/RD*(XI2*D11 - 1.0)
+    AJ3_vertical = -XI/RD2*(Q2*D11 - 0.5)
+    AJ6_vertical = -Y/RD2*(XI2*D11 - 0.5)
+
+    dipping = CD != 0.0
+    AI3 = num.where(dipping, AI3_dip, AI3_vertical)
+    AI4 = num.where(dipping, AI4_dip, AI4_vertical)
+    AK1 = num.where(dipping, AK1_dip, AK1_vertical)
+    AK3 = num.where(dipping, AK3_dip, AK3_vertical)
+    AJ3 = num.where(dipping, AJ3_dip, AJ3_vertical)
+    AJ6 = num.where(dipping, AJ6_dip, AJ6_vertical)
+
+    XY = XI*Y11
+    AI1 = -XI/RD*CD - AI4*SD
+    AI2 = num.log(RD) + AI3*SD
+    AK2 = 1.0/R + AK3*SD
+    AK4 = XY*CD - AK1*SD
+    AJ1 = AJ5*CD - AJ6*SD
+    AJ4 = -XY - AJ2*CD + AJ3*SD
+
+    QX = Q*X11
+    QY = Q*Y11
+
+    U = num.zeros((12,) + num.shape(XI), float)
+
+    contributions = []
+
+    contributions.append([
+        lambda: -XI*QY - TT - ALP3*AI1*SD,
+        lambda: -Q/R + ALP3*Y/RD*SD,
+        lambda: Q*QY - ALP3*AI2*SD,
+        lambda: XI2*Q*Y32 - ALP3*AJ1*SD,
+        lambda: XI*Q/R3 - ALP3*AJ2*SD,
+        lambda: -XI*Q2*Y32 - ALP3*AJ3*SD,
+        lambda: -XI*FY - D*X11 + ALP3*(XY + AJ4)*SD,
+        lambda: -EY + ALP3*(1.0/R + AJ5)*SD,
+        lambda: Q*FY - ALP3*(QY - AJ6)*SD,
+        lambda: -XI*FZ - Y*X11 + ALP3*AK1*SD,
+        lambda: -EZ + ALP3*Y*D11*SD,
+        lambda: Q*FZ + ALP3*AK2*SD])
+
+    contributions.append([
+        lambda: -Q/R + ALP3*AI3*SDCD,
+        lambda: -ET*QX - TT - ALP3*XI/RD*SDCD,
+        lambda: Q*QX + ALP3*AI4*SDCD,
+        lambda: XI*Q/R3 + ALP3*AJ4*SDCD,
+        lambda: ET*Q/R3 + QY + ALP3*AJ5*SDCD,
+        lambda: -Q2/R3 + ALP3*AJ6*SDCD,
+        lambda: -EY + ALP3*AJ1*SDCD,
+        lambda: -ET*GY - XY*SD + ALP3*AJ2*SDCD,
+        lambda: Q*GY + ALP3*AJ3*SDCD,
+        lambda: -EZ - ALP3*AK3*SDCD,
+        lambda: -ET*GZ - XY*CD - ALP3*XI*D11*SDCD,
+        lambda: Q*GZ - ALP3*AK4*SDCD])
+
+    contributions.append([
+        lambda: Q*QY - ALP3*AI3*SDSD,
+        lambda: Q*QX + ALP3*XI/RD*SDSD,
+        lambda: ET*QX + XI*QY - TT - ALP3*AI4*SDSD,
+        lambda: -XI*Q2*Y32 - ALP3*AJ4*SDSD,
+        lambda: -Q2/R3 - ALP3*AJ5*SDSD,
+        lambda: Q*Q2*Y32 - ALP3*AJ6*SDSD,
+        lambda: Q*FY - ALP3*AJ1*SDSD,
+        lambda: Q*GY - ALP3*AJ2*SDSD,
+        lambda: -Q*HY - ALP3*AJ3*SDSD,
+        lambda: Q*FZ + ALP3*AK3*SDSD,
+        lambda: Q*GZ + ALP3*XI*D11*SDSD,
+        lambda: -Q*HZ + ALP3*AK4*SDSD])
+
+    _add_contributions(U, [DISL1, DISL2, DISL3], contributions, components)
+
+    return U
+
+
+def _uc(c, g, XI, ET, Q, Z, DISL1, DISL2, DISL3, components):
+    """Displacement and strain at depth (part C) due to a buried finite
+    fault in a semi-infinite medium.
+    """
+
+    ALP4, ALP5 = c.ALP4, c.ALP5
+    SD, CD, SDSD, CDCD, SDCD = c.SD, c.CD, c.SDSD, c.CDCD, c.SDCD
+    XI2, ET2, Q2 = g.XI2, g.ET2, g.Q2
+    R, R2, R3, R5 = g.R, g.R2, g.R3, g.R5
+    Y, D = g.Y, g.D
+    X11, Y11, X32, Y32 = g.X11, g.Y11, g.X32, g.Y32
+
+    C = D + Z
+    X53 = (8.0*R2 + 9.0*R*XI + 3.0*XI2)*X11*X11*X11/R2
+    Y53 = (8.0*R2 + 9.0*R*ET + 3.0*ET2)*Y11*Y11*Y11/R2
+    H = Q*CD - Z
+    Z32 = SD/R3 - H*Y32
+    Z53 = 3.0*SD/R5 - H*Y53
+    Y0 = Y11 - XI2*Y32
+    Z0 = Z32 - XI2*Z53
+    PPY = CD/R3 + Q*Y32*SD
+    PPZ = SD/R3 - Q*Y32*CD
+    QQ = Z*Y32 + Z32 + Z0
+    QQY = 3.0*C*D/R5 - QQ*SD
+    QQZ = 3.0*C*Y/R5 - QQ*CD + Q*Y32
+    XY = XI*Y11
+    QY = Q*Y11
+    QR = 3.0*Q/R5
+    CDR = (C + D)/R3
+    YY0 = Y/R3 - Y0*CD
+
+    U = num.zeros((12,) + num.shape(XI), float)
+
+    contributions = []
+
+    contributions.append([
+        lambda: ALP4*XY*CD - ALP5*XI*Q*Z32,
+        lambda: ALP4*(CD/R + 2.0*QY*SD) - ALP5*C*Q/R3,
+        lambda: ALP4*QY*CD - ALP5*(C*ET/R3 - Z*Y11 + XI2*Z32),
+        lambda: ALP4*Y0*CD - ALP5*Q*Z0,
+        lambda: -ALP4*XI*(CD/R3 + 2.0*Q*Y32*SD) + ALP5*C*XI*QR,
+        lambda: -ALP4*XI*Q*Y32*CD + ALP5*XI*(3.0*C*ET/R5 - QQ),
+        lambda: -ALP4*XI*PPY*CD - ALP5*XI*QQY,
+        lambda: ALP4*2.0*(D/R3 - Y0*SD)*SD - Y/R3*CD - ALP5*(CDR*SD - ET/R3 - C*Y*QR),
+        lambda: -ALP4*Q/R3 + YY0*SD + ALP5*(CDR*CD + C*D*QR - (Y0*CD + Q*Z0)*SD),
+        lambda: ALP4*XI*PPZ*CD - ALP5*XI*QQZ,
+        lambda: ALP4*2.0*(Y/R3 - Y0*CD)*SD + D/R3*CD - ALP5*(CDR*CD + C*D*QR),
+        lambda: YY0*CD - ALP5*(CDR*SD - C*Y*QR - Y0*SDSD + Q*Z0*CD)])
+
+    contributions.append([
+        lambda: ALP4*CD/R - QY*SD - ALP5*C*Q/R3,
+        lambda: ALP4*Y*X11 - ALP5*C*ET*Q*X32,
+        lambda: -D*X11 - XY*SD - ALP5*C*(X11 - Q2*X32),
+        lambda: -ALP4*XI/R3*CD + ALP5*C*XI*QR + XI*Q*Y32*SD,
+        lambda: -ALP4*Y/R3 + ALP5*C*ET*QR,
+        lambda: D/R3 - Y0*SD + ALP5*C/R3*(1.0 - 3.0*Q2/R2),
+        lambda: -ALP4*ET/R3 + Y0*SDSD - ALP5*(CDR*SD - C*Y*QR),
+        lambda: ALP4*(X11 - Y*Y*X32) - ALP5*C*((D + 2.0*Q*CD)*X32 - Y*ET*Q*X53),
+        lambda: XI*PPY*SD + Y*D*X32 + ALP5*C*((Y + 2.0*Q*SD)*X32 - Y*Q2*X53),
+        lambda: -Q/R3 + Y0*SDCD - ALP5*(CDR*CD + C*D*QR),
+        lambda: ALP4*Y*D*X32 - ALP5*C*((Y - 2.0*Q*SD)*X32 + D*ET*Q*X53),
+        lambda: -XI*PPZ*SD + X11 - D*D*X32 - ALP5*C*((D - 2.0*Q*CD)*X32 - D*Q2*X53)])
+
+    contributions.append([
+        lambda: -ALP4*(SD/R + QY*CD) - ALP5*(Z*Y11 - Q2*Z32),
+        lambda: ALP4*2.0*XY*SD + D*X11 - ALP5*C*(X11 - Q2*X32),
+        lambda: ALP4*(Y*X11 + XY*CD) + ALP5*Q*(C*ET*X32 + XI*Z32),
+        lambda: ALP4*XI/R3*SD + XI*Q*Y32*CD + ALP5*XI*(3.0*C*ET/R5 - 2.0*Z32 - Z0),
+        lambda: ALP4*2.0*Y0*SD - D/R3 + ALP5*C/R3*(1.0 - 3.0*Q2/R2),
+        lambda: -ALP4*YY0 - ALP5*(C*ET*QR - Q*Z0),
+        lambda: ALP4*(Q/R3 + Y0*SDCD) + ALP5*(Z/R3*CD + C*D*QR - Q*Z0*SD),
+        lambda: -ALP4*2.0*XI*PPY*SD - Y*D*X32 + ALP5*C*((Y + 2.0*Q*SD)*X32 - Y*Q2*X53),
+        lambda: -ALP4*(XI*PPY*CD - X11 + Y*Y*X32)
+                + ALP5*(C*((D + 2.0*Q*CD)*X32 - Y*ET*Q*X53) + XI*QQY),
+        lambda: -ET/R3 + Y0*CDCD - ALP5*(Z/R3*SD - C*Y*QR - Y0*SDSD + Q*Z0*CD),
+        lambda: ALP4*2.0*XI*PPZ*SD - X11 + D*D*X32 - ALP5*C*((D - 2.0*Q*CD)*X32 - D*Q2*X53),
+        lambda: ALP4*(XI*PPZ*CD + Y*D*X32) + ALP5*(C*((Y - 2.0*Q*SD)*X32 + D*ET*Q*X53) + XI*QQZ)])
+
+    _add_contributions(U, [DISL1, DISL2, DISL3], contributions, components)
+
+    return U
+
+
+def _fault_edges(c, X, Y, DEPTH, AL1, AL2, AW1, AW2, D):
+    """XI, ET and Q of the fault edges as seen from the receivers, the
+    flags of the negative extensions of the edges and the flags of the
+    receivers on a fault edge.
+    """
+
+    XI = [_small_to_zero(X - AL1), _small_to_zero(X - AL2)]
+
+    P = Y*c.CD + D*c.SD
+    Q = _small_to_zero(Y*c.SD - D*c.CD)
+    ET = [_small_to_zero(P - AW1), _small_to_zero(P - AW2)]
+
+    # on fault edge
+    singular = (Q == 0.0) & (((XI[0]*XI[1] < 0.0) & (ET[0]*ET[1] == 0.0))
+                             | ((ET[0]*ET[1] < 0.0) & (XI[0]*XI[1] == 0.0)))
+
+    # on negative extension of fault edge
+    R12 = num.sqrt(XI[0]*XI[0] + ET[1]*ET[1] + Q*Q)
+    R21 = num.sqrt(XI[1]*XI[1] + ET[0]*ET[0] + Q*Q)
+    R22 = num.sqrt(XI[1]*XI[1] + ET[1]*ET[1] + Q*Q)
+    KXI = [(XI[0] < 0.0) & (R21 + XI[1] < _EPS),
+           (XI[0] < 0.0) & (R22 + XI[1] < _EPS)]
+    KET = [(ET[0] < 0.0) & (R12 + ET[1] < _EPS),
+           (ET[0] < 0.0) & (R22 + ET[1] < _EPS)]
+
+    return XI, ET, Q, KXI, KET, singular
+
+
+def dc3d(ALPHA, X, Y, Z, DEPTH, DIP, AL1, AL2, AW1, AW2, DISL1, DISL2, DISL3,
+         components=None):
+    """Displacement and strain at depth due to a buried finite fault in
+    a semi-infinite medium (array version of Okada_func.DC3D).
+
+    ALPHA : medium constant (lambda+myu)/(lambda+2*myu)
+    X,Y,Z : coordinates of the observing points
+    DEPTH : depth of reference point
+    DIP   : dip angle (degrees)
+    AL1,AL2 : fault length range
+    AW1,AW2 : fault width range
+    DISL1-DISL3 : strike-, dip-, tensile-dislocations
+    components : indices of the components of U to calculate (default
+                 all), the other components are returned as zero
+
+    Returns U (12 components) and the singular flags.
+    """
+
+    if components is None:
+        components = range(12)
+    components = sorted(set(components))
+
+    # Each component is rotated together with the other components of
+    # its derivative (groups of three), and the z-derivatives also need
+    # the first three components of DUC
+    groups = sorted(set(3*(I//3) for I in components))
+    needed = [I + k for I in groups for k in range(3)]
+    if 9 in groups and 0 not in groups:
+        needed = [0, 1, 2] + needed
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        X, Y, Z, DEPTH, DIP = num.broadcast_arrays(*[num.asarray(v, float)
+                                                     for v in [X, Y, Z, DEPTH, DIP]])
+        AL1, AL2, AW1, AW2, DISL1, DISL2, DISL3 = \
+            [num.broadcast_to(num.asarray(v, float), X.shape)
+             for v in [AL1, AL2, AW1, AW2, DISL1, DISL2, DISL3]]
+
+        if num.any(Z > 0):
+            log.critical('** POSITIVE Z WAS GIVEN IN SUB-DC3D')
+
+        c = _dccon0(ALPHA, DIP)
+        SD = c.SD
+        CD = c.CD
+
+        U = num.zeros((12,) + X.shape, float)
+
+        # real-source contribution
+        XI, ET, Q, KXI, KET, singular = \
+            _fault_edges(c, X, Y, DEPTH, AL1, AL2, AW1, AW2, DEPTH + Z)
+
+        for K in range(2):
+            for J in range(2):
+                g = _dccon2(c, XI[J], ET[K], Q, KXI[K], KET[J])
+                DUA = _ua(c, g, XI[J], ET[K], Q, DISL1, DISL2, DISL3, needed)
+
+                DU = num.zeros_like(DUA)
+                for I in groups:
+                    DU[I] = -DUA[I]
+                    DU[I+1] = -DUA[I+1]*CD + DUA[I+2]*SD
+                    DU[I+2] = -DUA[I+1]*SD - DUA[I+2]*CD
+                DU[9:] = -DU[9:]
+
+                # The fault corner itself contributes nothing
+                DU[:, g.R == 0.0] = 0.0
+
+                if J + K == 1:
+                    U -= DU
+                else:
+                    U += DU
+
+        # image-source contribution
+        XI, ET, Q, KXI, KET, image_singular = \
+            _fault_edges(c, X, Y, DEPTH, AL1, AL2, AW1, AW2, DEPTH - Z)
+        singular = singular | image_singular
+
+        for K in range(2):
+            for J in range(2):
+                g = _dccon2(c, XI[J], ET[K], Q, KXI[K], KET[J])
+                DUA = _ua(c, g, XI[J], ET[K], Q, DISL1, DISL2, DISL3, needed)
+                DUB = _ub(c, g, XI[J], ET[K], Q, DISL1, DISL2, DISL3, needed)
+                DUC = _uc(c, g, XI[J], ET[K], Q, Z, DISL1, DISL2, DISL3, needed)
+
+                DU = num.zeros_like(DUA)
+                for I in groups:
+                    DU[I] = DUA[I] + DUB[I] + Z*DUC[I]
+                    DU[I+1] = ((DUA[I+1] + DUB[I+1] + Z*DUC[I+1])*CD
+                               - (DUA[I+2] + DUB[I+2] + Z*DUC[I+2])*SD)
+                    DU[I+2] = ((DUA[I+1] + DUB[I+1] - Z*DUC[I+1])*SD
+                               + (DUA[I+2] + DUB[I+2] - Z*DUC[I+2])*CD)
+                if 9 in groups:
+                    DU[9] += DUC[0]
+                    DU[10] += DUC[1]*CD - DUC[2]*SD
+                    DU[11] -= DUC[1]*SD + DUC[2]*CD
+
+                DU[:, g.R == 0.0] = 0.0
+
+                if J + K == 1:
+                    U -= DU
+                else:
+                    U += DU
+
+        U[_others(components)] = 0.0
+        U[:, singular] = 0.0
+
+    return U, singular
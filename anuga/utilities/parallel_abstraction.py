@@ -54,6 +54,12 @@ except:
   def send(*args, **kwargs):
       pass
 
+  def isend(*args, **kwargs):
+      return None
+
+  def waitall(*args, **kwargs):
+      pass
+
   def print0(*args):
     """ Print arguments
     """
@@ -239,6 +245,18 @@ else:
     else:
       comm.send(x, dest=destination, tag=tag)
 
+  def isend(x, destination, tag=1):
+    """ Nonblocking send of a numpy array using Isend. The array must
+        not be modified or freed until the returned request has completed
+        (see waitall)
+    """
+    return comm.Isend(np.ascontiguousarray(x), dest=destination, tag=tag)
+
+  def waitall(requests):
+    """ Wait for the completion of a list of requests from isend
+    """
+    MPI.Request.Waitall([r for r in requests if r is not None])
+
   def size():
     return comm.size
 
@@ -277,6 +295,80 @@ else:
 
 
 
+#------------------------------------------------------------------------------
+# Fused reduction of several scalars in a single collective call
+#------------------------------------------------------------------------------
+_fused_reduction_ops = {}
+_fused_reduction_types = {}
+
+def _fused_reduction(nmax):
+    """ MPI user op reducing one vector of doubles by max over the first
+        nmax entries and by sum over the remaining entries
+    """
+    def reduction(inbuf, outbuf, datatype):
+        a = np.frombuffer(inbuf, dtype=np.float64)
+        b = np.frombuffer(outbuf, dtype=np.float64)
+        np.maximum(a[:nmax], b[:nmax], out=b[:nmax])
+        b[nmax:] += a[nmax:]
+
+    return reduction
+
+
+def allreduce_values(values, ops):
+    """ Reduce a list of scalars over all processors using one Allreduce.
+
+        ops gives for each value one of 'min', 'max' or 'sum'.
+        Returns a numpy array of the reduced values.
+    """
+
+    values = np.array(values, dtype=np.float64).reshape(-1)
+    ops = list(ops)
+
+    msg = 'Need one reduction op per value'
+    assert len(ops) == len(values), msg
+
+    for op in ops:
+        if op not in ['min', 'max', 'sum']:
+            msg = 'Unknown reduction op %s, use min, max or sum' % op
+            raise Exception(msg)
+
+    if not pypar_available or numprocs == 1 or len(values) == 0:
+        return values
+
+    # Min is reduced as a max of the negated value. The max (and min)
+    # entries are placed before the sums
+    n = len(values)
+    sign = np.array([-1.0 if op == 'min' else 1.0 for op in ops])
+    is_max = np.array([op != 'sum' for op in ops])
+    order = np.concatenate((np.flatnonzero(is_max), np.flatnonzero(~is_max)))
+    nmax = int(np.sum(is_max))
+
+    sendbuf = (sign*values)[order]
+    recvbuf = np.empty(n)
+
+    if nmax == n:
+        comm.Allreduce(sendbuf, recvbuf, op=MPI.MAX)
+    elif nmax == 0:
+        comm.Allreduce(sendbuf, recvbuf, op=MPI.SUM)
+    else:
+        # The values are sent as a single element of a contiguous
+        # datatype, so MPI cannot split them between calls of the op
+        if n not in _fused_reduction_types:
+            _fused_reduction_types[n] = MPI.DOUBLE.Create_contiguous(n).Commit()
+        if nmax not in _fused_reduction_ops:
+            _fused_reduction_ops[nmax] = MPI.Op.Create(_fused_reduction(nmax), commute=True)
+
+        datatype = _fused_reduction_types[n]
+        comm.Allreduce([sendbuf, 1, datatype], [recvbuf, 1, datatype],
+                       op=_fused_reduction_ops[nmax])
+
+    result = np.empty(n)
+    result[order] = recvbuf
+
+    return sign*result
+
+
+
 # Global error handler
 #
 # Taken from https://github.com/chainer/chainermn/issues/236
@@ -0,0 +1,128 @@
+"""
+Wall clock timers for the phases of the evolve loop.
+
+A domain has a phase_timers attribute which is a Null_phase_timers object
+unless timing has been switched on with domain.set_phase_timing(), in which
+case it is a Phase_timers object accumulating the wall clock time and
+number of calls of each named phase (compute_fluxes, update_boundary,
+ghost_communication, ...). In parallel each processor has its own timers.
+
+    timers.start('compute_fluxes')
+    ...
+    timers.stop('compute_fluxes')
+
+or, for times which have already been measured,
+
+    timers.add('ghost_communication', dt)
+"""
+
+from time import perf_counter
+
+import json
+import csv
+
+
+class Null_phase_timers(object):
+    """Timers which do nothing, used when phase timing is switched off
+    """
+
+    enabled = False
+
+    def start(self, name):
+        pass
+
+    def stop(self, name):
+        pass
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def reset(self):
+        pass
+
+
+class Phase_timers(object):
+    """Accumulate wall clock time and number of calls of named phases
+    """
+
+    enabled = True
+
+    def __init__(self):
+
+        self.times = {}
+        self.calls = {}
+        self.starts = {}
+
+    def start(self, name):
+        """Start timing a call of phase name"""
+
+        self.starts[name] = perf_counter()
+
+    def stop(self, name):
+        """Stop timing phase name, adding the time since start(name)"""
+
+        self.add(name, perf_counter() - self.starts.pop(name))
+
+    def add(self, name, seconds, calls=1):
+        """Add seconds of wall clock time and calls to phase name"""
+
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def reset(self):
+
+        self.times = {}
+        self.calls = {}
+        self.starts = {}
+
+    def get_total_time(self):
+
+        return sum(self.times.values())
+
+    def get_phases(self):
+        """Return list of (name, time, calls) sorted by decreasing time"""
+
+        phases = [(name, self.times[name], self.calls[name]) for name in self.times]
+        phases.sort(key=lambda phase: -phase[1])
+
+        return phases
+
+    def statistics(self):
+        """Return string with the time spent in each phase"""
+
+        total = self.get_total_time()
+
+        msg = '  Phase timers (wall clock):\n'
+        for name, seconds, calls in self.get_phases():
+            percentage = 100.0*seconds/total if total > 0.0 else 0.0
+            msg += '    %s: %10.4f (s) %5.1f%%, calls=%d\n' \
+                % (name.ljust(36), seconds, percentage, calls)
+
+        return msg
+
+    def write(self, filename, file_format=None, **kwargs):
+        """Write the phase times and calls to filename as json or csv
+        (default from the extension of filename). Keyword arguments are
+        stored as extra fields, e.g. processor=myid.
+        """
+
+        if file_format is None:
+            file_format = 'csv' if filename.endswith('.csv') else 'json'
+
+        if file_format == 'json':
+            data = dict(kwargs)
+            data['phases'] = {name: {'time': seconds, 'calls': calls}
+                              for name, seconds, calls in self.get_phases()}
+            with open(filename, 'w') as fid:
+                json.dump(data, fid, indent=2)
+
+        elif file_format == 'csv':
+            keys = list(kwargs)
+            with open(filename, 'w', newline='') as fid:
+                writer = csv.writer(fid)
+                writer.writerow(keys + ['phase', 'time', 'calls'])
+                for name, seconds, calls in self.get_phases():
+                    writer.writerow([kwargs[key] for key in keys] + [name, seconds, calls])
+        else:
+            msg = 'Unknown phase timers file format %s, use json or csv' % file_format
+            raise Exception(msg)
@@ -15,6 +15,10 @@ from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.config import netcdf_float, netcdf_float32, netcdf_int
 from anuga.file.sww import SWW_file, Write_sww
 
+# Memory (in bytes) used for the timesteps being merged at a time by
+# sww_merge_parallel
+default_memory_limit = 2**28
+
 def sww_merge(domain_global_name, np, verbose=False):
 
     output = domain_global_name+".sww"
@@ -23,7 +27,16 @@ def sww_merge(domain_global_name, np, verbose=False):
     _sww_merge(swwfiles, output, verbose)
 
 
-def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
+def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False,
+                       memory_limit=None, processes=None, incremental=False):
+    """Merge the sww files of a parallel run with np processors into
+    domain_global_name.sww
+
+    The timesteps are merged in blocks which fit into memory_limit bytes,
+    processes > 1 reads the files of each block in parallel and incremental
+    appends the timesteps not yet in an existing merged file (the sww
+    files are kept, so incremental cannot be used with delete_old).
+    """
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
@@ -40,9 +53,11 @@ def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
     fid.close()
 
     if 3*number_of_volumes == number_of_points:
-        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old,
+                                       memory_limit, processes, incremental)
     else:
-        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old,
+                                   memory_limit, processes, incremental)
         
 
 def _sww_merge(swwfiles, output, verbose=False):
@@ -202,7 +217,10 @@ def _sww_merge(swwfiles, output, verbose=False):
     fido.close()
 
 
-def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False):
+
+
+def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                               memory_limit=None, processes=None, incremental=False):
     """
         Merge a list of sww files into a single file.
         
@@ -210,7 +228,7 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
 
         The sww files to be merged must have exactly the same timesteps.
 
-        It is assumed that the separate sww files have been stored in non_smooth
+        It is assumed that the separate sww files have been stored in smooth
         format.
 
         Note that some advanced information and custom quantities may not be
@@ -219,327 +237,17 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
-    """
-
-    if verbose:
-        print("MERGING SWW Files")
-        
-    
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print('Reading file ', filename, ':')    
-    
-        fid = NetCDFFile(filename, netcdf_mode_r)
-         
-        if first_file:
-
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            #number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
-            
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
-
-            g_volumes = num.zeros((number_of_global_triangles,3),int)
-            g_x = num.zeros((number_of_global_nodes,),num.float32)
-            g_y = num.zeros((number_of_global_nodes,),num.float32)
-
-            g_points = num.zeros((number_of_global_nodes,2),num.float32)
-
-            #=====================================
-            # Deal with the vertex based variables
-            #=====================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_quantities = []
-            dynamic_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
-                
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((number_of_global_nodes,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_nodes),num.float32)
-
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_c_quantities:
-                out_d_c_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_triangles),num.float32)
-                 
-            description = 'merged:' + getattr(fid, 'description')          
-            first_file = False
-
-
-        # Read in from files and add to global arrays
-
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
-        tri_full_flag = fid.variables['tri_full_flag'][:]
-        volumes = num.array(fid.variables['volumes'][:],dtype=int)
-        l_volumes = num.zeros_like(volumes)
-        l_old_volumes = num.zeros_like(volumes)
-
-
-        # Change the local node ids to global id in the
-        # volume array
-
-        # FIXME SR: Surely we can knock up a numpy way of doing this
-        #for i in range(len(l_volumes)):
-        #    g_n0 = node_l2g[volumes[i,0]]
-        #    g_n1 = node_l2g[volumes[i,1]]
-        #    g_n2 = node_l2g[volumes[i,2]]
-        #
-        #    l_old_volumes[i,:] = [g_n0,g_n1,g_n2]
 
-        g_n0 = node_l2g[volumes[:,0]].reshape(-1,1)
-        g_n1 = node_l2g[volumes[:,1]].reshape(-1,1)
-        g_n2 = node_l2g[volumes[:,2]].reshape(-1,1)
-
-        #print g_n0.shape
-        l_volumes = num.hstack((g_n0,g_n1,g_n2))
-
-        #assert num.allclose(l_volumes, l_old_volumes)
-
-        # Just pick out the full triangles
-        ftri_ids = num.where(tri_full_flag>0)
-        ftri_l2g = num.compress(tri_full_flag, tri_l2g)
-        
-        #f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        #f_gids = tri_l2g[f_ids]
-
-        #print l_volumes
-        #print tri_full_flag
-        #print tri_l2g
-        #print ftri_l2g
-        
-        f_volumes0 = num.compress(tri_full_flag,volumes[:,0])
-        f_volumes1 = num.compress(tri_full_flag,volumes[:,1])
-        f_volumes2 = num.compress(tri_full_flag,volumes[:,2])
-        
-        g_volumes[ftri_l2g,0] = node_l2g[f_volumes0]
-        g_volumes[ftri_l2g,1] = node_l2g[f_volumes1]
-        g_volumes[ftri_l2g,2] = node_l2g[f_volumes2]
-
-        #fg_volumes = num.compress(tri_full_flag,l_volumes,axis=0)
-        #g_volumes[ftri_l2g] = fg_volumes
-
-
-
-
-        #g_x[node_l2g] = fid.variables['x']
-        #g_y[node_l2g] = fid.variables['y']
-
-        g_points[node_l2g,0] = fid.variables['x'][:]
-        g_points[node_l2g,1] = fid.variables['y'][:]
-        
-
-        #print number_of_timesteps
-
-
-        # FIXME SR: It seems that some of the "ghost" node quantity values
-        # are being storded. We should only store those nodes which are associated with
-        # full triangles. So we need an index array of "full" nodes, ie those in
-        # full triangles
-
-        #use numpy.compress and numpy.unique to get "full nodes
-
-        f_volumes = num.compress(tri_full_flag,volumes,axis=0)
-        fl_nodes = num.unique(f_volumes)
-        f_node_l2g = node_l2g[fl_nodes]
-
-        #print len(node_l2g)
-        #print len(fl_nodes)
-
-        # Read in static quantities
-        for quantity in static_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            #print quantity, q.shape
-            out_s_quantities[quantity][f_node_l2g] = \
-                         num.array(q[:],dtype=num.float32)[fl_nodes]
-
-        
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                #out_d_quantities[quantity][i][node_l2g] = \
-                #           num.array(q[i],dtype=num.float32)
-                out_d_quantities[quantity][i][f_node_l2g] = \
-                           num.array(q[i],dtype=num.float32)[fl_nodes]
-
-
-        # Read in static c quantities
-        for quantity in static_c_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][ftri_l2g] = \
-                         num.array(q).astype(num.float32)[ftri_ids]
-
-        
-        #Collate all dynamic c quantities according to their timestep
-        for quantity in dynamic_c_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                out_d_c_quantities[quantity][i][ftri_l2g] = \
-                           num.array(q[i]).astype(num.float32)[ftri_ids]
-
-
-        fid.close()
-
-
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
-    #print g_points.shape
-
-    #print number_of_global_triangles
-    #print number_of_global_nodes
-
-
-    if verbose:
-            print('Writing file ', output, ':')
-    fido = NetCDFFile(output, netcdf_mode_w)
-
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_nodes,
-                             description=description,
-                             sww_precision=netcdf_float32)
-
-
-
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
-    
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
-
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-       
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
-
-    # Write out all the dynamic quantities for each timestep
-
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
-
-        
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        if verbose:
-            print('  Writing quantity: ',q)
-            
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
-
-    for q in dynamic_c_quantities:
-        if verbose:
-            print('  Writing quantity: ',q)
-            
-        q_values = out_d_c_quantities[q]
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-                                        
-    #print out_s_quantities
-    #print out_d_quantities
-    
-    #print g_x
-    #print g_y
+        See _sww_merge_parallel_streaming for memory_limit, processes and
+        incremental.
+    """
 
-    #print g_volumes
+    _sww_merge_parallel_streaming(swwfiles, output, True, verbose, delete_old,
+                                  memory_limit, processes, incremental)
 
-    fido.close()
-    
-    if delete_old:
-        import os
-        for filename in swwfiles:
 
-            if verbose:
-                print('Deleting file ', filename, ':')
-            os.remove(filename)
-
-
-def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False):
+def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                                   memory_limit=None, processes=None, incremental=False):
     """
         Merge a list of sww files into a single file.
 
@@ -556,243 +264,288 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
-    """
-
-    if verbose:
-        print("MERGING SWW Files")
 
+        See _sww_merge_parallel_streaming for memory_limit, processes and
+        incremental.
+    """
 
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print('Reading file ', filename, ':')
+    _sww_merge_parallel_streaming(swwfiles, output, False, verbose, delete_old,
+                                  memory_limit, processes, incremental)
 
-        fid = NetCDFFile(filename, netcdf_mode_r)
 
-        if first_file:
+def _sww_merge_parallel_streaming(swwfiles, output, smooth, verbose=False, delete_old=False,
+                                  memory_limit=None, processes=None, incremental=False):
+    """
+        Merge the sww files of a parallel run a block of timesteps at a time.
+
+        Only the global mesh, the static quantities and one block of
+        timesteps of the dynamic quantities are held in memory, the block
+        size being chosen so that the block fits in memory_limit bytes
+        (default_memory_limit if None).
+
+        processes > 1 reads the sww files of the block with a pool of
+        that many processes.
+
+        If incremental is True and output already exists, only the
+        timesteps which are not yet in output are appended, so a merge can
+        be repeated while the simulation is still writing its sww files.
+        Only the timesteps stored in all of the sww files are merged.
+        As later merges need the sww files, incremental cannot be combined
+        with delete_old.
+    """
 
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
+    import os
 
-            out_s_quantities = {}
-            out_d_quantities = {}
+    if incremental and delete_old:
+        msg = ('An incremental merge needs the sww files for the next merge, '
+               'so delete_old cannot be used with incremental')
+        raise Exception(msg)
 
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
+    if verbose:
+        print("MERGING SWW Files")
 
+    if memory_limit is None:
+        memory_limit = default_memory_limit
 
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
+    #=======================================
+    # Header information from the first file
+    #=======================================
+    fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
 
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-            number_of_global_triangle_vertices = 3*number_of_global_triangles
+    starttime = int(fid.starttime)
 
+    number_of_global_triangles = int(fid.number_of_global_triangles)
+    number_of_global_nodes     = int(fid.number_of_global_nodes)
 
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
+    if smooth:
+        number_of_global_points = number_of_global_nodes
+    else:
+        number_of_global_points = 3*number_of_global_triangles
 
-            g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
+    attributes = {}
+    for name in ['order', 'xllcorner', 'yllcorner', 'zone', 'false_easting',
+                 'false_northing', 'datum', 'projection']:
+        attributes[name] = getattr(fid, name)
 
+    description = 'merged:' + getattr(fid, 'description')
 
+    # Quantities with a number_of_timesteps dimension are dynamic
+    variables = set(fid.variables.keys())
 
-            g_x = num.zeros((number_of_global_triangle_vertices,),num.float32)
-            g_y = num.zeros((number_of_global_triangle_vertices,),num.float32)
+    def split_quantities(quantities):
+        static = []
+        dynamic = []
+        for quantity in sorted(set(quantities) & variables):
+            if 'number_of_timesteps' in fid.variables[quantity].dimensions:
+                dynamic.append(quantity)
+            else:
+                static.append(quantity)
+        return static, dynamic
 
-            g_points = num.zeros((number_of_global_triangle_vertices,2),num.float32)
+    static_quantities, dynamic_quantities = \
+        split_quantities(['elevation', 'friction', 'stage', 'xmomentum',
+                          'ymomentum', 'xvelocity', 'yvelocity', 'height'])
 
-            #=======================================
-            # Deal with the vertex based variables
-            #=======================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
+    static_c_quantities, dynamic_c_quantities = \
+        split_quantities(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
+                          'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
 
-            quantities = list(quantities & variables)
+    fid.close()
 
-            static_quantities = []
-            dynamic_quantities = []
+    #=======================================
+    # Global mesh, static quantities and the
+    # local to global maps of each file
+    #=======================================
+    if smooth:
+        g_volumes = num.zeros((number_of_global_triangles,3),int)
+    else:
+        g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
 
-            for quantity in quantities:
-                # Test if elevation is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
+    g_points = num.zeros((number_of_global_points,2),num.float32)
 
-            # Static Quantities are stored as a 1D array
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((3*number_of_global_triangles,),num.float32)
+    out_s_quantities = {}
+    for quantity in static_quantities:
+        out_s_quantities[quantity] = num.zeros((number_of_global_points,),num.float32)
 
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
+    out_s_c_quantities = {}
+    for quantity in static_c_quantities:
+        out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
 
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
-
-            description = 'merged:' + getattr(fid, 'description')
-            first_file = False
+    vertex_maps = []
+    centroid_maps = []
+    n_steps = None
 
+    for filename in swwfiles:
+        if verbose:
+            print('Reading file ', filename, ':')
 
-        # Read in from files and add to global arrays
+        fid = NetCDFFile(filename, netcdf_mode_r)
 
         tri_l2g  = fid.variables['tri_l2g'][:]
         node_l2g = fid.variables['node_l2g'][:]
         tri_full_flag = fid.variables['tri_full_flag'][:]
 
+        # Just pick out the full triangles
         f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
         f_gids = tri_l2g[f_ids]
 
-        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+        if smooth:
+            volumes = num.array(fid.variables['volumes'][:],dtype=int)
 
+            f_volumes = volumes[f_ids]
+            g_volumes[f_gids] = node_l2g[f_volumes]
 
-        l_x = num.array(fid.variables['x'][:],dtype=num.float32)
-        l_y = num.array(fid.variables['y'][:],dtype=num.float32)
-
-        
-        g_x[g_vids] = l_x[l_vids]
-        g_y[g_vids] = l_y[l_vids]
+            g_points[node_l2g,0] = fid.variables['x'][:]
+            g_points[node_l2g,1] = fid.variables['y'][:]
 
-        g_points[g_vids,0] = g_x[g_vids]
-        g_points[g_vids,1] = g_y[g_vids]
+            # Only store the nodes of full triangles, ie not the "ghost" nodes
+            l_vids = num.unique(f_volumes)
+            g_vids = node_l2g[l_vids]
+        else:
+            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
 
+            g_points[g_vids,0] = num.array(fid.variables['x'][:],dtype=num.float32)[l_vids]
+            g_points[g_vids,1] = num.array(fid.variables['y'][:],dtype=num.float32)[l_vids]
 
-        ## Read in static quantities
         for quantity in static_quantities:
-            q = fid.variables[quantity]
             out_s_quantities[quantity][g_vids] = \
-                         num.array(q).astype(num.float32)[l_vids]
-                         #num.array(q,dtype=num.float32)[l_vids]
-
+                num.array(fid.variables[quantity][:]).astype(num.float32)[l_vids]
 
-        # Read in static c quantities
         for quantity in static_c_quantities:
-            q = fid.variables[quantity]
             out_s_c_quantities[quantity][f_gids] = \
-                         num.array(q).astype(num.float32)[f_ids]
-                         #num.array(q,dtype=num.float32)[f_ids]
+                num.array(fid.variables[quantity][:]).astype(num.float32)[f_ids]
+
+        vertex_maps.append((l_vids, g_vids))
+        centroid_maps.append((f_ids, f_gids))
+
+        # The files of a running simulation may differ in length
+        file_steps = len(fid.variables['time'])
+        if n_steps is None or file_steps < n_steps:
+            n_steps = file_steps
+
+        if filename == swwfiles[0]:
+            times = num.array(fid.variables['time'][:])
 
-        
         fid.close()
 
+    times = times[:n_steps]
+
     #---------------------------
-    # Write out the SWW file
+    # Open the output SWW file
     #---------------------------
+    if incremental and os.path.exists(output):
+        if verbose:
+            print('Appending to file ', output, ':')
 
-    if verbose:
+        fido = NetCDFFile(output, netcdf_mode_a)
+
+        try: # works with netcdf4
+            number_of_volumes = len(fido.dimensions['number_of_volumes'])
+        except: # works with scientific.io.netcdf
+            number_of_volumes = int(fido.dimensions['number_of_volumes'])
+
+        if number_of_volumes != number_of_global_triangles:
+            fido.close()
+            msg = 'File %s does not have the mesh of the files being merged' % output
+            raise Exception(msg)
+
+        first_step = len(fido.variables['time'])
+    else:
+        if verbose:
             print('Writing file ', output, ':')
 
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_triangles*3,
-                             description=description,
-                             sww_precision=netcdf_float32)
+        fido = NetCDFFile(output, netcdf_mode_w)
 
+        sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
+        sww.store_header(fido, starttime,
+                                 number_of_global_triangles,
+                                 number_of_global_points,
+                                 description=description,
+                                 sww_precision=netcdf_float32)
 
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
+        from anuga.coordinate_transforms.geo_reference import Geo_reference
+        geo_reference = Geo_reference()
 
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
+        sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
 
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
+        for name, value in attributes.items():
+            setattr(fido, name, value)
 
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
-    
-    # Write out all the dynamic quantities for each timestep
+        sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
+        sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
 
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
+        first_step = 0
 
-    for q in (dynamic_quantities + dynamic_c_quantities):
+    # Release the static data before streaming the dynamic quantities
+    g_points = g_volumes = out_s_quantities = out_s_c_quantities = None
 
-        if verbose:
-            print('  Writing quantity: ',q)
-                    
-        # Initialise q_values with zeros
-        if q in dynamic_quantities:
-            q_values = num.zeros((n_steps, 3*number_of_global_triangles), num.float32)
-        elif q in dynamic_c_quantities:
-            q_values = num.zeros((n_steps, number_of_global_triangles), num.float32)
+    #---------------------------
+    # Stream the dynamic quantities
+    #---------------------------
+    # The block buffers plus the values read from the files
+    step_size = 2*4*(number_of_global_points*len(dynamic_quantities) +
+                     number_of_global_triangles*len(dynamic_c_quantities))
+    block_size = max(1, int(memory_limit//max(step_size, 1)))
 
+    pool = None
+    if processes is not None and processes > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes)
 
-        # Read the quantities one at a time, to reduce memory usage
-        for filename in swwfiles:
-            fid = NetCDFFile(filename, netcdf_mode_r)
-
-            # Index information
-            tri_l2g  = fid.variables['tri_l2g'][:]
-            node_l2g = fid.variables['node_l2g'][:]
-            tri_full_flag = fid.variables['tri_full_flag'][:]
-            f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-            f_gids = tri_l2g[f_ids]
-            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            for i in range(n_steps):
-                # Different indices for vertex and centroid quantities
-                if q in dynamic_quantities:
-                    q_values[i][g_vids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[l_vids]
-                elif q in dynamic_c_quantities:
-                    q_values[i][f_gids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[f_ids]
-
-            fid.close()
-
-        # Write to the file
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-        if q in dynamic_quantities:
-            # This updates the _range values
-            q_range = fido.variables[q + Write_sww.RANGE][:]
-            q_values_min = num.min(q_values)
-            if q_values_min < q_range[0]:
-                fido.variables[q + Write_sww.RANGE][0] = q_values_min
-            q_values_max = num.max(q_values)
-            if q_values_max > q_range[1]:
-                fido.variables[q + Write_sww.RANGE][1] = q_values_max
+    try:
+        for i0 in range(first_step, n_steps, block_size):
+            i1 = min(i0 + block_size, n_steps)
+
+            if verbose:
+                print('  Writing timesteps %g to %g' % (i0, i1-1))
+
+            tasks = [(filename, dynamic_quantities, dynamic_c_quantities,
+                      vertex_map[0], centroid_map[0], i0, i1)
+                     for filename, vertex_map, centroid_map
+                     in zip(swwfiles, vertex_maps, centroid_maps)]
+
+            if pool is None:
+                blocks = map(_read_sww_block, tasks)
+            else:
+                blocks = pool.imap(_read_sww_block, tasks)
+
+            q_values = {}
+            for q in dynamic_quantities:
+                q_values[q] = num.zeros((i1-i0, number_of_global_points), num.float32)
+            for q in dynamic_c_quantities:
+                q_values[q] = num.zeros((i1-i0, number_of_global_triangles), num.float32)
+
+            for block, vertex_map, centroid_map in zip(blocks, vertex_maps, centroid_maps):
+                for q in dynamic_quantities:
+                    q_values[q][:, vertex_map[1]] = block[q]
+                for q in dynamic_c_quantities:
+                    q_values[q][:, centroid_map[1]] = block[q]
+
+            fido.variables['time'][i0:i1] = times[i0:i1]
+
+            for q in dynamic_quantities + dynamic_c_quantities:
+                fido.variables[q][i0:i1] = q_values[q]
+
+            for q in dynamic_quantities:
+                # This updates the _range values
+                q_range = fido.variables[q + Write_sww.RANGE][:]
+                q_values_min = num.min(q_values[q])
+                if q_values_min < q_range[0]:
+                    fido.variables[q + Write_sww.RANGE][0] = q_values_min
+                q_values_max = num.max(q_values[q])
+                if q_values_max > q_range[1]:
+                    fido.variables[q + Write_sww.RANGE][1] = q_values_max
+
+            fido.sync()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     fido.close()
 
     if delete_old:
-        import os
         for filename in swwfiles:
 
             if verbose:
@@ -800,3 +553,22 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
             os.remove(filename)
 
 
+def _read_sww_block(task):
+    """Read timesteps i0 to i1-1 of the dynamic quantities of the full
+    vertices and triangles of one sww file (used by
+    _sww_merge_parallel_streaming, possibly in a separate process).
+    """
+
+    filename, dynamic_quantities, dynamic_c_quantities, l_vids, f_ids, i0, i1 = task
+
+    fid = NetCDFFile(filename, netcdf_mode_r)
+
+    block = {}
+    for q in dynamic_quantities:
+        block[q] = num.array(fid.variables[q][i0:i1], dtype=num.float32)[:, l_vids]
+    for q in dynamic_c_quantities:
+        block[q] = num.array(fid.variables[q][i0:i1], dtype=num.float32)[:, f_ids]
+
+    fid.close()
+
+    return block
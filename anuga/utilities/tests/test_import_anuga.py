@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""Check that the public anuga namespace is served lazily and that
+"import anuga" stays cheap.
+"""
+
+import unittest
+import subprocess
+import sys
+import os
+
+import anuga
+
+
+# Modules which should only be imported when a name needing them is used
+heavy_modules = ['matplotlib', 'scipy', 'mpi4py', 'netCDF4']
+
+# Wall clock timings are unreliable on loaded machines, so the bound on
+# the time of a bare "import anuga" is only checked if the environment
+# variable ANUGA_MAX_IMPORT_TIME gives it (in seconds). Eager imports of
+# the full api took several seconds.
+max_import_time = os.environ.get('ANUGA_MAX_IMPORT_TIME')
+
+
+import_script = """
+import sys, time
+t0 = time.perf_counter()
+import anuga
+t1 = time.perf_counter()
+print(t1 - t0)
+print(' '.join(m for m in %r if m in sys.modules))
+""" % (heavy_modules,)
+
+
+class Test_import_anuga(unittest.TestCase):
+
+    def run_import_script(self):
+        output = subprocess.check_output([sys.executable, '-c', import_script],
+                                         universal_newlines=True)
+        lines = output.strip().split('\n')
+        import_time = float(lines[0])
+        loaded = lines[1].split() if len(lines) > 1 else []
+        return import_time, loaded
+
+    def test_import_heavy_modules(self):
+
+        import_time, loaded = self.run_import_script()
+
+        msg = 'import anuga should not import %s' % loaded
+        assert loaded == [], msg
+
+    @unittest.skipIf(max_import_time is None,
+                     'set ANUGA_MAX_IMPORT_TIME to check the import time')
+    def test_import_time(self):
+
+        # Take the best of a few runs to smooth out a busy machine
+        times = [self.run_import_script()[0] for i in range(3)]
+
+        msg = 'import anuga took %g s, expected less than %s s' \
+              % (min(times), max_import_time)
+        assert min(times) < float(max_import_time), msg
+
+    def test_public_names(self):
+
+        for name in anuga.__all__:
+            assert getattr(anuga, name) is not None, name
+
+        assert anuga.Domain is anuga.shallow_water.shallow_water_domain.Domain
+        assert anuga.acos is anuga.utilities.numerical_tools.safe_acos
+        assert anuga.log is anuga.utilities.log
+        assert anuga.plot_utils is anuga.utilities.plot_utils
+
+        from anuga import Reflective_boundary
+        assert Reflective_boundary is anuga.shallow_water.boundaries.Reflective_boundary
+
+        assert 'Rate_operator' in dir(anuga)
+
+    def test_structure_operators(self):
+
+        if anuga.pypar_available:
+            import anuga.parallel.parallel_operator_factory as module
+        else:
+            import anuga.structures.boyd_box_operator as module
+
+        assert anuga.Boyd_box_operator is module.Boyd_box_operator
+
+    def test_unknown_name(self):
+
+        try:
+            anuga.no_such_name
+        except AttributeError:
+            pass
+        else:
+            msg = 'Should have raised AttributeError'
+            raise Exception(msg)
+
+        assert not hasattr(anuga, 'no_such_name')
+
+
+################################################################################
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_import_anuga)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
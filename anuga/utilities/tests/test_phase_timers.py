@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+
+import unittest
+import tempfile
+import shutil
+import json
+import csv
+import os
+
+import anuga
+from anuga.utilities.phase_timers import Phase_timers, Null_phase_timers
+
+
+class Test_phase_timers(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_phase_timers(self):
+
+        timers = Phase_timers()
+
+        timers.start('a')
+        timers.stop('a')
+        timers.start('a')
+        timers.stop('a')
+        timers.add('b', 2.0)
+        timers.add('c', 1.0, calls=3)
+
+        phases = timers.get_phases()
+        assert [name for name, seconds, calls in phases] == ['b', 'c', 'a']
+        assert timers.calls == {'a': 2, 'b': 1, 'c': 3}
+        assert timers.times['a'] >= 0.0
+        assert abs(timers.get_total_time() - 3.0 - timers.times['a']) < 1.0e-12
+
+        msg = timers.statistics()
+        assert 'b' in msg and 'calls=3' in msg
+
+        timers.reset()
+        assert timers.get_phases() == []
+
+    def test_null_phase_timers(self):
+
+        timers = Null_phase_timers()
+
+        timers.start('a')
+        timers.stop('a')
+        timers.add('b', 1.0)
+
+        assert not timers.enabled
+
+    def test_write(self):
+
+        timers = Phase_timers()
+        timers.add('compute_fluxes', 2.0, calls=10)
+        timers.add('update_boundary', 1.0, calls=10)
+
+        filename = os.path.join(self.dir, 'timers.json')
+        timers.write(filename, processor=1)
+
+        with open(filename) as fid:
+            data = json.load(fid)
+
+        assert data['processor'] == 1
+        assert data['phases']['compute_fluxes'] == {'time': 2.0, 'calls': 10}
+
+        filename = os.path.join(self.dir, 'timers.csv')
+        timers.write(filename, processor=1)
+
+        with open(filename) as fid:
+            rows = list(csv.reader(fid))
+
+        assert rows[0] == ['processor', 'phase', 'time', 'calls']
+        assert rows[1] == ['1', 'compute_fluxes', '2.0', '10']
+        assert len(rows) == 3
+
+        with self.assertRaises(Exception):
+            timers.write(filename, file_format='xml')
+
+    def test_domain_phase_timing(self):
+
+        domain = anuga.rectangular_cross_domain(10, 5, len1=10.0, len2=5.0)
+        domain.set_name('phase_timing')
+        domain.set_datadir(self.dir)
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('stage', expression='elevation + 0.2')
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([0.0, 0.0, 0.0])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        op = anuga.Rate_operator(domain, rate=0.01, label='rain')
+
+        assert not domain.get_phase_timing()
+        assert domain.get_phase_timers() == []
+
+        domain.set_phase_timing(file_format='csv')
+        assert domain.get_phase_timing()
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            msg = domain.timestepping_statistics()
+            assert 'Phase timers' in msg
+
+        phases = {name: calls for name, seconds, calls in domain.get_phase_timers()}
+
+        steps = phases['compute_fluxes']
+        assert steps > 0
+        assert phases['update_conserved_quantities'] == steps
+        assert phases['compute_forcing_terms'] == steps
+        assert phases[op.label] == steps
+        assert phases['update_boundary'] >= steps
+        assert phases['distribute_to_vertices_and_edges'] >= steps
+        assert phases['storage'] >= 3
+
+        filename = os.path.join(self.dir, 'phase_timing_phase_timers.csv')
+        assert os.path.exists(filename)
+
+        domain.set_phase_timing(False)
+        assert not domain.get_phase_timing()
+
+        with self.assertRaises(Exception):
+            domain.set_phase_timing(file_format='xml')
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_phase_timers)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,143 @@
+"""
+Test the streaming merge of the sww files of a parallel run.
+
+The sub domain sww files are created in one process by building the
+Parallel_domain of each processor with Sequential_distribute.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+
+import numpy as num
+
+import anuga
+from anuga.file.netcdf import NetCDFFile
+from anuga.parallel.sequential_distribute import Sequential_distribute
+from anuga.parallel.parallel_shallow_water import Parallel_domain
+from anuga.utilities.sww_merge import sww_merge_parallel
+
+verbose = False
+
+
+class Test_sww_merge(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir)
+
+
+    def create_sww_files(self, name, smooth, steps, numprocs=3):
+        """Store steps timesteps of the sub domains of a small domain"""
+
+        domain = anuga.rectangular_cross_domain(6, 4)
+        domain.set_name(name)
+        domain.set_quantity('elevation', lambda x, y: -x)
+        domain.set_quantity('stage', 0.5)
+
+        partition = Sequential_distribute(domain)
+        partition.distribute(numprocs)
+
+        for p in range(numprocs):
+            kwargs, points, vertices, boundary, quantities = partition.extract_submesh(p)[:5]
+
+            sub_domain = Parallel_domain(points, vertices, boundary, **kwargs)
+            for quantity in quantities:
+                sub_domain.set_quantity(quantity, quantities[quantity])
+            sub_domain.set_name(name)
+            sub_domain.smooth = smooth
+            sub_domain.set_store_centroids(True)
+
+            sub_domain.initialise_storage()
+            for k in range(steps):
+                sub_domain.set_time(float(k))
+                sub_domain.quantities['stage'].centroid_values[:] = 0.5 + k + 0.01*sub_domain.tri_l2g
+                sub_domain.quantities['xmomentum'].centroid_values[:] = 0.1*k
+                sub_domain.distribute_to_vertices_and_edges()
+                sub_domain.store_timestep()
+            sub_domain.finalise_storage()
+
+        return domain
+
+
+    def read_sww(self, filename):
+
+        fid = NetCDFFile(filename)
+        values = dict((name, num.array(fid.variables[name][:])) for name in fid.variables)
+        fid.close()
+
+        return values
+
+
+    def check_merge(self, smooth):
+
+        name = 'merge'
+        domain = self.create_sww_files(name, smooth, steps=7)
+
+        sww_merge_parallel(name, 3)
+        expected = self.read_sww(name + '.sww')
+
+        # Centroid values are stored in the global order
+        stage_c = expected['stage_c']
+        assert stage_c.shape == (7, len(domain))
+        for k in range(7):
+            assert num.allclose(stage_c[k], 0.5 + k + 0.01*num.arange(len(domain)))
+        assert num.allclose(expected['time'], num.arange(7))
+        assert num.allclose(expected['stage_range'], [expected['stage'].min(), expected['stage'].max()])
+
+        # One timestep at a time, and reading with a pool of processes
+        for kwargs in [dict(memory_limit=1), dict(memory_limit=1, processes=2)]:
+            sww_merge_parallel(name, 3, **kwargs)
+            values = self.read_sww(name + '.sww')
+            for variable in expected:
+                assert num.array_equal(values[variable], expected[variable]), variable
+
+        # Merge the first timesteps of a run and then append the rest
+        os.remove(name + '.sww')
+        self.create_sww_files(name, smooth, steps=4)
+        sww_merge_parallel(name, 3, incremental=True)
+        assert len(self.read_sww(name + '.sww')['time']) == 4
+
+        self.create_sww_files(name, smooth, steps=7)
+
+        # The sww files are needed by later merges
+        try:
+            sww_merge_parallel(name, 3, incremental=True, delete_old=True)
+        except Exception:
+            pass
+        else:
+            msg = 'Should have raised an exception'
+            raise Exception(msg)
+
+        assert len(self.read_sww(name + '.sww')['time']) == 4
+
+        sww_merge_parallel(name, 3, incremental=True)
+
+        values = self.read_sww(name + '.sww')
+        for variable in expected:
+            assert num.array_equal(values[variable], expected[variable]), variable
+
+        for p in range(3):
+            assert os.path.exists(name + '_P3_%d.sww' % p)
+
+
+    def test_merge_smooth(self):
+
+        self.check_merge(True)
+
+
+    def test_merge_non_smooth(self):
+
+        self.check_merge(False)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_sww_merge, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)